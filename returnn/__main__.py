@@ -230,7 +230,7 @@ def load_data(config, cache_byte_size, files_config_key, **kwargs):
     data = init_dataset_via_str(config_str, config=config, cache_byte_size=cache_byte_size, **kwargs)
   cache_leftover = 0
   if isinstance(data, HDFDataset):
-    cache_leftover = data.definite_cache_leftover
+    cache_leftover = data.get_cache_byte_size_left_over()
   return data, cache_leftover
 
 
@@ -23,7 +23,7 @@ import functools
 import typing
 
 from returnn.log import log
-from returnn.engine.batch import Batch, BatchSetGenerator
+from returnn.engine.batch import Batch, BatchSetGenerator, get_recurrent_batch_ends, iterate_recurrent_batches
 from returnn.util.basic import PY3, try_run, NumbersDict, unicode, OptionalNotImplementedError
 
 
@@ -87,7 +87,7 @@ class Dataset(object):
                seq_ordering='default', random_seed_offset=None,
                partition_epoch=None, repeat_epoch=None,
                seq_list_filter_file=None, unique_seq_tags=False,
-               seq_order_seq_lens_file=None,
+               seq_order_seq_lens_file=None, vectorized_seq_ordering=False,
                shuffle_frames_of_nseqs=0, min_chunk_size=0, chunking_variance=0,
                estimated_num_seqs=None):
     """
@@ -106,6 +106,9 @@ class Dataset(object):
     :param str|None seq_list_filter_file: defines a subset of sequences (by tag) to use
     :param bool unique_seq_tags: uniquify seqs with same seq tags in seq order
     :param str|None seq_order_seq_lens_file: for seq order, use the seq length given by this file
+    :param bool vectorized_seq_ordering: use the NumPy seq order implementation
+      (see :func:`_get_seq_order_for_epoch_vectorized`). Much faster for large corpora.
+      The deterministic orderings are the same, but the random orderings will differ.
     :param int shuffle_frames_of_nseqs: shuffles the frames. not always supported
     :param None|int estimated_num_seqs: for progress reporting in case the real num_seqs is unknown
     """
@@ -125,6 +128,9 @@ class Dataset(object):
     self.unique_seq_tags = unique_seq_tags
     self._seq_order_seq_lens_file = seq_order_seq_lens_file
     self._seq_order_seq_lens_by_idx = None
+    self.vectorized_seq_ordering = vectorized_seq_ordering
+    self._seq_tags_filter_mask = None  # type: typing.Optional[numpy.ndarray]  # for vectorized_seq_ordering
+    self._seq_tags_unique_ids = None  # type: typing.Optional[numpy.ndarray]  # for vectorized_seq_ordering
     # There is probably no use case for combining the two, so avoid potential misconfiguration.
     assert self.partition_epoch == 1 or self.repeat_epoch == 1, (
       "Combining partition_epoch and repeat_epoch is prohibited.")
@@ -291,6 +297,40 @@ class Dataset(object):
     """
     raise OptionalNotImplementedError
 
+  def get_all_seq_lengths(self):
+    """
+    In contrast to self.get_seq_length(), this returns the seq lengths of all sequences at once,
+    such that seq ordering and batch generation do not need a Python call per sequence.
+
+    :return: data-key -> int array of shape (num_total_seqs,), indexed by the corpus seq idx
+      (the same index as for :func:`get_seq_order_for_epoch`, i.e. without partition epoch).
+      The values are the same as from :func:`get_seq_length`.
+      Not all datasets implement this.
+    :rtype: NumbersDict
+    """
+    raise OptionalNotImplementedError
+
+  def get_current_seq_lengths(self):
+    """
+    :return: data-key -> int array of shape (num_seqs,), indexed by the sorted seq idx of the current epoch,
+      i.e. get_current_seq_lengths()[key][seq_idx] == get_seq_length(seq_idx)[key].
+      Not all datasets implement this.
+    :rtype: NumbersDict
+    """
+    all_seq_lens = self.get_all_seq_lengths()
+    seq_order = numpy.asarray(self.get_current_seq_order(), dtype="int64")
+    return NumbersDict({key: all_seq_lens[key][seq_order] for key in all_seq_lens.keys()})
+
+  def _try_get_current_seq_lengths(self):
+    """
+    :return: like :func:`get_current_seq_lengths`, or None if not supported by the dataset
+    :rtype: NumbersDict|None
+    """
+    try:
+      return self.get_current_seq_lengths()
+    except OptionalNotImplementedError:
+      return None
+
   def get_num_timesteps(self):
     """
     :rtype: int
@@ -357,12 +397,12 @@ class Dataset(object):
     """
     raise NotImplementedError
 
-  def _get_seq_order_seq_lens_by_idx(self, seq_idx):
+  def _get_seq_order_seq_lens_from_file(self):
     """
-    :param int seq_idx:
-    :rtype: int
+    :return: seq lens by corpus seq idx, as given by seq_order_seq_lens_file, shape (num_seqs,)
+    :rtype: numpy.ndarray
     """
-    if not self._seq_order_seq_lens_by_idx:
+    if self._seq_order_seq_lens_by_idx is None:
       assert self._seq_order_seq_lens_file
       if self._seq_order_seq_lens_file.endswith(".gz"):
         import gzip
@@ -372,10 +412,24 @@ class Dataset(object):
       seq_lens = eval(raw)
       assert isinstance(seq_lens, dict)
       all_tags = self.get_all_tags()
-      self._seq_order_seq_lens_by_idx = [seq_lens[tag] for tag in all_tags]
-    return self._seq_order_seq_lens_by_idx[seq_idx]
+      self._seq_order_seq_lens_by_idx = numpy.array([seq_lens[tag] for tag in all_tags], dtype="int64")
+    return self._seq_order_seq_lens_by_idx
+
+  def _get_seq_order_seq_lens_by_idx(self, seq_idx):
+    """
+    :param int seq_idx:
+    :rtype: int
+    """
+    return int(self._get_seq_order_seq_lens_from_file()[seq_idx])
+
+  def _seq_ordering_uses_seq_lens(self):
+    """
+    :return: whether the configured seq_ordering needs the seq lens
+    :rtype: bool
+    """
+    return self.seq_ordering.startswith(("sorted", "sort_bin_shuffle", "laplace"))
 
-  def get_seq_order_for_epoch(self, epoch, num_seqs, get_seq_len=None):
+  def get_seq_order_for_epoch(self, epoch, num_seqs, get_seq_len=None, get_seq_lens=None):
     """
     Returns the order of the given epoch.
     This is mostly a static method, except that is depends on the configured type of ordering,
@@ -384,9 +438,15 @@ class Dataset(object):
     :param int epoch: for 'random', this determines the random seed
     :param int num_seqs:
     :param ((int) -> int)|None get_seq_len: function (originalSeqIdx: int) -> int
+    :param (() -> numpy.ndarray)|None get_seq_lens: function returning the seq lens of all seqs in bulk,
+      i.e. an array of shape (num_seqs,), indexed by originalSeqIdx. Alternative to get_seq_len.
+      Only called if the seq ordering needs the seq lens.
     :return: the order for the given epoch. such that seq_idx -> underlying idx
     :rtype: list[int]
     """
+    if self.vectorized_seq_ordering:
+      return self._get_seq_order_for_epoch_vectorized(
+        epoch=epoch, num_seqs=num_seqs, get_seq_len=get_seq_len, get_seq_lens=get_seq_lens).tolist()
     partition_epoch = self.partition_epoch or 1
     repeat_epoch = self.repeat_epoch or 1
     if not epoch:
@@ -398,6 +458,8 @@ class Dataset(object):
     seq_index = list(range(num_seqs))  # type: typing.List[int]  # the real seq idx after sorting
     if self._seq_order_seq_lens_file:
       get_seq_len = self._get_seq_order_seq_lens_by_idx
+    elif not get_seq_len and get_seq_lens and self._seq_ordering_uses_seq_lens():
+      get_seq_len = get_seq_lens().__getitem__
     if self.seq_ordering == 'default':
       pass  # Keep order as-is.
     elif self.seq_ordering.startswith("default_every_n:"):
@@ -507,6 +569,119 @@ class Dataset(object):
         self, sorted(self.seq_tags_filter)[:3], [all_seq_tags[i] for i in old_seq_index[:3]])
     return seq_index
 
+  def _get_seq_order_for_epoch_vectorized(self, epoch, num_seqs, get_seq_len=None, get_seq_lens=None):
+    """
+    Like :func:`get_seq_order_for_epoch`, but everything is done in NumPy on an int64 seq len array.
+    The deterministic orderings ("default", "default_every_n", "reverse", "sorted", "sorted_reverse")
+    give exactly the same order.
+    The random orderings use :class:`numpy.random.RandomState` and thus give a different order.
+
+    :param int|None epoch: for 'random', this determines the random seed
+    :param int num_seqs:
+    :param ((int) -> int)|None get_seq_len: function (originalSeqIdx: int) -> int. slow, prefer get_seq_lens
+    :param (() -> numpy.ndarray)|None get_seq_lens: function returning the seq lens of all seqs, shape (num_seqs,)
+    :return: the order for the given epoch, int64, shape (num_seqs',). such that seq_idx -> underlying idx
+    :rtype: numpy.ndarray
+    """
+    partition_epoch = self.partition_epoch or 1
+    repeat_epoch = self.repeat_epoch or 1
+    if not epoch:
+      epoch = 1
+    full_epoch = epoch
+    if partition_epoch > 1:
+      full_epoch = (epoch - 1) // partition_epoch + 1
+    assert num_seqs > 0
+    seq_lens = None  # type: typing.Optional[numpy.ndarray]
+    if self._seq_ordering_uses_seq_lens():
+      if self._seq_order_seq_lens_file:
+        seq_lens = self._get_seq_order_seq_lens_from_file()
+      elif get_seq_lens:
+        seq_lens = numpy.asarray(get_seq_lens(), dtype="int64")
+      else:
+        assert get_seq_len
+        seq_lens = numpy.fromiter(map(get_seq_len, range(num_seqs)), dtype="int64", count=num_seqs)
+      assert seq_lens.shape == (num_seqs,)
+    tmp = self.seq_ordering.split(':')[1:]
+    bins = 2
+    if tmp:
+      if tmp[0].startswith("."):  # starting with "." -> approx chunk size (num of seqs in one bin)
+        bins = max(num_seqs // int(tmp[0][1:]), 2)
+      else:  # the number of bins
+        bins = int(tmp[0])
+    nth = int(tmp[1]) if len(tmp) > 1 else 1
+    if self.seq_ordering == 'default':
+      seq_index = numpy.arange(num_seqs, dtype="int64")
+    elif self.seq_ordering.startswith("default_every_n:"):
+      num = int(tmp[0])
+      seq_index = numpy.arange(num_seqs // num, dtype="int64").repeat(num)
+      for i in range(1, num):
+        seq_index[i::num] += i * (num_seqs // num)
+    elif self.seq_ordering == 'reverse':
+      seq_index = numpy.arange(num_seqs - 1, -1, -1, dtype="int64")
+    elif self.seq_ordering == 'sorted':
+      seq_index = numpy.argsort(seq_lens, kind="stable")
+    elif self.seq_ordering == "sorted_reverse":
+      seq_index = numpy.argsort(-seq_lens, kind="stable")
+    elif self.seq_ordering.startswith('sort_bin_shuffle'):
+      # Shuffle seqs, sort by length, and shuffle bins (then shuffle seqs within each bin if sort_bin_shuffle_x2).
+      rnd = numpy.random.RandomState(((full_epoch - 1) // nth + 1) + self.random_seed_offset)
+      seq_index = rnd.permutation(num_seqs)
+      seq_index = seq_index[numpy.argsort(seq_lens[seq_index], kind="stable")]
+      pos_bins = self._get_seq_order_pos_bins(num_seqs=num_seqs, bins=bins)
+      bin_rank = numpy.argsort(rnd.permutation(bins))  # bin idx -> position of the bin in the shuffled order
+      if self.seq_ordering.startswith('sort_bin_shuffle_x2'):
+        seq_index = seq_index[numpy.lexsort((rnd.random_sample(num_seqs), bin_rank[pos_bins]))]
+      else:
+        seq_index = seq_index[numpy.argsort(bin_rank[pos_bins], kind="stable")]
+    elif self.seq_ordering.startswith('laplace'):
+      rnd = numpy.random.RandomState(((full_epoch - 1) // nth + 1) + self.random_seed_offset)
+      seq_index = rnd.permutation(num_seqs)
+      pos_bins = self._get_seq_order_pos_bins(num_seqs=num_seqs, bins=bins)
+      # Sort within each bin by length, alternating ascending and descending.
+      signed_seq_lens = numpy.where(pos_bins % 2 == 1, -seq_lens[seq_index], seq_lens[seq_index])
+      seq_index = seq_index[numpy.lexsort((signed_seq_lens, pos_bins))]
+    elif self.seq_ordering.startswith('random'):
+      nth = int(tmp[0]) if tmp else 1
+      rnd = numpy.random.RandomState(((full_epoch - 1) // nth + 1) + self.random_seed_offset)
+      seq_index = rnd.permutation(num_seqs)
+    else:
+      assert False, "invalid batching specified: " + self.seq_ordering
+    seq_index = seq_index.astype("int64", copy=False)
+    if self.unique_seq_tags:
+      if self._seq_tags_unique_ids is None:
+        _, self._seq_tags_unique_ids = numpy.unique(numpy.array(self.get_all_tags()), return_inverse=True)
+      _, first_pos = numpy.unique(self._seq_tags_unique_ids[seq_index], return_index=True)
+      seq_index = seq_index[numpy.sort(first_pos)]
+    if partition_epoch > 1:
+      seq_index = self._apply_partition_epoch(seq_index, partition_epoch, epoch)
+    if repeat_epoch > 1:
+      seq_index = numpy.tile(seq_index, repeat_epoch)
+    if self.seq_tags_filter is not None:
+      assert len(seq_index) > 0
+      if self._seq_tags_filter_mask is None:
+        all_seq_tags = self.get_all_tags()
+        assert len(all_seq_tags) == num_seqs == self.get_total_num_seqs(), "%r vs %r vs %r" % (
+          len(all_seq_tags), num_seqs, self.get_total_num_seqs())
+        self._seq_tags_filter_mask = numpy.fromiter(
+          (tag in self.seq_tags_filter for tag in all_seq_tags), dtype="bool", count=num_seqs)
+      old_seq_index = seq_index
+      seq_index = seq_index[self._seq_tags_filter_mask[seq_index]]
+      assert len(seq_index) > 0, (
+        "%s: empty after applying seq_list_filter_file. Example filter tags: %r, used tags: %r" % (
+          self, sorted(self.seq_tags_filter)[:3], [self.get_all_tags()[i] for i in old_seq_index[:3]]))
+    return seq_index
+
+  @staticmethod
+  def _get_seq_order_pos_bins(num_seqs, bins):
+    """
+    :param int num_seqs:
+    :param int bins: number of bins. the bins are split as in :func:`get_seq_order_for_epoch`
+    :return: for each position in the seq order, the bin idx, shape (num_seqs,)
+    :rtype: numpy.ndarray
+    """
+    bin_starts = numpy.arange(bins + 1, dtype="int64") * num_seqs // bins
+    return numpy.repeat(numpy.arange(bins, dtype="int64"), numpy.diff(bin_starts))
+
   @classmethod
   def _apply_partition_epoch(cls, seq_index, partition_epoch, epoch):
     """
@@ -956,9 +1131,13 @@ class Dataset(object):
     chunk_size_orig = chunk_size.copy()
     chunk_step_orig = chunk_step.copy()
 
+    seq_lens = self._try_get_current_seq_lengths()  # bulk, if possible
     s = 0
     while self.is_less_than_num_seqs(s):
-      length = self.get_seq_length(s)
+      if seq_lens is not None:
+        length = NumbersDict({key: seq_lens[key][s] for key in seq_lens.keys()})
+      else:
+        length = self.get_seq_length(s)
       if chunk_size == 0:
         yield s, NumbersDict.constant_like(0, numbers_dict=length), length
       else:
@@ -1027,6 +1206,93 @@ class Dataset(object):
             break
       s += 1
 
+  def _get_seq_parts_arrays(self, chunk_size=None, chunk_step=None, used_data_keys=None):
+    """
+    Vectorized variant of :func:`iterate_seqs`, based on :func:`get_current_seq_lengths`.
+
+    :param int|NumbersDict chunk_size:
+    :param int|NumbersDict chunk_step:
+    :param set(str)|None used_data_keys:
+    :return: the same as :func:`iterate_seqs` yields, for all parts (chunks) at once:
+      (seq index, seq start, seq end), where seq index is an int array of shape (num_parts,),
+      and seq start/end are NumbersDict with int arrays of shape (num_parts,).
+      None if this is not supported, e.g. when the dataset does not provide the seq lengths in bulk,
+      or with chunking_variance.
+    :rtype: (numpy.ndarray,NumbersDict,NumbersDict)|None
+    """
+    if chunk_size is None:
+      chunk_size = self.chunk_size
+    if chunk_step is None:
+      chunk_step = self.chunk_step
+    chunk_size = NumbersDict(chunk_size)
+    chunk_step = NumbersDict(chunk_step)
+    if chunk_size != 0 and self.chunking_variance > 0:
+      return None
+    seq_lens = self._try_get_current_seq_lengths()
+    if seq_lens is None or not seq_lens.keys():
+      return None
+    length = NumbersDict({key: numpy.asarray(value, dtype="int64") for (key, value) in seq_lens.items()})
+    num_seqs = len(next(iter(length.dict.values())))
+    if chunk_size == 0:
+      return (
+        numpy.arange(num_seqs),
+        NumbersDict({key: numpy.zeros_like(value) for (key, value) in length.items()}),
+        length)
+    default_key = "data"
+    if used_data_keys is not None:
+      length = NumbersDict({k: length[k] for k in used_data_keys})
+      if default_key not in used_data_keys:
+        default_key = sorted(used_data_keys)[0]
+      if chunk_step[default_key] == 0:  # allow some keys with zero chunk-step
+        assert chunk_step.max_value() > 0
+        default_key = [key for key in sorted(used_data_keys) if chunk_step[key] > 0][0]
+    if not chunk_size.keys_set.issubset(length.keys_set) or not chunk_step.keys_set.issubset(length.keys_set):
+      return None  # iterate_seqs would add these keys to the chunks, leave that to the generic code
+    assert chunk_step[default_key] > 0
+    # See iterate_seqs for the logic. Keys of length 0 or 1 are treated special, by using the full seq for every chunk.
+    keys_with_full_seqs = {}  # key -> bool array (num_seqs,)
+    for key in length.keys():
+      same_len = length[key] == length[default_key]
+      if chunk_step[key] == chunk_step[default_key]:
+        other_len = numpy.logical_not(same_len) & (length[key] > 1)
+        if other_len.any():
+          seq_idx = int(numpy.argmax(other_len))
+          raise Exception("Chunking with multiple data-keys of different length: %r" % (
+            NumbersDict({k: v[seq_idx] for (k, v) in length.items()}),))
+        keys_with_full_seqs[key] = numpy.logical_not(same_len)
+      else:
+        keys_with_full_seqs[key] = length[key] <= 1
+        limit = limit_default = 1
+        if self.min_chunk_size == chunk_size[default_key]:
+          limit = chunk_size[key]
+          limit_default = chunk_size[default_key]
+        nr_of_chunks = (length[key] - limit) // chunk_step[key] + 1
+        nr_of_chunks_default = (length[default_key] - limit_default) // chunk_step[default_key] + 1
+        mismatch = numpy.logical_not(keys_with_full_seqs[key]) & (nr_of_chunks != nr_of_chunks_default)
+        if mismatch.any():
+          seq_idx = int(numpy.argmax(mismatch))
+          raise AssertionError(
+            "%s: iterate seqs with chunking: length %r, chunk size/step %r/%r (min %r), key %r (default %r)" % (
+              self, NumbersDict({k: v[seq_idx] for (k, v) in length.items()}),
+              chunk_size, chunk_step, self.min_chunk_size, key, default_key))
+    # The first chunk always starts at 0, and we continue while more than min_chunk_size frames are left.
+    num_chunks = numpy.where(
+      length[default_key] > 0,
+      1 + numpy.maximum((length[default_key] - self.min_chunk_size - 1) // chunk_step[default_key], 0),
+      0)
+    seq_idx = numpy.repeat(numpy.arange(num_seqs), num_chunks)
+    chunk_idx = numpy.arange(len(seq_idx)) - numpy.repeat(numpy.cumsum(num_chunks) - num_chunks, num_chunks)
+    chunk_start = NumbersDict()
+    chunk_end = NumbersDict()
+    for key in length.keys():
+      key_len = length[key][seq_idx]
+      full_seq = keys_with_full_seqs[key][seq_idx]
+      start = chunk_idx * chunk_step.get(key, 0)
+      end = numpy.minimum(start + chunk_size.get(key, 0), key_len)
+      chunk_start[key] = numpy.where(full_seq, 0, start)
+      chunk_end[key] = numpy.where(full_seq, key_len, end)
+    return seq_idx, chunk_start, chunk_end
+
   def get_start_end_frames_full_seq(self, seq_idx):
     """
     :param int seq_idx:
@@ -1096,6 +1362,14 @@ class Dataset(object):
       if chunk_size != 0:
         print("Non-recurrent network, chunk size %s:%s ignored" % (chunk_size, chunk_step), file=log.v4)
         chunk_size = 0
+    if recurrent_net and not self.weights and seq_drop <= 0:
+      parts = self._get_seq_parts_arrays(chunk_size=chunk_size, chunk_step=chunk_step, used_data_keys=used_data_keys)
+      if parts is not None:
+        for batch in self._generate_recurrent_batches_from_parts(
+              parts, batch_size=batch_size, max_seqs=max_seqs, max_seq_length=max_seq_length,
+              max_pad_size=max_pad_size, min_seq_length=min_seq_length, max_total_num_seqs=max_total_num_seqs):
+          yield batch
+        return
     batch = Batch()
     total_num_seqs = 0
     last_seq_idx = -1
@@ -1152,6 +1426,58 @@ class Dataset(object):
     if batch.get_all_slices_num_frames().max_value() > 0:
       yield batch
 
+  def _generate_recurrent_batches_from_parts(self, parts, batch_size, max_seqs, max_seq_length, max_pad_size,
+                                             min_seq_length, max_total_num_seqs):
+    """
+    Vectorized variant of :func:`_generate_batches` for the recurrent case.
+    This yields the same batches, but computes all the batch boundaries at once.
+
+    :param (numpy.ndarray,NumbersDict,NumbersDict) parts: from :func:`_get_seq_parts_arrays`
+    :param NumbersDict batch_size:
+    :param int|float max_seqs:
+    :param NumbersDict max_seq_length:
+    :param NumbersDict max_pad_size:
+    :param NumbersDict min_seq_length:
+    :param int|float max_total_num_seqs:
+    :rtype: typing.Iterator[Batch]
+    """
+    seq_idx, t_start, t_end = parts
+    num_parts = len(seq_idx)
+    t_start -= self.ctx_left
+    t_end += self.ctx_right
+    # Keys which are only in the context window get a scalar. Make them arrays as well.
+    for nd in (t_start, t_end):
+      for key, value in list(nd.items()):
+        nd[key] = numpy.broadcast_to(value, (num_parts,))
+    length = t_end - t_start
+    mask = numpy.logical_not(
+      length.any_compare_elemwise(max_seq_length, numpy.greater) |
+      length.any_compare_elemwise(min_seq_length, numpy.less))
+    mask = numpy.array(numpy.broadcast_to(mask, (num_parts,)))
+    seq_idx = seq_idx[mask]
+    if max_total_num_seqs < float("inf") and len(seq_idx):
+      # Like _generate_batches, we stop at the first part after we have seen more than max_total_num_seqs seqs.
+      new_seq = numpy.concatenate([[True], seq_idx[1:] != seq_idx[:-1]])
+      num_seqs_before = numpy.cumsum(new_seq) - new_seq
+      mask[mask] = num_seqs_before <= max_total_num_seqs
+      seq_idx = seq_idx[num_seqs_before <= max_total_num_seqs]
+    if not len(seq_idx):
+      return
+    t_start = NumbersDict(
+      numbers_dict={key: value[mask] for (key, value) in t_start.items()}, broadcast_value=t_start.value)
+    length = NumbersDict(
+      numbers_dict={key: value[mask] for (key, value) in length.items()}, broadcast_value=length.value)
+    too_long = length.any_compare_elemwise(batch_size, numpy.greater)
+    for i in numpy.flatnonzero(numpy.broadcast_to(too_long, seq_idx.shape)):
+      part_length = NumbersDict(
+        numbers_dict={key: value[i] for (key, value) in length.items()}, broadcast_value=length.value)
+      print("warning: sequence length (%r) larger than limit (%r)" % (part_length, batch_size), file=log.v4)
+    batch_ends = get_recurrent_batch_ends(
+      lengths=length, batch_size=batch_size, max_seqs=max_seqs, max_pad_size=max_pad_size)
+    for batch in iterate_recurrent_batches(
+          seq_idx=seq_idx, seq_start_frame=t_start, length=length, batch_ends=batch_ends):
+      yield batch
+
   def batch_set_generator_cache_whole_epoch(self):
     """
     The BatchSetGenerator can cache the list of batches which we generated across epochs.
@@ -1261,7 +1587,7 @@ def get_dataset_class(name):
   # because this function is only used for such cases.
   mod_names = [
     "hdf", "sprint", "generating", "numpy_dump",
-    "meta", "lm", "stereo", "raw_wav"]
+    "meta", "lm", "stereo", "raw_wav", "multi_proc"]
   for mod_name in mod_names:
     mod = import_module("returnn.datasets.%s" % mod_name)
     if name in vars(mod):
@@ -8,6 +8,7 @@ from __future__ import print_function
 from .basic import Dataset, DatasetSeq, convert_data_dims
 from .cached2 import CachedDataset2
 from returnn.util.basic import class_idx_seq_to_1_of_k, CollectionReadCheckCovered, PY3
+from returnn.util.basic import PersistentArraysCache, PersistentSeqArraysCache
 from returnn.log import log
 import numpy
 import sys
@@ -996,6 +997,9 @@ class ExtractAudioFeatures:
   """
   Currently uses librosa to extract MFCC/log-mel features.
   (Alternatives: python_speech_features, talkbox.features.mfcc, librosa)
+  With ``feature_backend="numpy"``, the spectral features are computed by
+  :class:`returnn.util.sig_proc.AudioFeatureExtractor` instead,
+  which gives the same features (up to float precision) but is faster and does not need librosa.
   """
 
   def __init__(self,
@@ -1005,14 +1009,18 @@ class ExtractAudioFeatures:
                features="mfcc", feature_options=None, random_permute=None, random_state=None, raw_ogg_opts=None,
                pre_process=None, post_process=None,
                sample_rate=None, num_channels=None,
-               peak_normalization=True, preemphasis=None, join_frames=None):
+               peak_normalization=True, preemphasis=None, join_frames=None, feature_backend="librosa",
+               pad_mode="constant"):
     """
     :param float window_len: in seconds
     :param float step_len: in seconds
     :param int num_feature_filters:
     :param bool|int with_delta:
-    :param numpy.ndarray|str|int|float|None norm_mean: if str, will interpret as filename, or "per_seq"
-    :param numpy.ndarray|str|int|float|None norm_std_dev: if str, will interpret as filename, or "per_seq"
+    :param numpy.ndarray|str|int|float|None norm_mean: if str, will interpret as filename, or "per_seq".
+      The file can be a text file (e.g. from ``tools/collect-norm-stats.py`` or ``tools/dump-dataset.py``)
+      or the statistics .npz file of :class:`MeanVarianceAccumulator`.
+    :param numpy.ndarray|str|int|float|None norm_std_dev: if str, will interpret as filename, or "per_seq".
+      Like norm_mean.
     :param str|function features: "mfcc", "log_mel_filterbank", "log_log_mel_filterbank", "raw", "raw_ogg"
     :param dict[str]|None feature_options: provide additional parameters for the feature function
     :param CollectionReadCheckCovered|dict[str]|bool|None random_permute:
@@ -1025,6 +1033,10 @@ class ExtractAudioFeatures:
     :param bool peak_normalization: set to False to disable the peak normalization for audio files
     :param float|None preemphasis: set a preemphasis filter coefficient
     :param int|None join_frames: concatenate multiple frames together to a superframe
+    :param str feature_backend: "librosa" or "numpy" (:class:`returnn.util.sig_proc.AudioFeatureExtractor`).
+      only relevant for the spectral features (not "raw", "raw_ogg" or a custom features function)
+    :param str pad_mode: for feature_backend="numpy", how the signal is padded for the centered frames.
+      "constant" is the librosa default since librosa 0.9. use "reflect" to match older librosa versions
     :return: float32 data of shape
     (audio_len // int(step_len * sample_rate), num_channels (optional), (with_delta + 1) * num_feature_filters)
     :rtype: numpy.ndarray
@@ -1048,10 +1060,10 @@ class ExtractAudioFeatures:
     self.join_frames = join_frames
     if norm_mean is not None:
       if not isinstance(norm_mean, (int, float)):
-        norm_mean = self._load_feature_vec(norm_mean)
+        norm_mean = self._load_feature_vec(norm_mean, stats_key="mean")
     if norm_std_dev is not None:
       if not isinstance(norm_std_dev, (int, float)):
-        norm_std_dev = self._load_feature_vec(norm_std_dev)
+        norm_std_dev = self._load_feature_vec(norm_std_dev, stats_key="std_dev")
     self.norm_mean = norm_mean
     self.norm_std_dev = norm_std_dev
     if random_permute and not isinstance(random_permute, CollectionReadCheckCovered):
@@ -1071,10 +1083,14 @@ class ExtractAudioFeatures:
     self.num_channels = num_channels
     self.raw_ogg_opts = raw_ogg_opts
     self.peak_normalization = peak_normalization
+    assert feature_backend in ("librosa", "numpy"), "invalid feature_backend %r" % (feature_backend,)
+    self.feature_backend = feature_backend
+    self.pad_mode = pad_mode
 
-  def _load_feature_vec(self, value):
+  def _load_feature_vec(self, value, stats_key=None):
     """
     :param str|None value:
+    :param str|None stats_key: "mean" or "std_dev", if value is a statistics .npz file
     :return: shape (self.num_inputs,), float32
     :rtype: numpy.ndarray|str|None
     """
@@ -1083,7 +1099,13 @@ class ExtractAudioFeatures:
     if isinstance(value, str):
       if value == "per_seq":
         return value
-      value = numpy.loadtxt(value)
+      if value.endswith(".npz"):
+        from returnn.datasets.normalization_data import MeanVarianceAccumulator
+        assert stats_key in ("mean", "std_dev")
+        stats = MeanVarianceAccumulator.load(value)
+        value = stats.get_mean() if stats_key == "mean" else stats.get_std_dev()
+      else:
+        value = numpy.loadtxt(value)
     assert isinstance(value, numpy.ndarray)
     assert value.shape == (self.get_feature_dimension(),)
     return value.astype("float32")
@@ -1174,6 +1196,11 @@ class ExtractAudioFeatures:
 
       if callable(self.features):
         feature_data = self.features(random_state=self.random_state, **kwargs)
+      elif self.feature_backend == "numpy":
+        from returnn.util.sig_proc import AudioFeatureExtractor
+        audio = kwargs.pop("audio")
+        kwargs.setdefault("pad_mode", self.pad_mode)
+        feature_data = AudioFeatureExtractor.get_instance(features=self.features, **kwargs).get_features(audio)
       elif self.features == "mfcc":
         feature_data = _get_audio_features_mfcc(**kwargs)
       elif self.features == "log_mel_filterbank":
@@ -1250,6 +1277,37 @@ class ExtractAudioFeatures:
     """
     return (self.with_delta + 1) * self.num_feature_filters * (self.join_frames or 1)
 
+  def get_cache_opts(self):
+    """
+    :return: all options which determine the features, with a deterministic repr (e.g. for a feature cache),
+      or None if the features are not deterministic (random_permute, pre_process or custom features function,
+      which get the random state)
+    :rtype: dict[str]|None
+    """
+    if self.random_permute_opts and self.random_permute_opts.truth_value:
+      return None
+    if self.pre_process or callable(self.features):
+      return None
+
+    def _make_deterministic(value):
+      """
+      :param object value:
+      :rtype: object
+      """
+      if isinstance(value, numpy.ndarray):
+        return value.tolist()
+      if isinstance(value, dict):
+        return sorted([(k, _make_deterministic(v)) for (k, v) in value.items()])
+      if callable(value):
+        return "%s.%s" % (getattr(value, "__module__", None), getattr(value, "__name__", None))
+      return value
+
+    keys = [
+      "window_len", "step_len", "num_feature_filters", "with_delta", "norm_mean", "norm_std_dev",
+      "features", "feature_options", "raw_ogg_opts", "post_process", "sample_rate", "num_channels",
+      "peak_normalization", "preemphasis", "join_frames", "feature_backend", "pad_mode"]
+    return {key: _make_deterministic(getattr(self, key)) for key in keys}
+
 
 def _get_audio_linear_spectrogram(audio, sample_rate, window_len=0.025, step_len=0.010, num_feature_filters=512):
   """
@@ -1905,14 +1963,18 @@ class Vocabulary(object):
       clz = BytePairEncoding
     return clz(**opts)
 
-  def __init__(self, vocab_file, seq_postfix=None, unknown_label="UNK", num_labels=None):
+  def __init__(self, vocab_file, seq_postfix=None, unknown_label="UNK", num_labels=None, vocab_cache=False):
     """
     :param str|None vocab_file:
     :param str|None unknown_label:
     :param int num_labels: just for verification
     :param list[int]|None seq_postfix: labels will be added to the seq in self.get_seq
+    :param bool|str vocab_cache: persistent on-disk cache of the parsed vocab file, see :class:`PersistentArraysCache`.
+      True uses the default cache dir, a str specifies the cache dir.
+      Loading it is much faster than parsing the vocab file, e.g. for big vocabs in every worker process.
     """
     self.vocab_file = vocab_file
+    self.vocab_cache = vocab_cache
     self.unknown_label = unknown_label
     self.num_labels = None  # type: typing.Optional[int]  # will be set by _parse_vocab
     self.vocab = None  # type: typing.Optional[typing.Dict[str,int]]  # label->idx
@@ -1941,21 +2003,12 @@ class Vocabulary(object):
     Sets self.vocab, self.labels, self.num_labels.
     """
     filename = self.vocab_file
-    import pickle
     if filename in self._cache:
       self.vocab, self.labels = self._cache[filename]
       assert self.unknown_label is None or self.unknown_label in self.vocab
       self.num_labels = len(self.labels)
     else:
-      if filename[-4:] == ".pkl":
-        d = pickle.load(open(filename, "rb"))
-      else:
-        d = eval(open(filename, "r").read())
-        if not PY3:
-          # Any utf8 string will not be a unicode string automatically, so enforce this.
-          assert isinstance(d, dict)
-          from returnn.util.basic import py2_utf8_str_to_unicode
-          d = {py2_utf8_str_to_unicode(s): i for (s, i) in d.items()}
+      d = self._load_vocab_dict()
       assert isinstance(d, dict)
       assert self.unknown_label is None or self.unknown_label in d
       labels = {idx: label for (label, idx) in sorted(d.items())}
@@ -1970,6 +2023,68 @@ class Vocabulary(object):
       self.labels = [label for (idx, label) in sorted(labels.items())]
       self._cache[filename] = (self.vocab, self.labels)
 
+  def _read_vocab_dict(self):
+    """
+    Parses the vocab file.
+
+    :return: label -> idx
+    :rtype: dict[str,int]
+    """
+    filename = self.vocab_file
+    if filename[-4:] == ".pkl":
+      import pickle
+      d = pickle.load(open(filename, "rb"))
+    else:
+      d = eval(open(filename, "r").read())
+      if not PY3:
+        # Any utf8 string will not be a unicode string automatically, so enforce this.
+        assert isinstance(d, dict)
+        from returnn.util.basic import py2_utf8_str_to_unicode
+        d = {py2_utf8_str_to_unicode(s): i for (s, i) in d.items()}
+    assert isinstance(d, dict)
+    return d
+
+  def _load_vocab_dict(self):
+    """
+    :return: label -> idx, via the vocab cache if enabled
+    :rtype: dict[str,int]
+    """
+    if not self.vocab_cache:
+      return self._read_vocab_dict()
+    cache = PersistentArraysCache(
+      name="vocab", source_files=[self.vocab_file],
+      cache_dir=self.vocab_cache if isinstance(self.vocab_cache, str) else None)
+    return self._vocab_dict_from_arrays(cache.get(lambda: self._vocab_dict_to_arrays(self._read_vocab_dict())))
+
+  @staticmethod
+  def _vocab_dict_to_arrays(d):
+    """
+    Represents the vocab dict as a sorted string table.
+
+    :param dict[str,int] d: label -> idx
+    :return: "labels": the sorted labels, concatenated, utf8 encoded, "offsets": str offsets in there, "ids"
+    :rtype: dict[str,numpy.ndarray]
+    """
+    labels = sorted(d.keys())
+    offsets = numpy.zeros((len(labels) + 1,), dtype="int64")
+    offsets[1:] = numpy.cumsum([len(label) for label in labels])
+    return {
+      "labels": numpy.frombuffer("".join(labels).encode("utf8"), dtype="uint8"),
+      "offsets": offsets,
+      "ids": numpy.array([d[label] for label in labels], dtype="int64")}
+
+  @staticmethod
+  def _vocab_dict_from_arrays(arrays):
+    """
+    :param dict[str,numpy.ndarray] arrays: see :func:`_vocab_dict_to_arrays`
+    :return: label -> idx
+    :rtype: dict[str,int]
+    """
+    labels_str = arrays["labels"].tobytes().decode("utf8")
+    offsets = arrays["offsets"].tolist()
+    labels = [labels_str[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+    return dict(zip(labels, arrays["ids"].tolist()))
+
   @classmethod
   def create_vocab_dict_from_labels(cls, labels):
     """
@@ -2019,6 +2134,45 @@ class Vocabulary(object):
       return [self.vocab.get(k, self.unknown_label_id) for k in seq]
     return [self.vocab[k] for k in seq]
 
+  def get_seqs(self, sentences):
+    """
+    Like :func:`get_seq`, but for a batch of sentences at once, which is faster.
+
+    :param list[str] sentences:
+    :return: int32 arrays
+    :rtype: list[numpy.ndarray]
+    """
+    return self.get_seqs_indices([sentence.split() for sentence in sentences])
+
+  def get_seqs_indices(self, seqs):
+    """
+    Like :func:`get_seq_indices` for every seq, but with a single lookup over all labels of the batch.
+    Also adds the seq postfix, like :func:`get_seq`.
+
+    :param list[list[str]] seqs:
+    :return: int32 arrays
+    :rtype: list[numpy.ndarray]
+    """
+    import itertools
+    if not seqs:
+      return []
+    labels = list(itertools.chain.from_iterable(seqs))
+    if self.unknown_label is not None:
+      indices = map(self.vocab.get, labels, itertools.repeat(self.unknown_label_id, len(labels)))
+    else:
+      indices = map(self.vocab.__getitem__, labels)
+    indices = numpy.fromiter(indices, dtype="int32", count=len(labels))
+    seq_lens = numpy.array([len(seq) for seq in seqs], dtype="int64")
+    postfix = numpy.array(self.seq_postfix, dtype="int32")
+    out_seq_ends = numpy.cumsum(seq_lens + len(postfix))
+    out = numpy.empty((out_seq_ends[-1],), dtype="int32")
+    is_label = numpy.ones(out.shape, dtype="bool")
+    postfix_pos = (out_seq_ends - len(postfix))[:, None] + numpy.arange(len(postfix))[None, :]  # (batch,postfix)
+    out[postfix_pos] = postfix[None, :]
+    is_label[postfix_pos] = False
+    out[is_label] = indices
+    return numpy.split(out, out_seq_ends[:-1])
+
   def get_seq_labels(self, seq):
     """
     :param list[int] seq:
@@ -2037,14 +2191,16 @@ class BytePairEncoding(Vocabulary):
   Proceedings of the 54th Annual Meeting of the Association for Computational Linguistics (ACL 2016). Berlin, Germany.
   """
 
-  def __init__(self, vocab_file, bpe_file, seq_postfix=None, unknown_label="UNK"):
+  def __init__(self, vocab_file, bpe_file, seq_postfix=None, unknown_label="UNK", vocab_cache=False):
     """
     :param str vocab_file:
     :param str bpe_file:
     :param list[int]|None seq_postfix: labels will be added to the seq in self.get_seq
     :param str|None unknown_label:
+    :param bool|str vocab_cache: see :class:`Vocabulary`
     """
-    super(BytePairEncoding, self).__init__(vocab_file=vocab_file, seq_postfix=seq_postfix, unknown_label=unknown_label)
+    super(BytePairEncoding, self).__init__(
+      vocab_file=vocab_file, seq_postfix=seq_postfix, unknown_label=unknown_label, vocab_cache=vocab_cache)
     from returnn.util.bpe import StandardBytePairEncoder
     self.bpe = StandardBytePairEncoder(bpe_codes_file=bpe_file, labels=self.labels)
 
@@ -2057,6 +2213,13 @@ class BytePairEncoding(Vocabulary):
     seq = self.get_seq_indices(segments)
     return seq + self.seq_postfix
 
+  def get_seqs(self, sentences):
+    """
+    :param list[str] sentences:
+    :rtype: list[numpy.ndarray]
+    """
+    return self.get_seqs_indices(self.bpe.segment_sentences(sentences))
+
 
 class SamplingBytePairEncoding(Vocabulary):
   """
@@ -2065,15 +2228,16 @@ class SamplingBytePairEncoding(Vocabulary):
   This will encode the text on-the-fly with BPE.
   """
 
-  def __init__(self, vocab_file, breadth_prob, seq_postfix=None, unknown_label="UNK"):
+  def __init__(self, vocab_file, breadth_prob, seq_postfix=None, unknown_label="UNK", vocab_cache=False):
     """
     :param str vocab_file:
     :param float breadth_prob:
     :param list[int]|None seq_postfix: labels will be added to the seq in self.get_seq
     :param str|None unknown_label:
+    :param bool|str vocab_cache: see :class:`Vocabulary`
     """
     super(SamplingBytePairEncoding, self).__init__(
-      vocab_file=vocab_file, seq_postfix=seq_postfix, unknown_label=unknown_label)
+      vocab_file=vocab_file, seq_postfix=seq_postfix, unknown_label=unknown_label, vocab_cache=vocab_cache)
     from returnn.util.bpe import SamplingBytePairEncoder
     self.rnd = numpy.random.RandomState(0)
     self.bpe = SamplingBytePairEncoder(
@@ -2094,6 +2258,13 @@ class SamplingBytePairEncoding(Vocabulary):
     seq = self.get_seq_indices(segments)
     return seq + self.seq_postfix
 
+  def get_seqs(self, sentences):
+    """
+    :param list[str] sentences:
+    :rtype: list[numpy.ndarray]
+    """
+    return self.get_seqs_indices([self.bpe.segment_sentence(sentence) for sentence in sentences])
+
 
 class CharacterTargets(Vocabulary):
   """
@@ -2101,13 +2272,15 @@ class CharacterTargets(Vocabulary):
   Also see :class:`Utf8ByteTargets`.
   """
 
-  def __init__(self, vocab_file, seq_postfix=None, unknown_label="@"):
+  def __init__(self, vocab_file, seq_postfix=None, unknown_label="@", vocab_cache=False):
     """
     :param str vocab_file:
     :param list[int]|None seq_postfix: labels will be added to the seq in self.get_seq
     :param str|None unknown_label:
+    :param bool|str vocab_cache: see :class:`Vocabulary`
     """
-    super(CharacterTargets, self).__init__(vocab_file=vocab_file, seq_postfix=seq_postfix, unknown_label=unknown_label)
+    super(CharacterTargets, self).__init__(
+      vocab_file=vocab_file, seq_postfix=seq_postfix, unknown_label=unknown_label, vocab_cache=vocab_cache)
 
   def get_seq(self, sentence):
     """
@@ -2120,6 +2293,13 @@ class CharacterTargets(Vocabulary):
       seq = [self.vocab[k] for k in sentence]
     return seq + self.seq_postfix
 
+  def get_seqs(self, sentences):
+    """
+    :param list[str] sentences:
+    :rtype: list[numpy.ndarray]
+    """
+    return self.get_seqs_indices([list(sentence) for sentence in sentences])
+
 
 class Utf8ByteTargets(Vocabulary):
   """
@@ -2152,6 +2332,16 @@ class Utf8ByteTargets(Vocabulary):
       seq = list(bytearray(sentence.encode("utf8")))
     return seq + self.seq_postfix
 
+  def get_seqs(self, sentences):
+    """
+    :param list[str] sentences:
+    :rtype: list[numpy.ndarray]
+    """
+    postfix = numpy.array(self.seq_postfix, dtype="int32")
+    return [
+      numpy.concatenate([numpy.frombuffer(sentence.encode("utf8"), dtype="uint8").astype("int32"), postfix])
+      for sentence in sentences]
+
 
 class BlissDataset(CachedDataset2):
   """
@@ -2649,12 +2839,15 @@ class OggZipDataset(CachedDataset2):
   however, it does not have to match the real duration in any way.
   """
 
+  TargetsBatchSize = 100  # num seqs for which the targets are encoded at once, see _encode_targets_batch
+
   def __init__(self, path, audio, targets,
                targets_post_process=None,
                use_cache_manager=False, segment_file=None,
                zip_audio_files_have_name_as_prefix=True,
                fixed_random_seed=None, fixed_random_subset=None,
                epoch_wise_filter=None,
+               feature_cache=None,
                **kwargs):
     """
     :param str|list[str] path: filename to zip
@@ -2670,6 +2863,12 @@ class OggZipDataset(CachedDataset2):
       If given, will use this random subset. This will be applied initially at loading time,
       i.e. not dependent on the epoch. It will use an internally hardcoded fixed random seed, i.e. it's deterministic.
     :param dict|None epoch_wise_filter: see init_seq_order
+    :param bool|str|None feature_cache: persistent on-disk cache for the audio features,
+      see :class:`PersistentSeqArraysCache`. True uses the default cache dir, a str specifies the cache dir.
+      There is one cache per zip file and feature options, which can be shared between multiple training jobs
+      on the same host. It is filled lazily, or via ``tools/precompute-feature-cache.py``.
+      Without zip file, the cache also depends on the mtime and size of all the audio files.
+      This needs deterministic features, i.e. no random_permute or pre_process.
     """
     import os
     import zipfile
@@ -2742,10 +2941,29 @@ class OggZipDataset(CachedDataset2):
     else:
       self.num_outputs["data"] = [0, 2]
     self._data = self._collect_data()
+    self._feature_caches = None  # type: typing.Optional[typing.List[PersistentSeqArraysCache]]  # per zip file
+    if feature_cache:
+      assert self.feature_extractor, "%s: feature_cache needs audio features" % self
+      cache_opts = self.feature_extractor.get_cache_opts()
+      assert cache_opts is not None, (
+        "%s: feature_cache needs deterministic features (no random_permute or pre_process)" % self)
+      if self._zip_files is not None:
+        source_files = self.paths
+      else:
+        source_files = ["%s/%s.txt" % (self.paths[0], self._names[0])]
+        # The audio files are not covered by the txt file.
+        cache_opts = dict(cache_opts, audio_files=self._get_audio_files_hash())
+      self._feature_caches = [
+        PersistentSeqArraysCache(
+          name="ogg_zip_features", source_files=[fn], opts=cache_opts,
+          cache_dir=feature_cache if isinstance(feature_cache, str) else None)
+        for fn in source_files]
     if fixed_random_subset:
       self._filter_fixed_random_subset(fixed_random_subset)
+    self._seq_lens_by_duration = None  # type: typing.Optional[numpy.ndarray]  # see init_seq_order
     self.epoch_wise_filter = EpochWiseFilter(epoch_wise_filter) if epoch_wise_filter else None
     self._seq_order = None  # type: typing.Optional[typing.List[int]]
+    self._targets_batch = {}  # type: typing.Dict[int,numpy.ndarray]  # seq_idx -> targets, see _encode_targets_batch
     self.init_seq_order()
 
   def _read(self, filename, zip_index):
@@ -2806,6 +3024,23 @@ class OggZipDataset(CachedDataset2):
       data = self._collect_data_part(0)
     return data
 
+  def _get_audio_files_hash(self):
+    """
+    Only without zip file, where the audio files are separate files.
+
+    :return: hash over all audio files (name, mtime, size), e.g. for the feature cache
+    :rtype: str
+    """
+    import hashlib
+    import os
+    assert self._zip_files is None
+    h = hashlib.sha1()
+    for seq in self._data:
+      audio_fn = self._get_audio_filename(seq)
+      st = os.stat("%s/%s" % (self.paths[0], audio_fn))
+      h.update(("%s %r %i\n" % (audio_fn, st.st_mtime, st.st_size)).encode("utf8"))
+    return h.hexdigest()
+
   def _read_segment_list(self, segment_file):
     """
     read a list of segment names in either plain text or gzip
@@ -2844,11 +3079,19 @@ class OggZipDataset(CachedDataset2):
     :rtype: bool
     :returns whether the order changed (True is always safe to return)
     """
+    if self._feature_caches:
+      num_hits = sum([cache.num_hits for cache in self._feature_caches])
+      num_misses = sum([cache.num_misses for cache in self._feature_caches])
+      if num_hits or num_misses:
+        print("%s: feature cache: %i hits, %i misses" % (self, num_hits, num_misses), file=log.v4)
+      for cache in self._feature_caches:
+        cache.num_hits = cache.num_misses = 0
     super(OggZipDataset, self).init_seq_order(epoch=epoch, seq_list=seq_list, seq_order=seq_order)
     if not epoch:
       epoch = 1
     random_seed = self._fixed_random_seed or self._get_random_seed_for_epoch(epoch=epoch)
     self._audio_random.seed(random_seed)
+    self._targets_batch = {}
     if self.targets:
       self.targets.set_random_seed(random_seed)
 
@@ -2862,6 +3105,16 @@ class OggZipDataset(CachedDataset2):
       """
       return int(self._data[i]["duration"] * 100)
 
+    def get_seq_lens():
+      """
+      Like get_seq_len, but for all seqs at once.
+      :rtype: numpy.ndarray
+      """
+      if self._seq_lens_by_duration is None:
+        durations = numpy.fromiter((seq["duration"] for seq in self._data), dtype="float64", count=len(self._data))
+        self._seq_lens_by_duration = (durations * 100).astype("int64")
+      return self._seq_lens_by_duration
+
     if seq_order is not None:
       self._seq_order = seq_order
     elif seq_list is not None:
@@ -2875,10 +3128,11 @@ class OggZipDataset(CachedDataset2):
     else:
       num_seqs = len(self._data)
       self._seq_order = self.get_seq_order_for_epoch(
-        epoch=epoch, num_seqs=num_seqs, get_seq_len=get_seq_len)
+        epoch=epoch, num_seqs=num_seqs, get_seq_len=get_seq_len, get_seq_lens=get_seq_lens)
       if self.epoch_wise_filter:
         self.epoch_wise_filter.debug_msg_prefix = str(self)
-        self._seq_order = self.epoch_wise_filter.filter(epoch=epoch, seq_order=self._seq_order, get_seq_len=get_seq_len)
+        self._seq_order = self.epoch_wise_filter.filter(
+          epoch=epoch, seq_order=self._seq_order, get_seq_len=get_seq_len, get_seq_lens=get_seq_lens)
     self._num_seqs = len(self._seq_order)
 
     return True
@@ -2948,19 +3202,34 @@ class OggZipDataset(CachedDataset2):
         return [self.feature_extractor.num_channels, self.feature_extractor.get_feature_dimension()]
     return super(OggZipDataset, self).get_data_shape(key)
 
+  def _encode_targets_batch(self, start_seq_idx):
+    """
+    Encodes the targets of the next seqs of this epoch at once, via :func:`Vocabulary.get_seqs`,
+    which is faster than encoding each seq on its own.
+
+    :param int start_seq_idx:
+    """
+    seq_idxs = range(start_seq_idx, max(min(start_seq_idx + self.TargetsBatchSize, self._num_seqs), start_seq_idx + 1))
+    targets_txts = []
+    for seq_idx in seq_idxs:
+      targets_txt = self._data[self._get_ref_seq_idx(seq_idx)]["text"]
+      if self.targets_post_process:
+        targets_txt = self.targets_post_process(targets_txt)
+      targets_txts.append(targets_txt)
+    self._targets_batch = dict(zip(seq_idxs, self.targets.get_seqs(targets_txts)))
+
   def _get_transcription(self, seq_idx):
     """
     :param int seq_idx:
     :return: (targets (e.g. bpe), txt)
-    :rtype: (list[int], str)
+    :rtype: (numpy.ndarray|list[int], str)
     """
     seq = self._data[self._get_ref_seq_idx(seq_idx)]
     raw_targets_txt = seq["text"]
-    targets_txt = raw_targets_txt
     if self.targets:
-      if self.targets_post_process:
-        targets_txt = self.targets_post_process(targets_txt)
-      targets_seq = self.targets.get_seq(targets_txt)
+      if seq_idx not in self._targets_batch:
+        self._encode_targets_batch(seq_idx)
+      targets_seq = self._targets_batch[seq_idx]
     else:
       targets_seq = []
     return targets_seq, raw_targets_txt
@@ -2972,13 +3241,38 @@ class OggZipDataset(CachedDataset2):
     """
     import io
     seq = self._data[self._get_ref_seq_idx(seq_idx)]
-    if self.zip_audio_files_have_name_as_prefix:
-      audio_fn = "%s/%s" % (self._names[seq['_zip_file_index']], seq["file"])
-    else:
-      audio_fn = seq["file"]
-    raw_bytes = self._read(audio_fn, seq['_zip_file_index'])
+    raw_bytes = self._read(self._get_audio_filename(seq), seq['_zip_file_index'])
     return io.BytesIO(raw_bytes)
 
+  def _get_audio_filename(self, seq):
+    """
+    :param dict[str] seq: entry of self._data
+    :return: filename in the zip file, or relative to the dir of the txt file without zip
+    :rtype: str
+    """
+    if self.zip_audio_files_have_name_as_prefix:
+      return "%s/%s" % (self._names[seq['_zip_file_index']], seq["file"])
+    return seq["file"]
+
+  def _get_audio_features(self, seq_idx, seq_tag):
+    """
+    :param int seq_idx:
+    :param str seq_tag:
+    :return: features, via the feature cache if enabled (then read-only)
+    :rtype: numpy.ndarray
+    """
+    def _extract():
+      """
+      :rtype: numpy.ndarray
+      """
+      with self._open_audio_file(seq_idx) as audio_file:
+        return self.feature_extractor.get_audio_features_from_raw_bytes(audio_file, seq_name=seq_tag)
+
+    if not self._feature_caches:
+      return _extract()
+    seq = self._data[self._get_ref_seq_idx(seq_idx)]
+    return self._feature_caches[seq["_zip_file_index"]].get(seq["file"], _extract)
+
   def _collect_single_seq(self, seq_idx):
     """
     :param int seq_idx:
@@ -2986,8 +3280,7 @@ class OggZipDataset(CachedDataset2):
     """
     seq_tag = self.get_tag(seq_idx)
     if self.feature_extractor:
-      with self._open_audio_file(seq_idx) as audio_file:
-        features = self.feature_extractor.get_audio_features_from_raw_bytes(audio_file, seq_name=seq_tag)
+      features = self._get_audio_features(seq_idx, seq_tag=seq_tag)
     else:
       features = numpy.zeros(())  # currently the API requires some dummy values...
     targets, txt = self._get_transcription(seq_idx)
@@ -6,7 +6,6 @@ Provides :class:`HDFDataset`.
 from __future__ import print_function
 import typing
 import collections
-import gc
 import h5py
 import numpy
 from .cached import CachedDataset
@@ -29,17 +28,24 @@ class HDFDataset(CachedDataset):
   This was the main original dataset format of RETURNN.
   """
 
-  def __init__(self, files=None, use_cache_manager=False, **kwargs):
+  def __init__(self, files=None, use_cache_manager=False, use_memmap=False, **kwargs):
     """
-    :param None|list[str] files:
+    :param None|list[str] files: HDF files, or manifests (see :func:`write_hdf_manifest`) with a list of HDF files
     :param bool use_cache_manager: uses :func:`Util.cf` for files
+    :param bool use_memmap: get_data returns read-only views into a :class:`numpy.memmap` of the file,
+      i.e. there is no copy and no h5py call per seq, and multiple processes share the OS page cache.
+      This only works for contiguous uncompressed HDF datasets, as written by :class:`HDFDatasetWriter`
+      (or after ``h5repack -l CONTI``). Other HDF datasets are still read via h5py.
+      This needs cache_byte_size=0.
     """
     super(HDFDataset, self).__init__(**kwargs)
-    assert self.partition_epoch == 1 or self.cache_byte_size_total_limit == 0, (
-      "To use partition_epoch in HDFDatasets, disable caching by setting cache_byte_size=0")
+    assert not use_memmap or self.seq_cache is None, (
+      "To use use_memmap in HDFDatasets, disable caching by setting cache_byte_size=0")
     self._use_cache_manager = use_cache_manager
+    self._use_memmap = use_memmap
     self.files = []  # type: typing.List[str]  # file names
     self.h5_files = []  # type: typing.List[h5py.File]
+    self.file_memmaps = []  # type: typing.List[typing.Dict[str,numpy.memmap]]  # per file, data key -> memmap
     self.file_start = [0]
     self.file_seq_start = []  # type: typing.List[numpy.ndarray]
     self.data_dtype = {}  # type: typing.Dict[str,str]
@@ -56,6 +62,7 @@ class HDFDataset(CachedDataset):
       except Exception:  # e.g. at shutdown. but does not matter
         pass
     del self.h5_files[:]
+    del self.file_memmaps[:]
     del self.file_seq_start[:]
 
   @staticmethod
@@ -81,6 +88,10 @@ class HDFDataset(CachedDataset):
     Use load_seqs() to load the actual data.
     :type filename: str
     """
+    if filename.endswith(".manifest"):
+      for filename_ in read_hdf_manifest(filename):
+        self.add_file(filename_)
+      return
     if self._use_cache_manager:
       from returnn.util.basic import cf
       filename = cf(filename)
@@ -96,6 +107,7 @@ class HDFDataset(CachedDataset):
         "expected " + str(len(self.labels['classes'])) + " got " + str(len(labels)))
     self.files.append(filename)
     self.h5_files.append(fin)
+    self.file_memmaps.append(self._open_memmaps(filename, fin) if self._use_memmap else {})
     print("parsing file", filename, file=log.v5)
     if 'times' in fin:
       if self.timestamps is None:
@@ -139,9 +151,6 @@ class HDFDataset(CachedDataset):
     for i in range(1, len(seq_lengths[0])):
       self._num_codesteps[i - 1] += numpy.sum(seq_lengths[:, i])
 
-    if not self._seq_start:
-      self._seq_start = [numpy.zeros((seq_lengths.shape[1],), 'int64')]
-
     # May be large, so better delete them early, we don't need them anymore.
     del seq_lengths
 
@@ -189,7 +198,7 @@ class HDFDataset(CachedDataset):
     if 'targets' in fin:
       for name in self.target_keys:
         self.data_dtype[str(name)] = str(fin['targets/data'][name].dtype)
-        self.targets[str(name)] = None
+        self.targets[str(name)] = None  # only to register the key
         if str(name) not in self.num_outputs:
           ndim = len(fin['targets/data'][name].shape)
           dim = 1 if ndim == 1 else fin['targets/data'][name].shape[-1]
@@ -197,71 +206,43 @@ class HDFDataset(CachedDataset):
     self.data_dtype["data"] = str(fin['inputs'].dtype)
     assert len(self.target_keys) == len(self.file_seq_start[0][0]) - 1
 
-  def _load_seqs(self, start, end):
-    """
-    Load data sequences.
-    As a side effect, will modify / fill-up:
-      self.alloc_intervals
-      self.targets
-      self.chars
+  def _open_memmaps(self, filename, fin):
+    """
+    :param str filename:
+    :param h5py.File fin:
+    :return: data key -> memmap, for all the HDF datasets which can be memory-mapped
+    :rtype: dict[str,numpy.memmap]
+    """
+    datasets = {"data": fin["inputs"]}
+    if "targets" in fin:
+      datasets.update({k: fin["targets/data"][k] for k in fin["targets/data"]})
+    memmaps = {}
+    for key, dataset in sorted(datasets.items()):
+      assert isinstance(dataset, h5py.Dataset)
+      # The offset is None if the storage is not contiguous (e.g. chunked) or not allocated.
+      offset = dataset.id.get_offset()
+      if offset is None or dataset.chunks is not None or dataset.external or dataset.dtype.hasobject:
+        print("%s: cannot memory-map %r in %s, will read it via h5py" % (self, dataset.name, filename), file=log.v3)
+        continue
+      memmaps[key] = numpy.memmap(filename, dtype=dataset.dtype, mode="r", offset=offset, shape=dataset.shape)
+    return memmaps
 
-    :param int start: start sorted seq idx
-    :param int end: end sorted seq idx
+  def _load_seq_by_real_idx(self, real_seq_idx):
     """
-    assert start < self.num_seqs
-    assert end <= self.num_seqs
-    if self.cache_byte_size_total_limit == 0:
-      # Just don't use the alloc intervals, or any of the other logic. Just load it on the fly when requested.
-      return
-    selection = self.insert_alloc_interval(start, end)
-    assert len(selection) <= end - start, (
-      "DEBUG: more sequences requested (" + str(len(selection)) + ") as required (" + str(end-start) + ")")
-    self.preload_set |= set(range(start, end)) - set(selection)
-    file_info = [[] for _ in range(len(self.files))]  # type: typing.List[typing.List[typing.Tuple[int,int]]]
-    # file_info[i] is (sorted seq idx from selection, real seq idx)
-    for idc in selection:
-      if self.sample(idc):
-        ids = self._seq_index[idc]
-        file_info[self._get_file_index(ids)].append((idc, ids))
-      else:
-        self.preload_set.add(idc)
-    for i in range(len(self.files)):
-      if len(file_info[i]) == 0:
-        continue
-      if start == 0 or self.cache_byte_size_total_limit > 0:  # suppress with disabled cache
-        print("loading file %d/%d (seq range %i-%i)" % (i+1, len(self.files), start, end), self.files[i], file=log.v4)
-      fin = self.h5_files[i]
-      inputs = fin['inputs']
-      targets = None
-      if 'targets' in fin:
-        targets = {k: fin['targets/data/' + k] for k in fin['targets/data']}
-      for idc, ids in file_info[i]:
-        s = ids - self.file_start[i]
-        p = self.file_seq_start[i][s]
-        q = self.file_seq_start[i][s + 1]
-        if 'targets' in fin:
-          for k in fin['targets/data']:
-            if self.targets[k] is None:
-              self.targets[k] = numpy.zeros(
-                (self._num_codesteps[self.target_keys.index(k)],) + targets[k].shape[1:], dtype=self.data_dtype[k]) - 1
-            ldx = self.target_keys.index(k) + 1
-            self.targets[k][self.get_seq_start(idc)[ldx]:self.get_seq_start(idc)[ldx] + q[ldx] - p[ldx]] = (
-              targets[k][p[ldx]:q[ldx]])
-        self._set_alloc_intervals_data(idc, data=inputs[p[0]:q[0]])
-        self.preload_set.add(idc)
-    gc.collect()
+    :param int real_seq_idx:
+    :return: data key -> data, for the seq cache
+    :rtype: dict[str,numpy.ndarray]
+    """
+    return {key: self._get_data_by_real_idx(real_seq_idx, key) for key in self.get_data_keys()}
 
-  def get_data(self, seq_idx, key):
+  def _get_data_by_real_idx(self, real_seq_idx, key):
     """
-    :param int seq_idx:
+    Directly reads the data from the file. This does not apply the window.
+
+    :param int real_seq_idx:
     :param str key:
     :rtype: numpy.ndarray
     """
-    if self.cache_byte_size_total_limit > 0:  # Use the cache?
-      return super(HDFDataset, self).get_data(seq_idx, key)
-
-    # Otherwise, directly read it from file now.
-    real_seq_idx = self._seq_index[seq_idx]
     file_idx = self._get_file_index(real_seq_idx)
     fin = self.h5_files[file_idx]
 
@@ -269,36 +250,33 @@ class HDFDataset(CachedDataset):
     start_pos = self.file_seq_start[file_idx][real_file_seq_idx]
     end_pos = self.file_seq_start[file_idx][real_file_seq_idx + 1]
 
+    memmaps = self.file_memmaps[file_idx]
     if key == "data":
-      inputs = fin['inputs']
+      inputs = memmaps["data"] if "data" in memmaps else fin['inputs']
       data = inputs[start_pos[0]:end_pos[0]]
-      if self.window > 1:
-        data = self._sliding_window(data)
     else:
       assert 'targets' in fin
-      targets = fin['targets/data/' + key]
+      targets = memmaps[key] if key in memmaps else fin['targets/data/' + key]
       ldx = self.target_keys.index(key) + 1
       data = targets[start_pos[ldx]:end_pos[ldx]]
+    if isinstance(data, numpy.memmap):
+      data = numpy.asarray(data)  # plain ndarray view, no copy
     return data
 
-  def get_input_data(self, sorted_seq_idx):
+  def get_data(self, seq_idx, key):
     """
-    :param int sorted_seq_idx:
+    :param int seq_idx:
+    :param str key:
     :rtype: numpy.ndarray
     """
-    if self.cache_byte_size_total_limit > 0:  # Use the cache?
-      return super(HDFDataset, self).get_input_data(sorted_seq_idx)
-    return self.get_data(sorted_seq_idx, "data")
+    if self.seq_cache is not None:  # Use the cache?
+      return super(HDFDataset, self).get_data(seq_idx, key)
 
-  def get_targets(self, target, sorted_seq_idx):
-    """
-    :param str target:
-    :param int sorted_seq_idx:
-    :rtype: numpy.ndarray
-    """
-    if self.cache_byte_size_total_limit > 0:  # Use the cache?
-      return super(HDFDataset, self).get_targets(target, sorted_seq_idx)
-    return self.get_data(sorted_seq_idx, target)
+    # Otherwise, directly read it from file now.
+    data = self._get_data_by_real_idx(self._seq_index[seq_idx], key)
+    if key == "data" and self.window > 1:
+      data = self._sliding_window(data)
+    return data
 
   def get_estimated_seq_length(self, seq_idx):
     """
@@ -306,7 +284,7 @@ class HDFDataset(CachedDataset):
     :rtype: int
     :returns sequence length of "data", used for sequence sorting
     """
-    real_seq_idx = self._seq_index[self._index_map[seq_idx]]
+    real_seq_idx = self._seq_index[seq_idx]
     return int(self._get_seq_length_by_real_idx(real_seq_idx)[0])
 
   def _get_seq_length_by_real_idx(self, real_seq_idx):
@@ -323,6 +301,13 @@ class HDFDataset(CachedDataset):
 
     return end_pos - start_pos
 
+  def _get_all_seq_lengths_by_real_idx(self):
+    """
+    :returns lengths of all sequences, by real seq idx, shape (num_seqs, len(target_keys) + 1)
+    :rtype: numpy.ndarray
+    """
+    return numpy.concatenate([numpy.diff(seq_start, axis=0) for seq_start in self.file_seq_start], axis=0)
+
   def _get_tag_by_real_idx(self, real_seq_idx):
     file_idx = self._get_file_index(real_seq_idx)
     real_file_seq_idx = real_seq_idx - self.file_start[file_idx]
@@ -336,7 +321,7 @@ class HDFDataset(CachedDataset):
     :param int sorted_seq_idx:
     :rtype: str
     """
-    ids = self._seq_index[self._index_map[sorted_seq_idx]]
+    ids = self._seq_index[sorted_seq_idx]
     return self._get_tag_by_real_idx(ids)
 
   def get_all_tags(self):
@@ -953,9 +938,14 @@ class SimpleHDFWriter:
   which can be read later by :class:`HDFDataset`.
 
   Note that we dump to a temp file first, and only at :func:`close` we move it over to the real destination.
+  The inserted seqs are buffered in memory, and written in one go (one resize per HDF dataset)
+  once the buffer exceeds ``write_buffer_size``.
   """
 
-  def __init__(self, filename, dim, labels=None, ndim=None, extra_type=None, swmr=False, extend_existing_file=False):
+  DefaultWriteBufferSize = 16 * 1024 * 1024
+
+  def __init__(self, filename, dim, labels=None, ndim=None, extra_type=None, swmr=False, extend_existing_file=False,
+               write_buffer_size=DefaultWriteBufferSize):
     """
     :param str filename: Create file, truncate if exists
     :param int|None dim:
@@ -964,6 +954,7 @@ class SimpleHDFWriter:
     :param dict[str,(int,int,str)]|None extra_type: key -> (dim,ndim,dtype)
     :param bool swmr: see http://docs.h5py.org/en/stable/swmr.html
     :param bool extend_existing_file: True also means we expect that it exists
+    :param int write_buffer_size: in bytes. 0 means to write after each :func:`insert_batch`
     """
     from returnn.util.basic import hdf5_strings, unicode
     import tempfile
@@ -1023,6 +1014,14 @@ class SimpleHDFWriter:
       dt = h5py.special_dtype(vlen=unicode)
       self._seq_tags = self._file.create_dataset('seqTags', (0,), dtype=dt, maxshape=(None,))
 
+    self._num_seqs = int(self._file.attrs['numSeqs'])  # including the pending seqs
+    self._num_timesteps = int(self._file.attrs['numTimesteps'])  # including the pending seqs
+    self.write_buffer_size = write_buffer_size
+    self._pending_data = {}  # type: typing.Dict[str,typing.List[numpy.ndarray]]  # key -> data, not written yet
+    self._pending_num_bytes = 0
+    self._pending_seq_lengths = []  # type: typing.List[typing.List[int]]  # per seq, by data_key_idx
+    self._pending_seq_tags = []  # type: typing.List[typing.Union[str,bytes]]
+
     self._extra_num_time_steps = {}  # type: typing.Dict[str,int]  # key -> num-steps
     self._prepared_extra = set()
     if extra_type:
@@ -1081,10 +1080,59 @@ class SimpleHDFWriter:
       self._seq_lengths.resize(1 + len(self._prepared_extra), axis=1)
     return bool(added_count)
 
+  def _add_pending_data(self, name, raw_data):
+    """
+    :param str name: HDF dataset key, e.g. "inputs"
+    :param numpy.ndarray raw_data: we copy it, as this might be a view into the batch of the caller
+    """
+    raw_data = numpy.array(raw_data)
+    self._pending_data.setdefault(name, []).append(raw_data)
+    self._pending_num_bytes += raw_data.nbytes
+
+  def _get_pending_seq_lengths(self):
+    """
+    :return: seq lengths of the current (last inserted) seq, by data_key_idx, with all the columns
+    :rtype: list[int]
+    """
+    seq_lengths = self._pending_seq_lengths[-1]
+    num_columns = 1 + len(self._prepared_extra)
+    if len(seq_lengths) < num_columns:
+      seq_lengths.extend([0] * (num_columns - len(seq_lengths)))
+    return seq_lengths
+
+  def _flush(self):
+    """
+    Writes all the pending data, with one resize per HDF dataset.
+    """
+    for name, pending in sorted(self._pending_data.items()):
+      data = numpy.concatenate(pending, axis=0) if len(pending) > 1 else pending[0]
+      hdf_data = self._datasets[name]
+      offset = hdf_data.shape[0]
+      hdf_data.resize(offset + data.shape[0], axis=0)
+      hdf_data[offset:] = data
+    self._pending_data.clear()
+    self._pending_num_bytes = 0
+
+    if self._pending_seq_lengths:
+      num_seqs = len(self._pending_seq_lengths)
+      seq_lengths = numpy.zeros((num_seqs, self._seq_lengths.shape[1]), dtype=self._seq_lengths.dtype)
+      for i, seq_lengths_ in enumerate(self._pending_seq_lengths):
+        seq_lengths[i, :len(seq_lengths_)] = seq_lengths_
+      offset = self._seq_lengths.shape[0]
+      self._seq_lengths.resize(offset + num_seqs, axis=0)
+      self._seq_lengths[offset:] = seq_lengths
+      self._seq_tags.resize(offset + num_seqs, axis=0)
+      self._seq_tags[offset:] = numpy.array(self._pending_seq_tags, dtype=self._seq_tags.dtype)
+      del self._pending_seq_lengths[:]
+      del self._pending_seq_tags[:]
+
+    self._file.attrs['numTimesteps'] = self._num_timesteps
+    self._file.attrs['numSeqs'] = self._num_seqs
+
   def _insert_h5_inputs(self, raw_data):
     """
     Inserts a record into the hdf5-file.
-    Resizes if necessary.
+    The data is buffered, see :func:`_flush`.
 
     :param numpy.ndarray raw_data: shape=(time,data) or shape=(time,)
     """
@@ -1095,14 +1143,10 @@ class SimpleHDFWriter:
       self._datasets[name] = self._file[name]
     if name not in self._datasets:
       self._datasets[name] = self._file.create_dataset(
-        name, raw_data.shape, raw_data.dtype, maxshape=tuple(None for _ in raw_data.shape))
-    else:
-      old_shape = self._datasets[name].shape
-      self._datasets[name].resize(old_shape[0] + raw_data.shape[0], axis=0)
-    # append raw data to dataset
-    self._datasets[name][self._file.attrs['numTimesteps']:] = raw_data
-    self._file.attrs['numTimesteps'] += raw_data.shape[0]
-    self._file.attrs['numSeqs'] += 1
+        name, (0,) + raw_data.shape[1:], raw_data.dtype, maxshape=tuple(None for _ in raw_data.shape))
+    self._add_pending_data(name, raw_data)
+    self._num_timesteps += raw_data.shape[0]
+    self._num_seqs += 1
 
   def _insert_h5_other(self, data_key, raw_data, dtype=None, add_time_dim=False, dim=None):
     """
@@ -1127,8 +1171,8 @@ class SimpleHDFWriter:
         dim = 1  # dummy
 
     # We assume that _insert_h5_inputs was called before.
-    assert self._file.attrs['numSeqs'] > 0 and self._seq_lengths.shape[0] > 0
-    seq_idx = self._file.attrs['numSeqs'] - 1
+    assert self._num_seqs > 0 and self._pending_seq_lengths
+    seq_idx = self._num_seqs - 1
 
     if raw_data.dtype == numpy.object:
       # Is this a string?
@@ -1141,17 +1185,14 @@ class SimpleHDFWriter:
       # Thus, seq_lengths might have become invalid. Reinit them.
       assert seq_idx == 0 or self.extend_existing_file  # We can only do that in the beginning.
       for data_key_idx_0, data_key_ in enumerate(sorted(self._prepared_extra)):
-        self._seq_lengths[seq_idx, data_key_idx_0 + 1] = self._extra_num_time_steps[data_key_]
+        self._get_pending_seq_lengths()[data_key_idx_0 + 1] = self._extra_num_time_steps[data_key_]
 
     self._extra_num_time_steps[data_key] += raw_data.shape[0]
-    self._datasets[data_key].resize(self._extra_num_time_steps[data_key], axis=0)
 
     data_key_idx = sorted(self._prepared_extra).index(data_key) + 1
-    self._seq_lengths[seq_idx, data_key_idx] = raw_data.shape[0]
+    self._get_pending_seq_lengths()[data_key_idx] = raw_data.shape[0]
 
-    offset = self._extra_num_time_steps[data_key] - raw_data.shape[0]
-    hdf_data = self._datasets[data_key]
-    hdf_data[offset:] = raw_data
+    self._add_pending_data(data_key, raw_data)
 
   def insert_batch(self, inputs, seq_len, seq_tag, extra=None):
     """
@@ -1186,12 +1227,8 @@ class SimpleHDFWriter:
       assert all([n_batch == value.shape[0] for value in extra.values()]), (
         "n_batch %i, extra shapes: %r" % (n_batch, {key: value.shape for (key, value) in extra.items()}))
 
-    seqlen_offset = self._seq_lengths.shape[0]
-    self._seq_lengths.resize(seqlen_offset + n_batch, axis=0)
-    self._seq_tags.resize(seqlen_offset + n_batch, axis=0)
-
     for i in range(n_batch):
-      self._seq_tags[seqlen_offset + i] = numpy.array(seq_tag[i], dtype=self._seq_tags.dtype)
+      self._pending_seq_tags.append(seq_tag[i])
       # Note: Currently, our HDFDataset does not support to have multiple axes with dynamic length.
       # Thus, we flatten all together, and calculate the flattened seq len.
       # (Ignore this if there is only a single time dimension.)
@@ -1200,7 +1237,7 @@ class SimpleHDFWriter:
       flat_shape = [flat_seq_len]
       if self.dim and not sparse:
         flat_shape.append(self.dim)
-      self._seq_lengths[seqlen_offset + i, 0] = flat_seq_len
+      self._pending_seq_lengths.append([flat_seq_len])
       data = inputs[i]
       data = data[tuple([slice(None, seq_len[axis][i]) for axis in range(ndim_with_seq_len)])]
       data = numpy.reshape(data, flat_shape)
@@ -1224,6 +1261,9 @@ class SimpleHDFWriter:
             file=log.v3)
           raise
 
+    if self._pending_num_bytes >= self.write_buffer_size:
+      self._flush()
+
   def close(self):
     """
     Closes the file.
@@ -1231,6 +1271,7 @@ class SimpleHDFWriter:
     import os
     import shutil
     if self._file:
+      self._flush()
       self._file.close()
       self._file = None
     if self.tmp_filename:
@@ -1244,6 +1285,52 @@ class SimpleHDFWriter:
       self.tmp_filename = None
 
 
+def write_hdf_manifest(filename, hdf_filenames):
+  """
+  A manifest is a text file with a list of HDF files, one per line, relative to the manifest.
+  It can be used in ``HDFDataset(files=[...])`` as a replacement for the list of HDF files,
+  e.g. for the parts of a sharded dump (see ``tools/hdf_dump.py``).
+
+  :param str filename: should end with ".manifest"
+  :param list[str] hdf_filenames:
+  """
+  import os
+  assert filename.endswith(".manifest")
+  base_dir = os.path.dirname(os.path.abspath(filename))
+  with open(filename, "w") as f:
+    for hdf_filename in hdf_filenames:
+      f.write("%s\n" % os.path.relpath(os.path.abspath(hdf_filename), base_dir))
+
+
+def read_hdf_manifest(filename):
+  """
+  :param str filename: see :func:`write_hdf_manifest`
+  :return: list of HDF files
+  :rtype: list[str]
+  """
+  import os
+  base_dir = os.path.dirname(filename)
+  with open(filename, "r") as f:
+    return [os.path.join(base_dir, line.strip()) for line in f.read().splitlines() if line.strip()]
+
+
+def _copy_in_blocks(src, dst, dst_offset=0, block_num_bytes=64 * 1024 * 1024):
+  """
+  Copies src into dst along the first axis, block-wise, such that we never have all the data in memory.
+
+  :param numpy.ndarray|h5py.Dataset src: e.g. a :class:`numpy.memmap`
+  :param h5py.Dataset dst:
+  :param int dst_offset: along the first axis of dst
+  :param int block_num_bytes:
+  """
+  num_frames = src.shape[0]
+  frame_num_bytes = max(int(numpy.prod(src.shape[1:])) * src.dtype.itemsize, 1)
+  block_len = max(block_num_bytes // frame_num_bytes, 1)
+  for start in range(0, num_frames, block_len):
+    end = min(start + block_len, num_frames)
+    dst[dst_offset + start:dst_offset + end] = src[start:end]
+
+
 class HDFDatasetWriter:
   """
   Similar as :class:`SimpleHDFWriter`, but is mostly intended to copy an existing dataset,
@@ -1269,15 +1356,29 @@ class HDFDatasetWriter:
     """
     :param Dataset dataset: could be any dataset implemented as child of Dataset
     :param int epoch: for dataset
-    :param int start_seq:
+    :param int start_seq: if the dataset has corpus seq indices, it is initialized with only the dumped seqs.
+      otherwise the seqs before are loaded (sequential datasets need that) but not dumped
     :param int|float end_seq:
     :param bool use_progress_bar:
     """
+    import os
+    import shutil
+    import tempfile
     from returnn.util.basic import NumbersDict, human_size, progress_bar_with_time, try_run, PY3
     hdf_dataset = self.file
 
     print("Work on epoch: %i" % epoch, file=log.v3)
     dataset.init_seq_order(epoch)
+    if start_seq > 0 and dataset.have_corpus_seq_idx():
+      # Init the dataset with only the seqs we dump, such that we do not need to go through the seqs before.
+      seq_order = []
+      seq_idx = start_seq
+      while dataset.is_less_than_num_seqs(seq_idx) and seq_idx <= end_seq:
+        seq_order.append(dataset.get_corpus_seq_idx(seq_idx))
+        seq_idx += 1
+      assert seq_order, "%s: no seqs in range %i to %s" % (dataset, start_seq, end_seq)
+      dataset.init_seq_order(epoch, seq_order=seq_order)
+      start_seq, end_seq = 0, len(seq_order) - 1
 
     data_keys = sorted(dataset.get_data_keys())
     print("Data keys:", data_keys, file=log.v3)
@@ -1310,14 +1411,10 @@ class HDFDatasetWriter:
       hdf_data_key_map["data"] = "classes"  # Replace "data" which is reserved for input key in HDFDataset.
       assert "classes" not in hdf_data_key_map
 
-    # We need to do one run through the dataset to collect some stats like total len.
-    print("Collect stats, iterate through all data...", file=log.v3)
-    seq_idx = start_seq
-    seq_idxs = []
-    seq_tags = []
-    seq_lens = []
-    total_seq_len = NumbersDict(0)
-    max_tag_len = 0
+    # We do only a single run through the dataset.
+    # The data is written to temporary raw files, and we collect the seq lens and tags.
+    # Once we know the total lens, we create the (contiguous) HDF datasets and copy the raw data over.
+    print("Iterate through all data...", file=log.v3)
     dataset_num_seqs = try_run(lambda: dataset.num_seqs, default=None)  # can be unknown
     if end_seq != float("inf"):
       if dataset_num_seqs is not None:
@@ -1327,104 +1424,137 @@ class HDFDatasetWriter:
     if dataset_num_seqs is not None:
       dataset_num_seqs -= start_seq
       assert dataset_num_seqs > 0
-    while dataset.is_less_than_num_seqs(seq_idx) and seq_idx <= end_seq:
-      seq_idxs += [seq_idx]
-      dataset.load_seqs(seq_idx, seq_idx + 1)
-      seq_len = dataset.get_seq_length(seq_idx)
-      seq_lens += [seq_len]
-      tag = dataset.get_tag(seq_idx)
-      seq_tags += [tag]
-      max_tag_len = max(len(tag), max_tag_len)
-      total_seq_len += seq_len
-      if use_progress_bar and dataset_num_seqs is not None:
-        progress_bar_with_time(float(seq_idx - start_seq) / dataset_num_seqs)
-      seq_idx += 1
-    num_seqs = len(seq_idxs)
-
-    assert num_seqs > 0
-    shapes = {}
-    for data_key in data_keys:
-      assert data_key in total_seq_len.dict
-      shape = [total_seq_len[data_key]]
-      shape += dataset.get_data_shape(data_key)
-      print("Total len of %r is %s, shape %r, dtype %s" % (
-        data_key, human_size(shape[0]), shape, dataset.get_data_dtype(data_key)), file=log.v3)
-      shapes[data_key] = shape
-
-    print("Set seq tags...", file=log.v3)
-    hdf_dataset.create_dataset('seqTags', shape=(num_seqs,), dtype="S%i" % (max_tag_len + 1))
-    for i, tag in enumerate(seq_tags):
-      hdf_dataset['seqTags'][i] = numpy.array(tag, dtype="S%i" % (max_tag_len + 1))
-      if use_progress_bar:
-        progress_bar_with_time(float(i) / num_seqs)
-
-    print("Set seq len info...", file=log.v3)
-    hdf_dataset.create_dataset(attr_seqLengths, shape=(num_seqs, 2), dtype="int32")
-    for i, seq_len in enumerate(seq_lens):
-      data_len = seq_len[default_data_input_key]
-      targets_len = seq_len[default_data_target_key]
-      for data_key in data_target_keys:
-        assert seq_len[data_key] == targets_len, "different lengths in multi-target not supported"
-      if targets_len is None:
-        targets_len = data_len
-      hdf_dataset[attr_seqLengths][i] = [data_len, targets_len]
-      if use_progress_bar:
-        progress_bar_with_time(float(i) / num_seqs)
-
-    print("Create arrays in HDF...", file=log.v3)
-    hdf_dataset.create_group('targets/data')
-    hdf_dataset.create_group('targets/size')
-    hdf_dataset.create_group('targets/labels')
-    for data_key in data_keys:
-      if data_key == default_data_input_key:
-        hdf_dataset.create_dataset(
-          'inputs', shape=shapes[data_key], dtype=dataset.get_data_dtype(data_key))
-      else:
-        hdf_dataset['targets/data'].create_dataset(
-          hdf_data_key_map[data_key], shape=shapes[data_key], dtype=dataset.get_data_dtype(data_key))
-        hdf_dataset['targets/size'].attrs[hdf_data_key_map[data_key]] = dataset.num_outputs[data_key]
-      if data_key in dataset.labels:
-        labels = dataset.labels[data_key]
-        if PY3:
-          labels = [label.encode("utf8") for label in labels]
-        assert len(labels) == dataset.num_outputs[data_key][0]
-      else:
-        labels = ["%s-class-%i" % (data_key, i) for i in range(dataset.get_data_dim(data_key))]
-      print("Labels for %s:" % data_key, labels[:3], "...", file=log.v5)
-      max_label_len = max(map(len, labels))
-      if data_key != default_data_input_key:
-        hdf_dataset['targets/labels'].create_dataset(hdf_data_key_map[data_key],
-                                                     (len(labels),), dtype="S%i" % (max_label_len + 1))
-        for i, label in enumerate(labels):
-          hdf_dataset['targets/labels'][hdf_data_key_map[data_key]][i] = numpy.array(
-            label, dtype="S%i" % (max_label_len + 1))
-
-    # Again iterate through dataset, and set the data
-    print("Write data...", file=log.v3)
-    dataset.init_seq_order(epoch)
-    offsets = NumbersDict(0)
-    for seq_idx, tag in zip(seq_idxs, seq_tags):
-      dataset.load_seqs(seq_idx, seq_idx + 1)
-      tag_ = dataset.get_tag(seq_idx)
-      assert tag == tag_  # Just a check for sanity. We expect the same order.
-      seq_len = dataset.get_seq_length(seq_idx)
+    tmp_dir = tempfile.mkdtemp(
+      prefix=".%s.tmp" % os.path.basename(self.filename), dir=os.path.dirname(self.filename) or ".")
+    try:
+      raw_files = {data_key: open("%s/%s.raw" % (tmp_dir, data_key), "wb") for data_key in data_keys}
+      data_shapes = {data_key: tuple(dataset.get_data_shape(data_key)) for data_key in data_keys}
+      data_dtypes = {data_key: numpy.dtype(dataset.get_data_dtype(data_key)) for data_key in data_keys}
+      # Without corpus seq indices, the dataset might only support sequential loading (e.g. GeneratingDataset,
+      # where each seq depends on the random state after the previous seqs),
+      # thus we go through the seqs before start_seq and skip them.
+      seq_idx = 0
+      while seq_idx < start_seq and dataset.is_less_than_num_seqs(seq_idx):
+        dataset.load_seqs(seq_idx, seq_idx + 1)
+        seq_idx += 1
+      seq_tags = []  # type: typing.List[bytes]
+      seq_lens = []  # type: typing.List[typing.Tuple[int,int]]  # (data_len, targets_len)
+      total_seq_len = NumbersDict(0)
+      while dataset.is_less_than_num_seqs(seq_idx) and seq_idx <= end_seq:
+        dataset.load_seqs(seq_idx, seq_idx + 1)
+        seq_len = dataset.get_seq_length(seq_idx)
+        seq_tags.append(dataset.get_tag(seq_idx).encode("utf8"))
+        data_len = seq_len[default_data_input_key]
+        targets_len = seq_len[default_data_target_key]
+        for data_key in data_target_keys:
+          assert seq_len[data_key] == targets_len, "different lengths in multi-target not supported"
+        if targets_len is None:
+          targets_len = data_len
+        seq_lens.append((data_len, targets_len))
+        for data_key in data_keys:
+          data = numpy.ascontiguousarray(dataset.get_data(seq_idx, data_key), dtype=data_dtypes[data_key])
+          assert data.shape == (seq_len[data_key],) + data_shapes[data_key], "seq %i, data %r: unexpected shape %r" % (
+            seq_idx, data_key, data.shape)
+          raw_files[data_key].write(data.tobytes())
+        total_seq_len += seq_len
+        if use_progress_bar and dataset_num_seqs is not None:
+          progress_bar_with_time(float(seq_idx - start_seq) / dataset_num_seqs)
+        seq_idx += 1
+      for raw_file in raw_files.values():
+        raw_file.close()
+      num_seqs = len(seq_tags)
+      assert num_seqs > 0
+
+      print("Set seq tags and seq len info...", file=log.v3)
+      max_tag_len = max(map(len, seq_tags))
+      hdf_dataset.create_dataset('seqTags', data=numpy.array(seq_tags, dtype="S%i" % (max_tag_len + 1)))
+      hdf_dataset.create_dataset(attr_seqLengths, data=numpy.array(seq_lens, dtype="int32").reshape((num_seqs, 2)))
+
+      print("Create arrays in HDF...", file=log.v3)
+      hdf_dataset.create_group('targets/data')
+      hdf_dataset.create_group('targets/size')
+      hdf_dataset.create_group('targets/labels')
       for data_key in data_keys:
+        shape = (total_seq_len[data_key],) + data_shapes[data_key]
+        print("Total len of %r is %s, shape %r, dtype %s" % (
+          data_key, human_size(shape[0]), shape, data_dtypes[data_key]), file=log.v3)
         if data_key == default_data_input_key:
-          hdf_data = hdf_dataset['inputs']
+          hdf_data = hdf_dataset.create_dataset('inputs', shape=shape, dtype=data_dtypes[data_key])
         else:
-          hdf_data = hdf_dataset['targets/data'][hdf_data_key_map[data_key]]
-        data = dataset.get_data(seq_idx, data_key)
-        hdf_data[offsets[data_key]:offsets[data_key] + seq_len[data_key]] = data
-
-      if use_progress_bar:
-        progress_bar_with_time(float(offsets[default_data_input_key]) / total_seq_len[default_data_input_key])
-
-      offsets += seq_len
-
-    assert offsets == total_seq_len  # Sanity check.
+          hdf_data = hdf_dataset['targets/data'].create_dataset(
+            hdf_data_key_map[data_key], shape=shape, dtype=data_dtypes[data_key])
+          hdf_dataset['targets/size'].attrs[hdf_data_key_map[data_key]] = dataset.num_outputs[data_key]
+        if data_key in dataset.labels:
+          labels = dataset.labels[data_key]
+          if PY3:
+            labels = [label.encode("utf8") for label in labels]
+          assert len(labels) == dataset.num_outputs[data_key][0]
+        else:
+          labels = ["%s-class-%i" % (data_key, i) for i in range(dataset.get_data_dim(data_key))]
+        print("Labels for %s:" % data_key, labels[:3], "...", file=log.v5)
+        max_label_len = max(map(len, labels))
+        if data_key != default_data_input_key:
+          hdf_dataset['targets/labels'].create_dataset(
+            hdf_data_key_map[data_key], data=numpy.array(labels, dtype="S%i" % (max_label_len + 1)))
+
+        print("Write data %r..." % data_key, file=log.v3)
+        if shape[0] > 0:
+          raw_data = numpy.memmap(
+            "%s/%s.raw" % (tmp_dir, data_key), dtype=data_dtypes[data_key], mode="r", shape=shape)
+          _copy_in_blocks(src=raw_data, dst=hdf_data)
+          del raw_data
+    finally:
+      shutil.rmtree(tmp_dir)
 
     # Set some old-format attribs. Not needed for newer RETURNN versions.
     hdf_dataset.attrs[attr_inputPattSize] = dataset.num_inputs
     hdf_dataset.attrs[attr_numLabels] = dataset.num_outputs.get(default_data_target_key, (0, 0))[0]
 
     print("All done.", file=log.v3)
+
+  def merge_from_files(self, filenames, use_progress_bar=True):
+    """
+    Concatenates the HDF files written by :func:`dump_from_dataset` (e.g. the parts of a sharded dump),
+    in the given order, into this file.
+
+    :param list[str] filenames:
+    :param bool use_progress_bar:
+    """
+    from returnn.util.basic import progress_bar_with_time
+    hdf_dataset = self.file
+    in_files = [h5py.File(filename, "r") for filename in filenames]
+    try:
+      print("Merge %i files..." % len(in_files), file=log.v3)
+      seq_tags = [tag for in_file in in_files for tag in in_file['seqTags'][...].tolist()]
+      max_tag_len = max(map(len, seq_tags))
+      hdf_dataset.create_dataset('seqTags', data=numpy.array(seq_tags, dtype="S%i" % (max_tag_len + 1)))
+      hdf_dataset.create_dataset(
+        attr_seqLengths, data=numpy.concatenate([in_file[attr_seqLengths][...] for in_file in in_files], axis=0))
+
+      first = in_files[0]
+      hdf_dataset.create_group('targets/data')
+      hdf_dataset.create_group('targets/size')
+      hdf_dataset.create_group('targets/labels')
+      for key, value in first['targets/size'].attrs.items():
+        hdf_dataset['targets/size'].attrs[key] = value
+      for key in first['targets/labels']:
+        hdf_dataset['targets/labels'].create_dataset(key, data=first['targets/labels'][key][...])
+      for key, value in first.attrs.items():
+        hdf_dataset.attrs[key] = value
+
+      names = ['inputs'] + ['targets/data/%s' % key for key in sorted(first['targets/data'])]
+      for i, name in enumerate(names):
+        srcs = [in_file[name] for in_file in in_files]
+        dst = hdf_dataset.create_dataset(
+          name, shape=(sum([src.shape[0] for src in srcs]),) + srcs[0].shape[1:], dtype=srcs[0].dtype)
+        offset = 0
+        for src in srcs:
+          assert src.shape[1:] == dst.shape[1:] and src.dtype == dst.dtype, "%s: mismatch %r vs %r" % (name, src, dst)
+          _copy_in_blocks(src=src, dst=dst, dst_offset=offset)
+          offset += src.shape[0]
+        if use_progress_bar:
+          progress_bar_with_time(float(i + 1) / len(names))
+    finally:
+      for in_file in in_files:
+        in_file.close()
+    print("All done.", file=log.v3)
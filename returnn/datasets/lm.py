@@ -14,6 +14,7 @@ from .cached2 import CachedDataset2
 import gzip
 import xml.etree.ElementTree as ElementTree
 from returnn.util.basic import parse_orthography, parse_orthography_into_symbols, load_json, BackendEngine, unicode
+from returnn.util.basic import PersistentArraysCache
 from returnn.log import log
 import numpy
 import time
@@ -62,10 +63,16 @@ class LmDataset(CachedDataset2):
     The LmDataset does not work without providing a vocabulary with any of the above mentioned ways.
 
     After initialization, the corpus is represented by self.orths (as a list of sequences).
+    For big corpora, the corpus can be converted once to token ids
+    (see :func:`convert_corpus_to_token_corpus` and ``tools/lm-corpus-to-tokens.py``),
+    and ``corpus_file`` can then be the resulting directory.
+    The token ids are memory-mapped, i.e. the corpus is not loaded into memory and not parsed again,
+    and self.orths is None in that case.
     The vocabulary is given by self.orth_symbols and self.orth_symbols_map gives the corresponding
     mapping from symbol to integer index (in case ``phone_info`` is not set).
 
     :param str|()->str|list[str]|()->list[str] corpus_file: Bliss XML or line-based txt. optionally can be gzip.
+      or a token corpus directory, see :func:`convert_corpus_to_token_corpus`.
     :param str|()->str|None orth_symbols_file: a text file containing a list of orthography symbols
     :param str|()->str|None orth_symbols_map_file: either a list of orth symbols, each line: "<symbol> <index>",
                                                    or a pickled dictionary
@@ -123,7 +130,7 @@ class LmDataset(CachedDataset2):
       self.orth_symbols = orth_symbols
       self.labels["data"] = orth_symbols
       self.seq_gen = None
-    if orth_symbols_map_file and orth_symbols_map_file.endswith('.pkl'):
+    elif orth_symbols_map_file and orth_symbols_map_file.endswith('.pkl'):
       import pickle
       with open(orth_symbols_map_file, 'rb') as f:
         self.orth_symbols_map = pickle.load(f)
@@ -201,15 +208,24 @@ class LmDataset(CachedDataset2):
       self.num_outputs["delayed"] = self.num_outputs["data"]
       self.labels["delayed"] = self.labels["data"]
 
-    if isinstance(corpus_file, list):  # If a list of files is provided, concatenate all.
+    self.orths = None  # type: typing.Optional[typing.List[str]]
+    self._token_corpus = None  # type: typing.Optional[TokenCorpus]
+    if isinstance(corpus_file, str) and TokenCorpus.is_token_corpus(corpus_file):
+      assert not self.seq_gen, "LmDataset: token corpus %r does not support phone_info" % corpus_file
+      self._token_corpus = TokenCorpus(corpus_file)
+      self._token_corpus.check_vocab(num_labels=num_labels)
+      num_corpus_seqs = self._token_corpus.num_seqs
+    elif isinstance(corpus_file, list):  # If a list of files is provided, concatenate all.
       self.orths = []
       for file_name in corpus_file:
         self.orths += read_corpus(file_name)
+      num_corpus_seqs = len(self.orths)
     else:
       self.orths = read_corpus(corpus_file)
+      num_corpus_seqs = len(self.orths)
     # It's only estimated because we might filter some out or so.
-    self._estimated_num_seqs = len(self.orths) // self.partition_epoch
-    print("  done, loaded %i sequences" % len(self.orths), file=log.v4)
+    self._estimated_num_seqs = num_corpus_seqs // self.partition_epoch
+    print("  done, loaded %i sequences" % num_corpus_seqs, file=log.v4)
 
     self.next_orth_idx = 0
     self.next_seq_idx = 0
@@ -263,9 +279,14 @@ class LmDataset(CachedDataset2):
       self.seq_order = seq_order
     elif seq_list is not None:
       self.seq_order = [int(s[len(self._tag_prefix):]) for s in seq_list]
+    elif self._token_corpus is not None:
+      seq_lens = self._token_corpus.get_seq_lens()
+      self.seq_order = self.get_seq_order_for_epoch(
+        epoch=epoch, num_seqs=len(seq_lens), get_seq_len=lambda i: seq_lens[i], get_seq_lens=lambda: seq_lens)
     else:
       self.seq_order = self.get_seq_order_for_epoch(
-        epoch=epoch, num_seqs=len(self.orths), get_seq_len=lambda i: len(self.orths[i]))
+        epoch=epoch, num_seqs=len(self.orths), get_seq_len=lambda i: len(self.orths[i]),
+        get_seq_lens=lambda: numpy.fromiter(map(len, self.orths), dtype="int64", count=len(self.orths)))
     self.next_orth_idx = 0
     self.next_seq_idx = 0
     self.num_skipped = 0
@@ -292,6 +313,104 @@ class LmDataset(CachedDataset2):
     if not self.log_auto_replace_unknown_symbols:
       print("LmDataset: will stop logging about auto-replace with unknown symbol now", file=log.v4)
 
+  def _orth_to_class_idxs(self, orth):
+    """
+    :param str orth:
+    :return: class idxs, or None if the seq should be skipped
+    :rtype: numpy.ndarray|None
+    """
+    if self.seq_gen:
+      try:
+        phones = self.seq_gen.generate_seq(orth)
+      except KeyError as e:
+        if self.log_skipped_seqs:
+          print("LmDataset: skipping sequence %r because of missing lexicon entry: %s" % (orth, e), file=log.v4)
+          self._reduce_log_skipped_seqs()
+        if self.error_on_invalid_seq:
+          raise Exception("LmDataset: invalid seq %r, missing lexicon entry %r" % (orth, e))
+        self.num_skipped += 1
+        return None
+      return self.seq_gen.seq_to_class_idxs(phones, dtype=self.dtype)
+
+    assert self.orth_symbols
+    orth_syms = parse_orthography(orth, **self.parse_orth_opts)
+    while True:
+      orth_syms = sum([self.orth_replace_map.get(s, [s]) for s in orth_syms], [])
+      i = 0
+      # For the character-based case, spaces have been replaced by word_end_symbol.
+      space_symbol = self.word_end_symbol if self.word_end_symbol and not self.word_based else " "
+      while i < len(orth_syms) - 1:
+        if orth_syms[i:i+2] == [space_symbol, space_symbol]:
+          orth_syms[i:i+2] = [space_symbol]  # collapse two spaces
+        else:
+          i += 1
+      if self.auto_replace_unknown_symbol:
+        try:
+          list(map(self.orth_symbols_map.__getitem__, orth_syms))  # convert to list to trigger map (it's lazy)
+        except KeyError as e:
+          if sys.version_info >= (3, 0):
+            orth_sym = e.args[0]
+          else:
+            # noinspection PyUnresolvedReferences
+            orth_sym = e.message
+          if self.log_auto_replace_unknown_symbols:
+            print("LmDataset: unknown orth symbol %r, adding to orth_replace_map as %r" % (
+              orth_sym, self.unknown_symbol), file=log.v3)
+            self._reduce_log_auto_replace_unknown_symbols()
+          self.orth_replace_map[orth_sym] = [self.unknown_symbol] if self.unknown_symbol is not None else []
+          continue  # try this seq again with updated orth_replace_map
+      break
+    self.num_unknown += orth_syms.count(self.unknown_symbol)
+    if self.word_based:
+      orth_debug_str = repr(orth_syms)
+    else:
+      orth_debug_str = repr("".join(orth_syms))
+    try:
+      return numpy.array(list(map(self.orth_symbols_map.__getitem__, orth_syms)), dtype=self.dtype)
+    except KeyError as e:
+      if self.log_skipped_seqs:
+        print("LmDataset: skipping sequence %s because of missing orth symbol: %s" % (orth_debug_str, e),
+              file=log.v4)
+        self._reduce_log_skipped_seqs()
+      if self.error_on_invalid_seq:
+        raise Exception("LmDataset: invalid seq %s, missing orth symbol %s" % (orth_debug_str, e))
+      self.num_skipped += 1
+      return None
+
+  def convert_corpus_to_token_corpus(self, corpus_file, output_dir):
+    """
+    Converts the corpus once to token ids, with the vocabulary and all the options of this dataset,
+    such that it can be used as a memory-mapped corpus (``corpus_file=output_dir``).
+    The corpus is streamed, i.e. it is never completely in memory.
+    Skipped seqs ("</s>" or invalid seqs) become empty seqs, to keep the corpus seq idx (and thus the seq tags).
+    See also ``tools/lm-corpus-to-tokens.py``.
+
+    :param str|list[str] corpus_file: Bliss XML or line-based txt. optionally can be gzip.
+    :param str output_dir: will be created
+    :return: number of seqs
+    :rtype: int
+    """
+    assert not self.seq_gen, "LmDataset: phone_info (random phone seqs) cannot be converted to a token corpus"
+    writer = TokenCorpusWriter(output_dir, dtype=self.dtype)
+
+    def _callback(orth):
+      """
+      :param str orth:
+      """
+      data = None
+      if orth != "</s>":
+        data = self._orth_to_class_idxs(orth)
+      writer.add_seq(data if data is not None else numpy.zeros((0,), dtype=self.dtype))
+      if writer.num_seqs % 100000 == 0:
+        print("LmDataset: converted %i seqs, %i tokens" % (writer.num_seqs, writer.num_tokens), file=log.v4)
+
+    for file_name in (corpus_file if isinstance(corpus_file, list) else [corpus_file]):
+      iter_corpus(file_name, _callback)
+    writer.close(num_labels=len(self.labels["data"]), corpus_file=corpus_file)
+    print("LmDataset: converted %i seqs (%i skipped, %i unknown symbols), %i tokens, to %r" % (
+      writer.num_seqs, self.num_skipped, self.num_unknown, writer.num_tokens, output_dir), file=log.v3)
+    return writer.num_seqs
+
   def _collect_single_seq(self, seq_idx):
     """
     :type seq_idx: int
@@ -306,72 +425,20 @@ class LmDataset(CachedDataset2):
         return None
       assert self.next_seq_idx == seq_idx, "We expect that we iterate through all seqs."
       true_idx = self.seq_order[self.next_orth_idx]
-      orth = self.orths[true_idx]  # get sequence for the next index given by seq_order
       seq_tag = (self._tag_prefix + str(true_idx))
       self.next_orth_idx += 1
-      if orth == "</s>":
-        continue  # special sentence end symbol. empty seq, ignore.
-
-      if self.seq_gen:
-        try:
-          phones = self.seq_gen.generate_seq(orth)
-        except KeyError as e:
-          if self.log_skipped_seqs:
-            print("LmDataset: skipping sequence %r because of missing lexicon entry: %s" % (orth, e), file=log.v4)
-            self._reduce_log_skipped_seqs()
-          if self.error_on_invalid_seq:
-            raise Exception("LmDataset: invalid seq %r, missing lexicon entry %r" % (orth, e))
-          self.num_skipped += 1
-          continue  # try another seq
-        data = self.seq_gen.seq_to_class_idxs(phones, dtype=self.dtype)
-
-      elif self.orth_symbols:
-        orth_syms = parse_orthography(orth, **self.parse_orth_opts)
-        while True:
-          orth_syms = sum([self.orth_replace_map.get(s, [s]) for s in orth_syms], [])
-          i = 0
-          # For the character-based case, spaces have been replaced by word_end_symbol.
-          space_symbol = self.word_end_symbol if self.word_end_symbol and not self.word_based else " "
-          while i < len(orth_syms) - 1:
-            if orth_syms[i:i+2] == [space_symbol, space_symbol]:
-              orth_syms[i:i+2] = [space_symbol]  # collapse two spaces
-            else:
-              i += 1
-          if self.auto_replace_unknown_symbol:
-            try:
-              list(map(self.orth_symbols_map.__getitem__, orth_syms))  # convert to list to trigger map (it's lazy)
-            except KeyError as e:
-              if sys.version_info >= (3, 0):
-                orth_sym = e.args[0]
-              else:
-                # noinspection PyUnresolvedReferences
-                orth_sym = e.message
-              if self.log_auto_replace_unknown_symbols:
-                print("LmDataset: unknown orth symbol %r, adding to orth_replace_map as %r" % (
-                  orth_sym, self.unknown_symbol), file=log.v3)
-                self._reduce_log_auto_replace_unknown_symbols()
-              self.orth_replace_map[orth_sym] = [self.unknown_symbol] if self.unknown_symbol is not None else []
-              continue  # try this seq again with updated orth_replace_map
-          break
-        self.num_unknown += orth_syms.count(self.unknown_symbol)
-        if self.word_based:
-          orth_debug_str = repr(orth_syms)
-        else:
-          orth_debug_str = repr("".join(orth_syms))
-        try:
-          data = numpy.array(list(map(self.orth_symbols_map.__getitem__, orth_syms)), dtype=self.dtype)
-        except KeyError as e:
-          if self.log_skipped_seqs:
-            print("LmDataset: skipping sequence %s because of missing orth symbol: %s" % (orth_debug_str, e),
-                  file=log.v4)
-            self._reduce_log_skipped_seqs()
-          if self.error_on_invalid_seq:
-            raise Exception("LmDataset: invalid seq %s, missing orth symbol %s" % (orth_debug_str, e))
-          self.num_skipped += 1
-          continue  # try another seq
 
+      if self._token_corpus is not None:
+        data = self._token_corpus.get_seq(true_idx, dtype=self.dtype)
+        if data.shape[0] == 0:
+          continue  # skipped when the corpus was converted
       else:
-        assert False
+        orth = self.orths[true_idx]  # get sequence for the next index given by seq_order
+        if orth == "</s>":
+          continue  # special sentence end symbol. empty seq, ignore.
+        data = self._orth_to_class_idxs(orth)
+        if data is None:
+          continue  # try another seq
 
       targets = {}
       for i in range(self.add_random_phone_seqs):
@@ -386,6 +453,121 @@ class LmDataset(CachedDataset2):
       return DatasetSeq(seq_idx=seq_idx, features=data, targets=targets, seq_tag=seq_tag)
 
 
+class TokenCorpusWriter:
+  """
+  Writes a token corpus (see :class:`TokenCorpus`), seq by seq.
+  """
+
+  def __init__(self, output_dir, dtype):
+    """
+    :param str output_dir: will be created
+    :param str dtype: of the token ids
+    """
+    import array
+    if not os.path.exists(output_dir):
+      os.makedirs(output_dir)
+    assert not TokenCorpus.is_token_corpus(output_dir), "TokenCorpusWriter: %r already exists" % output_dir
+    self.output_dir = output_dir
+    self.dtype = dtype
+    self.tokens_file = open(os.path.join(output_dir, TokenCorpus.TokensFilename), "wb")
+    self.offsets = array.array("q", [0])  # 8 bytes per seq, much less than a list of ints
+    self.num_seqs = 0
+    self.num_tokens = 0
+
+  def add_seq(self, data):
+    """
+    :param numpy.ndarray data: token ids, shape (time,)
+    """
+    assert data.ndim == 1
+    self.tokens_file.write(numpy.ascontiguousarray(data, dtype=self.dtype).tobytes())
+    self.num_tokens += data.shape[0]
+    self.num_seqs += 1
+    self.offsets.append(self.num_tokens)
+
+  def close(self, num_labels, **info):
+    """
+    Writes the offsets and the info file. Only after this, the token corpus is valid.
+
+    :param int num_labels: vocab size
+    :param info: any further (JSON serializable) info
+    """
+    import json
+    self.tokens_file.close()
+    with open(os.path.join(self.output_dir, TokenCorpus.OffsetsFilename), "wb") as f:
+      f.write(numpy.frombuffer(self.offsets, dtype="int64").tobytes())
+    info = dict(info, num_seqs=self.num_seqs, num_tokens=self.num_tokens, dtype=self.dtype, num_labels=num_labels)
+    with open(os.path.join(self.output_dir, TokenCorpus.InfoFilename), "w") as f:
+      json.dump(info, f, indent=2, sort_keys=True)
+      f.write("\n")
+
+
+class TokenCorpus:
+  """
+  Pre-tokenized corpus, as created by :func:`LmDataset.convert_corpus_to_token_corpus`.
+  It is a directory with a flat array of all token ids, and an array of seq offsets (int64, num_seqs + 1).
+  Both are memory-mapped, i.e. seqs are zero-copy slices and the data is read from disk on demand.
+  """
+
+  TokensFilename = "tokens.bin"
+  OffsetsFilename = "offsets.bin"
+  InfoFilename = "info.json"
+
+  @classmethod
+  def is_token_corpus(cls, path):
+    """
+    :param str path:
+    :rtype: bool
+    """
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, cls.InfoFilename))
+
+  def __init__(self, path):
+    """
+    :param str path: directory
+    """
+    assert self.is_token_corpus(path), "TokenCorpus: %r is not a (complete) token corpus" % path
+    self.path = path
+    self.info = load_json(filename=os.path.join(path, self.InfoFilename))
+    self.dtype = self.info["dtype"]
+    self.num_seqs = self.info["num_seqs"]
+    self.offsets = numpy.memmap(os.path.join(path, self.OffsetsFilename), dtype="int64", mode="r")
+    assert self.offsets.shape == (self.num_seqs + 1,)
+    if self.info["num_tokens"] > 0:
+      self.tokens = numpy.memmap(os.path.join(path, self.TokensFilename), dtype=self.dtype, mode="r")
+    else:  # mmap cannot map an empty file
+      self.tokens = numpy.zeros((0,), dtype=self.dtype)
+    assert self.tokens.shape == (self.info["num_tokens"],)
+
+  def __repr__(self):
+    return "<%s %r, %i seqs, %i tokens>" % (self.__class__.__name__, self.path, self.num_seqs, self.tokens.shape[0])
+
+  def check_vocab(self, num_labels):
+    """
+    :param int num_labels: of the dataset which uses this corpus
+    """
+    assert self.info["num_labels"] == num_labels, "%r: was created with %i labels but dataset has %i labels" % (
+      self, self.info["num_labels"], num_labels)
+
+  def get_seq_lens(self):
+    """
+    :return: seq lens, shape (num_seqs,), int64
+    :rtype: numpy.ndarray
+    """
+    return numpy.diff(self.offsets)
+
+  def get_seq(self, corpus_seq_idx, dtype=None):
+    """
+    :param int corpus_seq_idx:
+    :param str|None dtype: if given and different to the stored dtype (e.g. int8 vs uint8), we need to copy
+    :return: token ids, read-only view on the memory-mapped data
+    :rtype: numpy.ndarray
+    """
+    start, end = self.offsets[corpus_seq_idx:corpus_seq_idx + 2]
+    data = numpy.asarray(self.tokens[start:end])
+    if dtype is not None and dtype != self.dtype:
+      data = data.astype(dtype)
+    return data
+
+
 def _is_bliss(filename):
   """
   :param str filename:
@@ -1045,6 +1227,104 @@ class PhoneSeqGenerator:
     return allos
 
 
+class PackedSeqList:
+  """
+  A list of 1D seqs (e.g. token ids), packed into one flat contiguous array plus an offsets array (int64),
+  instead of one small array object per seq.
+  It can be extended (e.g. while reading a corpus), and an item is just a view on the flat array.
+  It can also be created from given (e.g. memory-mapped) arrays.
+  """
+
+  def __init__(self, dtype="int32", tokens=None, offsets=None):
+    """
+    :param str dtype: of the seqs
+    :param numpy.ndarray|None tokens: flat array of all seqs. if given, also offsets must be given
+    :param numpy.ndarray|None offsets: shape (num_seqs + 1,), seq i is tokens[offsets[i]:offsets[i + 1]]
+    """
+    if tokens is None:
+      assert offsets is None
+      tokens = numpy.zeros((1024,), dtype=dtype)
+      offsets = numpy.zeros((1024,), dtype="int64")
+      self._num_seqs = 0
+    else:
+      assert offsets is not None and offsets.ndim == 1 and offsets.shape[0] >= 1
+      assert tokens.ndim == 1 and tokens.shape[0] == offsets[-1]
+      self._num_seqs = offsets.shape[0] - 1
+    self.dtype = dtype
+    # These can be bigger than needed (the capacity), when extended.
+    self._tokens = tokens
+    self._offsets = offsets
+
+  def __repr__(self):
+    return "<%s %i seqs, %i tokens>" % (self.__class__.__name__, self._num_seqs, self.num_tokens)
+
+  def __len__(self):
+    return self._num_seqs
+
+  def __getitem__(self, idx):
+    """
+    :param int idx:
+    :return: view on the flat array, shape (time,)
+    :rtype: numpy.ndarray
+    """
+    if idx < 0:
+      idx += self._num_seqs
+    if not 0 <= idx < self._num_seqs:
+      raise IndexError("%r: index %i out of range" % (self, idx))
+    return self._tokens[self._offsets[idx]:self._offsets[idx + 1]]
+
+  @property
+  def num_tokens(self):
+    """
+    :rtype: int
+    """
+    return int(self._offsets[self._num_seqs])
+
+  def extend(self, seqs):
+    """
+    :param list[numpy.ndarray] seqs: each of shape (time,)
+    """
+    if not seqs:
+      return
+    self.extend_packed(numpy.concatenate(seqs), [seq.shape[0] for seq in seqs])
+
+  def extend_packed(self, tokens, seq_lens):
+    """
+    :param numpy.ndarray tokens: all seqs concatenated, shape (sum(seq_lens),)
+    :param list[int]|numpy.ndarray seq_lens:
+    """
+    seq_lens = numpy.asarray(seq_lens, dtype="int64")
+    assert tokens.ndim == 1 and tokens.shape[0] == seq_lens.sum()
+    new_num_seqs = self._num_seqs + seq_lens.shape[0]
+    new_num_tokens = self.num_tokens + tokens.shape[0]
+    # Grow by doubling the capacity. Views on the old arrays stay valid, as the old data is never modified.
+    if new_num_tokens > self._tokens.shape[0]:
+      new_tokens = numpy.zeros((max(new_num_tokens, 2 * self._tokens.shape[0]),), dtype=self.dtype)
+      new_tokens[:self.num_tokens] = self._tokens[:self.num_tokens]
+      self._tokens = new_tokens
+    if new_num_seqs + 1 > self._offsets.shape[0]:
+      new_offsets = numpy.zeros((max(new_num_seqs + 1, 2 * self._offsets.shape[0]),), dtype="int64")
+      new_offsets[:self._num_seqs + 1] = self._offsets[:self._num_seqs + 1]
+      self._offsets = new_offsets
+    self._tokens[self.num_tokens:new_num_tokens] = tokens
+    self._offsets[self._num_seqs + 1:new_num_seqs + 1] = self.num_tokens + numpy.cumsum(seq_lens)
+    self._num_seqs = new_num_seqs
+
+  def get_seq_lens(self):
+    """
+    :return: shape (num_seqs,), int64
+    :rtype: numpy.ndarray
+    """
+    return numpy.diff(self._offsets[:self._num_seqs + 1])
+
+  def get_arrays(self):
+    """
+    :return: tokens, offsets, without the unused capacity. e.g. to store them
+    :rtype: (numpy.ndarray, numpy.ndarray)
+    """
+    return self._tokens[:self.num_tokens], self._offsets[:self._num_seqs + 1]
+
+
 class TranslationDataset(CachedDataset2):
   """
   Based on the conventions by our team for translation datasets.
@@ -1064,6 +1344,9 @@ class TranslationDataset(CachedDataset2):
   To follow the RETURNN conventions on data input and output, the source text is mapped to the "data" key,
   and the target text to the "classes" data key. Both are index sequences.
 
+  The index sequences of each data key are stored in a :class:`PackedSeqList`.
+  With ``data_cache``, these are stored on disk after the first loading,
+  and on the next start, they are just memory-mapped, i.e. the text files are not read again.
   """
 
   source_file_prefix = "source"
@@ -1077,6 +1360,7 @@ class TranslationDataset(CachedDataset2):
                unknown_label=None,
                seq_list_file=None,
                use_cache_manager=False,
+               data_cache=False,
                **kwargs):
     """
     :param str path: the directory containing the files
@@ -1093,6 +1377,9 @@ class TranslationDataset(CachedDataset2):
     :param str seq_list_file: filename. line-separated list of line numbers defining fixed sequence order.
       multiple occurrences supported, thus allows for repeating examples while loading only once.
     :param bool use_cache_manager: uses :func:`Util.cf` for files
+    :param bool|str data_cache: persistent on-disk cache for the index sequences, see :class:`PersistentArraysCache`.
+      True uses the default cache dir, a str specifies the cache dir.
+      The cache entry depends on the text files, the vocabularies and the options.
     """
 
     super(TranslationDataset, self).__init__(**kwargs)
@@ -1115,11 +1402,13 @@ class TranslationDataset(CachedDataset2):
     self._files_to_read = [
       prefix for prefix in self._main_data_key_map.keys()
       if not (prefix == self.target_file_prefix and search_without_reference)]
-    self._data_files = {prefix: self._get_data_file(prefix) for prefix in self._files_to_read}
+    self._data_filenames = {prefix: self._get_data_filename(prefix) for prefix in self._files_to_read}
+    self._data_files = {}  # type: typing.Dict[str,typing.Optional[typing.BinaryIO]]
 
     self._data_keys = self._source_data_keys + self._target_data_keys
     self._data = {
-      data_key: [] for data_key in self._data_keys}  # type: typing.Dict[str,typing.List[numpy.ndarray]]
+      data_key: self._new_data_list()
+      for data_key in self._data_keys}  # type: typing.Dict[str,typing.Union[PackedSeqList,typing.List[numpy.ndarray]]]
     self._data_len = None  # type: typing.Optional[int]
 
     self._vocabs = self._get_vocabs()
@@ -1138,7 +1427,20 @@ class TranslationDataset(CachedDataset2):
 
     self._seq_order = None  # type: typing.Optional[typing.List[int]]  # seq_idx -> line_nr
     self._tag_prefix = "line-"  # sequence tag is "line-n", where n is the line number
-    self._thread = Thread(name="%r reader" % self, target=self._thread_main)
+
+    self._data_cache = None  # type: typing.Optional[PersistentArraysCache]
+    self._thread = None
+    if data_cache:
+      self._data_cache = PersistentArraysCache(
+        name=self.__class__.__name__, source_files=sorted(self._data_filenames.values()),
+        opts=self._get_data_cache_opts(), cache_dir=data_cache if isinstance(data_cache, str) else None)
+      if self._load_data_cache():
+        print("%r: loaded %i seqs from data cache %r" % (self, self._data_len, self._data_cache.entry_dir),
+              file=log.v4)
+        return
+
+    self._data_files = {prefix: self._open_data_file(prefix) for prefix in self._files_to_read}
+    self._thread = Thread(name="%r reader" % self, target=self._thread_main)  # type: typing.Optional[Thread]
     self._thread.daemon = True
     self._thread.start()
 
@@ -1153,19 +1455,71 @@ class TranslationDataset(CachedDataset2):
     else:
       return [self.main_target_data_key]
 
+  def _new_data_list(self):
+    """
+    :return: the (empty) container of the seqs of one data key, which will be extended in :func:`_extend_data`
+    :rtype: PackedSeqList|list[numpy.ndarray]
+    """
+    return PackedSeqList(dtype="int32")
+
+  def _get_data_cache_opts(self):
+    """
+    :return: everything the index sequences depend on, except of the text files. see ``data_cache``
+    :rtype: dict[str]
+    """
+    import hashlib
+    return {
+      "data_keys": self._data_keys,
+      "files": sorted(self._files_to_read),
+      "postfix": sorted(self._add_postfix.items()),
+      "unknown_label": sorted(self._unknown_label.items()),
+      "vocabs": {
+        key: hashlib.sha1(repr(sorted(vocab.items())).encode("utf8")).hexdigest()
+        for (key, vocab) in self._vocabs.items()}}
+
+  def _load_data_cache(self):
+    """
+    :return: whether there was a valid cache entry, and then the (memory-mapped) data is set
+    :rtype: bool
+    """
+    arrays = self._data_cache.load()
+    if arrays is None:
+      return False
+    for data_key in self._data_keys:
+      self._data[data_key] = PackedSeqList(
+        dtype="int32", tokens=arrays["%s.tokens" % data_key], offsets=arrays["%s.offsets" % data_key])
+      assert len(self._data[data_key]) == len(self._data[self.main_source_data_key])
+    self._data_len = len(self._data[self.main_source_data_key])
+    return True
+
+  def _save_data_cache(self):
+    """
+    Stores the data, and replaces it by the memory-mapped data.
+    """
+    arrays = {}
+    for data_key in self._data_keys:
+      arrays["%s.tokens" % data_key], arrays["%s.offsets" % data_key] = self._data[data_key].get_arrays()
+    arrays = self._data_cache.save(arrays)
+    with self._lock:
+      for data_key in self._data_keys:
+        self._data[data_key] = PackedSeqList(
+          dtype="int32", tokens=arrays["%s.tokens" % data_key], offsets=arrays["%s.offsets" % data_key])
+    print("%r: stored data cache %r" % (self, self._data_cache.entry_dir), file=log.v4)
+
   def _extend_data(self, file_prefix, data_strs):
     """
     :param str file_prefix: prefix of the corpus file, "source" or "target"
     :param list[bytes] data_strs: lines of text read from the corpus file
     """
+    import itertools
     data_key = self.main_source_data_key if file_prefix == self.source_file_prefix else self.main_target_data_key
 
-    data = [
-      self._words_to_numpy(data_key, (s.decode("utf8").strip() + self._add_postfix[file_prefix]).split())
-      for s in data_strs]
+    # Map all words at once, directly into the packed representation.
+    words_seqs = [(s.decode("utf8").strip() + self._add_postfix[file_prefix]).split() for s in data_strs]
+    data = self._words_to_numpy(data_key, list(itertools.chain.from_iterable(words_seqs)))
 
     with self._lock:
-      self._data[data_key].extend(data)
+      self._data[data_key].extend_packed(data, [len(words) for words in words_seqs])
 
   def _thread_main(self):
     from returnn.util.basic import interrupt_main
@@ -1173,15 +1527,10 @@ class TranslationDataset(CachedDataset2):
     try:
       import returnn.util.better_exchook
       returnn.util.better_exchook.install()
-      from returnn.util.basic import AsyncThreadRun
 
-      # First iterate once over the data to get the data len as fast as possible.
-      data_len = 0
-      while True:
-        ls = self._data_files[self.source_file_prefix].readlines(10 ** 4)
-        data_len += len(ls)
-        if not ls:
-          break
+      # First only count the lines, to get the data len as fast as possible,
+      # such that init_seq_order does not need to wait until all the data is read.
+      data_len = self._count_lines(self._data_files[self.source_file_prefix])
       with self._lock:
         self._data_len = data_len
       self._data_files[self.source_file_prefix].seek(0, os.SEEK_SET)  # we will read it again below
@@ -1189,24 +1538,51 @@ class TranslationDataset(CachedDataset2):
       # Now, read and use the vocab for a compact representation in memory.
       files_to_read = list(self._files_to_read)
       while True:
-        for file_prefix in files_to_read:
+        for file_prefix in list(files_to_read):
           data_strs = self._data_files[file_prefix].readlines(10 ** 6)
           if not data_strs:
-            assert len(self._data[self._main_data_key_map[file_prefix]]) == self._data_len
             files_to_read.remove(file_prefix)
             continue
-          assert len(self._data[self._main_data_key_map[file_prefix]]) + len(data_strs) <= self._data_len
+          assert len(self._data[self._main_data_key_map[file_prefix]]) + len(data_strs) <= data_len, (
+            "%r: %r has more lines than %r" % (
+              self, self._data_filenames[file_prefix], self._data_filenames[self.source_file_prefix]))
           self._extend_data(file_prefix, data_strs)
         if not files_to_read:
           break
       for file_prefix, file_handle in list(self._data_files.items()):
         file_handle.close()
         self._data_files[file_prefix] = None
+      for file_prefix in self._files_to_read:
+        data_key = self._main_data_key_map[file_prefix]
+        assert len(self._data[data_key]) == data_len, "%r: %r has %i lines but %r has %i lines" % (
+          self, self._data_filenames[file_prefix], len(self._data[data_key]),
+          self._data_filenames[self.source_file_prefix], data_len)
+      if self._data_cache:
+        self._save_data_cache()
 
     except Exception:
       sys.excepthook(*sys.exc_info())
       interrupt_main()
 
+  @staticmethod
+  def _count_lines(f):
+    """
+    :param typing.BinaryIO f: at the beginning of the file
+    :return: num lines, like ``len(f.readlines())``, but faster
+    :rtype: int
+    """
+    num_lines = 0
+    last_chunk = b""
+    while True:
+      chunk = f.read(2 ** 24)
+      if not chunk:
+        break
+      num_lines += chunk.count(b"\n")
+      last_chunk = chunk
+    if last_chunk and not last_chunk.endswith(b"\n"):
+      num_lines += 1
+    return num_lines
+
   def _transform_filename(self, filename):
     """
     :param str filename:
@@ -1218,21 +1594,31 @@ class TranslationDataset(CachedDataset2):
       filename = cf(filename)
     return filename
 
-  def _get_data_file(self, prefix):
+  def _get_data_filename(self, prefix):
     """
     :param str prefix: e.g. "source" or "target"
-    :return: full filename
-    :rtype: io.FileIO
+    :return: full filename, maybe with ".gz"
+    :rtype: str
     """
     import os
     filename = "%s/%s.%s" % (self.path, prefix, self.file_postfix)
     if os.path.exists(filename):
-      return open(self._transform_filename(filename), "rb")
+      return filename
     if os.path.exists(filename + ".gz"):
-      import gzip
-      return gzip.GzipFile(self._transform_filename(filename + ".gz"), "rb")
+      return filename + ".gz"
     raise Exception("Data file not found: %r (.gz)?" % filename)
 
+  def _open_data_file(self, prefix):
+    """
+    :param str prefix: e.g. "source" or "target"
+    :rtype: io.FileIO
+    """
+    filename = self._data_filenames[prefix]
+    if filename.endswith(".gz"):
+      import gzip
+      return gzip.GzipFile(self._transform_filename(filename), "rb")
+    return open(self._transform_filename(filename), "rb")
+
   def _get_vocabs(self):
     """
     :return: vocabularies for main data keys ("data" and "classes") as a dict data_key -> vocabulary
@@ -1392,9 +1778,14 @@ class TranslationDataset(CachedDataset2):
       self._seq_order = [int(s[len(self._tag_prefix):]) for s in seq_list]
     else:
       num_seqs = self._get_data_len()
+      with self._lock:
+        source_data = self._data[self.main_source_data_key]
+        # The data len is known before all the data is read. Only then we can get all seq lens at once.
+        source_data_complete = isinstance(source_data, PackedSeqList) and len(source_data) == num_seqs
       self._seq_order = self.get_seq_order_for_epoch(
         epoch=epoch, num_seqs=num_seqs,
-        get_seq_len=lambda i: len(self._get_data(key=self.main_source_data_key, line_nr=i)))
+        get_seq_len=lambda i: len(self._get_data(key=self.main_source_data_key, line_nr=i)),
+        get_seq_lens=source_data.get_seq_lens if source_data_complete else None)
     self._num_seqs = len(self._seq_order)
     return True
 
@@ -1493,6 +1884,14 @@ class TranslationFactorsDataset(TranslationDataset):
 
     return vocabs
 
+  def _get_data_cache_opts(self):
+    """
+    :rtype: dict[str]
+    """
+    opts = super(TranslationFactorsDataset, self)._get_data_cache_opts()
+    opts["factor_separator"] = self._factor_separator
+    return opts
+
   def _extend_data(self, file_prefix, data_strs):
     """
     Similar to the base class method, but handles several data streams read from one string.
@@ -1581,11 +1980,20 @@ class ConfusionNetworkDataset(TranslationDataset):
     :param str|None unknown_label: "UNK" or so. if not given, then will not replace unknowns but throw an error
     :param int max_density: the density of the confusion network: max number of arcs per slot
     """
+    assert not kwargs.get("data_cache"), "%s: data_cache not supported" % self.__class__.__name__
     self.density = max_density
     super(ConfusionNetworkDataset, self).__init__(**kwargs)
     if "sparse_weights" not in self._data.keys():
       self._data["sparse_weights"] = []
 
+  def _new_data_list(self):
+    """
+    The sparse inputs are matrices, and the weights can be None, thus we keep a list of arrays here.
+
+    :rtype: list[numpy.ndarray]
+    """
+    return []
+
   def get_data_keys(self):
     """
     :rtype: list[str]
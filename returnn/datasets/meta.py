@@ -25,11 +25,12 @@ from __future__ import print_function
 
 from returnn.datasets.basic import Dataset, DatasetSeq, init_dataset, convert_data_dims
 from .cached2 import CachedDataset2
-from returnn.util.basic import NumbersDict, load_json
+from returnn.util.basic import NumbersDict, load_json, OptionalNotImplementedError
 from returnn.log import log
 from random import Random
 import numpy
 import sys
+import time
 import typing
 
 
@@ -47,12 +48,14 @@ class EpochWiseFilter:
     self.debug_msg_prefix = debug_msg_prefix
 
   @classmethod
-  def filter_epoch(cls, opts, seq_order, get_seq_len, debug_msg_prefix):
+  def filter_epoch(cls, opts, seq_order, get_seq_len, debug_msg_prefix, get_seq_lens=None):
     """
     :param dict[str]|returnn.util.basic.CollectionReadCheckCovered opts:
     :param list[int] seq_order: list of seq idxs
-    :param ((int)->int) get_seq_len: seq idx -> len
+    :param ((int)->int)|None get_seq_len: seq idx -> len
     :param str debug_msg_prefix:
+    :param (()->numpy.ndarray)|None get_seq_lens: returns the lens of all seqs in bulk, indexed by seq idx.
+      if given, used in favor of get_seq_len
     :return: new seq_order
     :rtype: list[int]
     """
@@ -61,28 +64,34 @@ class EpochWiseFilter:
       opts = util.CollectionReadCheckCovered(opts)
     if opts.get("max_mean_len"):
       max_mean_len = opts.get("max_mean_len")
-      lens_and_seqs = numpy.array(sorted([(get_seq_len(idx), idx) for idx in seq_order]))
+      seq_order_ = numpy.asarray(seq_order, dtype="int64")
+      if get_seq_lens:
+        seq_lens = numpy.asarray(get_seq_lens(), dtype="int64")[seq_order_]
+      else:
+        seq_lens = numpy.array([get_seq_len(idx) for idx in seq_order], dtype="int64")
+      sort_idx = numpy.lexsort((seq_order_, seq_lens))  # like sorting (len, idx) tuples
+      mean_seq_lens = numpy.cumsum(seq_lens[sort_idx]) / numpy.arange(1, len(seq_lens) + 1)  # mean of first num
       best_num = util.binary_search_any(
-        cmp=lambda num: numpy.mean(lens_and_seqs[:num, 0]) - max_mean_len, low=1, high=len(lens_and_seqs) + 1)
+        cmp=lambda num: mean_seq_lens[num - 1] - max_mean_len, low=1, high=len(seq_lens) + 1)
       assert best_num is not None
-      selected_seq_idxs = set(lens_and_seqs[:best_num, 1])
       # Select subset of seq_order. Keep order as-is.
-      seq_order = [seq_idx for seq_idx in seq_order if seq_idx in selected_seq_idxs]
+      seq_order = seq_order_[numpy.isin(seq_order_, seq_order_[sort_idx[:best_num]])].tolist()
       print(
         ("%sOld mean seq len is %f, new is %f, requested max is %f."
          " Old num seqs is %i, new num seqs is %i.") %
         (debug_msg_prefix,
-         float(numpy.mean(lens_and_seqs[:, 0])), float(numpy.mean(lens_and_seqs[:best_num, 0])),
-         max_mean_len, len(lens_and_seqs), best_num),
+         float(mean_seq_lens[-1]), float(mean_seq_lens[min(best_num, len(seq_lens)) - 1]),
+         max_mean_len, len(seq_lens), best_num),
         file=log.v4)
     opts.assert_all_read()
     return seq_order
 
-  def filter(self, epoch, seq_order, get_seq_len):
+  def filter(self, epoch, seq_order, get_seq_len, get_seq_lens=None):
     """
     :param int|None epoch:
     :param list[int] seq_order: list of seq idxs
-    :param ((int)->int) get_seq_len: seq idx -> len
+    :param ((int)->int)|None get_seq_len: seq idx -> len
+    :param (()->numpy.ndarray)|None get_seq_lens: returns the lens of all seqs in bulk, indexed by seq idx
     :return: new seq_order
     """
     epoch = epoch or 1
@@ -99,7 +108,7 @@ class EpochWiseFilter:
         any_filter = True
         seq_order = self.filter_epoch(
           opts=value, debug_msg_prefix="%s, epoch %i. " % (self.debug_msg_prefix, epoch),
-          seq_order=seq_order, get_seq_len=get_seq_len)
+          seq_order=seq_order, get_seq_len=get_seq_len, get_seq_lens=get_seq_lens)
     if any_filter:
       print("%s, epoch %i. Old num seqs %i, new num seqs %i." % (
         self.debug_msg_prefix, epoch, old_num_seqs, len(seq_order)), file=log.v4)
@@ -108,6 +117,141 @@ class EpochWiseFilter:
     return seq_order
 
 
+class SubDatasets:
+  """
+  Holds the sub-datasets of a :class:`MetaDataset` or :class:`CombinedDataset`, by dataset-key.
+  Behaves like a dict, but with ``lazy=True``, a sub-dataset is only created via :func:`init_dataset`
+  when it is accessed for the first time.
+  Creation is thread-safe, with a lock per dataset-key,
+  such that different sub-datasets can be created concurrently inside :func:`init_seq_order_parallel`.
+  """
+
+  def __init__(self, opts, keys, lazy=False, name=None, on_init=None):
+    """
+    :param dict[str,dict[str]] opts: dataset-key -> dataset-kwargs
+    :param typing.Iterable[str] keys: dataset-keys which we use
+    :param bool lazy: if False, will create all datasets right away
+    :param str|None name: of the parent dataset. the sub-dataset name will be "<name>_<key>"
+    :param ((str,Dataset)->None)|None on_init: called after a sub-dataset was created
+    """
+    import threading
+    self._opts = {key: opts[key] for key in keys}
+    self._name = name
+    self._on_init = on_init
+    self._datasets = {}  # type: typing.Dict[str,Dataset]
+    self._locks = {key: threading.Lock() for key in self._opts.keys()}  # type: typing.Dict[str,threading.Lock]
+    if not lazy:
+      for key in sorted(self._opts.keys()):
+        self._create(key)
+
+  def __repr__(self):
+    return "<%s keys %r, initialized %r>" % (
+      self.__class__.__name__, sorted(self._opts.keys()), sorted(self._datasets.keys()))
+
+  def _create(self, key):
+    """
+    :param str key:
+    :rtype: Dataset
+    """
+    with self._locks[key]:
+      if key in self._datasets:
+        return self._datasets[key]
+      extra_kwargs = {"name": "%s_%s" % (self._name, key)} if self._name else None
+      dataset = init_dataset(self._opts[key], extra_kwargs=extra_kwargs)
+      assert isinstance(dataset, Dataset)
+      if self._on_init:
+        self._on_init(key, dataset)
+      self._datasets[key] = dataset
+      return dataset
+
+  def __getitem__(self, key):
+    """
+    :param str key:
+    :rtype: Dataset
+    """
+    dataset = self._datasets.get(key)
+    if dataset is None:
+      if key not in self._opts:
+        raise KeyError(key)
+      dataset = self._create(key)
+    return dataset
+
+  def __contains__(self, key):
+    return key in self._opts
+
+  def __len__(self):
+    return len(self._opts)
+
+  def __iter__(self):
+    return iter(self._opts.keys())
+
+  def keys(self):
+    """
+    :rtype: list[str]
+    """
+    return list(self._opts.keys())
+
+  def values(self):
+    """
+    This will create all sub-datasets.
+
+    :rtype: list[Dataset]
+    """
+    return [self[key] for key in self._opts.keys()]
+
+  def items(self):
+    """
+    This will create all sub-datasets.
+
+    :rtype: list[(str,Dataset)]
+    """
+    return [(key, self[key]) for key in self._opts.keys()]
+
+  def is_initialized(self, key):
+    """
+    :param str key:
+    :rtype: bool
+    """
+    return key in self._datasets
+
+  def initialized_items(self):
+    """
+    :return: only the sub-datasets which were already created
+    :rtype: list[(str,Dataset)]
+    """
+    return [(key, self._datasets[key]) for key in self._opts.keys() if key in self._datasets]
+
+
+def init_seq_order_parallel(datasets, calls, num_threads=1):
+  """
+  Calls :func:`Dataset.init_seq_order` on multiple sub-datasets.
+  With ``num_threads > 1``, this is done concurrently in a thread pool.
+  This is helpful when the sub-datasets do I/O or wait on a subprocess (e.g. HDF, OggZip, Sprint),
+  and also covers the creation of lazily initialized sub-datasets.
+
+  :param SubDatasets|dict[str,Dataset] datasets:
+  :param list[(str,dict[str])] calls: list of (dataset-key, init_seq_order kwargs)
+  :param int num_threads:
+  :return: dataset-key -> result of init_seq_order
+  :rtype: dict[str,bool]
+  """
+  def _call(key, kwargs):
+    """
+    :param str key:
+    :param dict[str] kwargs:
+    :rtype: bool
+    """
+    return datasets[key].init_seq_order(**kwargs)
+
+  if num_threads <= 1 or len(calls) <= 1:
+    return {key: _call(key, kwargs) for (key, kwargs) in calls}
+  from concurrent.futures import ThreadPoolExecutor
+  with ThreadPoolExecutor(max_workers=min(num_threads, len(calls))) as executor:
+    futures = [(key, executor.submit(_call, key, kwargs)) for (key, kwargs) in calls]
+    # result() reraises any exception from the thread
+    return {key: future.result() for (key, future) in futures}
+
+
 class MetaDataset(CachedDataset2):
   """
   The MetaDataset is to be used in the case of **Multimodality**.
@@ -182,6 +326,8 @@ class MetaDataset(CachedDataset2):
                seq_lens_file=None,
                data_dims=None,
                data_dtypes=None,  # noqa  # not used
+               lazy_init=False,
+               init_seq_order_num_threads=1,
                window=1, **kwargs):
     """
     :param dict[str,dict[str]] datasets: dataset-key -> dataset-kwargs. including keyword 'class' and maybe 'files'
@@ -200,6 +346,10 @@ class MetaDataset(CachedDataset2):
     :param dict[str,(int,int)] data_dims: self-data-key -> data-dimension, len(shape) (1 ==> sparse repr).
        Deprecated/Only to double check. Read from data if not specified.
     :param dict[str,str] data_dtypes: self-data-key -> dtype. Read from data if not specified.
+    :param bool lazy_init: create the sub-datasets only when they are accessed for the first time.
+      This only has an effect for sub-datasets which are not needed before the first init_seq_order,
+      i.e. you should also provide ``data_dims`` and ``seq_list_file``.
+    :param int init_seq_order_num_threads: if >1, init_seq_order of the sub-datasets is done in a thread pool
     """
     assert window == 1  # not implemented
     super(MetaDataset, self).__init__(**kwargs)
@@ -213,26 +363,24 @@ class MetaDataset(CachedDataset2):
     self.default_dataset_key = seq_order_control_dataset or self.data_map["data"][0]
     self.seq_order_control_dataset = seq_order_control_dataset
 
+    self.init_seq_order_num_threads = init_seq_order_num_threads
+
     # This will only initialize datasets needed for features occuring in data_map
-    self.datasets = {
-      key: init_dataset(datasets[key], extra_kwargs={"name": "%s_%s" % (self.name, key)})
-      for key in self.dataset_keys}  # type: typing.Dict[str,Dataset]
+    self.datasets = SubDatasets(
+      datasets, keys=self.dataset_keys, lazy=lazy_init, name=self.name, on_init=self._on_sub_dataset_init)
 
     self.seq_list_original = self._load_seq_list(seq_list_file)
     self.num_total_seqs = len(self.seq_list_original[self.default_dataset_key])
     for key in self.dataset_keys:
       assert len(self.seq_list_original[key]) == self.num_total_seqs
 
-    self.tag_idx = {tag: idx for (idx, tag) in enumerate(self.seq_list_original[self.default_dataset_key])}
+    self._tag_idx = None  # type: typing.Optional[typing.Dict[str,int]]  # via tag_idx, seq tag -> corpus seq idx
 
-    self._seq_lens = None  # type: typing.Optional[typing.Dict[str,NumbersDict]]
+    self._seq_lens = None  # type: typing.Optional[NumbersDict]  # data-key -> array, by corpus seq idx
     self._num_timesteps = None  # type: typing.Optional[NumbersDict]
     if seq_lens_file:
-      seq_lens = load_json(filename=seq_lens_file)
-      assert isinstance(seq_lens, dict)
-      # dict[str,NumbersDict], seq-tag -> data-key -> len
-      self._seq_lens = {tag: NumbersDict(l) for (tag, l) in seq_lens.items()}
-      self._num_timesteps = sum([self._seq_lens[s] for s in self.seq_list_original[self.default_dataset_key]])
+      self._seq_lens = self._load_seq_lens_file(seq_lens_file)
+      self._num_timesteps = NumbersDict({key: int(numpy.sum(v)) for (key, v) in self._seq_lens.items()})
 
     if data_dims:
       data_dims = convert_data_dims(data_dims)
@@ -243,19 +391,38 @@ class MetaDataset(CachedDataset2):
     else:
       self.data_dims = {}
 
-    for data_key in self.data_keys:
-      dataset_key, dataset_data_key = self.data_map[data_key]
-      dataset = self.datasets[dataset_key]
-      if not data_dims:
-        self.data_dims[data_key] = dataset.num_outputs[dataset_data_key]
-      if dataset_data_key in dataset.labels:
-        self.labels[data_key] = dataset.labels[dataset_data_key]
+    if not data_dims:
+      for data_key in self.data_keys:
+        dataset_key, dataset_data_key = self.data_map[data_key]
+        self.data_dims[data_key] = self.datasets[dataset_key].num_outputs[dataset_data_key]
 
     self.num_inputs = self.data_dims["data"][0]
     self.num_outputs = self.data_dims
 
     self.orig_seq_order_is_initialized = False
     self.seq_list_ordered = None  # type: typing.Optional[typing.Dict[str,typing.List[str]]]
+    self._seq_order = None  # type: typing.Optional[typing.List[int]]  # via init_seq_order
+
+  def _on_sub_dataset_init(self, dataset_key, dataset):
+    """
+    Called by :class:`SubDatasets` once the sub-dataset was created.
+
+    :param str dataset_key:
+    :param Dataset dataset:
+    """
+    for data_key, (dataset_key_, dataset_data_key) in self.data_map.items():
+      if dataset_key_ == dataset_key and dataset_data_key in dataset.labels:
+        self.labels[data_key] = dataset.labels[dataset_data_key]
+
+  @property
+  def tag_idx(self):
+    """
+    :return: seq tag (of the default dataset) -> corpus seq idx. created once on first access
+    :rtype: dict[str,int]
+    """
+    if self._tag_idx is None:
+      self._tag_idx = {tag: idx for (idx, tag) in enumerate(self.seq_list_original[self.default_dataset_key])}
+    return self._tag_idx
 
   def _is_same_seq_name_for_each_dataset(self):
     """
@@ -290,6 +457,8 @@ class MetaDataset(CachedDataset2):
       for key in self.dataset_keys:
         if key == self.default_dataset_key:
           continue
+        if not self.datasets.is_initialized(key):
+          continue  # lazy init. whether the tags are valid will be checked in _check_dataset_seq()
         try:
           if self.datasets[key].get_total_num_seqs() >= len(seq_list):
             continue  # ok
@@ -297,14 +466,15 @@ class MetaDataset(CachedDataset2):
           continue  # we don't know. but continue for now...
         print("Dataset %r has less sequences (%i) than in sequence list (%i) read from %r, this cannot work out!" % (
           key, self.datasets[key].get_total_num_seqs(), len(seq_list), self.default_dataset_key), file=log.v1)
-        other_tags = self.datasets[key].get_all_tags()
+        other_tags = set(self.datasets[key].get_all_tags())
+        seq_list_set = set(seq_list)
         for tag in seq_list:
           if tag not in other_tags:
             print(
               "Seq tag %r in dataset %r but not in dataset %r." % (tag, self.default_dataset_key, key), file=log.v1)
             break  # only print one
         for tag in other_tags:
-          if tag not in seq_list:
+          if tag not in seq_list_set:
             print(
               "Seq tag %r in dataset %r but not in dataset %r." % (tag, key, self.default_dataset_key), file=log.v1)
             break  # only print one
@@ -316,6 +486,33 @@ class MetaDataset(CachedDataset2):
 
     return seq_list
 
+  def _load_seq_lens_file(self, seq_lens_file):
+    """
+    The parsed seq lens are stored in a :class:`PersistentArraysCache`,
+    such that the (potentially big) JSON file only needs to be parsed once.
+
+    :param str seq_lens_file: see __init__
+    :return: data-key -> seq lens, by corpus seq idx
+    :rtype: NumbersDict
+    """
+    import hashlib
+    from returnn.util.basic import PersistentArraysCache
+    seq_tags = self.seq_list_original[self.default_dataset_key]
+
+    def _parse_seq_lens_file():
+      seq_lens = load_json(filename=seq_lens_file)
+      assert isinstance(seq_lens, dict)
+      keys = sorted(seq_lens[seq_tags[0]].keys())
+      for tag in seq_tags:
+        assert sorted(seq_lens[tag].keys()) == keys, "%s: seq lens file %r: seq %r has keys %r, expected %r" % (
+          self, seq_lens_file, tag, sorted(seq_lens[tag].keys()), keys)
+      return {key: numpy.array([seq_lens[tag][key] for tag in seq_tags], dtype="int64") for key in keys}
+
+    seq_tags_hash = hashlib.sha1("\n".join(seq_tags).encode("utf8")).hexdigest()
+    cache = PersistentArraysCache(
+      name="meta_dataset_seq_lens", source_files=[seq_lens_file], opts={"seq_tags": seq_tags_hash})
+    return NumbersDict(cache.get(_parse_seq_lens_file))
+
   def _get_dataset_seq_length(self, seq_idx):
     if not self.orig_seq_order_is_initialized:
       # To use get_seq_length() we first have to init the sequence order once in original order.
@@ -351,29 +548,61 @@ class MetaDataset(CachedDataset2):
       seq_order_dataset.init_seq_order(epoch=epoch)
       seq_index = seq_order_dataset.get_current_seq_order()
     else:
-      if self._seq_lens:
+      get_seq_lens = None
+      if self._seq_lens is not None:
         def get_seq_len(s):
           """
           :param int s:
           :rtype: int
           """
-          return self._seq_lens[self.seq_list_original[self.default_dataset_key][s]]["data"]
+          return int(self._seq_lens["data"][s])
+
+        def get_seq_lens():
+          """
+          :rtype: numpy.ndarray
+          """
+          return self._seq_lens["data"]
       elif self._seq_order_seq_lens_file:
         get_seq_len = self._get_seq_order_seq_lens_by_idx
       else:
         self.orig_seq_order_is_initialized = False
         get_seq_len = self._get_dataset_seq_length
-      seq_index = self.get_seq_order_for_epoch(epoch, self.num_total_seqs, get_seq_len)
+      seq_index = self.get_seq_order_for_epoch(epoch, self.num_total_seqs, get_seq_len, get_seq_lens=get_seq_lens)
+    self._seq_order = seq_index
     self._num_seqs = len(seq_index)
-    self.seq_list_ordered = {key: [ls[s] for s in seq_index] for (key, ls) in self.seq_list_original.items()}
-
-    for dataset_key, dataset in self.datasets.items():
-      assert isinstance(dataset, Dataset)
-      if dataset is seq_order_dataset:
-        continue
-      dataset.init_seq_order(epoch=epoch, seq_list=self.seq_list_ordered[dataset_key])
+    # Without seq_list_file, all datasets share the same seq list. Then only create the ordered list once.
+    seq_list_ordered_by_id = {}  # type: typing.Dict[int,typing.List[str]]
+    self.seq_list_ordered = {}
+    for key, ls in self.seq_list_original.items():
+      if id(ls) not in seq_list_ordered_by_id:
+        seq_list_ordered_by_id[id(ls)] = [ls[s] for s in seq_index]
+      self.seq_list_ordered[key] = seq_list_ordered_by_id[id(ls)]
+
+    init_seq_order_parallel(
+      self.datasets,
+      [(dataset_key, {"epoch": epoch, "seq_list": self.seq_list_ordered[dataset_key]})
+       for dataset_key in sorted(self.dataset_keys)
+       if not (seq_order_dataset and dataset_key == self.seq_order_control_dataset)],
+      num_threads=self.init_seq_order_num_threads)
     return True
 
+  def get_current_seq_order(self):
+    """
+    :return: current seq order, i.e. sorted seq idx -> corpus seq idx (i.e. idx in the original seq list)
+    :rtype: list[int]
+    """
+    assert self._seq_order is not None
+    return self._seq_order
+
+  def get_all_seq_lengths(self):
+    """
+    :return: data-key -> seq lens, by corpus seq idx. only available with seq_lens_file
+    :rtype: NumbersDict
+    """
+    if self._seq_lens is None:
+      raise OptionalNotImplementedError
+    return self._seq_lens
+
   def get_all_tags(self):
     """
     :return: list of all seq tags, of the whole dataset, without partition epoch
@@ -386,7 +615,7 @@ class MetaDataset(CachedDataset2):
     This would get called at the end of the epoch.
     """
     super(MetaDataset, self).finish_epoch()
-    for _, dataset in self.datasets.items():
+    for _, dataset in self.datasets.initialized_items():
       assert isinstance(dataset, Dataset)
       dataset.finish_epoch()
 
@@ -443,8 +672,9 @@ class MetaDataset(CachedDataset2):
     :param int sorted_seq_idx:
     :rtype: NumbersDict
     """
-    if self._seq_lens:
-      return self._seq_lens[self.seq_list_ordered[self.default_dataset_key][sorted_seq_idx]]
+    if self._seq_lens is not None:
+      corpus_seq_idx = self._seq_order[sorted_seq_idx]
+      return NumbersDict({key: int(v[corpus_seq_idx]) for (key, v) in self._seq_lens.items()})
     return super(MetaDataset, self).get_seq_length(sorted_seq_idx)
 
   def get_tag(self, sorted_seq_idx):
@@ -819,6 +1049,8 @@ class CombinedDataset(CachedDataset2):
                data_dims=None,
                data_dtypes=None,
                sampling_sizes=None,
+               lazy_init=False,
+               init_seq_order_num_threads=1,
                window=1, **kwargs):
     """
     :param dict[str,dict[str]] datasets: dataset-key -> dataset-kwargs. including keyword 'class' and maybe 'files'
@@ -832,6 +1064,10 @@ class CombinedDataset(CachedDataset2):
     :param dict[str,(int,int)] data_dims: self-data-key -> data-dimension, len(shape) (1 ==> sparse repr).
        Deprecated/Only to double check. Read from data if not specified.
     :param dict[str,str] data_dtypes: self-data-key -> dtype. Read from data if not specified.
+    :param bool lazy_init: create the sub-datasets only when they are accessed for the first time,
+      i.e. at the first init_seq_order (in parallel, if init_seq_order_num_threads > 1).
+      This needs ``data_dims``.
+    :param int init_seq_order_num_threads: if >1, init_seq_order of the sub-datasets is done in a thread pool
     """
     assert window == 1  # not implemented
     super(CombinedDataset, self).__init__(**kwargs)
@@ -860,11 +1096,16 @@ class CombinedDataset(CachedDataset2):
       sampling_sizes = {key: sampling_sizes for key in self.dataset_keys}
     self.sampling_sizes = sampling_sizes
 
+    self.init_seq_order_num_threads = init_seq_order_num_threads
+    self.data_map = data_map
+
     # This will only initialize datasets needed for features occurring in data_map
-    self.datasets = {key: init_dataset(datasets[key]) for key in self.dataset_keys}
+    self.datasets = SubDatasets(
+      datasets, keys=self.dataset_keys, lazy=lazy_init, on_init=self._on_sub_dataset_init)
 
-    self._estimated_num_seqs = sum([self.datasets[k].estimated_num_seqs for k in sorted(self.datasets.keys())])
-    self.estimated_num_seq_per_subset = [self.datasets[k].estimated_num_seqs for k in sorted(self.datasets.keys())]
+    self.estimated_num_seq_per_subset = None  # type: typing.Optional[typing.List[int]]
+    if not lazy_init:
+      self._init_estimated_num_seqs()
 
     if data_dims:
       data_dims = convert_data_dims(data_dims)
@@ -875,13 +1116,9 @@ class CombinedDataset(CachedDataset2):
     else:
       self.data_dims = {}
 
-    for dataset_key_tuple, data_key in data_map.items():
-      dataset_key, dataset_data_key = dataset_key_tuple
-      dataset = self.datasets[dataset_key]
-      if not data_dims:
-        self.data_dims[data_key] = dataset.num_outputs[dataset_data_key]
-      if dataset_data_key in dataset.labels:
-        self.labels[data_key] = dataset.labels[dataset_data_key]
+    if not data_dims:
+      for (dataset_key, dataset_data_key), data_key in data_map.items():
+        self.data_dims[data_key] = self.datasets[dataset_key].num_outputs[dataset_data_key]
 
     self.num_inputs = self.data_dims["data"][0]
     self.num_outputs = self.data_dims
@@ -889,8 +1126,29 @@ class CombinedDataset(CachedDataset2):
     self.data_dtypes = {data_key: _select_dtype(data_key, self.data_dims, data_dtypes) for data_key in self.data_keys}
 
     self.dataset_seq_idx_boundaries = None  # type: typing.Optional[typing.List[int]]
-    self.dataset_sorted_seq_idx_list = None  # type: typing.Optional[typing.List[typing.Tuple[int,int]]]
+    # Sorted seq idx -> (dataset_idx, dataset_seq_idx).
+    # Int64 array of shape (num_seqs, 2) if num_seqs is known, otherwise a list which is filled as we go.
+    self.dataset_sorted_seq_idx_list = None  # type: typing.Optional[typing.Union[numpy.ndarray,typing.List[typing.Tuple[int,int]]]]  # nopep8
     self.used_num_seqs_per_subset = None  # type: typing.Optional[typing.List[int]]
+    self._dataset_seq_lens = {}  # type: typing.Dict[int,numpy.ndarray]  # dataset_idx -> seq lens. reset per epoch
+
+  def _on_sub_dataset_init(self, dataset_key, dataset):
+    """
+    Called by :class:`SubDatasets` once the sub-dataset was created.
+
+    :param str dataset_key:
+    :param Dataset dataset:
+    """
+    for (dataset_key_, dataset_data_key), data_key in self.data_map.items():
+      if dataset_key_ == dataset_key and dataset_data_key in dataset.labels:
+        self.labels[data_key] = dataset.labels[dataset_data_key]
+
+  def _init_estimated_num_seqs(self):
+    """
+    Sets the estimated num seqs, from the sub-datasets.
+    """
+    self.estimated_num_seq_per_subset = [self.datasets[k].estimated_num_seqs for k in sorted(self.datasets.keys())]
+    self._estimated_num_seqs = sum(self.estimated_num_seq_per_subset)
 
   def init_seq_order(self, epoch=None, seq_list=None, seq_order=None):
     """
@@ -912,8 +1170,12 @@ class CombinedDataset(CachedDataset2):
     # First init sequence order for sub-datasets as usual to get a list of available sequences. This way, sorting and
     # partition epoch of the individual sub-datasets is still supported. Later we will call init_seq_order again with a
     # sequence list to e.g. apply joint sorting or partition epoch of all sequences.
-    for dataset in self.datasets.values():
-      dataset.init_seq_order(epoch=epoch)
+    init_seq_order_parallel(
+      self.datasets, [(key, {"epoch": epoch}) for key in sorted(self.dataset_keys)],
+      num_threads=self.init_seq_order_num_threads)
+    if self.estimated_num_seq_per_subset is None:  # lazy init
+      self._init_estimated_num_seqs()
+    self._dataset_seq_lens = {}
 
     # noinspection PyBroadException
     try:
@@ -930,37 +1192,38 @@ class CombinedDataset(CachedDataset2):
         seq_order = self._get_random_dataset_seq_order(total_num_seqs)
       else:
         seq_order = self.get_seq_order_for_epoch(
-          epoch=epoch, num_seqs=total_num_seqs, get_seq_len=self._get_seq_length)
+          epoch=epoch, num_seqs=total_num_seqs, get_seq_len=self._get_seq_length, get_seq_lens=self._get_seq_lengths)
       self._num_seqs = len(seq_order)
 
+      # (dataset_idx, dataset_seq_idx) for each seq in seq_order, where dataset_seq_idx is from the first init above.
+      dataset_seq_idxs = self._seq_idxs_to_dataset_seq_idxs(seq_order)
+      dataset_idxs = dataset_seq_idxs[:, 0]
+      # It may be large, so better delete it early, we don't need it anymore.
+      del seq_order
+
       # Apply seq_order to self.dataset_seq_idx.
-      # We have to re-calculate the seq_idx's because we will sort the datasets below.
-      self.dataset_sorted_seq_idx_list = []
-      counters = [0] * len(self.datasets)
-      for seq_idx in seq_order:
-        dataset_idx, _ = self._seq_idx_to_dataset_seq_idx(seq_idx)
-        dataset_seq_idx = counters[dataset_idx]
-        counters[dataset_idx] += 1
-        self.dataset_sorted_seq_idx_list.append((dataset_idx, dataset_seq_idx))
+      # We have to re-calculate the seq_idx's because we will sort the datasets below,
+      # i.e. the new dataset_seq_idx is the running count of each dataset in seq_order.
+      self.dataset_sorted_seq_idx_list = numpy.stack(
+        [dataset_idxs, _running_count_per_group(dataset_idxs, num_groups=len(self.datasets))], axis=1)
 
       # We only want to load those sequences in the sub-datasets that appear in seq_order. For this, we extract
       # sequence lists containing the subset of sequences for each dataset from seq_order.
-      seq_order_subdatasets = [[] for _ in self.datasets]
-      for seq_idx in seq_order:
-        dataset_idx, dataset_seq_idx = self._seq_idx_to_dataset_seq_idx(seq_idx)
-        dataset = self.datasets[self.dataset_idx2key_map[dataset_idx]]
-        dataset_corpus_seq_idx = dataset.get_corpus_seq_idx(dataset_seq_idx)
-        seq_order_subdatasets[dataset_idx].append(dataset_corpus_seq_idx)
-
-      # It may be large, so better delete it early, we don't need it anymore.
-      del seq_order
-
-      # Re-initialize sequence orders of sub-datasets with created sequence list.
       self.used_num_seqs_per_subset = []
-      for dataset_idx, dataset_key in self.dataset_idx2key_map.items():
-        assert self.datasets[dataset_key].have_corpus_seq_idx()
-        self.datasets[dataset_key].init_seq_order(epoch=epoch, seq_order=seq_order_subdatasets[dataset_idx])
-        self.used_num_seqs_per_subset.append(len(seq_order_subdatasets[dataset_idx]))
+      calls = []
+      for dataset_idx, dataset_key in sorted(self.dataset_idx2key_map.items()):
+        dataset = self.datasets[dataset_key]
+        assert dataset.have_corpus_seq_idx()
+        sub_seq_idxs = dataset_seq_idxs[dataset_idxs == dataset_idx, 1]
+        try:
+          sub_seq_order = numpy.asarray(dataset.get_current_seq_order(), dtype="int64")[sub_seq_idxs].tolist()
+        except OptionalNotImplementedError:
+          sub_seq_order = [dataset.get_corpus_seq_idx(seq_idx) for seq_idx in sub_seq_idxs.tolist()]
+        # Re-initialize sequence orders of sub-datasets with created sequence list.
+        calls.append((dataset_key, {"epoch": epoch, "seq_order": sub_seq_order}))
+        self.used_num_seqs_per_subset.append(len(sub_seq_order))
+      del dataset_seq_idxs, dataset_idxs
+      init_seq_order_parallel(self.datasets, calls, num_threads=self.init_seq_order_num_threads)
 
     else:
       self.dataset_sorted_seq_idx_list = []  # We will fill this as we go
@@ -991,45 +1254,54 @@ class CombinedDataset(CachedDataset2):
     :param int seq_idx:
     :rtype: (int,int)
     """
-    assert seq_idx < self.dataset_seq_idx_boundaries[-1]
-
-    dataset_idx = 0
-    while self.dataset_seq_idx_boundaries[dataset_idx + 1] <= seq_idx:
-      dataset_idx += 1
-
+    assert 0 <= seq_idx < self.dataset_seq_idx_boundaries[-1]
+    dataset_idx = int(numpy.searchsorted(self.dataset_seq_idx_boundaries, seq_idx, side="right")) - 1
     dataset_seq_idx = seq_idx - self.dataset_seq_idx_boundaries[dataset_idx]
-
     return dataset_idx, dataset_seq_idx
 
+  def _seq_idxs_to_dataset_seq_idxs(self, seq_idxs):
+    """
+    Like :func:`_seq_idx_to_dataset_seq_idx`, but for many seqs at once.
+
+    :param list[int]|numpy.ndarray seq_idxs: sequence indices (before sorting)
+    :return: int64 array of shape (len(seq_idxs), 2), with (dataset_idx, dataset_seq_idx) pairs
+    :rtype: numpy.ndarray
+    """
+    seq_idxs = numpy.asarray(seq_idxs, dtype="int64").reshape((-1,))
+    boundaries = numpy.asarray(self.dataset_seq_idx_boundaries, dtype="int64")
+    assert numpy.all(seq_idxs >= 0) and numpy.all(seq_idxs < boundaries[-1])
+    dataset_idxs = numpy.searchsorted(boundaries, seq_idxs, side="right") - 1
+    return numpy.stack([dataset_idxs, seq_idxs - boundaries[dataset_idxs]], axis=1)
+
   def _get_random_dataset_seq_order(self, total_num_seqs):
     """
     Choose datasets randomly but preserve order within each dataset. This sorting method is unique to CombinedDataset.
+    This is sampling of the datasets without replacement, weighted by the (remaining) number of seqs of each dataset.
 
     :param int total_num_seqs:
     :returns: sequence order
-    :rtype: list[int]
+    :rtype: numpy.ndarray
     """
     # Create a list containing each dataset_idx dataset.num_seqs-times and shuffle it.
-    dataset_ids = [self._seq_idx_to_dataset_seq_idx(seq_idx)[0] for seq_idx in range(total_num_seqs)]
+    num_seqs_per_subset = numpy.diff(self.dataset_seq_idx_boundaries)
+    dataset_ids = numpy.repeat(numpy.arange(len(self.datasets)), num_seqs_per_subset).tolist()
     rnd_seed = self._get_random_seed_for_epoch(self.epoch)
     rnd = Random(rnd_seed)
-    rnd.shuffle(dataset_ids)
+    rnd.shuffle(dataset_ids)  # Python Random, to keep the same order as before
+    dataset_ids = numpy.array(dataset_ids, dtype="int64")
+    assert len(dataset_ids) == total_num_seqs
 
-    # Create the actual seq_order list.
+    # Create the actual seq_order.
     # We want to keep the order within the sub-datasets, thus we assign seq_ids by simply counting up for each dataset.
     # We however have to account for the different offsets needed when accessing self.dataset_seq_idx_list later.
-    seq_order = []
-    counters = [0] * len(self.datasets)
-    for dataset_idx in dataset_ids:
-      seq_order.append(counters[dataset_idx] + self.dataset_seq_idx_boundaries[dataset_idx])
-      counters[dataset_idx] += 1
-
-    assert sum(counters) == total_num_seqs
+    seq_order = (
+      _running_count_per_group(dataset_ids, num_groups=len(self.datasets)) +
+      numpy.asarray(self.dataset_seq_idx_boundaries[:-1], dtype="int64")[dataset_ids])
 
     if self.partition_epoch:
       seq_order = self._apply_partition_epoch(seq_order, self.partition_epoch, self.epoch)
     if self.repeat_epoch:
-      seq_order = seq_order * self.repeat_epoch
+      seq_order = numpy.tile(seq_order, self.repeat_epoch)
 
     return seq_order
 
@@ -1039,7 +1311,7 @@ class CombinedDataset(CachedDataset2):
     Afterwards, sequence ordering is applied to the list of all collected sequences.
 
     :returns: sequence order
-    :rtype: list[int]
+    :rtype: numpy.ndarray
     """
     assert self.partition_epoch in [None, 1], "partition_epoch not supported in combination with sampling_sizes."
     assert self._seq_order_seq_lens_file is None, (
@@ -1049,40 +1321,52 @@ class CombinedDataset(CachedDataset2):
 
     epoch = self.epoch or 1
 
-    total_num_seqs = sum(self.sampling_sizes.values())
-
-    seq_order = numpy.zeros(total_num_seqs, dtype='int32')
-    seq_order_length = 0
-
-    # For each dataset sample sequences and write to seq_order.
+    # For each dataset sample sequences.
+    seq_orders = []
     for dataset_idx in range(len(self.datasets)):
       dataset_key = self.dataset_idx2key_map[dataset_idx]
-
       sampling_size = self.sampling_sizes[dataset_key]
+      num_seqs = self.datasets[dataset_key].num_seqs
 
       # All sequences should be seen in order. So start where we ended in last epoch.
-      epoch_offset = ((epoch - 1) * sampling_size) % self.datasets[dataset_key].num_seqs
+      epoch_offset = ((epoch - 1) * sampling_size) % num_seqs
 
       # Take the next 'sampling_size' sequences. If reached the end, start at the beginning again.
-      dataset_seq_range = numpy.arange(epoch_offset, epoch_offset + sampling_size) % self.datasets[dataset_key].num_seqs
+      dataset_seq_range = numpy.arange(epoch_offset, epoch_offset + sampling_size, dtype="int64") % num_seqs
 
       # Add the start position of the current dataset to get the global index.
-      seq_range = dataset_seq_range + self.dataset_seq_idx_boundaries[dataset_idx]
-
-      # Write the current range of the sequence order.
-      seq_order[seq_order_length:seq_order_length + sampling_size] = seq_range
-      seq_order_length += sampling_size
+      seq_orders.append(dataset_seq_range + self.dataset_seq_idx_boundaries[dataset_idx])
+    seq_order = numpy.concatenate(seq_orders)
 
     # We want to additionally sort the sequences in the current sample. For this, create a sequence order on a
     # range of length of the number of sequences in the sample. Note that we have to map the indices to make use
     # of self._get_seq_length here.
+    # We do not use the bulk self._get_seq_lengths here, as the sample might be much smaller than the datasets.
     seq_order_remapping = self.get_seq_order_for_epoch(
-      epoch=epoch, num_seqs=len(seq_order), get_seq_len=lambda i: self._get_seq_length(seq_order[i]))
+      epoch=epoch, num_seqs=len(seq_order), get_seq_len=lambda i: self._get_seq_length(int(seq_order[i])))
 
     # Then use this order to reorder the sequences in the sample.
-    seq_order = numpy.take(seq_order, seq_order_remapping)
+    return seq_order[numpy.asarray(seq_order_remapping, dtype="int64")]
 
-    return list(seq_order)
+  def _get_dataset_seq_lengths(self, dataset_idx):
+    """
+    :param int dataset_idx:
+    :return: estimated seq lens of the sub-dataset, by its seq idx of the current epoch. cached for the epoch
+    :rtype: numpy.ndarray
+    """
+    if dataset_idx not in self._dataset_seq_lens:
+      dataset = self.datasets[self.dataset_idx2key_map[dataset_idx]]
+      self._dataset_seq_lens[dataset_idx] = numpy.array(
+        [dataset.get_estimated_seq_length(seq_idx) for seq_idx in range(dataset.num_seqs)], dtype="int64")
+    return self._dataset_seq_lens[dataset_idx]
+
+  def _get_seq_lengths(self):
+    """
+    :return: estimated seq lens of all seqs, by seq idx (before sorting)
+    :rtype: numpy.ndarray
+    """
+    return numpy.concatenate(
+      [self._get_dataset_seq_lengths(dataset_idx) for dataset_idx in range(len(self.datasets))])
 
   def _get_seq_length(self, seq_idx):
     """
@@ -1090,6 +1374,8 @@ class CombinedDataset(CachedDataset2):
     :rtype: int
     """
     dataset_idx, dataset_seq_idx = self._seq_idx_to_dataset_seq_idx(seq_idx)
+    if dataset_idx in self._dataset_seq_lens:
+      return int(self._dataset_seq_lens[dataset_idx][dataset_seq_idx])
     dataset = self.datasets[self.dataset_idx2key_map[dataset_idx]]
 
     return dataset.get_estimated_seq_length(dataset_seq_idx)
@@ -1100,6 +1386,8 @@ class CombinedDataset(CachedDataset2):
     :return: something?
     :rtype: bool
     """
+    if isinstance(self.dataset_sorted_seq_idx_list, numpy.ndarray):
+      return False  # the full seq order was already set in init_seq_order
     for i in range(num_values):
       if self.seq_ordering == "default":  # i.e. in order
         dataset_idx = 0
@@ -1176,14 +1464,14 @@ class CombinedDataset(CachedDataset2):
     if end > len(self.dataset_sorted_seq_idx_list):
       self._expand_dataset_sec_idxs(end - len(self.dataset_sorted_seq_idx_list))
 
-    requested_seqs = self.dataset_sorted_seq_idx_list[start:end]
+    requested_seqs = numpy.asarray(self.dataset_sorted_seq_idx_list[start:end], dtype="int64").reshape((-1, 2))
 
     for dataset_idx in range(len(self.datasets)):
       dataset = self.datasets[self.dataset_idx2key_map[dataset_idx]]
-      sub_requested_seqs = [s[1] for s in requested_seqs if s[0] == dataset_idx]
-      if not sub_requested_seqs:
+      sub_requested_seqs = requested_seqs[requested_seqs[:, 0] == dataset_idx, 1]
+      if not len(sub_requested_seqs):
         continue
-      sub_start, sub_end = min(sub_requested_seqs), max(sub_requested_seqs)
+      sub_start, sub_end = int(numpy.min(sub_requested_seqs)), int(numpy.max(sub_requested_seqs))
       dataset.load_seqs(sub_start, sub_end + 1)
     super(CombinedDataset, self)._load_seqs(start=start, end=end)
 
@@ -1208,7 +1496,7 @@ class CombinedDataset(CachedDataset2):
     """
     if not self.is_less_than_num_seqs(seq_idx):
       return None
-    dataset_idx, dataset_seq_idx = self.dataset_sorted_seq_idx_list[seq_idx]
+    dataset_idx, dataset_seq_idx = [int(i) for i in self.dataset_sorted_seq_idx_list[seq_idx]]
     dataset_key = self.dataset_idx2key_map[dataset_idx]
     dataset = self.datasets[dataset_key]
 
@@ -1310,19 +1598,20 @@ class ConcatSeqsDataset(CachedDataset2):
     :rtype: bool
     """
     super(ConcatSeqsDataset, self).init_seq_order(epoch=epoch, seq_list=seq_list, seq_order=seq_order)
-    assert not seq_list and not seq_order  # not implemented
+    assert not seq_list  # not implemented
     if not seq_list:
-      def get_seq_len(i):
-        """
-        :param int i:
-        :rtype: int
-        """
-        return self.full_seq_len_list[i]
-      seq_order = self.get_seq_order_for_epoch(
-        epoch=epoch, num_seqs=len(self.full_seq_list), get_seq_len=get_seq_len)
-      if self.epoch_wise_filter:
-        self.epoch_wise_filter.debug_msg_prefix = str(self)
-        seq_order = self.epoch_wise_filter.filter(epoch=epoch, seq_order=seq_order, get_seq_len=get_seq_len)
+      if seq_order is None:
+        def get_seq_len(i):
+          """
+          :param int i:
+          :rtype: int
+          """
+          return self.full_seq_len_list[i]
+        seq_order = self.get_seq_order_for_epoch(
+          epoch=epoch, num_seqs=len(self.full_seq_list), get_seq_len=get_seq_len)
+        if self.epoch_wise_filter:
+          self.epoch_wise_filter.debug_msg_prefix = str(self)
+          seq_order = self.epoch_wise_filter.filter(epoch=epoch, seq_order=seq_order, get_seq_len=get_seq_len)
       self._seq_order = seq_order
       seq_list = [self.full_seq_list[i] for i in seq_order]  # tag list
     self.cur_seq_list = seq_list
@@ -1430,22 +1719,34 @@ class ConcatSeqsDataset(CachedDataset2):
 
 class ChunkShuffleDataset(CachedDataset2):
   """
-  This goes through a dataset, caches some recent chunks
+  This goes through a dataset, cuts it into chunks (via the batch generation of the sub-dataset),
+  and shuffles the chunks within a window.
+
+  The window is a shuffle pool of bounded size (``chunk_shuffle_cache`` chunks and ``chunk_shuffle_cache_bytes``).
+  Whenever a chunk is emitted, a random chunk from the pool is taken, and the pool is refilled right away,
+  i.e. the pool is refilled continuously and not in bursts.
+  The chunks are views into the data of the sub-dataset, i.e. they are not copied.
   """
 
   def __init__(self, dataset,
                chunk_shuffle_cache=1000,
+               chunk_shuffle_cache_bytes=None,
                batch_gen_batch_size=5000, batch_gen_max_seqs=1,
                batch_gen_recurrent_net=True,
                **kwargs):
     """
     :param dict[str] dataset: kwargs for init_dataset
+    :param int chunk_shuffle_cache: max num of chunks in the shuffle pool
+    :param int|None chunk_shuffle_cache_bytes: max num of bytes (of the chunks) in the shuffle pool.
+      Note that the chunks are views, i.e. they keep the data of their source seq alive.
     """
     super(ChunkShuffleDataset, self).__init__(**kwargs)
     self.dataset = init_dataset(dataset)
     assert self.dataset
     self.dataset_last_load_seq_end = None
+    assert chunk_shuffle_cache >= 1
     self.chunk_shuffle_cache = chunk_shuffle_cache
+    self.chunk_shuffle_cache_bytes = chunk_shuffle_cache_bytes
     self.batch_gen = None
     self.batch_gen_batch_size = batch_gen_batch_size
     self.batch_gen_max_seqs = batch_gen_max_seqs
@@ -1454,7 +1755,11 @@ class ChunkShuffleDataset(CachedDataset2):
     self.num_outputs = self.dataset.num_outputs
     self.labels = self.dataset.labels
     self.rng = Random(0)
-    self.load_seqs_end = None
+    # The shuffle pool. List of (data, original_tag, num_bytes).
+    self._pool = []  # type: typing.List[typing.Tuple[typing.Dict[str,numpy.ndarray],str,int]]
+    self._pool_num_bytes = 0
+    self._next_seq_idx = 0
+    self._stats = None  # type: typing.Optional[typing.Dict[str,typing.Union[int,float]]]
 
   def init_seq_order(self, epoch=None, seq_list=None, seq_order=None):
     """
@@ -1464,9 +1769,13 @@ class ChunkShuffleDataset(CachedDataset2):
     """
     need_reinit = self.epoch is None or self.epoch != epoch
     super(ChunkShuffleDataset, self).init_seq_order(epoch=epoch, seq_list=seq_list, seq_order=seq_order)
-    self.load_seqs_end = 0
     self.dataset_last_load_seq_end = 0
     self.rng.seed(epoch or 1)
+    self._pool = []
+    self._pool_num_bytes = 0
+    self._next_seq_idx = 0
+    self._stats = {
+      "start_time": time.time(), "num_chunks": 0, "num_frames": 0, "max_pool_len": 0, "max_pool_bytes": 0}
     if not need_reinit:
       return False
 
@@ -1481,41 +1790,19 @@ class ChunkShuffleDataset(CachedDataset2):
                                                    max_seqs=self.batch_gen_max_seqs)
     return True
 
-  def _add_data(self, data, original_tag):
+  def _is_pool_full(self):
     """
-    :type data: dict[str,numpy.ndarray]
-    :type original_tag: str
+    :rtype: bool
     """
-    features = data["data"]
-    if not self.added_data:
-      seq_idx = 0
-      assert self.expected_load_seq_start == 0
-    else:
-      seq_idx = self.added_data[-1].seq_idx + 1
-    tag = "%s.%i" % (original_tag, seq_idx)
-    seq = DatasetSeq(seq_idx=seq_idx, features=features, targets=data, seq_tag=tag)
-    self._num_timesteps_accumulated += seq.num_frames
-    self.added_data += [seq]
-
-  def _shuffle(self):
-    start_seq_idx = self.added_data[0].seq_idx
-    end_seq_idx = self.added_data[-1].seq_idx
-    assert start_seq_idx < self.load_seqs_end < end_seq_idx
-    start_idx = 0
-    if start_seq_idx < self.load_seqs_end:
-      start_idx = self.load_seqs_end - start_seq_idx
-      assert self.added_data[start_idx].seq_idx == self.load_seqs_end
-      start_seq_idx = self.load_seqs_end
-    sublist = self.added_data[start_idx:]
-    self.rng.shuffle(sublist)
-    for i, seq in enumerate(sublist):
-      seq.seq_idx = i + start_seq_idx
-    assert sublist[-1].seq_idx == end_seq_idx
-    self.added_data[start_idx:] = sublist
+    if len(self._pool) >= self.chunk_shuffle_cache:
+      return True
+    if self.chunk_shuffle_cache_bytes is not None and self._pool_num_bytes >= self.chunk_shuffle_cache_bytes:
+      return True
+    return False
 
   def _add_more(self):
     """
-    Adds each chunk/batch seq as a single DatasetSeq.
+    Adds each chunk/batch seq of the next batch to the shuffle pool.
     See EngineUtil.assign_dev_data() for comparison.
     :returns whether we added some more
     """
@@ -1528,36 +1815,92 @@ class ChunkShuffleDataset(CachedDataset2):
         self.dataset.load_seqs(batch.start_seq, batch.end_seq)
         self.dataset_last_load_seq_end = batch.end_seq
 
-      used_data_keys = self.get_data_keys()
+      used_data_keys = self.dataset.get_data_keys()
       for seq in batch.seqs:
         res_data = {}
         for k in used_data_keys:
           data = self.dataset.get_data(seq.seq_idx, k)
           if data is not None:
-            res_data[k] = data[seq.seq_start_frame[k]:seq.seq_end_frame[k]]
+            res_data[k] = data[seq.seq_start_frame[k]:seq.seq_end_frame[k]]  # view, no copy
         original_tag = self.dataset.get_tag(seq.seq_idx)
-        self._add_data(data=res_data, original_tag=original_tag)
+        num_bytes = sum([v.nbytes for v in res_data.values()])
+        self._pool.append((res_data, original_tag, num_bytes))
+        self._pool_num_bytes += num_bytes
 
     self.batch_gen.advance(len(batches))
+    self._stats["max_pool_len"] = max(self._stats["max_pool_len"], len(self._pool))
+    self._stats["max_pool_bytes"] = max(self._stats["max_pool_bytes"], self._pool_num_bytes)
     return True
 
-  def _add_more_until(self, end, shuffle=False):
-    if self.added_data and end <= self.added_data[-1].seq_idx:
-      return True
-    while self._add_more():
-      assert self.added_data
-      if end <= self.added_data[-1].seq_idx:
-        if shuffle:
-          self._shuffle()
-        return True
-    # We have reached the end.
-    if not self.added_data:
-      self._num_seqs = 0
-      print("warning: empty dataset", file=log.v3)
-    else:
-      self._num_seqs = self.added_data[-1].seq_idx + 1
-    self.reached_final_seq = True
-    return False
+  def _fill_pool(self):
+    """
+    Adds chunks to the shuffle pool until it is full or the sub-dataset is exhausted.
+    """
+    while not self._is_pool_full():
+      if not self._add_more():
+        break
+
+  def _emit_chunk(self):
+    """
+    Takes a random chunk out of the shuffle pool, adds it as a new seq, and refills the pool.
+
+    :return: whether we added a seq. False if we have reached the end
+    :rtype: bool
+    """
+    self._fill_pool()
+    if not self._pool:
+      return False
+    # Swap with the last one and pop it, such that this is O(1).
+    i = self.rng.randrange(len(self._pool))
+    self._pool[i], self._pool[-1] = self._pool[-1], self._pool[i]
+    data, original_tag, num_bytes = self._pool.pop()
+    self._pool_num_bytes -= num_bytes
+    seq_idx = self._next_seq_idx
+    self._next_seq_idx += 1
+    assert seq_idx >= self.expected_load_seq_start
+    seq = DatasetSeq(
+      seq_idx=seq_idx, features=data["data"], targets=data, seq_tag="%s.%i" % (original_tag, seq_idx))
+    self._num_timesteps_accumulated += seq.num_frames
+    self.added_data.append(seq)
+    self._stats["num_chunks"] += 1
+    self._stats["num_frames"] += seq.num_frames["data"]
+    return True
+
+  def _add_more_until(self, end):
+    """
+    :param int end: seq idx, inclusive
+    :return: whether we have the seq idx
+    :rtype: bool
+    """
+    if self.reached_final_seq:
+      return end < self._num_seqs
+    while self._next_seq_idx <= end:
+      if not self._emit_chunk():
+        # We have reached the end.
+        self._num_seqs = self._next_seq_idx
+        if not self._num_seqs:
+          print("warning: empty dataset", file=log.v3)
+        self.reached_final_seq = True
+        self._print_stats()
+        return False
+    return True
+
+  def _print_stats(self):
+    """
+    Prints the throughput and memory stats of the current epoch.
+    """
+    from returnn.util.basic import human_size, human_bytes_size, peak_rss_in_bytes
+    stats = self._stats
+    duration = max(time.time() - stats["start_time"], 1e-10)
+    peak_rss = peak_rss_in_bytes()
+    print(
+      ("%s: %i chunks, %s frames in %.1f secs, %.1f chunks/sec, %s frames/sec."
+       " Shuffle pool max %i chunks, %s. Peak RSS %s.") % (
+        self, stats["num_chunks"], human_size(stats["num_frames"]), duration,
+        stats["num_chunks"] / duration, human_size(int(stats["num_frames"] / duration)),
+        stats["max_pool_len"], human_bytes_size(stats["max_pool_bytes"]),
+        human_bytes_size(peak_rss) if peak_rss is not None else "unknown"),
+      file=log.v4)
 
   def is_less_than_num_seqs(self, seq_idx):
     """
@@ -1568,9 +1911,7 @@ class ChunkShuffleDataset(CachedDataset2):
     """
     if self._num_seqs is not None:
       return seq_idx < self._num_seqs
-    if seq_idx < self.expected_load_seq_start:
-      return True
-    if self.added_data and seq_idx <= self.added_data[-1].seq_idx:
+    if seq_idx < self._next_seq_idx:
       return True
     return self._add_more_until(seq_idx)
 
@@ -1587,8 +1928,7 @@ class ChunkShuffleDataset(CachedDataset2):
       # Cleanup old data.
       self._cleanup_old_seqs(start)
       self.expected_load_seq_start = start
-    self.load_seqs_end = end
-    self._add_more_until(end + self.chunk_shuffle_cache, shuffle=True)
+    self._add_more_until(end - 1)
 
   def _collect_single_seq(self, seq_idx):
     """
@@ -1613,6 +1953,29 @@ def _simple_to_bool(v):
   return v
 
 
+def _running_count_per_group(groups, num_groups):
+  """
+  Vectorized variant of::
+
+    counters = [0] * num_groups
+    for i, g in enumerate(groups):
+      res[i] = counters[g]
+      counters[g] += 1
+
+  :param numpy.ndarray groups: int array of shape (n,), values in [0, num_groups)
+  :param int num_groups:
+  :return: int64 array of shape (n,), the running count of each group
+  :rtype: numpy.ndarray
+  """
+  groups = numpy.asarray(groups, dtype="int64")
+  counts = numpy.bincount(groups, minlength=num_groups)
+  group_starts = numpy.cumsum(counts) - counts
+  order = numpy.argsort(groups, kind="stable")
+  res = numpy.empty((len(groups),), dtype="int64")
+  res[order] = numpy.arange(len(groups), dtype="int64") - numpy.repeat(group_starts, counts)
+  return res
+
+
 def _select_dtype(key, data_dims, data_dtypes):
   if data_dtypes and key in data_dtypes:
     v = data_dtypes[key]
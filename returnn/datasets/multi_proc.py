@@ -0,0 +1,199 @@
+"""
+Provides :class:`MultiProcDataset`.
+"""
+
+from __future__ import print_function
+
+from collections import deque
+import functools
+import typing
+from returnn.log import log
+from returnn.util.task_system import AsyncTask, numpy_copy_and_set_unused, numpy_set_unused
+from .basic import init_dataset, DatasetSeq
+from .cached2 import CachedDataset2
+
+
+class MultiProcDataset(CachedDataset2):
+  """
+  Runs the given dataset in multiple worker processes.
+  This is useful when the data loading or feature extraction (e.g. :class:`OggZipDataset`)
+  is the bottleneck, because in a single process, it is bound by the GIL.
+
+  Every worker creates its own instance of the dataset and does the same seq ordering.
+  The worker ``i`` loads only the seqs ``seq_idx`` with ``seq_idx % num_workers == i``,
+  and we collect the seqs in the original order, so the result is deterministic
+  and the same as with the dataset itself.
+  The data is sent via our own pickler (:mod:`returnn.util.task_system`),
+  which uses shared memory (:class:`SharedNumpyArray`) for big arrays.
+
+  Example::
+
+    train = {
+      "class": "MultiProcDataset", "num_workers": 4, "buffer_size": 10,
+      "dataset": {"class": "OggZipDataset", ...}}
+
+  Note that the seq ordering etc. is configured in the sub dataset.
+  The sub dataset should know its num seqs in advance,
+  otherwise every worker will load all the seqs (see :func:`CachedDataset2.is_less_than_num_seqs`).
+  """
+
+  def __init__(self, dataset, num_workers, buffer_size=10, use_shared_mem=True, **kwargs):
+    """
+    :param dict[str] dataset: kwargs for init_dataset, this dataset is created in every worker
+    :param int num_workers: number of worker processes
+    :param int buffer_size: number of seqs each worker prepares in advance. this bounds the memory
+    :param bool use_shared_mem: whether big arrays are sent via shared memory
+    """
+    super(MultiProcDataset, self).__init__(**kwargs)
+    assert num_workers > 0 and buffer_size > 0
+    self.dataset = dataset
+    self.num_workers = num_workers
+    self.buffer_size = buffer_size
+    self.use_shared_mem = use_shared_mem
+    self._workers = []  # type: typing.List[AsyncTask]
+    self._worker_requested_seqs = []  # type: typing.List[typing.Deque[int]]  # per worker
+    self._requested_seq_end = 0
+    self._start_workers()
+
+  def __del__(self):
+    # noinspection PyBroadException
+    try:
+      self._stop_workers()
+    except Exception:
+      pass  # might happen at Python exit
+
+  def _start_workers(self):
+    info = None
+    for i in range(self.num_workers):
+      worker = AsyncTask(
+        func=functools.partial(_worker_proc_loop, dataset=self.dataset, use_shared_mem=self.use_shared_mem),
+        name="%s worker %i" % (self.name, i))
+      self._workers.append(worker)
+      self._worker_requested_seqs.append(deque())
+    for worker in self._workers:
+      msg, info = worker.get()
+      assert msg == "info"
+    print("%s: started %i workers" % (self, self.num_workers), file=log.v4)
+    self.num_inputs = info["num_inputs"]
+    self.num_outputs = info["num_outputs"]
+    self.labels = info["labels"]
+
+  def _stop_workers(self):
+    for worker in self._workers:
+      if worker.is_alive():
+        worker.put(("exit", None))
+        worker.join(timeout=10)
+    self._workers = []
+    self._worker_requested_seqs = []
+
+  def init_seq_order(self, epoch=None, seq_list=None, seq_order=None):
+    """
+    :param int|None epoch:
+    :param list[str]|None seq_list:
+    :param list[int]|None seq_order:
+    :rtype: bool
+    """
+    super(MultiProcDataset, self).init_seq_order(epoch=epoch, seq_list=seq_list, seq_order=seq_order)
+    for worker in self._workers:
+      worker.put(("init_seq_order", {"epoch": epoch, "seq_list": seq_list, "seq_order": seq_order}))
+    num_seqs = None
+    for worker, requested_seqs in zip(self._workers, self._worker_requested_seqs):
+      # Skip the seqs which were still requested from the previous epoch.
+      while True:
+        msg = worker.get()
+        if msg[0] == "init_seq_order":
+          break
+        assert msg[0] == "seq" and msg[1] == requested_seqs.popleft()
+        _features_set_unused(msg[2])
+      assert not requested_seqs
+      num_seqs = msg[1]
+    self._requested_seq_end = 0
+    self._num_seqs = num_seqs
+    return True
+
+  def _request_seqs(self, start, end):
+    """
+    :param int start:
+    :param int end:
+    """
+    start = max(start, self._requested_seq_end)
+    if self._num_seqs is not None:
+      end = min(end, self._num_seqs)
+    for seq_idx in range(start, end):
+      worker_idx = seq_idx % self.num_workers
+      self._workers[worker_idx].put(("get_seq", seq_idx))
+      self._worker_requested_seqs[worker_idx].append(seq_idx)
+    self._requested_seq_end = max(end, self._requested_seq_end)
+
+  def _collect_single_seq(self, seq_idx):
+    """
+    :param int seq_idx:
+    :rtype: DatasetSeq|None
+    """
+    if self._num_seqs is not None and seq_idx >= self._num_seqs:
+      return None
+    self._request_seqs(seq_idx, seq_idx + self.num_workers * self.buffer_size)
+    worker_idx = seq_idx % self.num_workers
+    worker = self._workers[worker_idx]
+    requested_seqs = self._worker_requested_seqs[worker_idx]
+    while True:
+      assert requested_seqs, "%s: seq %i was not requested" % (self, seq_idx)
+      requested_seq_idx = requested_seqs.popleft()
+      msg, msg_seq_idx, features, seq_tag = worker.get()
+      assert msg == "seq" and msg_seq_idx == requested_seq_idx
+      if msg_seq_idx == seq_idx:
+        break
+      assert msg_seq_idx < seq_idx  # skipped seq
+      _features_set_unused(features)
+    if features is None:
+      return None  # end reached
+    return DatasetSeq(seq_idx=seq_idx, features=numpy_copy_and_set_unused(features), seq_tag=seq_tag)
+
+
+def _features_set_unused(features):
+  """
+  For seqs which are discarded, to release the shared memory (see :class:`SharedNumpyArray`).
+
+  :param dict[str,numpy.ndarray]|numpy.ndarray|None features:
+  """
+  if isinstance(features, dict):
+    for value in features.values():
+      numpy_set_unused(value)
+  else:
+    numpy_set_unused(features)
+
+
+def _worker_proc_loop(task, dataset, use_shared_mem):
+  """
+  Runs in the worker process.
+
+  :param returnn.util.task_system.AsyncTask task:
+  :param dict[str] dataset: kwargs for init_dataset
+  :param bool use_shared_mem:
+  """
+  from returnn.util import task_system
+  task_system.SharedMemNumpyConfig["enabled"] = use_shared_mem
+  dataset = init_dataset(dataset)
+  task.put(("info", {"num_inputs": dataset.num_inputs, "num_outputs": dataset.num_outputs, "labels": dataset.labels}))
+  while True:
+    msg, value = task.get()
+    if msg == "exit":
+      break
+    elif msg == "init_seq_order":
+      dataset.init_seq_order(**value)
+      # noinspection PyBroadException
+      try:
+        num_seqs = dataset.num_seqs
+      except Exception:  # can fail, e.g. if num_seqs is not known in advance
+        num_seqs = None
+      task.put(("init_seq_order", num_seqs))
+    elif msg == "get_seq":
+      seq_idx = value
+      if not dataset.is_less_than_num_seqs(seq_idx):
+        task.put(("seq", seq_idx, None, None))
+        continue
+      dataset.load_seqs(seq_idx, seq_idx + 1)
+      features = {key: dataset.get_data(seq_idx, key) for key in dataset.get_data_keys()}
+      task.put(("seq", seq_idx, features, dataset.get_tag(seq_idx)))
+    else:
+      raise Exception("MultiProcDataset worker: unexpected message %r" % msg)
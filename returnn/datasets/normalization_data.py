@@ -2,9 +2,155 @@ import os
 import six
 import h5py
 import numpy as np
+import typing
 
 from .bundle_file import BundleFile
-from returnn.util.basic import long
+
+
+class MeanVarianceAccumulator(object):
+  """
+  Numerically stable running mean and variance over feature vectors, per feature dimension.
+  Data is added in chunks (e.g. a whole seq at once), and partial statistics (e.g. of different dataset shards,
+  collected in parallel processes) can be merged.
+  This uses the parallel variant of the Welford algorithm by Chan et al.,
+  see https://en.wikipedia.org/wiki/Algorithms_for_calculating_variance.
+
+  The partial statistics can be saved to and loaded from a file (NumPy .npz),
+  which allows to resume the accumulation.
+  """
+
+  def __init__(self, dtype=np.float64):
+    """
+    :param str|numpy.dtype dtype: used for the accumulation
+    """
+    self.dtype = dtype
+    self.count = 0
+    self.mean = None  # type: typing.Optional[np.ndarray]  # shape (dim,)
+    self.m2 = None  # type: typing.Optional[np.ndarray]  # shape (dim,), sum of squared differences from the mean
+    self.info = {}  # type: typing.Dict[str,typing.Union[int,str]]  # can be used to store e.g. where to resume
+
+  def __repr__(self):
+    return "<%s count=%i dim=%s>" % (
+      self.__class__.__name__, self.count, self.mean.shape[0] if self.mean is not None else None)
+
+  def _merge_moments(self, count, mean, m2):
+    """
+    :param int count:
+    :param numpy.ndarray mean: shape (dim,)
+    :param numpy.ndarray m2: shape (dim,)
+    """
+    if count == 0:
+      return
+    if self.count == 0:
+      self.count, self.mean, self.m2 = count, mean.astype(self.dtype), m2.astype(self.dtype)
+      return
+    assert self.mean.shape == mean.shape, "%s: dim mismatch, %r vs %r" % (self, self.mean.shape, mean.shape)
+    new_count = self.count + count
+    delta = mean - self.mean
+    self.mean = self.mean + delta * (float(count) / new_count)
+    self.m2 = self.m2 + m2 + np.square(delta) * (float(self.count) * count / new_count)
+    self.count = new_count
+
+  def add(self, data):
+    """
+    :param numpy.ndarray data: shape (time, dim)
+    """
+    assert data.ndim == 2
+    if data.shape[0] == 0:
+      return
+    data = data.astype(self.dtype, copy=False)
+    mean = np.mean(data, axis=0)
+    m2 = np.sum(np.square(data - mean[np.newaxis, :]), axis=0)
+    self._merge_moments(data.shape[0], mean, m2)
+
+  def merge(self, other):
+    """
+    :param MeanVarianceAccumulator other: partial statistics, e.g. of another shard
+    """
+    self._merge_moments(other.count, other.mean, other.m2)
+
+  def get_mean(self):
+    """
+    :rtype: numpy.ndarray
+    """
+    assert self.count > 0
+    return self.mean
+
+  def get_variance(self):
+    """
+    :rtype: numpy.ndarray
+    """
+    assert self.count > 0
+    return self.m2 / self.count
+
+  def get_std_dev(self):
+    """
+    :rtype: numpy.ndarray
+    """
+    return np.sqrt(self.get_variance())
+
+  def save(self, filename):
+    """
+    Saves the partial statistics. The file is replaced atomically.
+
+    :param str filename: .npz
+    """
+    assert filename.endswith(".npz")
+    tmp_filename = "%s.tmp%i.npz" % (filename[:-len(".npz")], os.getpid())
+    arrays = {"count": np.array(self.count, dtype="int64")}
+    if self.count > 0:
+      arrays.update({"mean": self.mean, "m2": self.m2})
+    for key, value in self.info.items():
+      arrays["info_%s" % key] = np.array(value)
+    np.savez(tmp_filename, **arrays)
+    os.replace(tmp_filename, filename)
+
+  @classmethod
+  def load(cls, filename, dtype=np.float64):
+    """
+    :param str filename: .npz, via :func:`save`
+    :param str|numpy.dtype dtype:
+    :rtype: MeanVarianceAccumulator
+    """
+    acc = cls(dtype=dtype)
+    with np.load(filename) as f:
+      count = int(f["count"])
+      if count > 0:
+        acc._merge_moments(count, f["mean"], f["m2"])
+      for key in f.files:
+        if key.startswith("info_"):
+          acc.info[key[len("info_"):]] = f[key].item()
+    return acc
+
+  def write_feature_vec_files(self, output_file_prefix):
+    """
+    Writes "<prefix>.mean.txt" and "<prefix>.std_dev.txt",
+    which can be used for ``norm_mean`` and ``norm_std_dev`` of :class:`ExtractAudioFeatures`
+    (same format as ``tools/dump-dataset.py --dump_stats``).
+
+    :param str output_file_prefix:
+    """
+    np.savetxt("%s.mean.txt" % output_file_prefix, self.get_mean())
+    np.savetxt("%s.std_dev.txt" % output_file_prefix, self.get_std_dev())
+
+
+def _accumulate_group(args):
+  """
+  Accumulates the mean/variance over all datasets of a group of one HDF file.
+  Module-level such that it can be used with :class:`multiprocessing.Pool`.
+
+  :param (str,str,numpy.dtype) args: HDF file path, group name, dtype
+  :rtype: MeanVarianceAccumulator
+  """
+  file_path, group_name, dtype = args
+  acc = MeanVarianceAccumulator(dtype=dtype)
+  with h5py.File(file_path, mode='r') as f:
+    if group_name not in f:
+      return acc
+    group = f[group_name]
+    for ds_name in group.keys():
+      acc.add(group[ds_name][...])
+  return acc
 
 
 class NormalizationData(object):
@@ -23,11 +169,10 @@ class NormalizationData(object):
   DATASET_TIME_DIMENSION_INDEX = 0
   DATASET_FEATURE_DIMENSION_INDEX = 1
 
-  SUMMATION_PRECISION = 1e-5
-
   @staticmethod
   def createNormalizationFile(bundleFilePath, outputFilePath, dtype=np.float64,
-                              flag_includeOutputs=True):
+                              flag_includeOutputs=True, numWorkers=1,
+                              partialStatsFilePrefix=None):
     """Calculates means over inputs and outputs of datasets in the HDF files
     described by the given bundle file.
 
@@ -47,6 +192,9 @@ class NormalizationData(object):
     Availability of means and variances depends on whether the corresponding
     groups are available in the input dataset HDF files.
 
+    The statistics are accumulated with :class:`MeanVarianceAccumulator`,
+    per HDF file, optionally in parallel processes.
+
     !!! IMPORTANT !!!
     General rule of thumb: if one dataset file has both input and output
     groups then you should make sure that all the dataset files have them.
@@ -63,24 +211,31 @@ class NormalizationData(object):
     :type flag_includeOutputs: bool
     :param flag_includeOutputs: if True then normalization data will be
                                 calculated for outputs (targets) as well.
+    :type numWorkers: int
+    :param numWorkers: number of processes. The HDF files are distributed over them.
+    :type partialStatsFilePrefix: str | None
+    :param partialStatsFilePrefix: if given, the partial statistics are saved
+                                   to "<prefix>.<group>.npz" after each HDF file,
+                                   and a later call resumes from there.
     """
-    NormalizationData._calculateNormalizationData(
-      bundleFilePath,
-      outputFilePath,
-      NormalizationData.GROUP_INPUTS,
-      dtype=dtype
-    )
+    groupNames = [NormalizationData.GROUP_INPUTS]
     if flag_includeOutputs:
+      groupNames.append(NormalizationData.GROUP_OUTPUTS)
+    for groupName in groupNames:
       NormalizationData._calculateNormalizationData(
         bundleFilePath,
         outputFilePath,
-        NormalizationData.GROUP_OUTPUTS,
-        dtype=dtype
+        groupName,
+        dtype=dtype,
+        numWorkers=numWorkers,
+        partialStatsFile=(
+          "%s.%s.npz" % (partialStatsFilePrefix, groupName) if partialStatsFilePrefix else None)
       )
 
   @staticmethod
   def _calculateNormalizationData(bundleFilePath, outputFilePath, groupName,
-                                  dtype=np.float64):
+                                  dtype=np.float64, numWorkers=1,
+                                  partialStatsFile=None):
     """Helper method.
     Calculates and writes into the output HDF file mean, mean of squares,
     variance and total number of frames for the datasets in the given HDF
@@ -98,143 +253,52 @@ class NormalizationData(object):
                       normalization data.
     :type dtype: numpy.dtype
     :param dtype: type of data to use during calculations.
+    :type numWorkers: int
+    :param numWorkers: number of processes
+    :type partialStatsFile: str | None
+    :param partialStatsFile: .npz file to save the partial statistics to, and to resume from
     """
-    accumulatedSum = None
-    accumulatedSumOfSqr = None
-    totalFrames = long()
     bundle = BundleFile(bundleFilePath)
-    for filePath in bundle.datasetFilePaths:
-      with h5py.File(filePath, mode='r') as datasetFile:
-        intermSum, intermSumOfSqr, intermTotalFrames = \
-          NormalizationData._accumulateSums(
-            datasetFile,
-            groupName,
-            dtype=dtype
-          )
-        accumulatedSum = NormalizationData._updateTotalSum(
-          accumulatedSum,
-          intermSum
-        )
-        accumulatedSumOfSqr = NormalizationData._updateTotalSum(
-          accumulatedSumOfSqr,
-          intermSumOfSqr
-        )
-        totalFrames += intermTotalFrames
-
-    mean, meanOfSquares, variance = \
-      NormalizationData._calculateMeans(
-        accumulatedSum,
-        accumulatedSumOfSqr,
-        totalFrames
-      )
+    acc = MeanVarianceAccumulator(dtype=dtype)
+    numFilesDone = 0
+    if partialStatsFile and os.path.isfile(partialStatsFile):
+      acc = MeanVarianceAccumulator.load(partialStatsFile, dtype=dtype)
+      numFilesDone = acc.info["num_files_done"]
+      assert acc.info["bundle_file"] == os.path.abspath(bundleFilePath), (
+        "%s: partial stats are from a different bundle file %r" % (partialStatsFile, acc.info["bundle_file"]))
+    jobs = [(filePath, groupName, dtype) for filePath in bundle.datasetFilePaths[numFilesDone:]]
+
+    pool = None
+    if numWorkers > 1 and len(jobs) > 1:
+      import multiprocessing
+      pool = multiprocessing.Pool(min(numWorkers, len(jobs)))
+      results = pool.imap(_accumulate_group, jobs)  # in order, such that we can resume
+    else:
+      results = six.moves.map(_accumulate_group, jobs)
+    try:
+      for fileAcc in results:
+        acc.merge(fileAcc)
+        numFilesDone += 1
+        if partialStatsFile:
+          acc.info.update({"num_files_done": numFilesDone, "bundle_file": os.path.abspath(bundleFilePath)})
+          acc.save(partialStatsFile)
+    finally:
+      if pool:
+        pool.terminate()
+
+    mean, meanOfSquares, variance = None, None, None
+    if acc.count > 0:
+      mean = acc.get_mean()
+      variance = acc.get_variance()
+      meanOfSquares = variance + np.square(mean)
 
     with h5py.File(outputFilePath, mode='a') as out:
       NormalizationData._writeData(
         out, groupName,
-        mean, meanOfSquares, variance, totalFrames,
+        mean, meanOfSquares, variance, acc.count,
         dtype=dtype
       )
 
-  @staticmethod
-  def _accumulateSums(f, groupName, dtype=np.float64):
-    """Helper method.
-    Accumulate sums and sums of squares over feature vectors for a given group.
-
-    :type f: h5py.File
-    :param f: handle to an opened HDF file with datasets
-    :type groupName: str
-    :param groupName: HDF group containing datasets
-    :type dtype: numpy.dtype
-    :param dtype: type of data to use during calculations.
-    :rtype: tuple (numpy.ndarray | None, numpy.ndarray | None, long)
-    :return: tuple (sum, sum of squares, total number of time frames)
-             if they are available
-    """
-    sum = None
-    sumOfSqr = None
-    totalFrames = np.int64(0)
-    if groupName not in f:
-      return sum, sumOfSqr, totalFrames
-    group = f[groupName]
-    datasetNames = group.keys()
-    if len(datasetNames) == 0:
-      return sum, sumOfSqr, totalFrames
-    featDims = group[datasetNames[0]].shape[
-      NormalizationData.DATASET_FEATURE_DIMENSION_INDEX
-    ]
-    sum = np.zeros(featDims, dtype=dtype)
-    sumOfSqr = np.zeros(featDims, dtype=dtype)
-    for dsName in datasetNames:
-      dataset = group[dsName][...]
-      sum += np.sum(
-        dataset,
-        axis=NormalizationData.DATASET_TIME_DIMENSION_INDEX
-      )
-      sumOfSqr += np.sum(
-        np.square(dataset),
-        axis=NormalizationData.DATASET_TIME_DIMENSION_INDEX
-      )
-      totalFrames += dataset.shape[
-        NormalizationData.DATASET_TIME_DIMENSION_INDEX
-      ]
-    return sum, sumOfSqr, totalFrames
-
-  @staticmethod
-  def _updateTotalSum(totalSum, intermediateSum):
-    """Helper method.
-    Updates total sum with intermediate sum if the latter is available.
-
-    :type totalSum: numpy.ndarray | None
-    :param totalSum: total sum
-    :type intermediateSum: numpy.ndarray | None
-    :param intermediateSum: intermediate sum
-    :rtype: numpy.ndarray | None
-    :return: updated total sum if available
-    """
-    if totalSum is None and intermediateSum is None:
-      return None
-    if totalSum is None:
-      return intermediateSum
-    if intermediateSum is None:
-      return totalSum
-    # floating point summation check
-    oldSum = totalSum
-    newSum = np.add(totalSum, intermediateSum)
-    sumErr = np.sum(np.abs(newSum - oldSum - intermediateSum))
-    if sumErr > NormalizationData.SUMMATION_PRECISION:
-      raise FloatingPointError(
-        'sums have very different orders of magnitude.'
-        ' summation error = {}'.format(sumErr)
-      )
-    return newSum
-
-  @staticmethod
-  def _calculateMeans(totalSum, totalSumOfSqr, totalFrames):
-    """Helper method.
-    Calculate mean, mean of squares and variance if they are available.
-
-    :type totalSum: numpy.ndarray | None
-    :param totalSum: total sum of features
-    :type totalSumOfSqr: numpy.ndarray | None
-    :param totalSumOfSqr: total sum of squares of features
-    :type totalFrames: long
-    :param totalFrames: total number of timeframes
-    :rtype: tuple (numpy.ndarray | None, numpy.ndarray | None, numpy.ndarray | None)
-    :return: tuple (mean, mean of squares, variance) if they are available
-    """
-    mean = None
-    meanOfSquares = None
-    variance = None
-    if totalSum is not None:
-      assert totalFrames > 0
-      mean = totalSum / totalFrames
-    if mean is not None and totalSumOfSqr is not None:
-      assert totalFrames > 0
-      meanOfSquares = totalSumOfSqr / totalFrames
-      # Var[X] = E[X ^ 2] - (E[X]) ^ 2
-      variance = meanOfSquares - np.square(mean)
-    return mean, meanOfSquares, variance
-
   @staticmethod
   def _writeData(f, groupName, mean, meanOfSqr, variance, totalFrames,
                  dtype=np.float64):
@@ -4,7 +4,9 @@ Provides :class:`NumpyDumpDataset`.
 """
 
 from returnn.datasets.basic import Dataset, DatasetSeq
+from returnn.log import log
 import os
+import time
 import numpy
 import typing
 
@@ -12,6 +14,13 @@ import typing
 class NumpyDumpDataset(Dataset):
   """
   For ``tools/dump-dataset.py --type=numpy``.
+
+  With ``postfix=".npy"``, the files are in the NumPy binary format, and will be memory-mapped.
+  Otherwise, they are text files (via :func:`numpy.loadtxt`).
+
+  With ``read_ahead``, the files of the next seqs (in the seq order of the current epoch)
+  are read asynchronously in a thread pool.
+  This helps on network filesystems where each file access has a high latency.
   """
 
   file_format_data = "%i.data"
@@ -19,7 +28,19 @@ class NumpyDumpDataset(Dataset):
 
   def __init__(self, prefix, postfix=".txt.gz",
                start_seq=0, end_seq=None,
-               num_inputs=None, num_outputs=None, **kwargs):
+               num_inputs=None, num_outputs=None,
+               read_ahead=0, read_ahead_num_threads=4,
+               **kwargs):
+    """
+    :param str prefix:
+    :param str postfix: e.g. ".txt.gz" or ".npy"
+    :param int start_seq:
+    :param int|None end_seq:
+    :param int num_inputs:
+    :param dict[str,(int,int)] num_outputs:
+    :param int read_ahead: num of seqs to read ahead asynchronously. 0 to disable
+    :param int read_ahead_num_threads: num of threads for read_ahead
+    """
     super(NumpyDumpDataset, self).__init__(**kwargs)
     self.file_format_data = prefix + self.file_format_data + postfix
     self.file_format_targets = prefix + self.file_format_targets + postfix
@@ -30,6 +51,14 @@ class NumpyDumpDataset(Dataset):
     self.num_inputs = num_inputs
     self.num_outputs = num_outputs
     assert num_inputs and num_outputs
+    self.read_ahead = read_ahead
+    self.read_ahead_num_threads = read_ahead_num_threads
+    self._read_ahead_executor = None  # created in init_seq_order, shut down in finish_epoch
+    self._read_ahead_futures = {}  # type: typing.Dict[int,typing.Any]  # seq_idx -> Future of (features, targets)
+    self._read_ahead_stall_time = 0.0
+    self._read_ahead_num_seqs = 0
+    if read_ahead:
+      print("%s: read-ahead window of %i seqs, %i threads" % (self, read_ahead, read_ahead_num_threads), file=log.v4)
 
   def _init_num_seqs(self, end_seq=None):
     last_seq = None
@@ -45,19 +74,92 @@ class NumpyDumpDataset(Dataset):
       i += 1
     if end_seq is None:
       assert last_seq is not None, "None found. Check %s." % (self.file_format_data % self.start_seq)
-      end_seq = last_seq
+      end_seq = last_seq + 1  # exclusive
     else:
       assert last_seq == end_seq - 1, "Check %s." % (self.file_format_data % end_seq)
     assert end_seq > self.start_seq
     self._num_seqs = end_seq - self.start_seq
 
+  @staticmethod
+  def _read_numpy_file(filename):
+    """
+    :param str filename:
+    :rtype: numpy.ndarray
+    """
+    if filename.endswith(".npy"):
+      return numpy.load(filename, mmap_mode="r")
+    return numpy.loadtxt(filename)
+
+  def _read_numpy_seq(self, real_idx):
+    """
+    Can be called from another thread.
+
+    :param int real_idx: file index
+    :return: features, targets
+    :rtype: (numpy.ndarray, numpy.ndarray)
+    """
+    features = self._read_numpy_file(self.file_format_data % real_idx)
+    targets = self._read_numpy_file(self.file_format_targets % real_idx)
+    return features, targets
+
+  def _read_ahead(self, start):
+    """
+    Submits the reads for the seqs [start, start + read_ahead), if not done yet.
+
+    :param int start: seq idx
+    """
+    for seq_idx in range(start, min(start + self.read_ahead, self.num_seqs)):
+      if seq_idx not in self._read_ahead_futures:
+        self._read_ahead_futures[seq_idx] = self._read_ahead_executor.submit(
+          self._read_numpy_seq, self._seq_index[seq_idx])
+
+  def _cancel_read_ahead(self):
+    """
+    Cancels all pending reads.
+    """
+    for future in self._read_ahead_futures.values():
+      future.cancel()
+    self._read_ahead_futures.clear()
+
+  def _shutdown_read_ahead(self):
+    """
+    Cancels all pending reads, and stops the threads.
+    """
+    if self._read_ahead_executor:
+      self._cancel_read_ahead()
+      self._read_ahead_executor.shutdown(wait=True)
+      self._read_ahead_executor = None
+
   def _load_numpy_seq(self, seq_idx):
     """
+    Loads the seq into the seq cache.
+    The seq cache is contiguous, thus this also loads the seqs in between, in order.
+
     :param int seq_idx:
     """
-    real_idx = self._seq_index[seq_idx]
-    features = numpy.loadtxt(self.file_format_data % real_idx)
-    targets = numpy.loadtxt(self.file_format_targets % real_idx)
+    if self.cached_seqs and seq_idx < self.cached_seqs[0].seq_idx:
+      self.cached_seqs[:] = []  # going backwards, start a new cache
+    if self.cached_seqs:
+      for seq_idx_ in range(self._get_cache_last_seq_idx() + 1, seq_idx):
+        self._load_single_numpy_seq(seq_idx_)
+    self._load_single_numpy_seq(seq_idx)
+
+  def _load_single_numpy_seq(self, seq_idx):
+    """
+    :param int seq_idx: directly after the last cached seq, or any if the cache is empty
+    """
+    if self._read_ahead_executor:
+      self._read_ahead(seq_idx)
+      # Drop reads for seqs which we have skipped.
+      for seq_idx_ in [i for i in self._read_ahead_futures if i < seq_idx]:
+        self._read_ahead_futures.pop(seq_idx_).cancel()
+      future = self._read_ahead_futures.pop(seq_idx)
+      start_time = time.time()
+      features, targets = future.result()
+      self._read_ahead_stall_time += time.time() - start_time
+      self._read_ahead_num_seqs += 1
+    else:
+      features, targets = self._read_numpy_seq(self._seq_index[seq_idx])
     assert features.ndim == 2
     assert features.shape[1] == self.num_inputs
     assert targets.ndim == 1
@@ -79,8 +181,24 @@ class NumpyDumpDataset(Dataset):
       self.seq_ordering = "default"
     self._seq_index = [i + self.start_seq for i in self.get_seq_order_for_epoch(epoch, self.num_seqs)]
     self.cached_seqs[:] = []
+    self._cancel_read_ahead()  # drop the reads of the previous seq order
+    if self.read_ahead and not self._read_ahead_executor:
+      from concurrent.futures import ThreadPoolExecutor
+      self._read_ahead_executor = ThreadPoolExecutor(max_workers=self.read_ahead_num_threads)
+    self._read_ahead_stall_time = 0.0
+    self._read_ahead_num_seqs = 0
     return True
 
+  def finish_epoch(self):
+    """
+    This would get called at the end of the epoch.
+    """
+    if self._read_ahead_executor:
+      self._shutdown_read_ahead()
+      print("%s: read-ahead window of %i seqs, %i seqs read, stalled %.3f secs" % (
+        self, self.read_ahead, self._read_ahead_num_seqs, self._read_ahead_stall_time), file=log.v4)
+    super(NumpyDumpDataset, self).finish_epoch()
+
   def _load_seqs(self, start, end):
     """
     :param int start:
@@ -90,6 +208,8 @@ class NumpyDumpDataset(Dataset):
     for i in range(start, end):
       if not self._have_cache_seq(i):
         self._load_numpy_seq(i)
+    if self._read_ahead_executor:
+      self._read_ahead(end)
 
   def get_input_data(self, seq_idx):
     """
@@ -167,6 +287,6 @@ class NumpyDumpDataset(Dataset):
       return -1
 
   def _add_cache_seq(self, seq_idx, features, targets):
-    last_seq_idx = self._get_cache_last_seq_idx()
-    assert seq_idx == last_seq_idx + 1
+    if self.cached_seqs:
+      assert seq_idx == self._get_cache_last_seq_idx() + 1
     self.cached_seqs += [DatasetSeq(seq_idx, features, targets)]
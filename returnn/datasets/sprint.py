@@ -1001,16 +1001,17 @@ class SprintCacheDataset(CachedDataset2):
     """
     Helper class to read a Sprint cache directly.
     """
-    def __init__(self, data_key, filename, data_type=None, allophone_labeling=None):
+    def __init__(self, data_key, filename, data_type=None, allophone_labeling=None, max_open_archives=64):
       """
       :param str data_key: e.g. "data" or "classes"
-      :param str filename: to Sprint cache archive
+      :param str filename: to Sprint cache archive or bundle
       :param str|None data_type: "feat" or "align"
       :param dict[str] allophone_labeling: kwargs for :class:`AllophoneLabeling`
+      :param int max_open_archives: max number of open archives of a bundle, see :class:`FileArchiveIndexedReader`
       """
       self.data_key = data_key
-      from returnn.sprint.cache import open_file_archive
-      self.sprint_cache = open_file_archive(filename)
+      from returnn.sprint.cache import FileArchiveIndexedReader
+      self.sprint_cache = FileArchiveIndexedReader(filename, max_open_archives=max_open_archives)
       if not data_type:
         if data_key == "data":
           data_type = "feat"
@@ -1057,12 +1058,10 @@ class SprintCacheDataset(CachedDataset2):
       """
       assert self.type == "feat"
       assert self.content_keys
-      times, feats = self.sprint_cache.read(self.content_keys[0], "feat")
+      times, feats = self.sprint_cache.read_features(self.content_keys[0])
       assert len(times) == len(feats) > 0
-      feat = feats[0]
-      assert isinstance(feat, numpy.ndarray)
-      assert feat.ndim == 1
-      return feat.shape[0]
+      assert feats.ndim == 2
+      return feats.shape[1]
 
     def read(self, name):
       """
@@ -1070,18 +1069,22 @@ class SprintCacheDataset(CachedDataset2):
       :return: numpy array of shape (time, [num_labels])
       :rtype: numpy.ndarray
       """
-      res = self.sprint_cache.read(name, typ=self.type)
       if self.type == "align":
-        label_seq = numpy.array([self.allophone_labeling.get_label_idx(a, s) for (t, a, s) in res], dtype=self.dtype)
-        assert label_seq.shape == (len(res),)
+        times, mixes = self.sprint_cache.read_alignment(name)
+        allos, states = self.sprint_cache.get_allophone_states(mixes)
+        label_seq = numpy.array(
+          [self.allophone_labeling.get_label_idx(a, s) for (a, s) in zip(allos.tolist(), states.tolist())],
+          dtype=self.dtype)
+        assert label_seq.shape == (len(times),)
         return label_seq
       elif self.type == "align_raw":
-        label_seq = numpy.array(
-          [self.allophone_labeling.state_tying_by_allo_state_idx[a] for (t, a, s) in res], dtype=self.dtype)
-        assert label_seq.shape == (len(res),)
+        times, mixes = self.sprint_cache.read_alignment(name)
+        state_tying = self.allophone_labeling.state_tying_by_allo_state_idx
+        label_seq = numpy.array([state_tying[a] for a in mixes.tolist()], dtype=self.dtype)
+        assert label_seq.shape == (len(times),)
         return label_seq
       elif self.type == "feat":
-        times, feats = res
+        times, feats = self.sprint_cache.read_features(name)
         assert len(times) == len(feats) > 0
         feat_mat = numpy.array(feats, dtype=self.dtype)
         assert feat_mat.shape == (len(times), self.num_labels)
@@ -1139,7 +1142,7 @@ class SprintCacheDataset(CachedDataset2):
       :param int s:
       :rtype: int
       """
-      return data0.sprint_cache.ft[self.seq_list_original[s]].size
+      return data0.sprint_cache.get_file_info(self.seq_list_original[s]).size
     seq_index = self.get_seq_order_for_epoch(epoch, self.num_seqs, get_seq_len=get_seq_size)
     self.seq_list_ordered = [self.seq_list_original[s] for s in seq_index]
     return True
@@ -6,6 +6,7 @@ This is shared across different backends.
 
 import random
 import typing
+import numpy
 from returnn.util import NumbersDict
 
 
@@ -20,6 +21,8 @@ class BatchSeqCopyPart:
    be stored in the batch.
   """
 
+  __slots__ = ("seq_idx", "seq_start_frame", "seq_end_frame", "batch_slice", "batch_frame_offset")
+
   def __init__(self, seq_idx, seq_start_frame, seq_end_frame,
                batch_slice, batch_frame_offset):
     """
@@ -57,6 +60,8 @@ class Batch:
   This is basically just a list of BatchSeqCopyPart.
   """
 
+  __slots__ = ("max_num_frames_per_slice", "num_slices", "seqs")
+
   def __init__(self):
     self.max_num_frames_per_slice = NumbersDict(0)
     self.num_slices = 0
@@ -164,6 +169,258 @@ class Batch:
     return self.end_seq - self.start_seq
 
 
+def get_recurrent_batch_ends(lengths, batch_size, max_seqs=float("inf"), max_pad_size=None):
+  """
+  Vectorized variant of the greedy batch construction in :func:`Dataset._generate_batches` for the recurrent case,
+  where every sequence (or chunk) becomes one slice in the batch (:func:`Batch.add_sequence_as_slice`).
+  A new batch is started when the padded size (max length * num slices) would exceed batch_size,
+  when there would be more than max_seqs slices, or when the padding would exceed max_pad_size.
+  The first sequence of a batch is always added.
+
+  :param NumbersDict lengths: data-key -> int array of shape (num_parts,), for all the parts in order.
+    The broadcast value (if set) is a scalar.
+  :param NumbersDict batch_size:
+  :param int|float max_seqs:
+  :param NumbersDict|None max_pad_size:
+  :return: end part index (exclusive) for every batch, i.e. batch i covers the parts ends[i-1]:ends[i]
+  :rtype: numpy.ndarray
+  """
+  if max_pad_size is None:
+    max_pad_size = NumbersDict()
+  keys = sorted(lengths.keys())
+  assert keys, "%r: need some data-key" % lengths
+  num_parts = len(lengths[keys[0]])
+  # As in Batch.try_sequence_as_slice, we start with max_num_frames_per_slice = NumbersDict(0).
+  max_frames_value = NumbersDict._max(0, lengths.value)
+  pad_value = max_frames_value - (lengths.value or 0)
+  window = int(max_seqs) + 1 if max_seqs < float("inf") else 128
+  ends = []
+  start = 0
+  while start < num_parts:
+    size = window
+    while True:
+      stop = min(start + size, num_parts)
+      num_slices = numpy.arange(1, stop - start + 1)
+      padded = NumbersDict(broadcast_value=max_frames_value * num_slices)
+      pad = NumbersDict(broadcast_value=pad_value * num_slices)
+      for key in keys:
+        part_lens = lengths[key][start:stop]
+        max_frames = numpy.maximum.accumulate(numpy.maximum(part_lens, 0))
+        padded[key] = max_frames * num_slices
+        pad[key] = max_frames * num_slices - numpy.cumsum(part_lens)
+      exceeds = (
+        padded.any_compare_elemwise(batch_size, numpy.greater) |
+        (num_slices > max_seqs) |
+        pad.any_compare_elemwise(max_pad_size, numpy.greater))
+      exceeds = numpy.broadcast_to(exceeds, num_slices.shape)[1:]
+      if exceeds.any():
+        end = start + 1 + int(numpy.argmax(exceeds))
+        break
+      if stop == num_parts:
+        end = num_parts
+        break
+      size *= 2
+    ends.append(end)
+    start = end
+  return numpy.array(ends, dtype="int64")
+
+
+def iterate_recurrent_batches(seq_idx, seq_start_frame, length, batch_ends):
+  """
+  Creates the batches for the batch boundaries from :func:`get_recurrent_batch_ends`.
+  These are the same as if they were created via :func:`Batch.add_sequence_as_slice`.
+
+  :param numpy.ndarray seq_idx: shape (num_parts,)
+  :param NumbersDict seq_start_frame: data-key -> int array of shape (num_parts,), broadcast value scalar
+  :param NumbersDict length: data-key -> int array of shape (num_parts,), broadcast value scalar
+  :param numpy.ndarray|list[int] batch_ends:
+  :rtype: typing.Iterator[Batch]
+  """
+  seq_end_frame = seq_start_frame + length
+  start = 0
+  for end in batch_ends:
+    batch = Batch()
+    for i in range(start, end):
+      batch.seqs.append(BatchSeqCopyPart(
+        seq_idx=int(seq_idx[i]),
+        seq_start_frame=NumbersDict(
+          numbers_dict={key: value[i] for (key, value) in seq_start_frame.items()},
+          broadcast_value=seq_start_frame.value),
+        seq_end_frame=NumbersDict(
+          numbers_dict={key: value[i] for (key, value) in seq_end_frame.items()},
+          broadcast_value=seq_end_frame.value),
+        batch_slice=i - start,
+        batch_frame_offset=0))
+    batch.max_num_frames_per_slice = NumbersDict.max([
+      NumbersDict(0),
+      NumbersDict(
+        numbers_dict={key: numpy.max(value[start:end]) for (key, value) in length.items()},
+        broadcast_value=length.value)])
+    batch.num_slices = end - start
+    yield batch
+    start = end
+
+
+class BatchSet:
+  """
+  Columnar storage of a list of :class:`Batch`, e.g. for caching all the batches of an epoch.
+  A :class:`Batch` with its :class:`BatchSeqCopyPart` objects and all the :class:`NumbersDict`
+  costs several hundred bytes per seq, while here we only store a few int32 numbers per seq and data-key.
+
+  All the parts (:class:`BatchSeqCopyPart`) of all batches are stored in flat tables,
+  and every batch is a range of rows, given by batch_parts_offset.
+  The columns of the NumbersDict tables are the data-keys, and the last column is the broadcast value.
+  Missing entries (no such key, or no broadcast value) are marked via :data:`Missing`.
+  Indexing returns an equivalent :class:`Batch` object, such that the usual API can be used.
+  """
+
+  Missing = numpy.iinfo(numpy.int32).min
+
+  def __init__(self):
+    self.keys = []  # type: typing.List[str]
+    self.num_batches = 0
+    self.num_parts = 0
+    self.batch_parts_offset = numpy.zeros((1,), dtype="int64")  # (num_batches + 1,)
+    self.batch_num_slices = numpy.zeros((0,), dtype="int32")  # (num_batches,)
+    self.batch_max_num_frames_per_slice = numpy.zeros((0, 1), dtype="int32")  # (num_batches, num_keys + 1)
+    self.seq_idx = numpy.zeros((0,), dtype="int32")  # (num_parts,)
+    self.batch_slice = numpy.zeros((0,), dtype="int32")  # (num_parts,)
+    self.seq_start_frame = numpy.zeros((0, 1), dtype="int32")  # (num_parts, num_keys + 1)
+    self.seq_end_frame = numpy.zeros((0, 1), dtype="int32")  # (num_parts, num_keys + 1)
+    self.batch_frame_offset = numpy.zeros((0, 1), dtype="int32")  # (num_parts, num_keys + 1)
+
+  def __repr__(self):
+    return "<BatchSet num_batches=%i num_parts=%i keys=%r>" % (self.num_batches, self.num_parts, self.keys)
+
+  def __len__(self):
+    return self.num_batches
+
+  def __getitem__(self, idx):
+    """
+    :param int idx:
+    :rtype: Batch
+    """
+    if idx < 0:
+      idx += self.num_batches
+    if not 0 <= idx < self.num_batches:
+      raise IndexError("%r: batch index %i out of range" % (self, idx))
+    batch = Batch()
+    batch.max_num_frames_per_slice = self._get_numbers_dict(self.batch_max_num_frames_per_slice[idx])
+    batch.num_slices = int(self.batch_num_slices[idx])
+    for i in range(self.batch_parts_offset[idx], self.batch_parts_offset[idx + 1]):
+      batch.seqs.append(BatchSeqCopyPart(
+        seq_idx=int(self.seq_idx[i]),
+        seq_start_frame=self._get_numbers_dict(self.seq_start_frame[i]),
+        seq_end_frame=self._get_numbers_dict(self.seq_end_frame[i]),
+        batch_slice=int(self.batch_slice[i]),
+        batch_frame_offset=self._get_numbers_dict(self.batch_frame_offset[i])))
+    return batch
+
+  def __iter__(self):
+    for idx in range(self.num_batches):
+      yield self[idx]
+
+  def _get_numbers_dict(self, row):
+    """
+    :param numpy.ndarray row: (num_keys + 1,)
+    :rtype: NumbersDict
+    """
+    return NumbersDict(
+      numbers_dict={key: int(row[i]) for (i, key) in enumerate(self.keys) if row[i] != self.Missing},
+      broadcast_value=int(row[-1]) if row[-1] != self.Missing else None)
+
+  def _get_row(self, d):
+    """
+    :param NumbersDict d:
+    :rtype: list[int]
+    """
+    return [d.dict.get(key, self.Missing) for key in self.keys] + [self.Missing if d.value is None else d.value]
+
+  def _add_keys(self, d):
+    """
+    Adds a column for all new keys.
+    This is not expected to happen often (usually only for the first batch).
+
+    :param NumbersDict d:
+    """
+    for key in sorted(d.keys()):
+      if key in self.keys:
+        continue
+      self.keys.append(key)
+      for name in ["batch_max_num_frames_per_slice", "seq_start_frame", "seq_end_frame", "batch_frame_offset"]:
+        table = getattr(self, name)
+        new_column = numpy.full((table.shape[0], 1), self.Missing, dtype=table.dtype)
+        setattr(self, name, numpy.concatenate([table[:, :-1], new_column, table[:, -1:]], axis=1))
+
+  @staticmethod
+  def _to_int32(values):
+    """
+    :param list[int]|list[list[int]] values:
+    :rtype: numpy.ndarray
+    """
+    values = numpy.array(values, dtype="int64")
+    assert values.size == 0 or (
+      numpy.iinfo(numpy.int32).min <= values.min() and values.max() <= numpy.iinfo(numpy.int32).max), (
+      "BatchSet: values out of int32 range")
+    return values.astype("int32")
+
+  @staticmethod
+  def _append_rows(table, rows, num_used):
+    """
+    :param numpy.ndarray table: with capacity, only the first num_used entries are used
+    :param numpy.ndarray rows:
+    :param int num_used:
+    :return: table, maybe reallocated (amortized growth)
+    :rtype: numpy.ndarray
+    """
+    if num_used + len(rows) > table.shape[0]:
+      new_table = numpy.zeros((max(num_used + len(rows), table.shape[0] * 2),) + table.shape[1:], dtype=table.dtype)
+      new_table[:num_used] = table[:num_used]
+      table = new_table
+    table[num_used:num_used + len(rows)] = rows
+    return table
+
+  def append(self, batch):
+    """
+    :param Batch batch:
+    """
+    self._add_keys(batch.max_num_frames_per_slice)
+    for seq in batch.seqs:
+      self._add_keys(seq.seq_start_frame)
+      self._add_keys(seq.seq_end_frame)
+      self._add_keys(seq.batch_frame_offset)
+    num_parts = len(batch.seqs)
+    shape = (num_parts, len(self.keys) + 1)
+    for name, values in [
+          ("seq_idx", [seq.seq_idx for seq in batch.seqs]),
+          ("batch_slice", [seq.batch_slice for seq in batch.seqs]),
+          ("seq_start_frame", [self._get_row(seq.seq_start_frame) for seq in batch.seqs]),
+          ("seq_end_frame", [self._get_row(seq.seq_end_frame) for seq in batch.seqs]),
+          ("batch_frame_offset", [self._get_row(seq.batch_frame_offset) for seq in batch.seqs])]:
+      rows = self._to_int32(values).reshape(shape[:getattr(self, name).ndim])
+      setattr(self, name, self._append_rows(getattr(self, name), rows, self.num_parts))
+    self.batch_max_num_frames_per_slice = self._append_rows(
+      self.batch_max_num_frames_per_slice, self._to_int32([self._get_row(batch.max_num_frames_per_slice)]),
+      self.num_batches)
+    self.batch_num_slices = self._append_rows(
+      self.batch_num_slices, self._to_int32([batch.num_slices]), self.num_batches)
+    self.num_parts += num_parts
+    self.batch_parts_offset = self._append_rows(
+      self.batch_parts_offset, numpy.array([self.num_parts], dtype="int64"), self.num_batches + 1)
+    self.num_batches += 1
+
+  def get_num_bytes(self):
+    """
+    :return: allocated memory of the tables
+    :rtype: int
+    """
+    return sum(
+      getattr(self, name).nbytes
+      for name in [
+        "batch_parts_offset", "batch_num_slices", "batch_max_num_frames_per_slice",
+        "seq_idx", "batch_slice", "seq_start_frame", "seq_end_frame", "batch_frame_offset"])
+
+
 class BatchSetGenerator:
   """
   This will give you the next batches (list[Batch]) such that you can use them for assign_dev_data().
@@ -184,16 +441,17 @@ class BatchSetGenerator:
     self.generator = generator
     self.shuffle_batches = shuffle_batches
     # In some cases, it might be faster to cache the list of batches.
+    # We store them in the compact BatchSet, and create the Batch objects again when needed.
     self.cache_whole_epoch = cache_whole_epoch
-    self.cache = []  # type: typing.List[Batch]
-    self.buffer = []  # type: typing.List[Batch]
+    self.cache = BatchSet()
+    self.buffer = []  # type: typing.List[typing.Union[Batch,int]]  # int: index into the cache
     self.last_batch = None  # type: typing.Optional[Batch]
     self.reached_end = False
     random.seed(1234)
     self._reset()
 
   def _reset(self):
-    self.buffer = self.cache[:]
+    self.buffer = list(range(len(self.cache)))
     if self.shuffle_batches:
       random.shuffle(self.buffer)
     self.cache_active = self.reached_end
@@ -219,7 +477,7 @@ class BatchSetGenerator:
     else:
       self.buffer += [batch]
       if self.cache_whole_epoch and not self.cache_active:
-        self.cache += [batch]
+        self.cache.append(batch)
       return True
 
   def _read_next_up_to_n(self, n):
@@ -229,6 +487,17 @@ class BatchSetGenerator:
       if not self._read_next():
         break
 
+  def _get_buffer_batches(self, n):
+    """
+    :param int n:
+    :return: the first n batches of the buffer, where we replace the cache indices by the batches
+    :rtype: list[Batch]
+    """
+    for i in range(min(n, len(self.buffer))):
+      if not isinstance(self.buffer[i], Batch):
+        self.buffer[i] = self.cache[self.buffer[i]]
+    return self.buffer[:n]
+
   def peek_next_n(self, n):
     """
     :rtype: list[Batch]
@@ -236,7 +505,7 @@ class BatchSetGenerator:
     If self.has_more() is True, it will at least return one.
     """
     self._read_next_up_to_n(n)
-    return self.buffer[:n]
+    return self._get_buffer_batches(n)
 
   def advance(self, n):
     """
@@ -245,7 +514,7 @@ class BatchSetGenerator:
     assert n > 0
     self._read_next_up_to_n(n)
     assert n <= len(self.buffer)
-    self.last_batch = self.buffer[n - 1]
+    self.last_batch = self._get_buffer_batches(n)[n - 1]
     self.buffer = self.buffer[n:]
     self.current_batch_idx += n
 
@@ -12,8 +12,10 @@ import sys
 import os
 import typing
 import array
-from struct import pack, unpack
+from collections import OrderedDict
+from struct import pack, unpack, unpack_from
 import numpy
+import threading
 import zlib
 import mmap
 
@@ -124,9 +126,11 @@ class FileArchive:
   # write routines
   def write_str(self, s):
     """
-    :param str s:
+    :param str|bytes s:
     :rtype: int
     """
+    if not isinstance(s, bytes):
+      s = s.encode("ascii")
     return self.f.write(pack("%ds" % len(s), s))
 
   def write_char(self, i):
@@ -580,6 +584,348 @@ class FileArchiveBundle:
       a.set_allophones(filename)
 
 
+def _read_file_archive_index(filename):
+  """
+  Reads the file info table of a Sprint cache archive, or scans the archive if there is none.
+  Like :func:`FileArchive.read_file_info_table` and :func:`FileArchive.scan_archive`,
+  but without keeping the file open.
+
+  :param str filename: single archive
+  :rtype: list[FileInfo]
+  """
+  with open(filename, "rb") as f:
+    buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+  try:
+    header_len = len(FileArchive.SprintCacheHeader)
+    assert buf[:header_len].decode("ascii") == FileArchive.SprintCacheHeader, "not a Sprint cache: %r" % filename
+    file_infos = []
+    if unpack_from("b", buf, header_len)[0]:  # has file info table
+      pos, = unpack_from("q", buf, len(buf) - 8)
+      count, = unpack_from("i", buf, pos)
+      pos += 4
+      for i in range(count):
+        str_len, = unpack_from("i", buf, pos)
+        name = buf[pos + 4:pos + 4 + str_len].decode("ascii")
+        pos += 4 + str_len
+        entry_pos, size, comp = unpack_from("qII", buf, pos)
+        pos += 16
+        file_infos.append(FileInfo(name, entry_pos, size, comp, i))
+    else:
+      pos = 0
+      while pos < len(buf):
+        tag, = unpack_from("I", buf, pos)
+        pos += 4
+        if tag != FileArchive.start_recovery_tag:
+          continue
+        str_len, = unpack_from("i", buf, pos)
+        name = buf[pos + 4:pos + 4 + str_len].decode("ascii")
+        pos += 4 + str_len
+        size, comp = unpack_from("II", buf, pos)
+        file_infos.append(FileInfo(name, pos, size, comp, len(file_infos)))
+        pos += 12 + size + 4  # header (size, comp, chk), data, end tag
+    return file_infos
+  finally:
+    buf.close()
+
+
+def _decode_feature_payload(buf):
+  """
+  :param bytes buf: uncompressed "vector-f32" entry
+  :return: times (time,2) float64 (start-time, end-time), features (time,dim) float32.
+    Both are read-only views into buf.
+    If the feature dimension varies over the frames, features is a list of (dim,) float32 arrays instead.
+  :rtype: (numpy.ndarray,numpy.ndarray|list[numpy.ndarray])
+  """
+  type_len, = unpack_from("I", buf, 0)
+  typ = buf[4:4 + type_len].decode("ascii")
+  assert typ == "vector-f32", "unexpected feature type %r" % typ
+  pos = 4 + type_len
+  count, = unpack_from("I", buf, pos)
+  pos += 4
+  if count == 0:
+    return numpy.zeros((0, 2), dtype="float64"), numpy.zeros((0, 0), dtype="float32")
+  dim, = unpack_from("I", buf, pos)
+  # Each frame is (size: u32, data: size x f32, time: 2 x f64), packed.
+  frame_dtype = numpy.dtype([("size", "u4"), ("data", "f4", (dim,)), ("time", "f8", (2,))])
+  if len(buf) - pos >= count * frame_dtype.itemsize:
+    frames = numpy.frombuffer(buf, dtype=frame_dtype, count=count, offset=pos)
+    if numpy.all(frames["size"] == dim):
+      return frames["time"], frames["data"]
+  # The feature dimension varies. Decode frame by frame, like FileArchive.read.
+  times = numpy.zeros((count, 2), dtype="float64")
+  features = []  # type: typing.List[numpy.ndarray]
+  for i in range(count):
+    size, = unpack_from("I", buf, pos)
+    pos += 4
+    features.append(numpy.frombuffer(buf, dtype="f4", count=size, offset=pos))
+    pos += 4 * size
+    times[i] = unpack_from("dd", buf, pos)
+    pos += 16
+  return times, features
+
+
+def _decode_alignment_payload(buf):
+  """
+  :param bytes buf: uncompressed "flow-alignment" entry
+  :return: times, mixtures (raw allophone state indices), both int32 arrays of shape (time,)
+  :rtype: (numpy.ndarray,numpy.ndarray)
+  """
+  type_len, = unpack_from("I", buf, 0)
+  typ = buf[4:4 + type_len].decode("ascii")
+  assert typ == "flow-alignment", "unexpected alignment type %r" % typ
+  pos = 4 + type_len + 4  # flag
+  typ = buf[pos:pos + 8].decode("ascii")
+  pos += 8
+  if typ not in ["ALIGNRLE", "AALPHRLE"]:
+    raise Exception("No valid alignment header found (found: %r). Wrong cache?" % typ)
+  size, = unpack_from("I", buf, pos)
+  pos += 4
+  if size >= (1 << 31):
+    raise NotImplementedError("No support for weighted alignments yet.")
+  times = numpy.zeros((size,), dtype="int32")
+  mixes = numpy.zeros((size,), dtype="int32")
+  time = 0
+  frame = 0
+  while frame < size:
+    n, = unpack_from("b", buf, pos)
+    pos += 1
+    if n > 0:  # n different mixtures
+      mixes[frame:frame + n] = numpy.frombuffer(buf, dtype="i4", count=n, offset=pos)
+      pos += 4 * n
+    elif n < 0:  # one mixture, repeated -n times
+      n = -n
+      mixes[frame:frame + n], = unpack_from("i", buf, pos)
+      pos += 4
+    else:  # jump in time
+      time, = unpack_from("i", buf, pos)
+      pos += 4
+      continue
+    times[frame:frame + n] = numpy.arange(time, time + n)
+    time += n
+    frame += n
+  return times, mixes
+
+
+class FileArchiveIndexedReader:
+  """
+  Thread-safe random-access reader for Sprint cache archives, e.g. a bundle with hundreds of archives.
+  In contrast to :class:`FileArchiveBundle`:
+
+    * We keep one global index, entry name -> (archive, :class:`FileInfo`).
+      Only the file info tables are read initially, and no file is kept open.
+    * The archives are memory-mapped lazily on the first read,
+      and at most max_open_archives are kept open (the least recently used ones are closed).
+    * :func:`read_features` and :func:`read_alignment` decode the whole entry via numpy.frombuffer.
+    * There is no shared file position, so one instance can be used from multiple threads.
+
+  :func:`read` is compatible to :func:`FileArchive.read`.
+  """
+
+  def __init__(self, filename=None, max_open_archives=64):
+    """
+    :param str|None filename: .bundle file or single archive
+    :param int max_open_archives: max number of memory-mapped archives (i.e. open file handles)
+    """
+    assert max_open_archives > 0
+    self.max_open_archives = max_open_archives
+    self.archive_filenames = []  # type: typing.List[str]
+    self.index = {}  # type: typing.Dict[str,typing.Tuple[int,FileInfo]]  # entry name -> (archive idx, file info)
+    self.allophones = []  # type: typing.List[str]
+    self._archive_idx_by_filename = {}  # type: typing.Dict[str,int]
+    self._short_seg_names = {}  # type: typing.Dict[str,str]
+    self._open_archives = OrderedDict()  # type: typing.Dict[int,mmap.mmap]  # least recently used first
+    self._lock = threading.Lock()
+    if filename is not None:
+      self.add_bundle_or_archive(filename)
+
+  def __del__(self):
+    self.close()
+
+  def close(self):
+    """
+    Closes all open archives. They would be reopened on the next read.
+    """
+    with self._lock:
+      for buf in self._open_archives.values():
+        buf.close()
+      self._open_archives.clear()
+
+  def add_bundle(self, filename):
+    """
+    :param str filename: bundle
+    """
+    for line in open(filename).read().splitlines():
+      self.add_archive(filename=line)
+
+  def add_archive(self, filename):
+    """
+    :param str filename: single archive
+    """
+    if filename in self._archive_idx_by_filename:
+      return
+    archive_idx = len(self.archive_filenames)
+    self.archive_filenames.append(filename)
+    self._archive_idx_by_filename[filename] = archive_idx
+    short_seg_names = {}
+    file_infos = _read_file_archive_index(filename)
+    for fi in file_infos:
+      self.index[fi.name] = (archive_idx, fi)
+      short_seg_names[os.path.basename(fi.name)] = fi.name
+    if len(short_seg_names) == len(file_infos):  # only if unique, like FileArchive
+      self._short_seg_names.update(short_seg_names)
+
+  def add_bundle_or_archive(self, filename):
+    """
+    :param str filename:
+    """
+    if filename.endswith(".bundle"):
+      self.add_bundle(filename)
+    else:
+      self.add_archive(filename)
+
+  def file_list(self):
+    """
+    :rtype: list[str]
+    :returns: list of content-filenames (which can be used for self.read())
+    """
+    return self.index.keys()
+
+  def has_entry(self, filename):
+    """
+    :param str filename: argument for self.read()
+    :return: True if we have this entry
+    """
+    return filename in self.index
+
+  def get_file_info(self, filename):
+    """
+    :param str filename: the entry-name in the archive
+    :rtype: FileInfo
+    """
+    if filename not in self.index:
+      if filename in self._short_seg_names:
+        filename = self._short_seg_names[filename]
+    return self.index[filename][1]
+
+  def set_allophones(self, f):
+    """
+    :param str f: allophone filename. line-separated. will ignore lines starting with "#"
+    """
+    self.allophones = [line.strip() for line in open(f) if not line.strip().startswith("#")]
+
+  def _get_archive_buffer(self, archive_idx):
+    """
+    Must be called with self._lock.
+
+    :param int archive_idx:
+    :rtype: mmap.mmap
+    """
+    if archive_idx in self._open_archives:
+      buf = self._open_archives.pop(archive_idx)
+    else:
+      while len(self._open_archives) >= self.max_open_archives:
+        _, old_buf = self._open_archives.popitem(last=False)
+        old_buf.close()
+      with open(self.archive_filenames[archive_idx], "rb") as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    self._open_archives[archive_idx] = buf  # most recently used
+    return buf
+
+  def read_raw(self, filename):
+    """
+    :param str filename: the entry-name in the archive
+    :return: the uncompressed data of the entry, or None if it is empty
+    :rtype: bytes|None
+    """
+    fi = self.get_file_info(filename)
+    archive_idx, _ = self.index[fi.name]
+    with self._lock:
+      buf = self._get_archive_buffer(archive_idx)
+      size, comp, _ = unpack_from("III", buf, fi.pos)
+      if size == 0:
+        return None
+      data = buf[fi.pos + 12:fi.pos + 12 + (comp or size)]  # copy, such that we can close the archive anytime
+    if comp > 0:
+      data = zlib.decompress(data, 15 + 32)
+    return data
+
+  def read_features(self, filename):
+    """
+    :param str filename: the entry-name in the archive
+    :return: times (time,2) float64 (start-time, end-time) in secs, features (time,dim) float32.
+      Read-only arrays. If the feature dimension varies, features is a list of (dim,) arrays.
+    :rtype: (numpy.ndarray,numpy.ndarray|list[numpy.ndarray])|None
+    """
+    data = self.read_raw(filename)
+    if data is None:
+      return None
+    return _decode_feature_payload(data)
+
+  def read_alignment(self, filename):
+    """
+    :param str filename: the entry-name in the archive
+    :return: times, mixtures (raw allophone state indices), both int32 arrays of shape (time,).
+      see :func:`get_allophone_states`
+    :rtype: (numpy.ndarray,numpy.ndarray)|None
+    """
+    data = self.read_raw(filename)
+    if data is None:
+      return None
+    return _decode_alignment_payload(data)
+
+  def get_allophone_states(self, mixes):
+    """
+    Vectorized variant of :func:`FileArchive.get_state`.
+
+    :param numpy.ndarray mixes: raw allophone state indices, see :func:`read_alignment`
+    :return: allophone indices, state indices
+    :rtype: (numpy.ndarray,numpy.ndarray)
+    """
+    assert self.allophones
+    max_states = 6
+    allos = numpy.array(mixes, dtype="int64")
+    states = numpy.full(allos.shape, max_states - 1, dtype="int32")
+    done = numpy.zeros(allos.shape, dtype="bool")
+    for state in range(max_states):
+      found = numpy.logical_and(numpy.logical_not(done), allos < len(self.allophones))
+      states[found] = state
+      done |= found
+      allos[numpy.logical_not(done)] -= (1 << 26)
+    assert numpy.all(allos >= 0)
+    return allos.astype("int32"), states
+
+  def read(self, filename, typ):
+    """
+    :param str filename: the entry-name in the archive
+    :param str typ: "str", "feat", "align" or "align_raw"
+    :return: like :func:`FileArchive.read`.
+      For "align_raw", we return the raw mixture (allophone state idx), and None as state.
+    :rtype: str|(list[numpy.ndarray],list[numpy.ndarray])|list[(int,int,int|None)]|None
+    """
+    if typ == "str":
+      data = self.read_raw(filename)
+      if data is None:
+        return None
+      return data[:self.get_file_info(filename).size].decode("ascii")
+    elif typ == "feat":
+      res = self.read_features(filename)
+      if res is None:
+        return None
+      times, features = res
+      return list(times), list(features)
+    elif typ in ["align", "align_raw"]:
+      res = self.read_alignment(filename)
+      if res is None:
+        return None
+      times, mixes = res
+      if typ == "align_raw":
+        return list(zip(times.tolist(), mixes.tolist(), [None] * len(mixes)))
+      allos, states = self.get_allophone_states(mixes)
+      return list(zip(times.tolist(), allos.tolist(), states.tolist()))
+    else:
+      raise NotImplementedError("typ: %r" % typ)
+
+
 def open_file_archive(archive_filename, must_exists=True):
   """
   :param str archive_filename:
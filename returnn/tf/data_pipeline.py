@@ -82,7 +82,11 @@ Also the chunk shuffling is more difficult to implement and would be slower comp
 Implementation via new tf.dataset API
 -------------------------------------
 
-This is planned, but not yet started.
+This is implemented in :class:`DatasetDataProvider`, with the pipeline defined by ``dataset_pipeline`` in the config.
+With ``dataset_pipeline = "batches"``, the batches of the RETURNN dataset (:class:`BatchSetGenerator`,
+i.e. the same chunking and batching as for :class:`FeedDictDataProvider`) are streamed via a generator,
+padded in parallel in the tf.data pipeline, and prefetched (optionally to the device),
+such that the input preparation overlaps with the train step.
 
 
 Some use case
@@ -122,6 +126,7 @@ except ImportError:
   # noinspection PyCompatibility,PyUnresolvedReferences
   from queue import Queue
 from threading import Thread, Condition
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy
 import tensorflow as tf
@@ -218,7 +223,7 @@ class FeedDictDataProvider(DataProviderBase):
   """
 
   def __init__(self, tf_session, dataset, batches, enforce_min_len1=False, capacity=10, tf_queue=None,
-               batch_slice=None, **kwargs):
+               batch_slice=None, num_workers=0, **kwargs):
     """
     :param tf.compat.v1.Session|tf.compat.v1.InteractiveSession tf_session:
     :param Dataset dataset:
@@ -226,9 +231,12 @@ class FeedDictDataProvider(DataProviderBase):
     :param bool enforce_min_len1:
     :param ExternData extern_data:
     :param set(str)|None data_keys:
-    :param int capacity:
+    :param int capacity: queue depth, i.e. max number of batches prepared ahead
     :param TFDataQueues|None tf_queue:
     :param slice|None batch_slice: select a subset of the batches
+    :param int num_workers: if >0, the padded batches are assembled by that many worker threads,
+      in a pool of preallocated buffers which are reused.
+      The seqs are still loaded from the dataset by the single data provider thread.
     """
     super(FeedDictDataProvider, self).__init__(**kwargs)
     self.tf_session = tf_session
@@ -245,6 +253,16 @@ class FeedDictDataProvider(DataProviderBase):
     self.thread_finished = False
     self.cur_batch_idx = 0
     self.reached_end = False
+    self.num_workers = num_workers
+    self._executor = None  # type: typing.Optional[ThreadPoolExecutor]
+    self._buffer_pool = None  # type: typing.Optional[Queue]  # free buffers, see _get_batch_buffer
+    self._consumer_buffers = None  # type: typing.Optional[typing.Dict[str,numpy.ndarray]]
+    if num_workers > 0:
+      assert self.queue, "num_workers not supported with tf_queue"
+      # Buffers are used by the batches in the queue, the one in the producer thread and the one of the consumer.
+      self._buffer_pool = Queue()
+      for _ in range(capacity + 2):
+        self._buffer_pool.put({})
 
   def start_threads(self, session):
     """
@@ -252,6 +270,8 @@ class FeedDictDataProvider(DataProviderBase):
 
     :param tf.compat.v1.Session session:
     """
+    if self.num_workers > 0:
+      self._executor = ThreadPoolExecutor(max_workers=self.num_workers)
     thread = Thread(target=self._thread_main, name="DataProvider thread")
     thread.daemon = True  # Thread will close when parent quits.
     thread.start()
@@ -266,17 +286,19 @@ class FeedDictDataProvider(DataProviderBase):
       self._flush_all_data()
       self.thread.join()
       self.thread = None
+    if self._executor:
+      self._executor.shutdown(wait=True)
+      self._executor = None
     self.dataset.finish_epoch()
 
-  def get_next_batch(self, consider_batch_slice):
+  def _peek_next_batch(self, consider_batch_slice):
     """
     This assumes that we have more data, i.e. self.batches.has_more().
 
     :param bool consider_batch_slice:
-    :returns: batch-data-value-dict or None. if not consider_batch_slice, will never be None
-    :rtype: dict[str,numpy.ndarray]|None
+    :returns: the next batch, or None if it is skipped due to the batch slice
+    :rtype: returnn.datasets.basic.Batch|None
     """
-    # See EngineUtil.assign_dev_data() for reference.
     cur_batch_idx = self.cur_batch_idx
     batch, = self.batches.peek_next_n(1)
     self.cur_batch_idx += 1
@@ -291,30 +313,24 @@ class FeedDictDataProvider(DataProviderBase):
         return None
       if step > 1 and (cur_batch_idx - start) % step != 0:
         return None
-    from returnn.datasets.basic import Batch, shapes_for_batches
-    assert isinstance(batch, Batch)
-    # In Returnn with Theano, we usually have the shape (time,batch,feature).
-    # In TensorFlow, the default is (batch,time,feature).
-    # This is also what we use here, i.e. batch_dim_first=True.
-    # This must match the Data specification in TFNetwork.ExternData.init_from_config().
-    shapes = shapes_for_batches(
-      [batch], data_keys=self.data_keys, extern_data=self.extern_data, enforce_min_len1=self.enforce_min_len1)
-    data = {k: numpy.zeros(shape=shapes[k], dtype=self.extern_data.data[k].dtype)
-            for k in self.data_keys if self.extern_data.data[k].dtype != "string"}
-    # Numpy cannot handle "string" dtype. Just make it a list[str], which is what TF can handle.
-    data.update({k: [""] * batch.num_slices
-                 for k in self.data_keys if self.extern_data.data[k].dtype == "string"})
-    data.update({"seq_idx": [-1] * batch.num_slices, "seq_tag": [""] * batch.num_slices})
-    seq_lens = {k: numpy.zeros(shape=(shapes[k][0],), dtype=self.extern_data.data[k].size_dtype)
-                for k in self.data_keys if self.extern_data.data[k].have_time_axis()}
+    return batch
+
+  def _collect_batch_seqs_data(self, batch):
+    """
+    Loads the seqs of the batch from the dataset, and collects the (not yet padded) data per seq.
+    This accesses the dataset, thus it must be called in order from a single thread.
+
+    :param returnn.datasets.basic.Batch batch:
+    :return: per seq in the batch: data key -> data, and the seq tag
+    :rtype: list[(dict[str,numpy.ndarray],str)]
+    """
     self.dataset.load_seqs(batch.start_seq, batch.end_seq)
     from returnn.util.basic import slice_pad_zeros
+    seqs_data = []
     with self.dataset.lock:
       for seq in batch.seqs:
-        o = seq.batch_frame_offset
-        q = seq.batch_slice
         length = seq.frame_length
-        # input-data, input-index will also be set in this loop. That is data-key "data".
+        seq_data = {}  # type: typing.Dict[str,numpy.ndarray]
         for k in self.data_keys:
           # Some special cases first, such as "seq_idx" and "seq_tag".
           # See also :func:`TFNetwork.get_extern_data`.
@@ -333,23 +349,112 @@ class FeedDictDataProvider(DataProviderBase):
               raise Exception("got shape[0]: %i, expected: %i, start/end: %r/%r, seq_idx: %i, seq len: %r" % (
                 ls, length[k], seq.seq_start_frame, seq.seq_end_frame, seq.seq_idx,
                 self.dataset.get_seq_length(seq.seq_idx)))
-            data[k][q, o[k]:o[k] + ls] = v
-            seq_lens[k][q] = max(seq_lens[k][q], o[k] + ls)
-          else:  # no time-axis
-            data[k][q] = v
-        data["seq_idx"][q] = seq.seq_idx
-        data["seq_tag"][q] = self.dataset.get_tag(seq.seq_idx)
+          seq_data[k] = v
+        seqs_data.append((seq_data, self.dataset.get_tag(seq.seq_idx)))
+    return seqs_data
+
+  def _assemble_batch(self, batch, seqs_data, buffers=None):
+    """
+    Creates the padded batch arrays.
+    This does not access the dataset, thus it can run in a worker thread.
+
+    :param returnn.datasets.basic.Batch batch:
+    :param list[(dict[str,numpy.ndarray],str)] seqs_data: from :func:`_collect_batch_seqs_data`
+    :param dict[str,numpy.ndarray]|None buffers: if given, reused for the padded data, see :func:`_get_batch_buffer`
+    :returns: batch-data-value-dict
+    :rtype: dict[str,numpy.ndarray]
+    """
+    from returnn.datasets.basic import Batch, shapes_for_batches
+    assert isinstance(batch, Batch)
+    # In Returnn with Theano, we usually have the shape (time,batch,feature).
+    # In TensorFlow, the default is (batch,time,feature).
+    # This is also what we use here, i.e. batch_dim_first=True.
+    # This must match the Data specification in TFNetwork.ExternData.init_from_config().
+    shapes = shapes_for_batches(
+      [batch], data_keys=self.data_keys, extern_data=self.extern_data, enforce_min_len1=self.enforce_min_len1)
+    if buffers is None:
+      data = {k: numpy.zeros(shape=shapes[k], dtype=self.extern_data.data[k].dtype)
+              for k in self.data_keys if self.extern_data.data[k].dtype != "string"}
+    else:
+      data = {k: _get_batch_buffer(buffers, key=k, shape=shapes[k], dtype=self.extern_data.data[k].dtype)
+              for k in self.data_keys if self.extern_data.data[k].dtype != "string"}
+    # Numpy cannot handle "string" dtype. Just make it a list[str], which is what TF can handle.
+    data.update({k: [""] * batch.num_slices
+                 for k in self.data_keys if self.extern_data.data[k].dtype == "string"})
+    data.update({"seq_idx": [-1] * batch.num_slices, "seq_tag": [""] * batch.num_slices})
+    seq_lens = {k: numpy.zeros(shape=(shapes[k][0],), dtype=self.extern_data.data[k].size_dtype)
+                for k in self.data_keys if self.extern_data.data[k].have_time_axis()}
+    assert len(seqs_data) == len(batch.seqs)
+    for seq, (seq_data, seq_tag) in zip(batch.seqs, seqs_data):
+      o = seq.batch_frame_offset
+      q = seq.batch_slice
+      # input-data, input-index will also be set in this loop. That is data-key "data".
+      for k, v in seq_data.items():
+        if self.extern_data.data[k].have_time_axis():
+          ls = v.shape[0]
+          data[k][q, o[k]:o[k] + ls] = v
+          seq_lens[k][q] = max(seq_lens[k][q], o[k] + ls)
+        else:  # no time-axis
+          data[k][q] = v
+      data["seq_idx"][q] = seq.seq_idx
+      data["seq_tag"][q] = seq_tag
     for k in seq_lens.keys():
       data["%s_seq_lens" % k] = seq_lens[k]
     return data
 
+  def get_next_batch(self, consider_batch_slice):
+    """
+    This assumes that we have more data, i.e. self.batches.has_more().
+
+    :param bool consider_batch_slice:
+    :returns: batch-data-value-dict or None. if not consider_batch_slice, will never be None
+    :rtype: dict[str,numpy.ndarray]|None
+    """
+    # See EngineUtil.assign_dev_data() for reference.
+    batch = self._peek_next_batch(consider_batch_slice=consider_batch_slice)
+    if batch is None:
+      return None
+    return self._assemble_batch(batch, self._collect_batch_seqs_data(batch))
+
+  def _get_next_batch_async(self):
+    """
+    Like :func:`get_next_batch`, but the padded batch is assembled by the worker threads,
+    in reused buffers from the buffer pool.
+
+    :return: future of the batch-data-value-dict and the used buffers, or None
+    :rtype: concurrent.futures.Future|None
+    """
+    batch = self._peek_next_batch(consider_batch_slice=True)
+    if batch is None:
+      return None
+    seqs_data = self._collect_batch_seqs_data(batch)
+    buffers = self._buffer_pool.get()  # there is always one free, see __init__
+    return self._executor.submit(lambda: (self._assemble_batch(batch, seqs_data, buffers=buffers), buffers))
+
+  def _dequeue(self):
+    """
+    :return: the next batch-data-value-dict from the queue
+    :rtype: dict[str,numpy.ndarray]
+    """
+    output = self.queue.get()
+    if self._buffer_pool is not None:
+      output, buffers = output.result()
+      # The previous batch was used by the consumer in the previous step, which is finished now.
+      if self._consumer_buffers is not None:
+        self._buffer_pool.put(self._consumer_buffers)
+      self._consumer_buffers = buffers
+    return output
+
   def _thread_main(self):
     try:
       from returnn.util import better_exchook
       better_exchook.install()
 
       while self.batches.has_more() and not self.coord.should_stop():
-        enqueue_args = self.get_next_batch(consider_batch_slice=True)
+        if self._executor:
+          enqueue_args = self._get_next_batch_async()
+        else:
+          enqueue_args = self.get_next_batch(consider_batch_slice=True)
         if enqueue_args is not None:
           if self.queue:
             self.queue.put(enqueue_args)
@@ -399,7 +504,7 @@ class FeedDictDataProvider(DataProviderBase):
     """
     while self.have_more_data(None):
       if self.queue:
-        self.queue.get()
+        self._dequeue()
       else:
         raise NotImplementedError
 
@@ -421,7 +526,7 @@ class FeedDictDataProvider(DataProviderBase):
       assert self.batch_slice is None
       output = self.get_next_batch(consider_batch_slice=False)
     else:
-      output = self.queue.get()
+      output = self._dequeue()
     assert isinstance(output, dict)
     # The data itself.
     d = {
@@ -461,6 +566,26 @@ class FeedDictDataProvider(DataProviderBase):
     return self.batches.completed_frac()
 
 
+def _get_batch_buffer(buffers, key, shape, dtype):
+  """
+  :param dict[str,numpy.ndarray] buffers: data key -> flat buffer. the buffer is replaced if it is too small,
+    i.e. it grows to the max batch shape
+  :param str key:
+  :param list[int]|tuple[int] shape:
+  :param str dtype:
+  :return: zero-filled (contiguous) view into the buffer
+  :rtype: numpy.ndarray
+  """
+  size = int(numpy.prod(shape))
+  buffer = buffers.get(key)
+  if buffer is None or buffer.size < size or buffer.dtype != numpy.dtype(dtype):
+    buffer = numpy.empty((size,), dtype=dtype)
+    buffers[key] = buffer
+  array = buffer[:size].reshape(shape)
+  array.fill(0)
+  return array
+
+
 class InputContext(object):
   """
   This object will be passed to the dataset pipeline function
@@ -563,6 +688,131 @@ class InputContext(object):
       output_types=output_types,
       output_shapes=output_shapes)
 
+  def get_returnn_batches_dataset(self):
+    """
+    Like :func:`get_returnn_dataset`, but iterates through the batches (:class:`BatchSetGenerator`)
+    of the RETURNN dataset, like :class:`FeedDictDataProvider`,
+    i.e. the chunking and batching (``batch_size``, ``max_seqs``, etc.) is the same.
+    Every element is one batch. Data with a time axis is in a flat format,
+    i.e. the frames of all the batch entries concatenated, and "size:<key>:0" are the lengths.
+    Use :func:`pad_batch_dataset` on this.
+
+    :rtype: tensorflow.data.Dataset
+    """
+    import os
+    from returnn.datasets.basic import Batch
+    from returnn.util.basic import slice_pad_zeros
+
+    dyn_time_keys = set()  # data keys with dynamic time axis
+    for key in self.parent.data_keys:
+      data = self.extern_data.data[key]
+      dyn_axes = [axis for (axis, dim) in enumerate(data.shape) if dim is None]
+      if dyn_axes == [0]:
+        dyn_time_keys.add(key)
+      elif dyn_axes:
+        raise NotImplementedError(
+          "%s: only a dynamic time axis (first axis) is supported, got shape %r" % (self, data.shape))
+
+    def generator():
+      """
+      :rtype: dict[str,numpy.ndarray]
+      """
+      assert self.parent.current_dataset_name, "current dataset name not set"
+      returnn_dataset = self.parent.datasets[self.parent.current_dataset_name]
+      assert returnn_dataset, "RETURNN dataset not loaded in this proc (pid %i)" % os.getpid()
+      batches = self.parent.current_batches
+      assert batches, "batches not set, see DatasetDataProvider.set_current_dataset"
+
+      while batches.has_more():
+        batch, = batches.peek_next_n(1)
+        assert isinstance(batch, Batch)
+        self.parent.current_dataset_complete_frac = batches.completed_frac()
+        returnn_dataset.load_seqs(batch.start_seq, batch.end_seq)
+
+        res = {}  # type: typing.Dict[str,numpy.ndarray]
+        with returnn_dataset.lock:
+          for key_ in self.parent.data_keys:
+            data_ = self.extern_data.data[key_]
+            if key_ not in dyn_time_keys:
+              if data_.dtype == "string":
+                res[key_] = numpy.array([""] * batch.num_slices, dtype=object)
+              else:
+                res[key_] = numpy.zeros((batch.num_slices,) + data_.shape, dtype=data_.dtype)
+              for seq in batch.seqs:
+                res[key_][seq.batch_slice] = returnn_dataset.get_data(seq.seq_idx, key_)
+              continue
+            pieces = [[] for _ in range(batch.num_slices)]  # per slice: list of (frame offset, data)
+            for seq in batch.seqs:
+              if seq.frame_length.get(key_) in [0, None]:
+                continue
+              value = slice_pad_zeros(
+                returnn_dataset.get_data(seq.seq_idx, key_),
+                begin=seq.seq_start_frame[key_], end=seq.seq_end_frame[key_])
+              pieces[seq.batch_slice].append((seq.batch_frame_offset[key_], value))
+            values = []  # type: typing.List[numpy.ndarray]
+            sizes = numpy.zeros((batch.num_slices,), dtype=data_.size_dtype)
+            for q, slice_pieces in enumerate(pieces):
+              for offset, value in sorted(slice_pieces, key=lambda piece: piece[0]):
+                assert offset >= sizes[q]
+                if offset > sizes[q]:
+                  values.append(numpy.zeros((offset - sizes[q],) + data_.shape[1:], dtype=data_.dtype))
+                values.append(numpy.asarray(value, dtype=data_.dtype))
+                sizes[q] = offset + value.shape[0]
+            if values:
+              res[key_] = numpy.concatenate(values, axis=0)
+            else:
+              res[key_] = numpy.zeros((0,) + data_.shape[1:], dtype=data_.dtype)
+            res["size:%s:0" % key_] = sizes
+        yield res
+        batches.advance(1)
+
+      returnn_dataset.finish_epoch()
+
+    output_types = {}  # type: typing.Dict[str,tf.DType]
+    output_shapes = {}  # type: typing.Dict[str,tf.TensorShape]
+    for key in self.parent.data_keys:
+      data = self.extern_data.data[key]
+      output_types[key] = tf.as_dtype(data.dtype)
+      output_shapes[key] = tf.TensorShape((None,) + data.shape[1:] if key in dyn_time_keys else (None,) + data.shape)
+      if key in dyn_time_keys:
+        size_key = "size:%s:0" % key
+        output_types[size_key] = tf.as_dtype(data.size_dtype)
+        output_shapes[size_key] = tf.TensorShape([None])  # [Batch]
+
+    return tf.data.Dataset.from_generator(
+      generator=generator,
+      output_types=output_types,
+      output_shapes=output_shapes)
+
+  def pad_batch_dataset(self, dataset, num_parallel_calls=None):
+    """
+    :param tensorflow.data.Dataset dataset: from :func:`get_returnn_batches_dataset`
+    :param int|None num_parallel_calls: for the padding. AUTOTUNE by default
+    :return: padded batches, as expected by :class:`DatasetDataProvider`
+    :rtype: tensorflow.data.Dataset
+    """
+    enforce_min_len1 = self.config.is_true("enforce_min_len1", False)
+    if num_parallel_calls is None:
+      num_parallel_calls = tf.data.experimental.AUTOTUNE
+
+    def pad(elements):
+      """
+      :param dict[str,tf.Tensor] elements:
+      :rtype: dict[str,tf.Tensor]
+      """
+      res = dict(elements)
+      for key in self.parent.data_keys:
+        if "size:%s:0" % key not in elements:  # no dynamic time axis
+          continue
+        value = tf.RaggedTensor.from_row_lengths(elements[key], row_lengths=elements["size:%s:0" % key]).to_tensor()
+        if enforce_min_len1:
+          value = tf.pad(
+            value, [[0, 0], [0, tf.maximum(1 - tf.shape(value)[1], 0)]] + [[0, 0]] * (value.shape.ndims - 2))
+        res[key] = value
+      return res
+
+    return dataset.map(pad, num_parallel_calls=num_parallel_calls)
+
   def get_default_max_seqs(self):
     """
     :return: batch size in number of seqs, used e.g. for padded_batch
@@ -677,6 +927,8 @@ class DatasetDataProvider(DataProviderBase):
     dataset_pipeline_func = config.typed_value("dataset_pipeline")
     if dataset_pipeline_func in [None, True, 1]:  # allow None here, if this class is used explicitly
       dataset_pipeline_func = self._dataset_pipeline_default
+    elif dataset_pipeline_func == "batches":
+      dataset_pipeline_func = self._dataset_pipeline_batches
     assert callable(dataset_pipeline_func), "dataset_pipeline in config is invalid"
 
     if datasets is None or not datasets:  # e.g. in distributed TF
@@ -708,13 +960,16 @@ class DatasetDataProvider(DataProviderBase):
     self.current_dataset_reached_end = False
     self.current_dataset_complete_frac = 0.
     self.current_dataset_name = None  # type: typing.Optional[str]
+    self.current_batches = None  # type: typing.Optional[BatchSetGenerator]
 
-  def set_current_dataset(self, dataset_name):
+  def set_current_dataset(self, dataset_name, batches=None):
     """
     :param str dataset_name:
+    :param BatchSetGenerator|None batches: needed for :func:`InputContext.get_returnn_batches_dataset`
     """
     assert dataset_name in self.contexts
     self.current_dataset_name = dataset_name
+    self.current_batches = batches
     self.current_dataset_complete_frac = 0.
     self.current_dataset_reached_end = False
 
@@ -811,3 +1066,20 @@ class DatasetDataProvider(DataProviderBase):
     dataset = context.map_producer_to_consumer(dataset)
     dataset = context.prefetch_to_consumer_device(dataset)
     return dataset
+
+  # noinspection PyMethodMayBeStatic
+  def _dataset_pipeline_batches(self, context):
+    """
+    Used for ``dataset_pipeline = "batches"``.
+    Same batches as :class:`FeedDictDataProvider`, but the input preparation overlaps with the train step.
+
+    :param InputContext context:
+    :rtype: tensorflow.data.Dataset
+    """
+    dataset = context.get_returnn_batches_dataset()
+    dataset = context.pad_batch_dataset(dataset)
+    dataset = dataset.prefetch(context.config.int("dataset_pipeline_prefetch", 2))
+    dataset = context.map_producer_to_consumer(dataset)
+    if context.config.bool("dataset_pipeline_prefetch_to_device", True):
+      dataset = context.prefetch_to_consumer_device(dataset)
+    return dataset
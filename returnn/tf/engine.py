@@ -33,13 +33,13 @@ from returnn.learning_rate_control import load_learning_rate_control_from_config
 from returnn.log import log
 from returnn.pretrain import pretrain_from_config
 import returnn.tf.compat as tf_compat
-from returnn.tf.network import TFNetwork, ExternData, help_on_tf_exception
+from returnn.tf.network import TFNetwork, ExternData, AsyncCheckpointSaver, help_on_tf_exception
 from returnn.tf.util.data import Data
 from returnn.tf.layers.base import LayerBase
 from returnn.tf.updater import Updater
 from returnn.tf.data_pipeline import FeedDictDataProvider, DatasetDataProvider
 import returnn.tf.horovod as tf_horovod
-from returnn.util.basic import hms, NumbersDict, BackendEngine
+from returnn.util.basic import hms, NumbersDict, BackendEngine, StepTrace
 from pprint import pprint
 
 
@@ -109,6 +109,7 @@ class Runner(object):
       assert extra_fetches_callback
     self.extra_fetches_callback = extra_fetches_callback
     self._step_start_time = None  # type: typing.Optional[float]
+    self.step_trace = None  # type: typing.Optional[StepTrace]  # set in run()
     self._horovod_last_param_sync_time = time.time()  # we assume it is synced right now
     self._horovod_stopped_runner = False
     self._horovod_finish_all = False
@@ -177,12 +178,13 @@ class Runner(object):
 
     return d
 
-  def _print_process(self, report_prefix, step, step_duration, eval_info):
+  def _print_process(self, report_prefix, step, step_duration, eval_info, input_wait_time=None):
     """
     :param str report_prefix:
     :param int step:
     :param float step_duration: in secs
     :param dict[str] eval_info: via :func:`_collect_eval_info`
+    :param float|None input_wait_time: in secs, how long we waited for the data provider in this step
     :return: nothing, will be printed to log
     """
     if not self._show_interactive_process_bar and not log.v[5]:
@@ -200,6 +202,7 @@ class Runner(object):
         info += ["%s %s" % item for item in sorted(eval_info.items())]
       info += [
         "%.3f sec/step" % step_duration,
+        ("%.3f sec input wait" % input_wait_time) if input_wait_time is not None else None,
         "elapsed %s" % hms(start_elapsed),
         "exp. remaining %s" % hms(remaining_estimated),
         "complete %.02f%%" % (complete * 100)]
@@ -593,6 +596,17 @@ class Runner(object):
     run_metadata = tf_compat.v1.RunMetadata()
     debug_shell_in_runner = self.engine.config.bool("debug_shell_in_runner", False)
     debug_shell_in_runner_step = self.engine.config.int("debug_shell_in_runner_step", 1)
+    step_trace_file_format = self.engine.config.value("step_trace_file", None)  # "chrome" or "jsonl"
+    step_trace_filename = None
+    if step_trace_file_format:
+      from returnn.util.basic import maybe_make_dirs
+      maybe_make_dirs(logdir)
+      step_trace_filename = "%s/step_trace.%s" % (logdir, "jsonl" if step_trace_file_format == "jsonl" else "json")
+      print("Write step trace to %s." % step_trace_filename, file=log.v4)
+    self.step_trace = StepTrace(
+      phases=["data_wait", "feed_dict", "session_run", "eval_info", "horovod_sync", "logging"],
+      capacity=self.engine.config.int("step_trace_capacity", 10000),
+      filename=step_trace_filename, file_format=step_trace_file_format)
 
     # Not sure if this is the best thing to do for an evaluation but it's ok for now.
     # We could also set it to 0 for non train epochs.
@@ -604,6 +618,7 @@ class Runner(object):
     self.data_provider.start_threads(session=sess)
     self.start_time = time.time()
     elapsed_time_tf = 0.0
+    elapsed_time_input = 0.0  # waiting for the data provider
     step = None
     fetches_dict = None
     feed_dict = None
@@ -619,19 +634,28 @@ class Runner(object):
       if writer:
         writer.add_graph(sess.graph)
       hvd_stop = hvd_error = False
+      input_wait_start_time = time.time()
       while self.data_provider.have_more_data(session=sess):
         self._step_start_time = time.time()
+        input_wait_time = self._step_start_time - input_wait_start_time
+        self.step_trace.start_step(step, start_time=input_wait_start_time)
+        trace_time = self.step_trace.record("data_wait", input_wait_start_time, end_time=self._step_start_time)
         hvd_stop, hvd_error = self._horovod_signal_have_more_data(local_step=step)
+        trace_time = self.step_trace.record("horovod_sync", trace_time)
         if hvd_error:
           raise Exception("Some other Horovod peer failed.")
         if hvd_stop:
           # Some other peer does not have data anymore, but no error occurred.
           break
+        feed_dict_start_time = time.time()
         feed_dict, meta_step_info = self.data_provider.get_feed_dict()
+        input_wait_time += time.time() - feed_dict_start_time
+        elapsed_time_input += input_wait_time
         if isinstance(self.engine.network.train_flag, tf.Tensor):
           feed_dict[self.engine.network.train_flag] = self._train_flag
         if isinstance(self.engine.network.epoch_step, tf.Tensor):
           feed_dict[self.engine.network.epoch_step] = step
+        self.step_trace.record("feed_dict", feed_dict_start_time)
         start_time = time.time()
         if self._should_train and self.reset_updater_vars_mod_step and step % self.reset_updater_vars_mod_step == 0:
           print("Reset updater vars in step %i." % step, file=log.v5)
@@ -667,19 +691,23 @@ class Runner(object):
               options=run_options,
               run_metadata=run_metadata)  # type: typing.Dict[str,typing.Union[numpy.ndarray,str]]
             elapsed_time_tf += time.time() - session_run_start_time
+            trace_time = self.step_trace.record("session_run", session_run_start_time)
             writer.add_summary(fetches_results["summary"], step + step_offset)
             writer.add_run_metadata(run_metadata, 'step_{:04d}'.format(step + step_offset))
             tl = timeline.Timeline(run_metadata.step_stats)
             timeline_path = os.path.join(logdir, 'timeline.trace')
             with open(timeline_path, 'w') as f:
               f.write(tl.generate_chrome_trace_format(show_memory=True))
+            self.step_trace.record("logging", trace_time)
           else:
             session_run_start_time = time.time()
             fetches_results = sess.run(
               fetches_dict, feed_dict=feed_dict)  # type: typing.Dict[str,typing.Union[numpy.ndarray,str]]
             elapsed_time_tf += time.time() - session_run_start_time
+            trace_time = self.step_trace.record("session_run", session_run_start_time)
             if writer and "summary" in fetches_results:
               writer.add_summary(fetches_results["summary"], step + step_offset)
+              self.step_trace.record("logging", trace_time)
         except tf.errors.OpError as exc:
           if isinstance(exc, tf.errors.OutOfRangeError) and isinstance(self.data_provider, DatasetDataProvider):
             # This means that we got end-of-sequence from the dataset iterator.
@@ -691,11 +719,18 @@ class Runner(object):
           # Extra info will be printed below.
           raise
 
+        trace_time = time.time()
         eval_info = self._collect_eval_info(fetches_results=fetches_results)
         self._maybe_handle_extra_fetches(fetches_results)
+        trace_time = self.step_trace.record("eval_info", trace_time)
         elapsed_time_tf += self._horovod_sync_params(local_step=step)
+        trace_time = self.step_trace.record("horovod_sync", trace_time)
         duration = time.time() - start_time
-        self._print_process(report_prefix=report_prefix, step=step, step_duration=duration, eval_info=eval_info)
+        self._print_process(
+          report_prefix=report_prefix, step=step, step_duration=duration, eval_info=eval_info,
+          input_wait_time=input_wait_time)
+        self.step_trace.record("logging", trace_time)
+        self.step_trace.end_step()
 
         if self.engine.config.bool("stop_on_nonfinite_train_score", True):
           score_values = self._results_accumulated.values()
@@ -707,6 +742,7 @@ class Runner(object):
         step += 1
         if self.cancel_flag:
           raise CancelTrainingException("cancel_flag is set")
+        input_wait_start_time = time.time()
 
       self._print_finish_process()
 
@@ -728,8 +764,11 @@ class Runner(object):
           print("  %s:" % k, v, file=log.v1)
       elapsed = time.time() - self.start_time
       elapsed_tf_percentage = (elapsed_time_tf / elapsed) if (elapsed > 0) else 0.0
-      print("%s, finished after %i steps, %s elapsed (%.1f%% computing time)" % (
-        report_prefix, step, hms(elapsed), (elapsed_tf_percentage * 100.)), file=log.v3)
+      elapsed_input_percentage = (elapsed_time_input / elapsed) if (elapsed > 0) else 0.0
+      print("%s, finished after %i steps, %s elapsed (%.1f%% computing time, %.1f%% input wait)" % (
+        report_prefix, step, hms(elapsed), (elapsed_tf_percentage * 100.), (elapsed_input_percentage * 100.)),
+        file=log.v3)
+      self.step_trace.print_summary(prefix=report_prefix, file=log.v4)
 
     except KeyboardInterrupt as exc:
       print("KeyboardInterrupt in step %r." % step)
@@ -757,6 +796,7 @@ class Runner(object):
       try_and_ignore_exception(coord.request_stop)
       try_and_ignore_exception(lambda: coord.join(threads))
       try_and_ignore_exception(self.data_provider.stop_threads)
+      try_and_ignore_exception(self.step_trace.close)
       # ignored if called before
       try_and_ignore_exception(lambda: self.engine.network.set_run_finished(error_occurred=True))
       self.elapsed = time.time() - self.start_time
@@ -802,11 +842,16 @@ class Engine(EngineBase):
     self._const_cache = {}  # type: typing.Dict[str,tf.Tensor]
     self.preload_from_files = None  # type: typing.Optional[typing.Dict[str,typing.Dict[str]]]
     self.max_seqs = None  # type: typing.Optional[int]
+    self._async_checkpoint_saver = None  # type: typing.Optional[AsyncCheckpointSaver]
 
   def finalize(self, error_occurred=False):
     """
     Finalizes the TF session, network, graph.
     """
+    if self._async_checkpoint_saver:
+      print("Wait for pending async model saves ...", file=log.v4)
+      self._async_checkpoint_saver.close()
+      self._async_checkpoint_saver = None
     self._close_tf_session()
     self._reset_graph(error_occurred=error_occurred)
 
@@ -931,6 +976,7 @@ class Engine(EngineBase):
     if epoch:
       assert not filename
       filename = self.get_epoch_model_filename(epoch=epoch)
+    self.wait_for_model_saves()
     print("Load model %s" % (filename,), file=log.v4)
     self.network.load_params_from_file(filename, session=self.tf_session)
 
@@ -942,9 +988,24 @@ class Engine(EngineBase):
       return
     if not filename:
       filename = self.get_epoch_model_filename()
+    if self.config.bool("save_model_async", False):
+      if not self._async_checkpoint_saver:
+        self._async_checkpoint_saver = AsyncCheckpointSaver(
+          max_pending=self.config.int("save_model_async_max_pending", 1))
+      print("Save model under %s (async)" % (filename,), file=log.v4)
+      self.network.save_params_to_file(
+        filename, session=self.tf_session, async_saver=self._async_checkpoint_saver)
+      return
     print("Save model under %s" % (filename,), file=log.v4)
     self.network.save_params_to_file(filename, session=self.tf_session)
 
+  def wait_for_model_saves(self):
+    """
+    Waits until all pending async model saves (via ``save_model_async``) are written.
+    """
+    if self._async_checkpoint_saver:
+      self._async_checkpoint_saver.join()
+
   @staticmethod
   def delete_model(filename):
     """
@@ -1839,6 +1900,7 @@ class Engine(EngineBase):
     from returnn.util.basic import CollectionReadCheckCovered, human_bytes_size, confirm
     from itertools import count
     opts = CollectionReadCheckCovered(self.config.get_of_type("cleanup_old_models", dict, {}))
+    self.wait_for_model_saves()
     existing_models = self.get_existing_models(config=self.config)
     if hasattr(self, "learning_rate_control"):
       lr_control = self.learning_rate_control
@@ -1966,7 +2028,7 @@ class Engine(EngineBase):
     :rtype: FeedDictDataProvider|DatasetDataProvider
     """
     if self.dataset_provider and feed_dict is not True and dataset_name:
-      self.dataset_provider.set_current_dataset(dataset_name=dataset_name)
+      self.dataset_provider.set_current_dataset(dataset_name=dataset_name, batches=batches)
       return self.dataset_provider
     else:
       if self.dataset_provider and feed_dict is not False:
@@ -1979,6 +2041,8 @@ class Engine(EngineBase):
         data_keys=self.network.get_used_data_keys(),
         dataset=dataset, batches=batches,
         batch_slice=batch_slice,
+        capacity=self.config.int("feed_dict_queue_capacity", 10),
+        num_workers=self.config.int("feed_dict_num_workers", 0),
         enforce_min_len1=self.config.is_true("enforce_min_len1", False))
       return data_provider
 
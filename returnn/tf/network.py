@@ -353,6 +353,7 @@ class TFNetwork(object):
           collections=[tf_compat.v1.GraphKeys.GLOBAL_STEP], trainable=False)
     self.epoch_step = None
     self.saver = None  # type: typing.Optional[tf.compat.v1.train.Saver]
+    self._checkpoint_save_specs = None  # type: typing.Optional[typing.List[typing.Tuple[str,str,tf.DType,tf.Tensor]]]
     self.extra_vars_to_save = []  # type: typing.List[tf.Variable]
     self.recurrent = False
     self._assigner_cache = {}  # type: typing.Dict[tf.Variable,VariableAssigner]
@@ -1374,6 +1375,7 @@ class TFNetwork(object):
     Warning: Don't repeat that too often as it will always create new ops in the computation graph.
     """
     self.saver = None
+    self._checkpoint_save_specs = None
 
   def _create_saver(self):
     # Saver for storing checkpoints of the model.
@@ -1381,36 +1383,56 @@ class TFNetwork(object):
       self.saver = tf_compat.v1.train.Saver(
         var_list=self.get_saveable_params_list(), max_to_keep=2 ** 31 - 1)
 
-  def save_params_to_file(self, filename, session):
+  def save_params_to_file(self, filename, session, async_saver=None):
     """
     Will save the model parameters to the filename.
     Note that the model parameters live inside the current TF session.
 
     :param str filename:
     :param tf.compat.v1.Session session:
+    :param AsyncCheckpointSaver|None async_saver: if given, only snapshots the params here,
+      and the checkpoint is written in the background
     """
     import os
     filename = os.path.abspath(filename)  # TF needs absolute path
+    if async_saver:
+      async_saver.save(filename, *self.get_params_snapshot_for_checkpoint(session=session))
+      return
     from returnn.util.basic import maybe_make_dirs
     maybe_make_dirs(os.path.dirname(filename))
     if not self.saver:
       self._create_saver()
-    # We add some extra logic to try again for DiskQuota and other errors.
-    # This could save us multiple hours of computation.
-    try_again_wait_time = 10
-    while True:
+    _call_with_io_error_retry(lambda: self.saver.save(sess=session, save_path=filename))
+
+  def get_params_snapshot_for_checkpoint(self, session):
+    """
+    Fetches all saveable params into host memory, in a single ``session.run``.
+    The tensor names and slices are the same as :class:`tf.train.Saver` would use,
+    such that the result can be written as a regular checkpoint, e.g. by :class:`AsyncCheckpointSaver`.
+
+    :param tf.compat.v1.Session session:
+    :return: tensor_names, shape_and_slices, dtypes, values
+    :rtype: (list[str], list[str], list[tf.DType], list[numpy.ndarray])
+    """
+    if self._checkpoint_save_specs is None:
       try:
-        self.saver.save(sess=session, save_path=filename)
-        break
-      except IOError as e:
-        import errno
-        import time
-        if e.errno in [errno.EBUSY, errno.EDQUOT, errno.EIO, errno.ENOSPC]:
-          print("Exception while saving:", e, file=log.v3)
-          print("Trying again in %s secs." % try_again_wait_time, file=log.v3)
-          time.sleep(try_again_wait_time)
-          continue
-        raise
+        from tensorflow.python.training.saving import saveable_object_util
+        saveables = saveable_object_util.validate_and_slice_inputs(
+          saveable_object_util.op_list_to_dict(self.get_saveable_params_list()))
+      except ImportError:  # TF <1.14
+        from tensorflow.python.training.saver import BaseSaverBuilder
+        # noinspection PyProtectedMember
+        saveables = BaseSaverBuilder()._ValidateAndSliceInputs(
+          BaseSaverBuilder.OpListToDict(self.get_saveable_params_list()))
+      # Note: spec.tensor might create a new op on every access (e.g. for resource variables),
+      # thus we do this only once.
+      with tf.name_scope("checkpoint_snapshot"):
+        self._checkpoint_save_specs = [
+          (spec.name, spec.slice_spec, spec.dtype.base_dtype, spec.tensor)
+          for saveable in saveables for spec in saveable.specs]
+    tensor_names, shape_and_slices, dtypes, tensors = zip(*self._checkpoint_save_specs)
+    values = session.run(list(tensors))
+    return list(tensor_names), list(shape_and_slices), list(dtypes), values
 
   def load_params_from_file(self, filename, session):
     """
@@ -2617,6 +2639,155 @@ def help_on_tf_exception(
     pprint(feed_dict, stream=file)
 
 
+def _call_with_io_error_retry(func, try_again_wait_time=10):
+  """
+  We add some extra logic to try again for DiskQuota and other errors when saving.
+  This could save us multiple hours of computation.
+
+  :param ()->None func:
+  :param int|float try_again_wait_time: in secs
+  """
+  while True:
+    try:
+      func()
+      break
+    except IOError as e:
+      import errno
+      import time
+      if e.errno in [errno.EBUSY, errno.EDQUOT, errno.EIO, errno.ENOSPC]:
+        print("Exception while saving:", e, file=log.v3)
+        print("Trying again in %s secs." % try_again_wait_time, file=log.v3)
+        time.sleep(try_again_wait_time)
+        continue
+      raise
+
+
+class AsyncCheckpointSaver:
+  """
+  Writes checkpoints in a background thread, such that a slow (network) file system does not stall the training.
+  The params are snapshotted before into host memory via :func:`TFNetwork.get_params_snapshot_for_checkpoint`.
+  The checkpoint is written under a temporary name, and then renamed, with the ``.index`` file last,
+  thus an existing ``.index`` file always means a complete checkpoint.
+  Unlike :func:`tf.train.Saver.save`, this does not write the ``.meta`` file and the ``checkpoint`` state file,
+  which RETURNN does not use.
+
+  If ``max_pending`` saves are not finished yet, :func:`save` blocks, to bound the host memory.
+  :func:`join` or :func:`close` must be called to make sure that all checkpoints are written.
+  """
+
+  def __init__(self, max_pending=1):
+    """
+    :param int max_pending: max number of snapshots which are kept in memory, i.e. in the queue or being written
+    """
+    import threading
+    try:
+      # noinspection PyCompatibility
+      from Queue import Queue
+    except ImportError:
+      # noinspection PyCompatibility
+      from queue import Queue
+    assert max_pending >= 1
+    self.max_pending = max_pending
+    self._pending_semaphore = threading.BoundedSemaphore(max_pending)
+    self._queue = Queue()
+    self._thread = None  # type: typing.Optional[threading.Thread]
+    self._exception = None  # type: typing.Optional[BaseException]
+
+  def save(self, filename, tensor_names, shape_and_slices, dtypes, values):
+    """
+    Enqueues the checkpoint to be written. Blocks if there are already ``max_pending`` saves.
+
+    :param str filename: checkpoint prefix, as for :func:`tf.train.Saver.save`
+    :param list[str] tensor_names:
+    :param list[str] shape_and_slices:
+    :param list[tf.DType] dtypes:
+    :param list[numpy.ndarray] values:
+    """
+    import time
+    import threading
+    self._check_exception()
+    start_time = time.time()
+    self._pending_semaphore.acquire()
+    wait_time = time.time() - start_time
+    if wait_time > 0.1:
+      print("Waited %.3f sec for pending checkpoint saves." % wait_time, file=log.v3)
+    if not self._thread:
+      self._thread = threading.Thread(target=self._thread_main, name="%s thread" % self.__class__.__name__)
+      self._thread.daemon = True  # we expect that close() is called
+      self._thread.start()
+    self._queue.put((filename, tensor_names, shape_and_slices, dtypes, values))
+
+  def join(self):
+    """
+    Waits until all enqueued checkpoints are written.
+    """
+    self._queue.join()
+    self._check_exception()
+
+  def close(self):
+    """
+    Writes all enqueued checkpoints, and stops the background thread.
+    """
+    if self._thread:
+      self._queue.put(None)
+      self._thread.join()
+      self._thread = None
+    self._check_exception()
+
+  def _check_exception(self):
+    if self._exception:
+      exc, self._exception = self._exception, None
+      raise exc
+
+  def _thread_main(self):
+    while True:
+      item = self._queue.get()
+      try:
+        if item is None:
+          return
+        if self._exception:  # skip further saves until the exception was raised in the main thread
+          continue
+        filename = item[0]
+        try:
+          _call_with_io_error_retry(lambda: self._write_checkpoint(*item))
+          print("Saved model under %s (async)." % filename, file=log.v4)
+        except BaseException as exc:
+          print("Exception while saving %s (async): %s" % (filename, exc), file=log.v1)
+          self._exception = exc
+      finally:
+        if item is not None:
+          self._pending_semaphore.release()
+        self._queue.task_done()
+
+  @staticmethod
+  def _write_checkpoint(filename, tensor_names, shape_and_slices, dtypes, values):
+    """
+    :param str filename:
+    :param list[str] tensor_names:
+    :param list[str] shape_and_slices:
+    :param list[tf.DType] dtypes:
+    :param list[numpy.ndarray] values:
+    """
+    import os
+    from glob import glob
+    from tensorflow.python.ops import gen_io_ops
+    from returnn.util.basic import maybe_make_dirs
+    maybe_make_dirs(os.path.dirname(filename))
+    tmp_prefix = "%s.tmp-async-save" % filename
+    # Separate graph and session on the CPU, independent from the training session.
+    with tf.Graph().as_default() as graph:
+      placeholders = [
+        tf_compat.v1.placeholder(dtype=dtype, name="value_%i" % i) for (i, dtype) in enumerate(dtypes)]
+      save_op = gen_io_ops.save_v2(
+        prefix=tmp_prefix, tensor_names=tensor_names, shape_and_slices=shape_and_slices, tensors=placeholders)
+      with tf_compat.v1.Session(graph=graph, config=tf_compat.v1.ConfigProto(device_count={"GPU": 0})) as session:
+        session.run(save_op, feed_dict=dict(zip(placeholders, values)))
+    # The .index file last, as it marks the checkpoint as existing.
+    tmp_filenames = sorted(glob(tmp_prefix + ".data-*")) + [tmp_prefix + ".index"]
+    for tmp_filename in tmp_filenames:
+      os.rename(tmp_filename, filename + tmp_filename[len(tmp_prefix):])
+
+
 class CustomCheckpointLoader:
   """
   This uses `tf.train.NewCheckpointReader`.
@@ -815,6 +815,21 @@ def available_physical_memory_in_bytes():
   return mem_bytes
 
 
+def peak_rss_in_bytes():
+  """
+  :return: peak resident set size (max RSS) of this process so far, if we can figure it out
+  :rtype: int|None
+  """
+  try:
+    import resource
+  except ImportError:  # e.g. Windows
+    return None
+  max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  if sys.platform == "darwin":
+    return max_rss  # bytes
+  return max_rss * 1024  # KB on Linux
+
+
 def default_cache_size_in_gbytes(factor=0.7):
   """
   :param float|int factor:
@@ -1857,6 +1872,26 @@ class NumbersDict:
         return True
     return False
 
+  def any_compare_elemwise(self, other, cmp):
+    """
+    Like :func:`any_compare`, but our values can be numpy arrays (all of the same shape, or scalars),
+    and the comparison is done elementwise.
+
+    :param NumbersDict other:
+    :param ((numpy.ndarray|int,numpy.ndarray|int)->numpy.ndarray) cmp: elementwise, e.g. numpy.greater
+    :return: elementwise "any", i.e. bool array, or just False if nothing was compared
+    :rtype: numpy.ndarray|bool
+    """
+    res = False
+    for key in self.keys():
+      if key in other.keys():
+        res = res | cmp(self[key], other[key])
+      elif other.value is not None:
+        res = res | cmp(self[key], other.value)
+    if self.value is not None and other.value is not None:
+      res = res | cmp(self.value, other.value)
+    return res
+
   @staticmethod
   def _max(*args):
     args = [a for a in args if a is not None]
@@ -2701,6 +2736,274 @@ class LockFile(object):
     self.unlock()
 
 
+class _PersistentCacheEntryBase(object):
+  """
+  Common base for persistent on-disk caches of data derived from some source files.
+  A cache entry dir is identified by a hash over the source files (name, mtime, size) and the given options,
+  i.e. when a source file changes, the old entry is not used anymore.
+  """
+
+  CacheDirName = None  # type: str
+  Version = None  # type: int
+
+  def __init__(self, name, source_files, opts=None, cache_dir=None):
+    """
+    :param str name: e.g. "seq_lens". used as sub dir name
+    :param str|list[str] source_files: the arrays are derived from these files
+    :param dict[str]|None opts: anything else the arrays depend on. must have a deterministic repr
+    :param str|None cache_dir: by default in :func:`get_temp_dir`
+    """
+    if isinstance(source_files, str):
+      source_files = [source_files]
+    self.name = name
+    self.source_files = [os.path.abspath(fn) for fn in source_files]
+    self.opts = opts or {}
+    self.cache_dir = cache_dir or "%s/%s" % (get_temp_dir(), self.CacheDirName)
+    self._info = self._make_info()
+    self.entry_dir = "%s/%s/%s" % (self.cache_dir, name, self._make_hash())
+
+  def _make_info(self):
+    """
+    :rtype: dict[str]
+    """
+    files = []
+    for fn in self.source_files:
+      st = os.stat(fn)
+      files.append([fn, st.st_mtime, st.st_size])
+    return {"version": self.Version, "source_files": files, "opts": repr(sorted(self.opts.items()))}
+
+  def _make_hash(self):
+    """
+    :rtype: str
+    """
+    import hashlib
+    import json
+    return hashlib.sha1(json.dumps(self._info, sort_keys=True).encode("utf8")).hexdigest()
+
+
+class PersistentArraysCache(_PersistentCacheEntryBase):
+  """
+  Persistent on-disk cache for a set of named NumPy arrays which are derived from some source files,
+  e.g. the seq lengths of a dataset.
+  The arrays are stored as uncompressed ``.npy`` files, such that they can be memory-mapped on load.
+
+  A cache entry is identified by a hash over the source files (name, mtime, size) and the given options,
+  i.e. when a source file changes, the old entry is not used anymore.
+  A new entry is written to a temp dir and then atomically renamed,
+  so it is safe when multiple processes (e.g. multiple training jobs on the same host) share the cache dir.
+  """
+
+  CacheDirName = "returnn_arrays_cache"
+  Version = 1
+
+  def load(self, mmap=True):
+    """
+    :param bool mmap: memory-map the arrays (read-only)
+    :return: name -> array, or None if there is no valid cache entry
+    :rtype: dict[str,numpy.ndarray]|None
+    """
+    import json
+    info_fn = "%s/info.json" % self.entry_dir
+    if not os.path.exists(info_fn):
+      return None
+    with open(info_fn) as f:
+      info = json.load(f)
+    keys = info.pop("keys")
+    if info != json.loads(json.dumps(self._info)):
+      return None
+    return {
+      key: np.load("%s/%i.npy" % (self.entry_dir, i), mmap_mode="r" if mmap else None)
+      for (i, key) in enumerate(keys)}
+
+  def save(self, arrays):
+    """
+    :param dict[str,numpy.ndarray] arrays: name -> array
+    :return: the arrays as they would be returned by :func:`load`
+    :rtype: dict[str,numpy.ndarray]
+    """
+    import json
+    import tempfile
+    import shutil
+    parent_dir = os.path.dirname(self.entry_dir)
+    maybe_make_dirs(parent_dir)
+    tmp_dir = tempfile.mkdtemp(prefix="tmp-", dir=parent_dir)
+    keys = sorted(arrays.keys())
+    for i, key in enumerate(keys):
+      np.save("%s/%i.npy" % (tmp_dir, i), np.asarray(arrays[key]))
+    info = dict(self._info)
+    info["keys"] = keys
+    with open("%s/info.json" % tmp_dir, "w") as f:
+      json.dump(info, f)
+    try:
+      os.rename(tmp_dir, self.entry_dir)
+    except OSError:  # some other process was faster. just use the existing entry
+      shutil.rmtree(tmp_dir, ignore_errors=True)
+    return self.load()
+
+  def get(self, create_func):
+    """
+    :param ()->dict[str,numpy.ndarray] create_func: called if there is no valid cache entry
+    :return: name -> array
+    :rtype: dict[str,numpy.ndarray]
+    """
+    arrays = self.load()
+    if arrays is None:
+      arrays = self.save(create_func())
+    return arrays
+
+
+class PersistentSeqArraysCache(_PersistentCacheEntryBase):
+  """
+  Persistent on-disk cache for one NumPy array per key, e.g. the audio features per audio file,
+  which are derived from some source files (e.g. the zip file).
+  Like :class:`PersistentArraysCache`, the entry is identified by a hash over the source files and the options.
+
+  The arrays are stored in binary chunk files, which are memory-mapped for reading,
+  and each chunk file has an index file, with one JSON line (key, offset, dtype, shape) per array.
+  Every process only appends to its own chunk and index file, and the index line is written after the data,
+  so multiple processes (e.g. multiple training jobs on the same host) can fill and read the same cache
+  concurrently. A missing key is looked up again in the index files of the other processes.
+  This is filled lazily via :func:`get`.
+  """
+
+  CacheDirName = "returnn_seq_arrays_cache"
+  Version = 1
+  Alignment = 16  # bytes, for the offsets in the chunk files
+
+  def __init__(self, name, source_files, opts=None, cache_dir=None):
+    """
+    :param str name: e.g. "ogg_zip_features". used as sub dir name
+    :param str|list[str] source_files: the arrays are derived from these files
+    :param dict[str]|None opts: anything else the arrays depend on. must have a deterministic repr
+    :param str|None cache_dir: by default in :func:`get_temp_dir`
+    """
+    super(PersistentSeqArraysCache, self).__init__(
+      name=name, source_files=source_files, opts=opts, cache_dir=cache_dir)
+    self._lock = threading.Lock()
+    self._index = {}  # type: typing.Dict[str,typing.Tuple[str,int,str,typing.Tuple[int,...]]]  # key -> (chunk, ...)
+    self._index_file_pos = {}  # type: typing.Dict[str,int]  # index filename -> pos up to which we have read it
+    self._chunk_buffers = {}  # type: typing.Dict[str,mmap.mmap]  # chunk filename -> mmap
+    self._write_chunk = None  # type: typing.Optional[typing.BinaryIO]
+    self._write_index = None  # type: typing.Optional[typing.TextIO]
+    self._write_pid = None  # type: typing.Optional[int]  # after a fork, we must not append to the same files
+    self.num_hits = 0
+    self.num_misses = 0
+
+  def __del__(self):
+    self.close()
+
+  def close(self):
+    """
+    Closes all files. Reading or writing would open them again.
+    """
+    for f in [self._write_chunk, self._write_index]:
+      if f:
+        f.close()
+    self._write_chunk = self._write_index = None
+    for buf in self._chunk_buffers.values():
+      # noinspection PyBroadException
+      try:
+        buf.close()
+      except Exception:  # e.g. BufferError if there are still arrays referring to it. they keep it alive then
+        pass
+    self._chunk_buffers.clear()
+
+  def _update_index(self):
+    """
+    Reads the new complete lines of all index files (ours and the ones of other processes).
+    """
+    import json
+    if not os.path.isdir(self.entry_dir):
+      return
+    for fn in sorted(os.listdir(self.entry_dir)):
+      if not fn.endswith(".index"):
+        continue
+      index_fn = "%s/%s" % (self.entry_dir, fn)
+      chunk_fn = index_fn[:-len(".index")] + ".data"
+      with open(index_fn, "rb") as f:
+        f.seek(self._index_file_pos.get(index_fn, 0))
+        for line in f:
+          if not line.endswith(b"\n"):
+            break  # incomplete, i.e. currently being written
+          key, offset, dtype, shape = json.loads(line.decode("utf8"))
+          self._index[key] = (chunk_fn, offset, dtype, tuple(shape))
+          self._index_file_pos[index_fn] = self._index_file_pos.get(index_fn, 0) + len(line)
+
+  def _get_chunk_buffer(self, chunk_fn, end_pos):
+    """
+    :param str chunk_fn:
+    :param int end_pos: we need the buffer at least up to this pos
+    :rtype: mmap.mmap
+    """
+    import mmap
+    buf = self._chunk_buffers.get(chunk_fn, None)
+    if buf is None or len(buf) < end_pos:  # not yet mapped, or the chunk file was extended since then
+      with open(chunk_fn, "rb") as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+      self._chunk_buffers[chunk_fn] = buf  # the old buffer stays valid as long as arrays refer to it
+    return buf
+
+  def load(self, key):
+    """
+    :param str key:
+    :return: read-only (memory-mapped) array, or None if it is not in the cache
+    :rtype: numpy.ndarray|None
+    """
+    with self._lock:
+      if key not in self._index:
+        self._update_index()
+        if key not in self._index:
+          return None
+      chunk_fn, offset, dtype, shape = self._index[key]
+      dtype = np.dtype(dtype)
+      count = int(np.prod(shape))
+      buf = self._get_chunk_buffer(chunk_fn, offset + count * dtype.itemsize)
+      return np.frombuffer(buf, dtype=dtype, count=count, offset=offset).reshape(shape)
+
+  def save(self, key, array):
+    """
+    :param str key:
+    :param numpy.ndarray array:
+    """
+    import json
+    import socket
+    import binascii
+    with self._lock:
+      if self._write_chunk is None or self._write_pid != os.getpid():
+        maybe_make_dirs(self.entry_dir)
+        self._write_pid = os.getpid()
+        base_fn = "%s/%s-%i-%s" % (
+          self.entry_dir, socket.gethostname(), os.getpid(), binascii.hexlify(os.urandom(4)).decode("ascii"))
+        self._write_chunk = open(base_fn + ".data", "ab")
+        self._write_index = open(base_fn + ".index", "a")
+      array = np.ascontiguousarray(array)
+      offset = self._write_chunk.tell()
+      if offset % self.Alignment:
+        self._write_chunk.write(b"\0" * (self.Alignment - offset % self.Alignment))
+        offset = self._write_chunk.tell()
+      self._write_chunk.write(array.tobytes())
+      self._write_chunk.flush()  # the data must be complete before the index refers to it
+      self._write_index.write(json.dumps([key, offset, array.dtype.str, list(array.shape)]) + "\n")
+      self._write_index.flush()
+      self._index[key] = (self._write_chunk.name, offset, array.dtype.str, array.shape)
+
+  def get(self, key, create_func):
+    """
+    :param str key:
+    :param ()->numpy.ndarray create_func: called if the key is not in the cache
+    :return: the cached array (read-only), or the created one (which is then also added to the cache)
+    :rtype: numpy.ndarray
+    """
+    array = self.load(key)
+    if array is not None:
+      self.num_hits += 1
+      return array
+    self.num_misses += 1
+    array = create_func()
+    self.save(key, array)
+    return array
+
+
 def str_is_number(s):
   """
   :param str s: e.g. "1", ".3" or "x"
@@ -3652,6 +3955,155 @@ class Stats:
       numpy.savetxt("%s.std_dev.txt" % output_file_prefix, self.get_std_dev())
 
 
+class StepTrace:
+  """
+  Lightweight per-step timing instrumentation, e.g. used by :class:`returnn.tf.engine.Runner`.
+  The durations of the phases of every step (e.g. data wait, session run) are kept in a ring buffer,
+  which is cheap enough to always have it enabled.
+  At the end, :func:`print_summary` prints the totals and percentiles per phase.
+  Optionally, every step is also written to a file,
+  either in Chrome trace format (open in chrome://tracing) or as JSON lines.
+  """
+
+  def __init__(self, phases, capacity=10000, filename=None, file_format=None):
+    """
+    :param list[str] phases:
+    :param int capacity: max number of steps in the ring buffer, which is used for the percentiles
+    :param str|None filename: if given, writes every step to this file
+    :param str|None file_format: "chrome" or "jsonl". by default "jsonl" if the filename ends with ".jsonl"
+    """
+    self.phases = list(phases)
+    self._phase_idxs = {phase: i for (i, phase) in enumerate(self.phases)}
+    self.capacity = capacity
+    self.num_steps = 0
+    # The last column is the total step duration.
+    self._durations = np.zeros((capacity, len(self.phases) + 1), dtype="float64")
+    self._total_durations = np.zeros((len(self.phases) + 1,), dtype="float64")
+    self._cur_step = None  # type: typing.Optional[int]
+    self._cur_start_time = None  # type: typing.Optional[float]
+    self._cur_durations = [0.0] * len(self.phases)
+    self._cur_events = []  # type: typing.List[typing.Tuple[str,float,float]]  # phase, start, end. only with file
+    self._file = None
+    self._file_format = None  # type: typing.Optional[str]
+    self._file_num_events = 0
+    if filename:
+      if file_format is None:
+        file_format = "jsonl" if filename.endswith(".jsonl") else "chrome"
+      assert file_format in ("chrome", "jsonl"), "%s: invalid file format %r" % (self, file_format)
+      self._file_format = file_format
+      self._file = open(filename, "w")
+      if file_format == "chrome":
+        self._file.write("[\n")
+
+  def __repr__(self):
+    return "<%s phases %r, %i steps>" % (self.__class__.__name__, self.phases, self.num_steps)
+
+  def start_step(self, step, start_time=None):
+    """
+    :param int step:
+    :param float|None start_time: time.time() by default
+    """
+    self._cur_step = step
+    self._cur_start_time = time.time() if start_time is None else start_time
+    self._cur_durations = [0.0] * len(self.phases)
+    del self._cur_events[:]
+
+  def record(self, phase, start_time, end_time=None):
+    """
+    Adds the duration to the phase in the current step.
+    A phase can be recorded multiple times in a step.
+
+    :param str phase:
+    :param float start_time:
+    :param float|None end_time: time.time() by default
+    :return: end_time, which can be used as the start time of the next phase
+    :rtype: float
+    """
+    if end_time is None:
+      end_time = time.time()
+    if self._cur_step is None:  # not started
+      return end_time
+    self._cur_durations[self._phase_idxs[phase]] += end_time - start_time
+    if self._file:
+      self._cur_events.append((phase, start_time, end_time))
+    return end_time
+
+  def end_step(self, end_time=None):
+    """
+    :param float|None end_time: time.time() by default
+    """
+    assert self._cur_step is not None
+    if end_time is None:
+      end_time = time.time()
+    durations = self._cur_durations + [end_time - self._cur_start_time]
+    self._durations[self.num_steps % self.capacity] = durations
+    self._total_durations += durations
+    self.num_steps += 1
+    if self._file:
+      self._write_step(durations)
+    self._cur_step = None
+
+  def _write_step(self, durations):
+    """
+    :param list[float] durations: per phase, and the total step duration
+    """
+    import json
+    if self._file_format == "jsonl":
+      d = {"step": self._cur_step, "start_time": self._cur_start_time, "step_duration": durations[-1]}
+      d.update({phase: duration for (phase, duration) in zip(self.phases, durations)})
+      self._file.write("%s\n" % json.dumps(d))
+      return
+    # Same pid/tid for all, then the phases are shown nested in the step.
+    events = [("step %i" % self._cur_step, self._cur_start_time, self._cur_start_time + durations[-1])]
+    events.extend(self._cur_events)
+    pid = os.getpid()
+    for name, start_time, end_time in events:
+      self._file.write("%s%s" % (",\n" if self._file_num_events else "", json.dumps({
+        "name": name, "ph": "X", "pid": pid, "tid": 0,
+        "ts": start_time * 1e6, "dur": (end_time - start_time) * 1e6, "args": {"step": self._cur_step}})))
+      self._file_num_events += 1
+
+  def get_total_durations(self):
+    """
+    :return: phase -> total duration in secs over all steps, and "step" for the total step duration
+    :rtype: dict[str,float]
+    """
+    return {phase: float(duration) for (phase, duration) in zip(self.phases + ["step"], self._total_durations)}
+
+  def print_summary(self, prefix="", file=None):
+    """
+    :param str prefix: e.g. "train epoch 3"
+    :param io.TextIOBase|None file: sys.stdout by default
+    """
+    if file is None:
+      file = sys.stdout
+    if not self.num_steps:
+      print("%s step trace: no steps" % prefix, file=file)
+      return
+    num_buffered = min(self.num_steps, self.capacity)
+    total_step_time = max(self._total_durations[-1], 1e-10)
+    print("%s step trace, %i steps, %s total%s:" % (
+      prefix, self.num_steps, hms_fraction(total_step_time, decimals=1),
+      (", percentiles of last %i steps" % num_buffered) if num_buffered < self.num_steps else ""), file=file)
+    for i, name in enumerate(self.phases + ["step"]):
+      p50, p90, p99 = np.percentile(self._durations[:num_buffered, i], [50, 90, 99]) * 1000.
+      print("  %s: %.1f%%, mean %.2fms, p50 %.2fms, p90 %.2fms, p99 %.2fms, max %.2fms" % (
+        name, self._total_durations[i] / total_step_time * 100., self._total_durations[i] / self.num_steps * 1000.,
+        p50, p90, p99, np.max(self._durations[:num_buffered, i]) * 1000.), file=file)
+    other_time = total_step_time - np.sum(self._total_durations[:-1])
+    print("  (other: %.1f%%)" % (max(other_time, 0.) / total_step_time * 100.,), file=file)
+
+  def close(self):
+    """
+    Closes the file, if there is one.
+    """
+    if self._file:
+      if self._file_format == "chrome":
+        self._file.write("\n]\n")
+      self._file.close()
+      self._file = None
+
+
 def is_namedtuple(cls):
   """
   :param T cls: tuple, list or namedtuple type
@@ -5,12 +5,79 @@ Provide basic Byte-Pair-Encoding (BPE) utilities.
 
 import re
 import typing
+import threading
+from collections import OrderedDict
 import numpy
 
 
 BpeMergeSymbol = "@@"
 
 
+class WordCache:
+  """
+  Bounded LRU cache word -> BPE segments. Thread-safe.
+  It can be shared by all encoders in the process with the same BPE codes and vocab, see :func:`get_shared`.
+  """
+
+  _shared = {}  # type: typing.Dict[typing.Tuple,WordCache]
+  _shared_lock = threading.Lock()
+
+  @classmethod
+  def get_shared(cls, key, max_size):
+    """
+    :param tuple key: must identify everything the encoding depends on (e.g. BPE codes, vocab)
+    :param int max_size: used if the cache does not exist yet
+    :rtype: WordCache
+    """
+    with cls._shared_lock:
+      if key not in cls._shared:
+        cls._shared[key] = WordCache(max_size=max_size)
+      return cls._shared[key]
+
+  def __init__(self, max_size):
+    """
+    :param int max_size: num words
+    """
+    self.max_size = max_size
+    self._lock = threading.Lock()
+    self._entries = OrderedDict()  # type: typing.Dict[str,typing.Tuple[str,...]]  # least recently used first
+    self.num_hits = 0
+    self.num_misses = 0
+
+  def __repr__(self):
+    return "<%s %i/%i words, %i hits, %i misses>" % (
+      self.__class__.__name__, len(self._entries), self.max_size, self.num_hits, self.num_misses)
+
+  def __len__(self):
+    return len(self._entries)
+
+  def get(self, word):
+    """
+    :param str word:
+    :return: segments, or None if not in the cache
+    :rtype: tuple[str]|None
+    """
+    with self._lock:
+      segments = self._entries.pop(word, None)
+      if segments is None:
+        self.num_misses += 1
+        return None
+      self._entries[word] = segments  # now the most recently used
+      self.num_hits += 1
+      return segments
+
+  def put(self, word, segments):
+    """
+    :param str word:
+    :param tuple[str] segments:
+    """
+    with self._lock:
+      self._entries.pop(word, None)
+      self._entries[word] = segments
+      while len(self._entries) > self.max_size:
+        self._entries.popitem(last=False)
+
+
 class StandardBytePairEncoder:
   """
   Code is partly taken from subword-nmt/apply_bpe.py.
@@ -24,13 +91,20 @@ class StandardBytePairEncoder:
   Rico Sennrich, Barry Haddow and Alexandra Birch (2016). Neural Machine Translation of Rare Words with Subword Units.
   Proceedings of the 54th Annual Meeting of the Association for Computational Linguistics (ACL 2016). Berlin, Germany.
 
+  The merge operations are applied via a priority queue over the symbol pairs, ranked by the codes file
+  (see :func:`_merge`), and the encoded words are kept in a :class:`WordCache`.
   """
 
-  def __init__(self, bpe_codes_file, labels=None):
+  DefaultWordCacheSize = 100000
+
+  def __init__(self, bpe_codes_file, labels=None, word_cache_size=DefaultWordCacheSize):
     """
     :param str bpe_codes_file: codes file
     :param list[str]|None labels: vocab
+    :param int|None word_cache_size: num words in the :class:`WordCache`, which is shared in the process
+      by all encoders with the same BPE codes file and vocab. 0 or None disables the cache
     """
+    import os
     self.labels = labels
     # check version information
     bpe_file_first_line = open(bpe_codes_file, "r").readline()
@@ -43,8 +117,13 @@ class StandardBytePairEncoder:
     # some hacking to deal with duplicates (only consider first instance)
     self._bpe_codes = dict([(code, i) for (i, code) in reversed(list(enumerate(self._bpe_codes)))])
     self._bpe_codes_reverse = dict([(pair[0] + pair[1], pair) for pair, i in self._bpe_codes.items()])
-    self._bpe_encode_cache = {}
     self._bpe_separator = BpeMergeSymbol
+    self._word_cache = None  # type: typing.Optional[WordCache]
+    if word_cache_size:
+      st = os.stat(bpe_codes_file)
+      self._word_cache = WordCache.get_shared(
+        key=("standard", os.path.abspath(bpe_codes_file), st.st_mtime, st.st_size, hash(tuple(labels or ()))),
+        max_size=word_cache_size)
 
   @staticmethod
   def _get_pairs(word):
@@ -62,14 +141,26 @@ class StandardBytePairEncoder:
 
   def _encode_word(self, orig):
     """
-    Encode word based on list of BPE merge operations, which are applied consecutively.
     :param str orig:
+    :return: segments, via the word cache
     :rtype: tuple[str]
     """
+    if self._word_cache is None:
+      return self._encode_word_uncached(orig)
+    segments = self._word_cache.get(orig)
+    if segments is None:
+      segments = self._encode_word_uncached(orig)
+      self._word_cache.put(orig, segments)
+    return segments
 
-    if orig in self._bpe_encode_cache:
-      return self._bpe_encode_cache[orig]
+  def _encode_word_uncached(self, orig, merge_func=None):
+    """
+    Encode word based on list of BPE merge operations, which are applied consecutively.
 
+    :param str orig:
+    :param ((tuple[str])->tuple[str])|None merge_func: :func:`_merge` by default
+    :rtype: tuple[str]
+    """
     if self._bpe_file_version == (0, 1):
       word = tuple(orig) + ('</w>',)
     elif self._bpe_file_version == (0, 2):  # more consistent handling of word-final segments
@@ -77,10 +168,69 @@ class StandardBytePairEncoder:
     else:
       raise NotImplementedError
 
-    pairs = self._get_pairs(word)
-    if not pairs:
-      return orig
+    if len(word) < 2:  # no pairs
+      return orig,
 
+    word = (merge_func or self._merge)(word)
+
+    # don't print end-of-word symbols
+    if word[-1] == '</w>':
+      word = word[:-1]
+    elif word[-1].endswith('</w>'):
+      word = word[:-1] + (word[-1].replace('</w>', ''),)
+
+    if self.labels:
+      word = tuple(self._check_vocab_and_split(word, self._bpe_codes_reverse, self.labels, self._bpe_separator))
+
+    return word
+
+  def _merge(self, word):
+    """
+    Applies the merge operations, lowest rank first, like :func:`_merge_reference`.
+    All adjacent symbol pairs which have a rank are in a priority queue (ordered by rank, then position),
+    and symbols are merged in a linked list, so this is O(n log n) instead of O(n^2) in the word length.
+    Outdated queue entries are skipped. As merged symbols only get longer, we can detect them by the symbols.
+
+    :param tuple[str] word: symbols
+    :rtype: tuple[str]
+    """
+    import heapq
+    ranks = self._bpe_codes
+    symbols = list(word)  # type: typing.List[typing.Optional[str]]  # None for merged-away symbols
+    num_symbols = len(symbols)
+    next_pos = list(range(1, num_symbols + 1))  # num_symbols means end
+    prev_pos = list(range(-1, num_symbols - 1))  # -1 means start
+    queue = []
+    for i in range(num_symbols - 1):
+      rank = ranks.get((symbols[i], symbols[i + 1]))
+      if rank is not None:
+        queue.append((rank, i, symbols[i], symbols[i + 1]))
+    heapq.heapify(queue)
+    while queue:
+      _, i, first, second = heapq.heappop(queue)
+      j = next_pos[i]
+      if symbols[i] != first or j >= num_symbols or symbols[j] != second:
+        continue  # outdated
+      symbols[i] = first + second
+      symbols[j] = None
+      next_pos[i] = next_pos[j]
+      if next_pos[i] < num_symbols:
+        prev_pos[next_pos[i]] = i
+      for left, right in [(prev_pos[i], i), (i, next_pos[i])]:
+        if left >= 0 and right < num_symbols:
+          rank = ranks.get((symbols[left], symbols[right]))
+          if rank is not None:
+            heapq.heappush(queue, (rank, left, symbols[left], symbols[right]))
+    return tuple([symbol for symbol in symbols if symbol is not None])
+
+  def _merge_reference(self, word):
+    """
+    The original greedy loop from subword-nmt. Used for testing and benchmarking :func:`_merge`.
+
+    :param tuple[str] word: symbols
+    :rtype: tuple[str]
+    """
+    pairs = self._get_pairs(word)
     while True:
       bigram = min(pairs, key=lambda pair: self._bpe_codes.get(pair, float('inf')))
       if bigram not in self._bpe_codes:
@@ -109,17 +259,6 @@ class StandardBytePairEncoder:
         break
       else:
         pairs = self._get_pairs(word)
-
-    # don't print end-of-word symbols
-    if word[-1] == '</w>':
-      word = word[:-1]
-    elif word[-1].endswith('</w>'):
-      word = word[:-1] + (word[-1].replace('</w>', ''),)
-
-    if self.labels:
-      word = self._check_vocab_and_split(word, self._bpe_codes_reverse, self.labels, self._bpe_separator)
-
-    self._bpe_encode_cache[orig] = word
     return word
 
   def _check_vocab_and_split(self, orig, bpe_codes, vocab, separator):
@@ -176,14 +315,13 @@ class StandardBytePairEncoder:
       for item in self._recursive_split(right, bpe_codes, vocab, separator, final):
         yield item
 
-  def segment_sentence(self, sentence):
+  @staticmethod
+  def _split_sentence(sentence):
     """
-    Segment single sentence (whitespace-tokenized string) with BPE encoding.
-
-    :param str sentence:
-    :rtype: list[str]
+    :param str sentence: whitespace-tokenized
+    :return: list of (word, whether to encode it). categories ("$cat { ... }") are kept as-is
+    :rtype: list[(str,bool)]
     """
-
     output = []
 
     found_category = False
@@ -192,23 +330,67 @@ class StandardBytePairEncoder:
     for word in sentence.split():
       if word[0] == '$' and len(word) > 1:
         found_category = True
-        output.append(word)
+        output.append((word, False))
       elif found_category is True and word[0] == '{':
         skip_category = True
-        output.append(word)
+        output.append((word, False))
       elif skip_category is True and word[0] != '}':
-        output.append(word)
+        output.append((word, False))
       else:
         found_category = False
         skip_category = False
-        new_word = self._encode_word(word)
+        output.append((word, True))
 
-        for item in new_word[:-1]:
-          output.append(item + self._bpe_separator)
-        output.append(new_word[-1])
+    return output
 
+  def _join_segments(self, words, encoded_words):
+    """
+    :param list[(str,bool)] words: from :func:`_split_sentence`
+    :param dict[str,tuple[str]] encoded_words:
+    :rtype: list[str]
+    """
+    output = []
+    for word, encode in words:
+      if not encode:
+        output.append(word)
+        continue
+      new_word = encoded_words[word]
+      for item in new_word[:-1]:
+        output.append(item + self._bpe_separator)
+      output.append(new_word[-1])
     return output
 
+  def encode_words(self, words):
+    """
+    Batched encoding of many words. Every distinct word is only encoded (or looked up in the cache) once.
+
+    :param list[str]|set[str] words:
+    :return: word -> segments (without separator)
+    :rtype: dict[str,tuple[str]]
+    """
+    return {word: self._encode_word(word) for word in set(words)}
+
+  def segment_sentence(self, sentence):
+    """
+    Segment single sentence (whitespace-tokenized string) with BPE encoding.
+
+    :param str sentence:
+    :rtype: list[str]
+    """
+    words = self._split_sentence(sentence)
+    return self._join_segments(words, {word: self._encode_word(word) for (word, encode) in words if encode})
+
+  def segment_sentences(self, sentences):
+    """
+    Like :func:`segment_sentence`, but for a batch of sentences, via :func:`encode_words`.
+
+    :param list[str] sentences:
+    :rtype: list[list[str]]
+    """
+    words_per_sentence = [self._split_sentence(sentence) for sentence in sentences]
+    encoded_words = self.encode_words([word for words in words_per_sentence for (word, encode) in words if encode])
+    return [self._join_segments(words, encoded_words) for words in words_per_sentence]
+
 
 class PrefixTree:
   """
@@ -410,13 +592,16 @@ class SamplingBytePairEncoder:
   Will randomly sample from any possible BPE split.
   """
 
-  def __init__(self, labels, breadth_prob, rnd, unknown_label=None):
+  def __init__(self, labels, breadth_prob, rnd, unknown_label=None,
+               word_cache_size=StandardBytePairEncoder.DefaultWordCacheSize):
     """
     :param list[str] labels: vocab
     :param float breadth_prob: 1.0 will lead to breadth-first search, 0.0 to depth-first search.
       other values are stochastic.
     :param numpy.random.RandomState rnd:
     :param str|None unknown_label:
+    :param int|None word_cache_size: for a deterministic search (breadth_prob 0 or 1),
+      the BPE splits are kept in a :class:`WordCache`, shared in the process. 0 or None disables the cache
     """
     self.labels = labels
     self.unknown_label = unknown_label
@@ -431,6 +616,11 @@ class SamplingBytePairEncoder:
       bpe.add(bpe_sym)
     self._bpe_prefix_tree = bpe
 
+    self._word_cache = None  # type: typing.Optional[WordCache]
+    if word_cache_size and (breadth_prob <= 0. or breadth_prob >= 1.):
+      self._word_cache = WordCache.get_shared(
+        key=("sampling", breadth_prob >= 1., hash(tuple(labels))), max_size=word_cache_size)
+
   def _sampler(self):
     # When this returns true, it will differ from depth-first search.
     return self.rnd.random_sample() <= self.breadth_prob
@@ -438,9 +628,17 @@ class SamplingBytePairEncoder:
   def get_bpe_split_for_word(self, word):
     """
     :param str word:
-    :rtype: list[str]|None
-    """
-    return DepthFirstSearch(bpe=self._bpe_prefix_tree, word=word, sampler=self._sampler).search()
+    :rtype: list[str]|tuple[str]|None
+    """
+    if self._word_cache is None:
+      return DepthFirstSearch(bpe=self._bpe_prefix_tree, word=word, sampler=self._sampler).search()
+    bpe_sym_seq = self._word_cache.get(word)
+    if bpe_sym_seq is None:
+      bpe_sym_seq = DepthFirstSearch(bpe=self._bpe_prefix_tree, word=word, sampler=self._sampler).search()
+      if bpe_sym_seq is not None:
+        bpe_sym_seq = tuple(bpe_sym_seq)
+        self._word_cache.put(word, bpe_sym_seq)
+    return bpe_sym_seq
 
   def segment_sentence(self, sentence):
     """
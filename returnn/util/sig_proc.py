@@ -3,6 +3,7 @@ Collection of generic utilities related to signal processing
 """
 
 import numpy
+import typing
 
 
 def greenwood_function(x, scaling_constant=165.4, constant_of_integration=0.88, slope=2.1):
@@ -160,3 +161,281 @@ class GammatoneFilterbank(object):
       _, f_resp = signal.freqz(filters[filt, :])
       filters[filt, :] = filters[filt, :] / numpy.max(numpy.abs(f_resp))
     return filters
+
+
+def frame_signal(signal, frame_length, hop_length):
+  """
+  Splits the signal into overlapping frames, without copying (strided view).
+
+  :param numpy.ndarray signal: shape (time,)
+  :param int frame_length:
+  :param int hop_length:
+  :return: read-only view of shape (num_frames, frame_length), num_frames = 1 + (time - frame_length) // hop_length
+  :rtype: numpy.ndarray
+  """
+  assert signal.ndim == 1 and len(signal) >= frame_length, "signal too short (%i < %i)" % (len(signal), frame_length)
+  num_frames = 1 + (len(signal) - frame_length) // hop_length
+  return numpy.lib.stride_tricks.as_strided(
+    signal, shape=(num_frames, frame_length), strides=(signal.strides[0] * hop_length, signal.strides[0]),
+    writeable=False)
+
+
+def hann_window(win_length, n_fft=None):
+  """
+  Periodic Hann window (like ``scipy.signal.get_window("hann", win_length)``),
+  zero-padded on both sides to ``n_fft`` (like librosa).
+
+  :param int win_length:
+  :param int|None n_fft: >= win_length
+  :return: shape (n_fft,)
+  :rtype: numpy.ndarray
+  """
+  if n_fft is None:
+    n_fft = win_length
+  assert n_fft >= win_length
+  window = 0.5 - 0.5 * numpy.cos(2. * numpy.pi * numpy.arange(win_length) / win_length)
+  left_pad = (n_fft - win_length) // 2
+  return numpy.pad(window, (left_pad, n_fft - win_length - left_pad), mode="constant")
+
+
+_SlaneyMelFreqStep = 200. / 3
+_SlaneyMelMinLogHz = 1000.
+_SlaneyMelMinLogMel = _SlaneyMelMinLogHz / _SlaneyMelFreqStep
+_SlaneyMelLogStep = numpy.log(6.4) / 27.
+
+
+def hz_to_mel(freqs):
+  """
+  Slaney mel scale (as in the Auditory Toolbox and librosa with ``htk=False``):
+  linear below 1 kHz, logarithmic above.
+
+  :param numpy.ndarray|float freqs: in Hz
+  :rtype: numpy.ndarray|float
+  """
+  freqs = numpy.asarray(freqs, dtype="float64")
+  return numpy.where(
+    freqs >= _SlaneyMelMinLogHz,
+    _SlaneyMelMinLogMel + numpy.log(numpy.maximum(freqs, _SlaneyMelMinLogHz) / _SlaneyMelMinLogHz) / _SlaneyMelLogStep,
+    freqs / _SlaneyMelFreqStep)
+
+
+def mel_to_hz(mels):
+  """
+  Inverse of :func:`hz_to_mel`.
+
+  :param numpy.ndarray|float mels:
+  :return: in Hz
+  :rtype: numpy.ndarray|float
+  """
+  mels = numpy.asarray(mels, dtype="float64")
+  return numpy.where(
+    mels >= _SlaneyMelMinLogMel,
+    _SlaneyMelMinLogHz * numpy.exp(_SlaneyMelLogStep * (mels - _SlaneyMelMinLogMel)),
+    mels * _SlaneyMelFreqStep)
+
+
+def mel_filterbank(sample_rate, n_fft, n_mels, fmin=0., fmax=None):
+  """
+  Triangular mel filters with Slaney normalization (constant energy per channel),
+  same as ``librosa.filters.mel`` with the defaults ``htk=False, norm="slaney"``.
+
+  :param int sample_rate:
+  :param int n_fft:
+  :param int n_mels:
+  :param float fmin: in Hz
+  :param float|None fmax: in Hz. sample_rate / 2 by default
+  :return: shape (n_mels, n_fft // 2 + 1)
+  :rtype: numpy.ndarray
+  """
+  if fmax is None:
+    fmax = sample_rate / 2.
+  fft_freqs = numpy.linspace(0., sample_rate / 2., n_fft // 2 + 1)
+  mel_freqs = mel_to_hz(numpy.linspace(hz_to_mel(fmin), hz_to_mel(fmax), n_mels + 2))
+  mel_freqs_diff = numpy.diff(mel_freqs)
+  ramps = mel_freqs[:, None] - fft_freqs[None, :]  # (n_mels + 2, freq)
+  lower = -ramps[:-2] / mel_freqs_diff[:-1, None]
+  upper = ramps[2:] / mel_freqs_diff[1:, None]
+  weights = numpy.maximum(0., numpy.minimum(lower, upper))
+  weights *= (2. / (mel_freqs[2:] - mel_freqs[:-2]))[:, None]
+  return weights
+
+
+def dct_matrix(n_input, n_output):
+  """
+  Orthonormal DCT-II basis, i.e. ``x.dot(dct_matrix(n, m).T)`` is the same as
+  ``scipy.fftpack.dct(x, type=2, norm="ortho")[..., :m]``.
+
+  :param int n_input:
+  :param int n_output: <= n_input
+  :return: shape (n_output, n_input)
+  :rtype: numpy.ndarray
+  """
+  assert n_output <= n_input
+  basis = numpy.cos(
+    numpy.pi / (2. * n_input) * numpy.arange(n_output)[:, None] * numpy.arange(1, 2 * n_input, 2)[None, :])
+  basis *= numpy.sqrt(2. / n_input)
+  basis[0] /= numpy.sqrt(2.)
+  return basis
+
+
+def power_to_db(power, amin=1e-10, top_db=80.):
+  """
+  Like ``librosa.power_to_db`` with ``ref=1.0``.
+
+  :param numpy.ndarray power:
+  :param float amin: clipping of small values
+  :param float|None top_db: if given, clips everything below ``max - top_db``
+  :rtype: numpy.ndarray
+  """
+  log_spec = 10. * numpy.log10(numpy.maximum(amin, power))
+  if top_db is not None:
+    log_spec = numpy.maximum(log_spec, log_spec.max() - top_db)
+  return log_spec
+
+
+class AudioFeatureExtractor(object):
+  """
+  NumPy implementation of the spectral features of :class:`returnn.datasets.generating.ExtractAudioFeatures`
+  (``feature_backend="numpy"``), without librosa.
+  It follows the librosa defaults which are used there:
+  centered frames, periodic Hann window, power spectrum,
+  Slaney mel scale and filter normalization, orthonormal DCT-II for the MFCCs,
+  and the RMS energy (unwindowed frames) as first MFCC.
+  The padding of the centered frames is given by ``pad_mode``. The librosa default changed
+  from "reflect" (librosa < 0.9) to "constant" (zeros, librosa >= 0.9),
+  thus :class:`ExtractAudioFeatures` passes the default of the installed librosa version.
+  Then the features are the same up to float precision.
+
+  Window, mel filterbank and DCT matrix are computed once per configuration (see :func:`get_instance`).
+  The frames are strided views on the padded signal, and the FFT and the filterbank matmul
+  are done for all frames at once, also over multiple seqs (:func:`get_features_batch`).
+  """
+
+  Features = ("mfcc", "log_mel_filterbank", "log_log_mel_filterbank", "db_mel_filterbank", "linear_spectrogram")
+  _instances = {}  # type: typing.Dict[typing.Tuple,AudioFeatureExtractor]
+
+  @classmethod
+  def get_instance(cls, **kwargs):
+    """
+    :param kwargs: see :func:`__init__`
+    :return: shared instance for this configuration
+    :rtype: AudioFeatureExtractor
+    """
+    key = tuple(sorted(kwargs.items()))
+    instance = cls._instances.get(key)
+    if instance is None:
+      instance = cls(**kwargs)
+      cls._instances[key] = instance
+    return instance
+
+  def __init__(self, features, sample_rate, window_len=0.025, step_len=0.010, num_feature_filters=40,
+               fmin=0., fmax=None, min_amp=1e-10, pad_mode="constant"):
+    """
+    :param str features: see :class:`AudioFeatureExtractor.Features`
+    :param int sample_rate:
+    :param float window_len: in seconds
+    :param float step_len: in seconds
+    :param int num_feature_filters: output dimension
+    :param float fmin: only for "db_mel_filterbank", minimum frequency covered by mel filters
+    :param float|None fmax: only for "db_mel_filterbank", maximum frequency covered by mel filters
+    :param float min_amp: only for "db_mel_filterbank", silence clipping for small amplitudes
+    :param str pad_mode: for :func:`numpy.pad` of the centered frames, e.g. "constant" or "reflect"
+    """
+    assert features in self.Features, "%s: features %r not supported" % (self.__class__.__name__, features)
+    if features != "db_mel_filterbank":
+      assert fmin == 0 and fmax is None and min_amp == 1e-10, "%s: %r has no feature options" % (
+        self.__class__.__name__, features)
+    assert fmin >= 0 and min_amp > 0
+    self.features = features
+    self.sample_rate = sample_rate
+    self.num_feature_filters = num_feature_filters
+    self.min_amp = min_amp
+    self.pad_mode = pad_mode
+    self.hop_length = int(step_len * sample_rate)
+    win_length = int(window_len * sample_rate)
+    if features == "linear_spectrogram":
+      assert num_feature_filters % 2 == 0 and num_feature_filters * 2 >= win_length
+      self.n_fft = num_feature_filters * 2
+    else:
+      self.n_fft = win_length
+    assert self.hop_length > 0 and self.n_fft > 0
+    self.window = hann_window(win_length, self.n_fft)
+    self.mel_basis = None  # type: typing.Optional[numpy.ndarray]  # (freq, mel)
+    self.dct_basis = None  # type: typing.Optional[numpy.ndarray]  # (mel, num_feature_filters)
+    if features != "linear_spectrogram":
+      num_mels = 128 if features == "mfcc" else num_feature_filters  # librosa.feature.mfcc default n_mels
+      self.mel_basis = numpy.ascontiguousarray(mel_filterbank(
+        sample_rate=sample_rate, n_fft=self.n_fft, n_mels=num_mels, fmin=fmin, fmax=fmax).T)
+      if features == "mfcc":
+        self.dct_basis = numpy.ascontiguousarray(dct_matrix(num_mels, num_feature_filters).T)
+
+  def __repr__(self):
+    return "<%s %r, sample rate %i, n_fft %i, hop %i, dim %i>" % (
+      self.__class__.__name__, self.features, self.sample_rate, self.n_fft, self.hop_length, self.num_feature_filters)
+
+  def get_frames(self, audio):
+    """
+    :param numpy.ndarray audio: shape (time,)
+    :return: centered frames (unwindowed), shape (1 + time // hop_length, n_fft), strided view on the padded audio
+    :rtype: numpy.ndarray
+    """
+    assert audio.ndim == 1
+    audio = numpy.pad(audio, self.n_fft // 2, mode=self.pad_mode)
+    return frame_signal(audio, frame_length=self.n_fft, hop_length=self.hop_length)
+
+  def get_features(self, audio):
+    """
+    :param numpy.ndarray audio: shape (time,)
+    :return: shape (1 + time // hop_length, num_feature_filters), float32
+    :rtype: numpy.ndarray
+    """
+    return self.get_features_batch([audio])[0]
+
+  def get_features_batch(self, audios):
+    """
+    :param list[numpy.ndarray] audios: each of shape (time,)
+    :return: for each audio, shape (1 + time // hop_length, num_feature_filters), float32
+    :rtype: list[numpy.ndarray]
+    """
+    frames_list = [self.get_frames(audio) for audio in audios]
+    frames = frames_list[0] if len(frames_list) == 1 else numpy.concatenate(frames_list, axis=0)
+    spectrum = numpy.fft.rfft(frames * self.window, axis=1)  # (num_frames_total, freq)
+    if self.features == "linear_spectrogram":
+      values = numpy.abs(spectrum[:, 1:])  # remove the DC part
+    else:
+      power = numpy.square(spectrum.real)
+      power += numpy.square(spectrum.imag)
+      values = power.dot(self.mel_basis)  # (num_frames_total, mel)
+    energy = None
+    if self.features == "mfcc":
+      energy = numpy.sqrt(numpy.mean(numpy.square(frames), axis=1))
+    res = []
+    offset = 0
+    for seq_frames in frames_list:
+      end = offset + seq_frames.shape[0]
+      res.append(self._post_process(values[offset:end], energy=energy[offset:end] if energy is not None else None))
+      offset = end
+    return res
+
+  def _post_process(self, values, energy=None):
+    """
+    Everything which is per seq (e.g. the top_db clipping depends on the max over the seq).
+
+    :param numpy.ndarray values: (time, freq|mel)
+    :param numpy.ndarray|None energy: (time,)
+    :return: (time, num_feature_filters), float32
+    :rtype: numpy.ndarray
+    """
+    log_noise_floor = 1e-3  # prevent numeric overflow in log
+    if self.features == "log_mel_filterbank":
+      values = numpy.log(numpy.maximum(log_noise_floor, values))
+    elif self.features == "log_log_mel_filterbank":
+      values = numpy.log(numpy.maximum(log_noise_floor, values))
+      values = power_to_db(numpy.square(values))  # librosa.amplitude_to_db
+    elif self.features == "db_mel_filterbank":
+      values = 20. * numpy.log10(numpy.maximum(self.min_amp, values))
+    elif self.features == "mfcc":
+      values = power_to_db(values).dot(self.dct_basis)
+      values[:, 0] = energy  # replace first MFCC with energy, per convention
+    assert values.shape[1] == self.num_feature_filters
+    return values.astype("float32")
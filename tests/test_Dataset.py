@@ -9,8 +9,8 @@ import unittest
 from nose.tools import assert_equal, assert_is_instance, assert_in, assert_not_in, assert_true, assert_false
 from returnn.datasets.generating import GeneratingDataset, DummyDataset, DummyDatasetMultipleSequenceLength
 from returnn.engine.batch import Batch
-from returnn.datasets.basic import DatasetSeq
-from returnn.util.basic import NumbersDict
+from returnn.datasets.basic import Dataset, DatasetSeq
+from returnn.util.basic import NumbersDict, OptionalNotImplementedError
 import numpy as np
 
 from returnn.util import better_exchook
@@ -324,6 +324,412 @@ def test_task12ax_window():
   assert_equal(list(data2a[-1, 2]), [0] * input_dim)  # zero-padded right
 
 
+def test_get_seq_order_for_epoch_vectorized_deterministic():
+  from returnn.datasets.basic import Dataset
+  rnd = np.random.RandomState(42)
+  num_seqs = 101
+  seq_lens = rnd.randint(1, 20, size=(num_seqs,))  # many duplicates, to check stable sorting
+  for seq_ordering in ["default", "default_every_n:4", "reverse", "sorted", "sorted_reverse"]:
+    for partition_epoch in [1, 3]:
+      kwargs = dict(seq_ordering=seq_ordering, partition_epoch=partition_epoch)
+      dataset = Dataset(**kwargs)
+      dataset_vec = Dataset(vectorized_seq_ordering=True, **kwargs)
+      for epoch in [1, 2, 5]:
+        seq_order = dataset.get_seq_order_for_epoch(epoch, num_seqs, get_seq_len=seq_lens.__getitem__)
+        seq_order_vec = dataset_vec.get_seq_order_for_epoch(epoch, num_seqs, get_seq_lens=lambda: seq_lens)
+        assert_is_instance(seq_order_vec, list)
+        assert_equal(seq_order, seq_order_vec, "seq_ordering %r, epoch %i" % (seq_ordering, epoch))
+
+
+def test_get_seq_order_for_epoch_vectorized_random():
+  from returnn.datasets.basic import Dataset
+  num_seqs = 100
+  seq_lens = np.arange(num_seqs) % 10 + 1
+  for seq_ordering in ["random", "random:2", "sort_bin_shuffle:3", "sort_bin_shuffle_x2:.10", "laplace:.20"]:
+    dataset = Dataset(seq_ordering=seq_ordering, vectorized_seq_ordering=True)
+    seq_order = dataset.get_seq_order_for_epoch(1, num_seqs, get_seq_lens=lambda: seq_lens)
+    assert_equal(sorted(seq_order), list(range(num_seqs)))
+    assert_equal(seq_order, dataset.get_seq_order_for_epoch(1, num_seqs, get_seq_lens=lambda: seq_lens))
+    if seq_ordering.startswith("laplace"):
+      # 5 bins, alternating ascending and descending seq lens.
+      for i in range(5):
+        bin_lens = [seq_lens[j] for j in seq_order[i * 20:(i + 1) * 20]]
+        assert_equal(bin_lens, sorted(bin_lens, reverse=(i % 2 == 1)))
+    if seq_ordering == "sort_bin_shuffle:3":
+      # Bins are shuffled, but each bin is sorted, i.e. we have at most 3 ascending runs.
+      lens = [seq_lens[j] for j in seq_order]
+      num_descents = sum([lens[i + 1] < lens[i] for i in range(num_seqs - 1)])
+      assert num_descents <= 2
+
+
+def test_get_seq_order_for_epoch_vectorized_seq_tags():
+  from returnn.datasets.basic import Dataset
+  all_tags = ["seq-%i" % (i % 4) for i in range(10)]
+  for vectorized_seq_ordering in [False, True]:
+    dataset = Dataset(seq_ordering="reverse", unique_seq_tags=True, vectorized_seq_ordering=vectorized_seq_ordering)
+    dataset.get_all_tags = lambda: all_tags
+    assert_equal(dataset.get_seq_order_for_epoch(1, 10), [9, 8, 7, 6])
+    dataset = Dataset(seq_ordering="default", vectorized_seq_ordering=vectorized_seq_ordering)
+    dataset.seq_tags_filter = {"seq-1", "seq-3"}
+    dataset.get_all_tags = lambda: all_tags
+    dataset.get_total_num_seqs = lambda: len(all_tags)
+    assert_equal(dataset.get_seq_order_for_epoch(1, 10), [1, 3, 5, 7, 9])
+
+
+def test_EpochWiseFilter_get_seq_lens():
+  from returnn.datasets.meta import EpochWiseFilter
+  rnd = np.random.RandomState(42)
+  seq_lens = rnd.randint(1, 100, size=(50,))
+  seq_order = list(rnd.permutation(50)) * 2
+  kwargs = dict(opts={"max_mean_len": 30}, seq_order=seq_order, debug_msg_prefix="test ")
+  res1 = EpochWiseFilter.filter_epoch(get_seq_len=lambda i: seq_lens[i], **kwargs)
+  res2 = EpochWiseFilter.filter_epoch(get_seq_len=None, get_seq_lens=lambda: seq_lens, **kwargs)
+  assert_equal(res1, res2)
+  assert 0 < len(res1) < len(seq_order)
+  assert all([seq_lens[i] <= max(seq_lens[res1]) for i in res1])
+
+
+class _SeqLensDataset(Dataset):
+  """
+  Only provides seq lengths, for testing the batch generation.
+  """
+
+  def __init__(self, seq_lens, bulk_seq_lens=True, **kwargs):
+    """
+    :param dict[str,list[int]] seq_lens:
+    :param bool bulk_seq_lens: whether to provide get_all_seq_lengths
+    """
+    super(_SeqLensDataset, self).__init__(**kwargs)
+    self._seq_lens = {key: np.array(value) for (key, value) in seq_lens.items()}
+    self._total_num_seqs = len(seq_lens["data"])
+    self._bulk_seq_lens = bulk_seq_lens
+    self._seq_order = None
+
+  def init_seq_order(self, epoch=None, seq_list=None, seq_order=None):
+    super(_SeqLensDataset, self).init_seq_order(epoch=epoch)
+    self._seq_order = self.get_seq_order_for_epoch(
+      epoch=epoch, num_seqs=self._total_num_seqs, get_seq_len=lambda i: self._seq_lens["data"][i])
+    return True
+
+  @property
+  def num_seqs(self):
+    return len(self._seq_order)
+
+  def get_current_seq_order(self):
+    return self._seq_order
+
+  def get_seq_length(self, seq_idx):
+    return NumbersDict({key: value[self._seq_order[seq_idx]] for (key, value) in self._seq_lens.items()})
+
+  def get_all_seq_lengths(self):
+    if not self._bulk_seq_lens:
+      raise OptionalNotImplementedError
+    return NumbersDict(self._seq_lens)
+
+
+def _batch_as_tuple(batch):
+  """
+  :param Batch batch:
+  :rtype: tuple
+  """
+  return (
+    batch.max_num_frames_per_slice.dict, batch.max_num_frames_per_slice.value, batch.num_slices,
+    [(s.seq_idx, s.seq_start_frame.dict, s.seq_start_frame.value, s.seq_end_frame.dict, s.seq_end_frame.value,
+      s.batch_slice, s.batch_frame_offset.dict, s.batch_frame_offset.value) for s in batch.seqs])
+
+
+def _get_batches_as_tuples(dataset, **kwargs):
+  """
+  :param Dataset dataset:
+  :rtype: list[tuple]
+  """
+  dataset.init_seq_order(epoch=1)
+  batches = []
+  for batch in dataset._generate_batches(**kwargs):
+    assert isinstance(batch, Batch)
+    batches.append(_batch_as_tuple(batch))
+  return batches
+
+
+def test_generate_batches_recurrent_vectorized():
+  rnd = np.random.RandomState(42)
+  lens = rnd.randint(1, 30, size=(100,))
+  seq_lens = {"data": lens, "classes": lens}
+  for dataset_opts, batch_opts in [
+        ({}, dict(batch_size=100, max_seqs=7)),
+        ({"seq_ordering": "random"}, dict(batch_size=50, max_seq_length=25, min_seq_length=3)),
+        ({"seq_ordering": "laplace:5"}, dict(batch_size=80, max_pad_size=20, max_total_num_seqs=42)),
+        ({"chunking": "10:5"}, dict(batch_size=40, max_seqs=3)),
+        ({"chunking": "10:5", "min_chunk_size": 3, "context_window": 3}, dict(batch_size=1000, max_seq_length=11)),
+        ({"chunking": ({"data": 10, "classes": 10}, {"data": 5, "classes": 5})},
+         dict(batch_size=30, used_data_keys={"data", "classes"})),
+        ({}, dict(batch_size=10)),  # some seqs longer than batch_size
+      ]:
+    print("dataset opts:", dataset_opts, "batch opts:", batch_opts)
+    generic = _get_batches_as_tuples(
+      _SeqLensDataset(seq_lens, bulk_seq_lens=False, **dataset_opts), recurrent_net=True, **batch_opts)
+    vectorized = _get_batches_as_tuples(_SeqLensDataset(seq_lens, **dataset_opts), recurrent_net=True, **batch_opts)
+    assert generic
+    assert_equal(generic, vectorized)
+
+
+def test_generate_batches_recurrent_vectorized_chunking_full_seq_keys():
+  # "classes" of length 1 is special, it is the full seq in every chunk.
+  seq_lens = {"data": [11, 12, 3, 25], "classes": [1, 1, 1, 1]}
+  kwargs = dict(recurrent_net=True, batch_size=40, max_seqs=4)
+  generic = _get_batches_as_tuples(_SeqLensDataset(seq_lens, bulk_seq_lens=False, chunking="5:5"), **kwargs)
+  vectorized = _get_batches_as_tuples(_SeqLensDataset(seq_lens, chunking="5:5"), **kwargs)
+  assert_equal(generic, vectorized)
+  assert_equal(sum(len(b[3]) for b in vectorized), 3 + 3 + 1 + 5)
+
+
+def test_BatchSet():
+  from returnn.engine.batch import BatchSet
+  dataset = DummyDatasetMultipleSequenceLength(
+    input_dim=2, output_dim=3, num_seqs=20, seq_len={"data": 11, "classes": 11}, chunking="5:3", context_window=3)
+  dataset.init_seq_order(epoch=1)
+  for recurrent_net in [True, False]:
+    batches = list(dataset._generate_batches(recurrent_net=recurrent_net, batch_size=13, max_seqs=4))
+    batch_set = BatchSet()
+    for batch in batches:
+      batch_set.append(batch)
+    assert_equal(len(batch_set), len(batches))
+    assert_equal(sorted(batch_set.keys), ["classes", "data"])
+    assert_equal([_batch_as_tuple(b) for b in batches], [_batch_as_tuple(b) for b in batch_set])
+    assert_equal(_batch_as_tuple(batches[-1]), _batch_as_tuple(batch_set[-1]))
+
+
+def test_BatchSetGenerator_cache_whole_epoch():
+  from returnn.engine.batch import BatchSetGenerator
+  dataset = _SeqLensDataset({"data": list(range(1, 30)), "classes": list(range(1, 30))}, seq_ordering="random")
+  dataset.init_seq_order(epoch=1)
+  batches = list(dataset._generate_batches(recurrent_net=True, batch_size=40))
+  batch_gen = BatchSetGenerator(
+    dataset, dataset._generate_batches(recurrent_net=True, batch_size=40), cache_whole_epoch=True)
+  for epoch in range(2):
+    res = []
+    while batch_gen.has_more():
+      batch, = batch_gen.peek_next_n(1)
+      res.append(batch)
+      batch_gen.advance(1)
+    assert_equal([_batch_as_tuple(b) for b in batches], [_batch_as_tuple(b) for b in res])
+    assert_equal(len(batch_gen.cache), len(batches))
+    batch_gen.reset()
+
+
+def test_MultiProcDataset():
+  from returnn.datasets.basic import init_dataset
+  from returnn.datasets.multi_proc import MultiProcDataset
+  sub_dataset = {"class": "DummyDataset", "input_dim": 2, "output_dim": 3, "num_seqs": 23, "seq_len": 5}
+  dataset = init_dataset({"class": "MultiProcDataset", "dataset": sub_dataset, "num_workers": 3, "buffer_size": 2})
+  assert isinstance(dataset, MultiProcDataset)
+  ref_dataset = init_dataset(sub_dataset)
+  assert_equal(dataset.num_outputs, ref_dataset.num_outputs)
+  for epoch in [1, 2]:
+    dataset.init_seq_order(epoch=epoch)
+    ref_dataset.init_seq_order(epoch=epoch)
+    assert_equal(dataset.num_seqs, 23)
+    seq_idx = 0
+    while dataset.is_less_than_num_seqs(seq_idx):
+      if epoch == 2 and seq_idx == 10:
+        seq_idx = 15  # skip some seqs
+      dataset.load_seqs(seq_idx, seq_idx + 1)
+      ref_dataset.load_seqs(seq_idx, seq_idx + 1)
+      assert_equal(dataset.get_tag(seq_idx), ref_dataset.get_tag(seq_idx))
+      for key in ["data", "classes"]:
+        np.testing.assert_array_equal(dataset.get_data(seq_idx, key), ref_dataset.get_data(seq_idx, key))
+      seq_idx += 1
+    assert_equal(seq_idx, 23)
+  dataset.init_seq_order(epoch=3)  # stop in the middle of the epoch
+  dataset.load_seqs(0, 5)
+  dataset.init_seq_order(epoch=1)
+  dataset.load_seqs(0, 1)
+  ref_dataset.init_seq_order(epoch=1)
+  ref_dataset.load_seqs(0, 1)
+  assert_equal(dataset.get_tag(0), ref_dataset.get_tag(0))
+
+
+def test_MetaDataset_lazy_init_parallel():
+  import tempfile
+  from returnn.datasets.basic import init_dataset
+  from returnn.datasets.meta import MetaDataset
+  sub_datasets = {
+    "a": {"class": "DummyDataset", "input_dim": 2, "output_dim": 3, "num_seqs": 11, "seq_len": 4},
+    "b": {"class": "DummyDataset", "input_dim": 5, "output_dim": 7, "num_seqs": 11, "seq_len": 3}}
+  opts = {
+    "class": "MetaDataset", "datasets": sub_datasets,
+    "data_map": {"data": ("a", "data"), "classes": ("a", "classes"), "b_data": ("b", "data")},
+    "seq_ordering": "random"}
+  lazy_opts = {
+    "lazy_init": True, "init_seq_order_num_threads": 2,
+    "data_dims": {"data": (2, 2), "classes": (3, 1), "b_data": (5, 2)}}
+  # DummyDataset does not know its tags before init_seq_order (and no seq_list_file is given),
+  # which is an error, the same for the lazy/parallel init.
+  errors = []
+  for opts_ in [opts, dict(opts, **lazy_opts)]:
+    try:
+      init_dataset(opts_)
+    except Exception as exc:
+      errors.append(str(exc))
+  assert_equal(len(errors), 2)
+  assert_equal(errors[0], errors[1])
+  # HDFDataset knows the tags initially.
+  from returnn.datasets.hdf import HDFDatasetWriter
+  for key, sub_dataset_opts in sorted(sub_datasets.items()):
+    hdf_filename = tempfile.mktemp(suffix=".hdf", prefix="MetaDataset_%s" % key)
+    writer = HDFDatasetWriter(hdf_filename)
+    writer.dump_from_dataset(init_dataset(sub_dataset_opts), use_progress_bar=False)
+    writer.close()
+    sub_datasets[key] = {"class": "HDFDataset", "files": [hdf_filename]}
+  ref_dataset = init_dataset(opts)
+  # Not via init_dataset, as that would already call init_seq_order.
+  dataset = MetaDataset(**dict([(k, v) for (k, v) in opts.items() if k != "class"], **lazy_opts))
+  assert not dataset.datasets.is_initialized("b")
+  for epoch in [1, 2]:
+    dataset.init_seq_order(epoch=epoch)
+    ref_dataset.init_seq_order(epoch=epoch)
+    assert dataset.datasets.is_initialized("b")
+    assert_equal(dataset.num_seqs, 11)
+    dataset.load_seqs(0, dataset.num_seqs)
+    ref_dataset.load_seqs(0, ref_dataset.num_seqs)
+    for seq_idx in range(dataset.num_seqs):
+      assert_equal(dataset.get_tag(seq_idx), ref_dataset.get_tag(seq_idx))
+      for key in ["data", "classes", "b_data"]:
+        np.testing.assert_array_equal(dataset.get_data(seq_idx, key), ref_dataset.get_data(seq_idx, key))
+
+
+def test_SubDatasets_create_concurrently():
+  import threading
+  from returnn.datasets.meta import SubDatasets, init_seq_order_parallel
+  opts = {key: {"class": "DummyDataset", "input_dim": 2, "output_dim": 3, "num_seqs": 3} for key in "ab"}
+  # Both sub-datasets must be in creation at the same time to pass the barrier.
+  barrier = threading.Barrier(2, timeout=10)
+  datasets = SubDatasets(opts, keys=["a", "b"], lazy=True, on_init=lambda key, dataset: barrier.wait())
+  assert not datasets.is_initialized("a") and not datasets.is_initialized("b")
+  init_seq_order_parallel(datasets, [("a", {"epoch": 1}), ("b", {"epoch": 1})], num_threads=2)
+  assert datasets.is_initialized("a") and datasets.is_initialized("b")
+
+
+def test_CombinedDataset_random_dataset_vectorized():
+  import tempfile
+  from returnn.datasets.basic import init_dataset
+  from returnn.datasets.meta import CombinedDataset
+  from returnn.datasets.hdf import HDFDatasetWriter
+  # CombinedDataset needs sub-datasets with corpus seq idx, thus not DummyDataset directly.
+  hdf_filename = tempfile.mktemp(suffix=".hdf", prefix="CombinedDataset")
+  writer = HDFDatasetWriter(hdf_filename)
+  writer.dump_from_dataset(
+    DummyDataset(input_dim=2, output_dim=3, num_seqs=5), use_progress_bar=False)
+  writer.close()
+  sub_dataset = {"class": "HDFDataset", "files": [hdf_filename]}
+  dataset = init_dataset({
+    "class": "CombinedDataset", "datasets": {"a": sub_dataset, "b": sub_dataset, "c": sub_dataset},
+    "seq_ordering": "random_dataset",
+    "data_map": {(key, data_key): data_key for key in "abc" for data_key in ["data", "classes"]}})
+  assert isinstance(dataset, CombinedDataset)
+  dataset.epoch = 1
+  dataset.dataset_seq_idx_boundaries = [0, 13, 13, 20]  # the dataset "b" is empty
+  for seq_idx in range(20):
+    dataset_idx, dataset_seq_idx = dataset._seq_idx_to_dataset_seq_idx(seq_idx)
+    assert_equal(dataset._seq_idxs_to_dataset_seq_idxs([seq_idx]).tolist(), [[dataset_idx, dataset_seq_idx]])
+    assert_equal(dataset_idx, 0 if seq_idx < 13 else 2)
+  seq_order = dataset._get_random_dataset_seq_order(total_num_seqs=20)
+  assert_equal(sorted(seq_order.tolist()), list(range(20)))
+  # The order within each sub-dataset is kept.
+  counters = [0] * 3
+  for dataset_idx, dataset_seq_idx in dataset._seq_idxs_to_dataset_seq_idxs(seq_order).tolist():
+    assert_equal(dataset_seq_idx, counters[dataset_idx])
+    counters[dataset_idx] += 1
+  assert_equal(counters, [13, 0, 7])
+  # Now the full init, with the real sub-datasets.
+  dataset.init_seq_order(epoch=2)
+  assert_equal(dataset.num_seqs, 15)
+  dataset.load_seqs(0, dataset.num_seqs)
+  tags = [dataset.get_tag(seq_idx) for seq_idx in range(dataset.num_seqs)]
+  assert_equal(sorted(tags), sorted(["seq-%i" % i for i in range(5)] * 3))
+  assert_equal(dataset.used_num_seqs_per_subset, [5, 5, 5])
+
+
+def test_ChunkShuffleDataset():
+  from returnn.datasets.basic import init_dataset
+  sub_dataset = {"class": "DummyDataset", "input_dim": 2, "output_dim": 3, "num_seqs": 20, "seq_len": 5}
+  dataset = init_dataset({"class": "ChunkShuffleDataset", "dataset": sub_dataset, "chunk_shuffle_cache": 4})
+  ref_dataset = init_dataset(sub_dataset)
+  ref_dataset.init_seq_order(epoch=1)
+  ref_dataset.load_seqs(0, 20)
+  ref_data = {ref_dataset.get_tag(seq_idx): ref_dataset.get_data(seq_idx, "data") for seq_idx in range(20)}
+  dataset.init_seq_order(epoch=1)
+  seq_idx = 0
+  tags = []
+  while dataset.is_less_than_num_seqs(seq_idx):
+    dataset.load_seqs(seq_idx, seq_idx + 1)
+    tag, chunk_seq_idx = dataset.get_tag(seq_idx).rsplit(".", 1)
+    assert_equal(int(chunk_seq_idx), seq_idx)
+    np.testing.assert_array_equal(dataset.get_data(seq_idx, "data"), ref_data[tag])
+    tags.append(tag)
+    seq_idx += 1
+  assert_equal(dataset.num_seqs, 20)
+  assert_equal(sorted(tags), sorted(ref_data.keys()))
+  assert tags != [ref_dataset.get_tag(seq_idx) for seq_idx in range(20)]  # shuffled
+  assert dataset._pool == []
+
+
+def test_NumpyDumpDataset_read_ahead():
+  import tempfile
+  import shutil
+  from returnn.datasets.numpy_dump import NumpyDumpDataset
+  tmp_dir = tempfile.mkdtemp()
+  rnd = np.random.RandomState(42)
+  seqs = []
+  for seq_idx in range(7):
+    features = rnd.normal(size=(rnd.randint(1, 10), 3)).astype("float32")
+    targets = rnd.randint(0, 5, size=(len(features),)).astype("int32")
+    np.save("%s/%i.data.npy" % (tmp_dir, seq_idx), features)
+    np.save("%s/%i.targets.npy" % (tmp_dir, seq_idx), targets)
+    seqs.append((features, targets))
+  dataset = NumpyDumpDataset(
+    prefix=tmp_dir + "/", postfix=".npy", num_inputs=3, num_outputs={"data": (3, 2), "classes": (5, 1)},
+    read_ahead=3, read_ahead_num_threads=2)
+  dataset.init_seq_order(epoch=1)
+  assert_equal(dataset.num_seqs, 7)
+  for seq_idx in range(7):
+    dataset.load_seqs(seq_idx, seq_idx + 1)
+    np.testing.assert_array_equal(dataset.get_input_data(seq_idx), seqs[seq_idx][0])
+    np.testing.assert_array_equal(dataset.get_targets("classes", seq_idx), seqs[seq_idx][1])
+  dataset.finish_epoch()
+  assert dataset._read_ahead_executor is None
+  # Re-init in the middle of the epoch, and skip some seqs.
+  dataset.init_seq_order(epoch=2)
+  dataset.load_seqs(0, 2)
+  dataset.init_seq_order(epoch=3)
+  for seq_idx in [0, 1, 4, 5]:
+    dataset.load_seqs(seq_idx, seq_idx + 1)
+    np.testing.assert_array_equal(dataset.get_input_data(seq_idx), seqs[seq_idx][0])
+  assert_equal(dataset.get_seq_length(6)["data"], len(seqs[6][0]))
+  dataset.finish_epoch()
+  shutil.rmtree(tmp_dir)
+
+
+def test_MeanVarianceAccumulator():
+  import tempfile
+  from returnn.datasets.normalization_data import MeanVarianceAccumulator
+  rnd = np.random.RandomState(42)
+  seqs = [rnd.normal(loc=1000., scale=0.1, size=(rnd.randint(1, 20), 3)) for _ in range(10)]
+  all_data = np.concatenate(seqs, axis=0)
+  shard_accs = [MeanVarianceAccumulator(), MeanVarianceAccumulator()]
+  for i, seq in enumerate(seqs):
+    shard_accs[i % 2].add(seq)
+  with tempfile.NamedTemporaryFile(suffix=".npz") as f:
+    shard_accs[0].info["seq_idx_end"] = 5
+    shard_accs[0].save(f.name)
+    acc = MeanVarianceAccumulator.load(f.name)
+  assert_equal(acc.info, {"seq_idx_end": 5})
+  acc.merge(shard_accs[1])
+  assert_equal(acc.count, len(all_data))
+  np.testing.assert_allclose(acc.get_mean(), np.mean(all_data, axis=0))
+  np.testing.assert_allclose(acc.get_variance(), np.var(all_data, axis=0), rtol=1e-6)
+
+
 if __name__ == "__main__":
   better_exchook.install()
   if len(sys.argv) <= 1:
@@ -4,7 +4,8 @@ from __future__ import print_function
 
 import _setup_test_env  # noqa
 import unittest
-from nose.tools import assert_equal, assert_is_instance, assert_in, assert_not_in, assert_true, assert_false
+from nose.tools import assert_equal, assert_not_equal, assert_is_instance, assert_in, assert_not_in, assert_true
+from nose.tools import assert_false
 from returnn.datasets.generating import *
 from returnn.datasets.basic import DatasetSeq
 from returnn.util.basic import PY3, unicode
@@ -140,6 +141,195 @@ def test_BytePairEncoding_unicode():
     u"råt råt iz ďër iz ďër ám à@@ n iz ďër ë låk ë k@@ o@@ d áv d@@ r@@ e@@ s w@@ ër yù w@@ ê@@ k dù ďë à@@ s@@ k")
 
 
+def test_BytePairEncoding_get_seqs():
+  bpe = BytePairEncoding(
+    bpe_file="%s/bpe-unicode-demo.codes" % my_dir,
+    vocab_file="%s/bpe-unicode-demo.vocab" % my_dir,
+    unknown_label="<unk>", seq_postfix=[0])
+  sentences = [u"råt råt iz ďër", u"", u"kod xyz", u"àn"]
+  seqs = bpe.get_seqs(sentences)
+  assert_equal(len(seqs), len(sentences))
+  for sentence, seq in zip(sentences, seqs):
+    assert_equal(seq.dtype, numpy.int32)
+    assert_equal(seq.tolist(), bpe.get_seq(sentence))
+
+
+def test_StandardBytePairEncoder_merge():
+  from returnn.util.bpe import StandardBytePairEncoder
+  bpe = BytePairEncoding(
+    bpe_file="%s/bpe-unicode-demo.codes" % my_dir,
+    vocab_file="%s/bpe-unicode-demo.vocab" % my_dir,
+    unknown_label="<unk>")
+  encoder = bpe.bpe
+  assert isinstance(encoder, StandardBytePairEncoder)
+  # Same BPE codes and vocab, thus the same word cache.
+  other_encoder = StandardBytePairEncoder(bpe_codes_file="%s/bpe-unicode-demo.codes" % my_dir, labels=bpe.labels)
+  assert other_encoder._word_cache is encoder._word_cache
+  chars = sorted(set("".join(a + b for (a, b) in encoder._bpe_codes.keys()).replace("</w>", "")))
+  rnd = numpy.random.RandomState(42)
+  words = ["".join(rnd.choice(chars, size=rnd.randint(1, 15))) for _ in range(1000)]
+  for word in words:
+    assert_equal(
+      encoder._encode_word_uncached(word), encoder._encode_word_uncached(word, merge_func=encoder._merge_reference))
+  sentences = [" ".join(words[i:i + 10]) for i in range(0, len(words), 10)]
+  assert_equal(encoder.segment_sentences(sentences), [encoder.segment_sentence(s) for s in sentences])
+
+
+def test_Vocabulary_vocab_cache():
+  import tempfile
+  import shutil
+  tmp_dir = tempfile.mkdtemp()
+  try:
+    vocab_file = "%s/vocab.txt" % tmp_dir
+    with open(vocab_file, "w") as f:
+      f.write(repr({"UNK": 0, "hello": 1, "world": 2, "</s>": 3, "\n": 4}))
+    Vocabulary._cache.clear()
+    orig_vocab = Vocabulary(vocab_file=vocab_file)
+    for _ in range(2):  # first fills the cache, then loads from it
+      Vocabulary._cache.clear()
+      vocab = Vocabulary(vocab_file=vocab_file, vocab_cache="%s/cache" % tmp_dir)
+      assert_equal(vocab.vocab, orig_vocab.vocab)
+      assert_equal(vocab.labels, orig_vocab.labels)
+    assert os.listdir("%s/cache" % tmp_dir)
+    assert_equal(
+      [seq.tolist() for seq in vocab.get_seqs(["hello world", "hello foo world"])], [[1, 2], [1, 0, 2]])
+  finally:
+    Vocabulary._cache.clear()
+    shutil.rmtree(tmp_dir)
+
+
+def test_LibriSpeechCorpus():
+  import tempfile
+  import shutil
+  tmp_dir = tempfile.mkdtemp()
+  os.makedirs("%s/train-clean-100/19/198" % tmp_dir)
+  with open("%s/train-clean-100/19/198/19-198.trans.txt" % tmp_dir, "w") as f:
+    f.write("19-198-0000 NORTHANGER ABBEY\n19-198-0001 THIS LITTLE WORK\n")
+  dataset = LibriSpeechCorpus(path=tmp_dir, prefix="train", audio=None)
+  dataset.init_seq_order(epoch=1)
+  dataset.load_seqs(0, 2)
+  assert_equal(dataset.num_seqs, 2)
+  assert_equal(dataset.get_all_tags(), ["train-clean-100-19-198-0000", "train-clean-100-19-198-0001"])
+  assert_equal(dataset.get_data(0, "raw"), "NORTHANGER ABBEY")
+  shutil.rmtree(tmp_dir)
+
+
+def test_OggZipDataset_feature_cache_audio_files():
+  import tempfile
+  import shutil
+  # noinspection PyPackageRequirements
+  import soundfile
+  tmp_dir = tempfile.mkdtemp()
+  try:
+    os.makedirs("%s/corpus" % tmp_dir)
+    with open("%s/corpus.txt" % tmp_dir, "w") as f:
+      f.write(repr([{"file": "seq0.wav", "text": "hello", "duration": 0.5}]))
+    rnd = numpy.random.RandomState(42)
+
+    def _write_audio():
+      """
+      Writes new random audio for the seq.
+      """
+      soundfile.write("%s/corpus/seq0.wav" % tmp_dir, rnd.uniform(-1., 1., (8000,)), 16000)
+
+    def _get_features():
+      """
+      :rtype: numpy.ndarray
+      """
+      dataset = OggZipDataset(
+        path="%s/corpus" % tmp_dir, audio={"features": "mfcc", "feature_backend": "numpy"}, targets=None,
+        feature_cache="%s/cache" % tmp_dir)
+      dataset.init_seq_order(epoch=1)
+      dataset.load_seqs(0, 1)
+      return dataset.get_data(0, "data")
+
+    _write_audio()
+    features = _get_features()
+    numpy.testing.assert_array_equal(_get_features(), features)
+    assert_equal(len(os.listdir("%s/cache/ogg_zip_features" % tmp_dir)), 1)
+    # The txt file is unchanged, but the audio changed, so the cached features must not be used.
+    _write_audio()
+    assert_false(numpy.array_equal(_get_features(), features))
+    assert_equal(len(os.listdir("%s/cache/ogg_zip_features" % tmp_dir)), 2)
+  finally:
+    shutil.rmtree(tmp_dir)
+
+
+def test_ExtractAudioFeatures_get_cache_opts():
+  opts = ExtractAudioFeatures(features="mfcc", norm_mean=numpy.zeros((40,))).get_cache_opts()
+  assert_equal(opts["features"], "mfcc")
+  assert_equal(opts["norm_mean"], [0.0] * 40)
+  assert_equal(repr(opts), repr(ExtractAudioFeatures(features="mfcc", norm_mean=numpy.zeros((40,))).get_cache_opts()))
+  assert ExtractAudioFeatures(features="mfcc", random_permute=True).get_cache_opts() is None
+  assert_equal(opts["pad_mode"], "constant")
+  assert_not_equal(
+    ExtractAudioFeatures(features="mfcc", feature_backend="numpy").get_cache_opts(),
+    ExtractAudioFeatures(features="mfcc", feature_backend="numpy", pad_mode="reflect").get_cache_opts())
+
+
+def test_AudioFeatureExtractor_linear_spectrogram():
+  from returnn.util.sig_proc import AudioFeatureExtractor
+  sample_rate, n_fft, hop_len, win_len = 16000, 512, 160, 400
+  audio = numpy.random.RandomState(42).uniform(-1., 1., (sample_rate // 2 + 123,))
+  extractor = AudioFeatureExtractor.get_instance(
+    features="linear_spectrogram", sample_rate=sample_rate, num_feature_filters=n_fft // 2, pad_mode="reflect")
+  features = extractor.get_features(audio)
+  assert_equal(features.shape, (1 + len(audio) // hop_len, n_fft // 2))
+  # Naive reference: centered frames (reflect padding), periodic Hann window zero-padded to n_fft, drop DC.
+  padded = numpy.pad(audio, n_fft // 2, mode="reflect")
+  window = numpy.zeros((n_fft,))
+  window[(n_fft - win_len) // 2:][:win_len] = 0.5 - 0.5 * numpy.cos(2. * numpy.pi * numpy.arange(win_len) / win_len)
+  for t in [0, 1, 17, features.shape[0] - 1]:
+    ref = numpy.abs(numpy.fft.fft(padded[t * hop_len:t * hop_len + n_fft] * window))[1:n_fft // 2 + 1]
+    numpy.testing.assert_allclose(features[t], ref, rtol=1e-4, atol=1e-4)
+
+
+def test_AudioFeatureExtractor_batch():
+  from returnn.util.sig_proc import AudioFeatureExtractor, hz_to_mel, mel_to_hz
+  sample_rate = 16000
+  sine = numpy.sin(2. * numpy.pi * 1000. * numpy.arange(sample_rate) / sample_rate)
+  audios = [sine, numpy.random.RandomState(42).uniform(-1., 1., (12345,))]
+  for features in AudioFeatureExtractor.Features:
+    dim = 256 if features == "linear_spectrogram" else 40
+    extractor = AudioFeatureExtractor.get_instance(
+      features=features, sample_rate=sample_rate, num_feature_filters=dim)
+    assert AudioFeatureExtractor.get_instance(features=features, sample_rate=sample_rate, num_feature_filters=dim) is (
+      extractor)
+    batch = extractor.get_features_batch(audios)
+    for audio, seq_features in zip(audios, batch):
+      assert_equal(seq_features.shape, (1 + len(audio) // 160, dim))
+      assert_equal(seq_features.dtype, numpy.float32)
+      numpy.testing.assert_array_equal(seq_features, extractor.get_features(audio))
+  # The peak of the 1 kHz sine should be in the mel channel with center frequency near 1 kHz.
+  extractor = AudioFeatureExtractor.get_instance(
+    features="log_mel_filterbank", sample_rate=sample_rate, num_feature_filters=80)
+  center_freqs = mel_to_hz(numpy.linspace(hz_to_mel(0.), hz_to_mel(sample_rate / 2.), 82))[1:-1]
+  peak_freq = center_freqs[numpy.argmax(extractor.get_features(sine)[50])]
+  assert 950. < peak_freq < 1050., "peak at %f Hz" % peak_freq
+
+
+def test_ExtractAudioFeatures_feature_backend_numpy():
+  audio = numpy.random.RandomState(42).uniform(-1., 1., (8000,))
+  try:
+    # noinspection PyPackageRequirements
+    import librosa
+  except ImportError:
+    librosa = None
+  pad_mode = "constant"
+  if librosa and tuple(int(v) for v in librosa.__version__.split(".")[:2]) < (0, 9):
+    pad_mode = "reflect"  # the older librosa default
+  for features in ["mfcc", "log_mel_filterbank", "log_log_mel_filterbank", "db_mel_filterbank"]:
+    numpy_extractor = ExtractAudioFeatures(
+      features=features, num_feature_filters=40, feature_backend="numpy", pad_mode=pad_mode)
+    numpy_features = numpy_extractor.get_audio_features(audio=audio.copy(), sample_rate=16000)
+    assert_equal(numpy_features.shape, (51, 40))
+    if not librosa:
+      continue
+    librosa_features = ExtractAudioFeatures(features=features, num_feature_filters=40).get_audio_features(
+      audio=audio.copy(), sample_rate=16000)
+    numpy.testing.assert_allclose(numpy_features, librosa_features, rtol=1e-3, atol=1e-3)
+
+
 if __name__ == "__main__":
   better_exchook.install()
   if len(sys.argv) <= 1:
@@ -227,6 +227,62 @@ def test_hdf_dump_not_frame_synced():
       assert_equal(hdf_reader.data[key][seq_idx].tolist(), orig_reader.data[key][seq_idx].tolist())
 
 
+def test_hdf_dump_parts_merge_and_manifest():
+  num_seqs = 11
+  from returnn.datasets.basic import init_dataset
+  dataset = init_dataset({"class": "TaskNumberBaseConvertDataset", "num_seqs": num_seqs})
+  part_fns = []
+  for start_seq, end_seq in [(0, 4), (5, 10)]:  # end_seq is inclusive
+    fn = get_test_tmp_file(suffix=".hdf")
+    writer = HDFDatasetWriter(fn)
+    writer.dump_from_dataset(dataset, start_seq=start_seq, end_seq=end_seq, use_progress_bar=False)
+    writer.close()
+    part_fns.append(fn)
+  merged_fn = get_test_tmp_file(suffix=".hdf")
+  writer = HDFDatasetWriter(merged_fn)
+  writer.merge_from_files(part_fns, use_progress_bar=False)
+  writer.close()
+  manifest_fn = get_test_tmp_file(suffix=".manifest")
+  write_hdf_manifest(manifest_fn, part_fns)
+  assert_equal(read_hdf_manifest(manifest_fn), part_fns)
+  assert_equal([HDFDataset([fn]).num_seqs for fn in part_fns], [5, 6])
+  assert_equal(HDFDataset([merged_fn]).num_seqs, num_seqs)
+  assert_equal(HDFDataset([manifest_fn]).num_seqs, num_seqs)
+
+  orig_reader = DatasetTestReader(dataset)
+  orig_reader.read_all()
+  for files in [[merged_fn], [manifest_fn], part_fns]:
+    hdf_reader = DatasetTestReader(HDFDataset(files, use_memmap=True, cache_byte_size=0))
+    hdf_reader.read_all()
+    assert hdf_reader.data_keys == orig_reader.data_keys == ["data", "classes"]
+    assert hdf_reader.num_seqs == orig_reader.num_seqs == num_seqs
+    assert_equal(hdf_reader.seq_tags, orig_reader.seq_tags)
+    for seq_idx in range(num_seqs):
+      for key in orig_reader.data_keys:
+        assert_equal(hdf_reader.seq_lens[seq_idx][key], orig_reader.seq_lens[seq_idx][key])
+        assert_equal(hdf_reader.data[key][seq_idx].tolist(), orig_reader.data[key][seq_idx].tolist())
+
+
+def test_hdf_dump_parts_corpus_seq_idx():
+  num_seqs = 11
+  hdf_fn = generate_hdf_from_other({"class": "TaskNumberBaseConvertDataset", "num_seqs": num_seqs})
+  dataset = HDFDataset([hdf_fn], seq_ordering="random")
+  orig_reader = DatasetTestReader(dataset)
+  orig_reader.read_all()
+  fn = get_test_tmp_file(suffix=".hdf")
+  writer = HDFDatasetWriter(fn)
+  writer.dump_from_dataset(dataset, start_seq=5, end_seq=8, use_progress_bar=False)
+  writer.close()
+  # Only the dumped seqs were in the seq order, i.e. the seqs before start_seq were not loaded.
+  assert_equal(dataset.num_seqs, 4)
+  hdf_reader = DatasetTestReader(HDFDataset([fn]))
+  hdf_reader.read_all()
+  assert_equal(hdf_reader.seq_tags, orig_reader.seq_tags[5:9])
+  for seq_idx in range(4):
+    for key in orig_reader.data_keys:
+      assert_equal(hdf_reader.data[key][seq_idx].tolist(), orig_reader.data[key][seq_idx + 5].tolist())
+
+
 def test_HDFDataset_partition_epoch():
   partition_epoch = 3
   num_seqs = 11
@@ -433,6 +489,39 @@ def test_SimpleHDFWriter_extend_existing_file():
     assert reader.seq_lens[i]["data"] == seq_len
 
 
+def test_SimpleHDFWriter_write_buffer():
+  rnd = numpy.random.RandomState(42)
+  n_dim = 3
+  batches = []
+  for batch_idx in range(5):
+    seq_lens = rnd.randint(1, 7, size=(4,)).tolist()
+    batches.append(dict(
+      inputs=rnd.normal(size=(len(seq_lens), max(seq_lens), n_dim)).astype("float32"),
+      seq_len=seq_lens,
+      seq_tag=["seq-%i-%i" % (batch_idx, i) for i in range(len(seq_lens))],
+      extra={"classes": rnd.randint(0, 5, size=(len(seq_lens), max(seq_lens))).astype("int32")}))
+  readers = []
+  for write_buffer_size in [0, 100, SimpleHDFWriter.DefaultWriteBufferSize]:
+    fn = get_test_tmp_file(suffix=".hdf")
+    os.remove(fn)  # SimpleHDFWriter expects that the file does not exist
+    writer = SimpleHDFWriter(filename=fn, dim=n_dim, labels=None, write_buffer_size=write_buffer_size)
+    for batch in batches:
+      writer.insert_batch(**batch)
+    writer.close()
+    reader = DatasetTestReader(dataset=HDFDataset(files=[fn]))
+    reader.read_all()
+    readers.append(reader)
+  for reader in readers:
+    assert_equal(reader.num_seqs, 20)
+    assert_equal(reader.seq_tags, readers[0].seq_tags)
+    for key in ["data", "classes"]:
+      assert_equal([seq_len[key] for seq_len in reader.seq_lens], [seq_len[key] for seq_len in readers[0].seq_lens])
+      for seq_idx in range(reader.num_seqs):
+        numpy.testing.assert_array_equal(reader.data[key][seq_idx], readers[0].data[key][seq_idx])
+  assert_equal(readers[0].seq_tags[:2], ["seq-0-0", "seq-0-1"])
+  numpy.testing.assert_array_equal(readers[0].data["data"][0], batches[0]["inputs"][0, :batches[0]["seq_len"][0]])
+
+
 @unittest.skip("unfinished...")
 def test_SimpleHDFWriter_swmr():
   fn = get_test_tmp_file(suffix=".hdf")
@@ -529,15 +618,15 @@ def test_rnn_initData():
   assert isinstance(train, HDFDataset)
   assert isinstance(dev, HDFDataset)
   assert train.cache_byte_size_total_limit == dev.cache_byte_size_total_limit == 0
-  assert train.cache_byte_size_limit_at_start == dev.cache_byte_size_limit_at_start == 0
+  assert train.seq_cache is None and dev.seq_cache is None
 
 
 def test_hdf_no_cache_iter():
   hdf_fn = generate_hdf_from_dummy()
   dataset = HDFDataset(files=[hdf_fn])
   dataset.initialize()
-  assert dataset.cache_byte_size_limit_at_start == 0
   assert dataset.cache_byte_size_total_limit == 0
+  assert dataset.seq_cache is None
 
   class DummyCallback:
     def __init__(self):
@@ -556,6 +645,98 @@ def test_hdf_no_cache_iter():
   assert not dataset._preload_seqs.was_called
 
 
+def test_hdf_get_current_seq_lengths():
+  hdf_fn = generate_hdf_from_dummy()
+  for cache_byte_size in [0, 100]:
+    dataset = HDFDataset(files=[hdf_fn], cache_byte_size=cache_byte_size, seq_ordering="random")
+    dataset.initialize()
+    dataset.init_seq_order(epoch=2)
+    all_seq_lens = dataset.get_all_seq_lengths()
+    seq_lens = dataset.get_current_seq_lengths()
+    assert_equal(sorted(seq_lens.keys()), sorted(dataset.get_data_keys()))
+    for seq_idx in range(dataset.num_seqs):
+      real_seq_idx = dataset.get_corpus_seq_idx(seq_idx)
+      for key in dataset.get_data_keys():
+        assert_equal(seq_lens[key][seq_idx], dataset.get_seq_length(seq_idx)[key])
+        assert_equal(all_seq_lens[key][real_seq_idx], dataset.get_seq_length(seq_idx)[key])
+
+
+def test_SeqCache():
+  from returnn.datasets.cached import SeqCache
+  x = {"data": numpy.zeros((10,), dtype="float32")}  # 40 bytes
+  cache = SeqCache(max_num_bytes=100, policy="lru")
+  assert cache.add(0, x) and cache.add(1, x)
+  assert cache.get(0) is x  # 0 is now the most recently used
+  assert cache.add(2, x)
+  assert_equal(sorted([i for i in range(3) if i in cache]), [0, 2])
+  assert cache.get(1) is None
+  assert_equal((cache.num_hits, cache.num_misses, cache.num_evictions), (1, 1, 1))
+  assert_equal(cache.num_bytes, 80)
+  assert not cache.add(3, {"data": numpy.zeros((30,), dtype="float32")})  # larger than the budget
+  keep_cache = SeqCache(max_num_bytes=100, policy="keep")
+  assert keep_cache.add(0, x) and keep_cache.add(1, x)
+  assert not keep_cache.add(2, x)
+  assert_equal((len(keep_cache), keep_cache.num_evictions, keep_cache.num_rejected), (2, 0, 1))
+
+
+def test_hdf_seq_cache_random_partition_epoch():
+  num_seqs = 11
+  hdf_fn = generate_hdf_from_other({"class": "TaskNumberBaseConvertDataset", "num_seqs": num_seqs})
+  datasets = [
+    HDFDataset([hdf_fn], partition_epoch=3, seq_ordering="random", cache_byte_size=cache_byte_size, **kwargs)
+    for (cache_byte_size, kwargs) in [(0, {}), (500, {"cache_policy": "lru"}), (500, {"cache_policy": "keep"})]]
+  num_hits, num_evictions = [0, 0, 0], [0, 0, 0]
+  for epoch in range(1, 7):
+    for dataset in datasets:
+      dataset.init_seq_order(epoch=epoch)
+    ref = datasets[0]
+    for seq_idx in range(ref.num_seqs):
+      for dataset in datasets:
+        dataset.load_seqs(seq_idx, seq_idx + 1)
+        assert_equal(dataset.get_tag(seq_idx), ref.get_tag(seq_idx))
+        for key in ref.get_data_keys():
+          numpy.testing.assert_array_equal(dataset.get_data(seq_idx, key), ref.get_data(seq_idx, key))
+    for i, dataset in enumerate(datasets[1:]):
+      assert 0 < dataset.seq_cache.num_bytes <= 500
+      num_hits[i] += dataset.seq_cache.num_hits
+      num_evictions[i] += dataset.seq_cache.num_evictions
+      dataset.finish_epoch()  # resets the counters
+  assert num_hits[0] > 0 and num_hits[1] > 0
+  assert num_evictions[0] > 0 and num_evictions[1] == 0
+
+
+def test_hdf_use_memmap():
+  hdf_fn = generate_hdf_from_other({"class": "Task12AXDataset", "num_seqs": 23})
+  dataset = HDFDataset(files=[hdf_fn], seq_ordering="random")
+  dataset_mmap = HDFDataset(files=[hdf_fn], seq_ordering="random", use_memmap=True)
+  assert_equal(sorted(dataset_mmap.file_memmaps[0].keys()), ["classes", "data"])
+  for ds in [dataset, dataset_mmap]:
+    ds.initialize()
+    ds.init_seq_order(epoch=1)
+  for seq_idx in range(dataset.num_seqs):
+    dataset.load_seqs(seq_idx, seq_idx + 1)
+    dataset_mmap.load_seqs(seq_idx, seq_idx + 1)
+    for key in ["data", "classes"]:
+      data = dataset_mmap.get_data(seq_idx, key)
+      assert isinstance(data, numpy.ndarray) and not data.flags.owndata and not data.flags.writeable
+      assert_equal(data.dtype, dataset.get_data(seq_idx, key).dtype)
+      numpy.testing.assert_array_equal(data, dataset.get_data(seq_idx, key))
+
+
+def test_hdf_use_memmap_fallback_chunked():
+  fn = get_test_tmp_file(suffix=".hdf")
+  os.remove(fn)  # SimpleHDFWriter expects that the file does not exist
+  writer = SimpleHDFWriter(filename=fn, dim=3, labels=None)
+  writer.insert_batch(
+    inputs=numpy.random.normal(size=(2, 3, 3)).astype("float32"), seq_len=[2, 3], seq_tag=["seq-0", "seq-1"])
+  writer.close()
+  dataset = HDFDataset(files=[fn], use_memmap=True)
+  assert_equal(dataset.file_memmaps, [{}])  # SimpleHDFWriter uses resizable (chunked) datasets
+  dataset.init_seq_order(epoch=1)
+  dataset.load_seqs(0, 2)
+  assert_equal(dataset.get_data(1, "data").shape, (3, 3))
+
+
 def test_hdf_data_short_int_dtype():
   from returnn.datasets.generating import StaticDataset
   dataset = StaticDataset([
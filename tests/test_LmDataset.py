@@ -0,0 +1,86 @@
+# coding: utf8
+
+from __future__ import print_function
+
+import sys
+import os
+import unittest
+import tempfile
+import shutil
+
+from nose.tools import assert_equal
+
+import _setup_test_env  # noqa
+from returnn.util import better_exchook
+from returnn.datasets.lm import LmDataset, TokenCorpus
+import numpy
+
+
+def _get_all_seqs(dataset):
+  """
+  :param LmDataset dataset:
+  :return: seq tag -> data
+  :rtype: dict[str,numpy.ndarray]
+  """
+  dataset.init_seq_order(epoch=1)
+  res = {}
+  seq_idx = 0
+  while dataset.is_less_than_num_seqs(seq_idx):
+    dataset.load_seqs(seq_idx, seq_idx + 1)
+    res[dataset.get_tag(seq_idx)] = dataset.get_data(seq_idx, "data")
+    seq_idx += 1
+  return res
+
+
+def test_LmDataset_token_corpus():
+  tmp_dir = tempfile.mkdtemp()
+  try:
+    corpus_file = os.path.join(tmp_dir, "corpus.txt")
+    with open(corpus_file, "w") as f:
+      f.write("hello world\n</s>\nhello unknown world\nworld\n")
+    vocab_file = os.path.join(tmp_dir, "vocab.txt")
+    with open(vocab_file, "w") as f:
+      f.write("[END]\nhello\nworld\n")
+    opts = dict(orth_symbols_file=vocab_file, word_based=True, error_on_invalid_seq=False)
+    orig_seqs = _get_all_seqs(LmDataset(corpus_file=corpus_file, **opts))
+    assert_equal(sorted(orig_seqs.keys()), ["line-0", "line-3"])
+    assert_equal(orig_seqs["line-0"].tolist(), [1, 2, 0])
+
+    token_corpus_dir = os.path.join(tmp_dir, "corpus.tokens")
+    num_seqs = LmDataset(corpus_file=[], **opts).convert_corpus_to_token_corpus(
+      corpus_file=corpus_file, output_dir=token_corpus_dir)
+    assert_equal(num_seqs, 4)  # including the skipped seqs
+    assert TokenCorpus.is_token_corpus(token_corpus_dir)
+    dataset = LmDataset(corpus_file=token_corpus_dir, **opts)
+    assert dataset.orths is None
+    seqs = _get_all_seqs(dataset)
+    assert_equal(sorted(seqs.keys()), sorted(orig_seqs.keys()))
+    for tag, data in seqs.items():
+      assert_equal(data.dtype, orig_seqs[tag].dtype)
+      assert_equal(data.tolist(), orig_seqs[tag].tolist())
+      assert not data.flags.writeable  # view on the memory-mapped tokens
+  finally:
+    shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+  better_exchook.install()
+  if len(sys.argv) <= 1:
+    for k, v in sorted(globals().items()):
+      if k.startswith("test_"):
+        print("-" * 40)
+        print("Executing: %s" % k)
+        try:
+          v()
+        except unittest.SkipTest as exc:
+          print("SkipTest:", exc)
+        print("-" * 40)
+    print("Finished all tests.")
+  else:
+    assert len(sys.argv) >= 2
+    for arg in sys.argv[1:]:
+      print("Executing: %s" % arg)
+      if arg in globals():
+        globals()[arg]()  # assume function and execute
+      else:
+        eval(arg)  # assume Python code and execute
@@ -178,6 +178,113 @@ def test_py2_client():
   assert seq_idx == num_seqs
 
 
+def _write_sprint_cache_entry(archive, name, payload, compress=False):
+  """
+  :param returnn.sprint.cache.FileArchive archive:
+  :param str name:
+  :param bytes payload:
+  :param bool compress:
+  """
+  import zlib
+  from returnn.sprint.cache import FileInfo
+  data = zlib.compress(payload) if compress else payload
+  archive.write_U32(archive.start_recovery_tag)
+  archive.write_u32(len(name))
+  archive.write_str(name)
+  pos = archive.f.tell()
+  archive.write_u32(len(payload))
+  archive.write_u32(len(data) if compress else 0)
+  archive.write_u32(0)
+  archive.f.write(data)
+  archive.write_U32(archive.end_recovery_tag)
+  archive.ft[name] = FileInfo(name, pos, len(payload), len(data) if compress else 0, len(archive.ft))
+
+
+def test_FileArchiveIndexedReader():
+  import struct
+  import tempfile
+  import threading
+  from returnn.sprint.cache import FileArchive, FileArchiveIndexedReader
+  tmp_dir = tempfile.mkdtemp()
+  rnd = np.random.RandomState(42)
+  features = {}
+  archive_fns = []
+  for i in range(3):
+    fn = "%s/features.%i.cache" % (tmp_dir, i)
+    archive = FileArchive(fn, must_exists=False)
+    for j in range(4):
+      name = "corpus/seq-%i-%i" % (i, j)
+      feats = rnd.normal(size=(rnd.randint(1, 10), 5)).astype("float32")
+      times = [(0.01 * t, 0.01 * (t + 1)) for t in range(len(feats))]
+      archive.add_feature_cache(name, feats, times)
+      features[name] = feats
+    if i == 0:
+      # Raw mixtures (allophone state idx), as RLE: 2 single ones, one repeated 3 times, a time jump, one more.
+      align = struct.pack("=b2i", 2, 1, 2 + (1 << 26)) + struct.pack("=bi", -3, 1 << 27) + struct.pack("=bi", 0, 10)
+      align += struct.pack("=bi", 1, 0)
+      payload = struct.pack("I", 14) + b"flow-alignment" + struct.pack("I", 0) + b"ALIGNRLE" + struct.pack("I", 6)
+      _write_sprint_cache_entry(archive, "corpus/align", payload + align, compress=True)
+    if i == 1:
+      # Varying feature dimension. FileArchive.add_feature_cache does not support that.
+      varying_feats = [rnd.normal(size=(dim,)).astype("float32") for dim in [3, 5, 4]]
+      payload = struct.pack("I", 10) + b"vector-f32" + struct.pack("I", len(varying_feats))
+      for t, feat in enumerate(varying_feats):
+        payload += struct.pack("I", len(feat)) + feat.tobytes() + struct.pack("dd", 0.01 * t, 0.01 * (t + 1))
+      _write_sprint_cache_entry(archive, "corpus/varying", payload, compress=False)
+    archive.finalize()
+    del archive
+    archive_fns.append(fn)
+  bundle_fn = "%s/features.bundle" % tmp_dir
+  with open(bundle_fn, "w") as f:
+    f.write("".join(["%s\n" % fn for fn in archive_fns]))
+  allophone_fn = "%s/allophones" % tmp_dir
+  with open(allophone_fn, "w") as f:
+    f.write("# comment\nsi{#+#}@i@f\na{#+#}\nb{#+#}\n")
+
+  reader = FileArchiveIndexedReader(bundle_fn, max_open_archives=2)
+  content_keys = [name for name in reader.file_list() if not name.endswith(".attribs")]
+  assert_equal(sorted(content_keys), sorted(list(features.keys()) + ["corpus/align", "corpus/varying"]))
+  assert_in('name="sample-size" value="5"', reader.read("corpus/seq-1-2.attribs", "str"))
+  for name, feats in features.items():
+    times, data = reader.read_features(name)
+    assert_equal(data.dtype, np.float32)
+    np.testing.assert_array_equal(data, feats)
+    assert_equal(times.shape, (len(feats), 2))
+    orig_times, orig_data = FileArchive(archive_fns[int(name.split("-")[1])]).read(name, "feat")
+    np.testing.assert_array_equal(times, np.array(orig_times))
+    np.testing.assert_array_equal(data, np.array(orig_data))
+  times, data = reader.read_features("corpus/varying")
+  assert_equal([len(x) for x in data], [3, 5, 4])
+  orig_times, orig_data = FileArchive(archive_fns[1]).read("corpus/varying", "feat")
+  np.testing.assert_array_equal(times, np.array(orig_times))
+  for x, orig_x in zip(data, orig_data):
+    np.testing.assert_array_equal(x, orig_x)
+  assert_equal(len(reader._open_archives), 2)
+
+  reader.set_allophones(allophone_fn)
+  times, mixes = reader.read_alignment("align")  # short seg name
+  assert_equal(times.tolist(), [0, 1, 2, 3, 4, 10])
+  assert_equal(mixes.tolist(), [1, 2 + (1 << 26), 1 << 27, 1 << 27, 1 << 27, 0])
+  assert_equal(reader.read("corpus/align", "align"), [(0, 1, 0), (1, 2, 1), (2, 0, 2), (3, 0, 2), (4, 0, 2), (10, 0, 0)])
+
+  errors = []
+
+  def read_all():
+    try:
+      for _ in range(10):
+        for name_, feats_ in features.items():
+          np.testing.assert_array_equal(reader.read_features(name_)[1], feats_)
+    except Exception as exc:
+      errors.append(exc)
+
+  threads = [threading.Thread(target=read_all) for _ in range(4)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  assert not errors, errors
+
+
 if __name__ == "__main__":
   better_exchook.install()
   if len(sys.argv) <= 1:
@@ -132,6 +132,43 @@ def test_FeedDictDataProvider():
   assert_equal(classes.tolist(), [[1, 2, 0, 1, 2]])
 
 
+def test_FeedDictDataProvider_num_workers():
+  from returnn.datasets.generating import StaticDataset
+  rnd = numpy.random.RandomState(42)
+  dataset = StaticDataset(
+    data=[
+      {"data": rnd.normal(size=(seq_len, 3)).astype("float32"),
+       "classes": rnd.randint(0, 4, size=(seq_len,)).astype("int32")}
+      for seq_len in rnd.randint(1, 20, size=(21,))],
+    input_dim=3, output_dim=4)
+  extern_data = ExternData(data={"data": {"dim": 3}, "classes": {"dim": 4, "sparse": True, "dtype": "int32"}})
+
+  from returnn.tf.data_pipeline import FeedDictDataProvider
+  results = []
+  for num_workers in [0, 3]:
+    dataset.init_seq_order(epoch=1)
+    batches = dataset.generate_batches(recurrent_net=True, batch_size=30, max_seqs=4)
+    data_provider = FeedDictDataProvider(
+      tf_session=session, extern_data=extern_data, data_keys=["data", "classes"],
+      dataset=dataset, batches=batches, capacity=2, num_workers=num_workers)
+    data_provider.start_threads(session=session)
+    result = []
+    while data_provider.have_more_data(session=session):
+      feed_dict, meta = data_provider.get_feed_dict()
+      # Copy, as the buffers will be reused.
+      result.append(({key.name: numpy.array(value) for (key, value) in feed_dict.items()}, meta["seq_idx"]))
+    assert data_provider.have_reached_end()
+    data_provider.stop_threads()
+    results.append(result)
+  assert_equal(len(results[0]), len(results[1]))
+  assert len(results[0]) > 1
+  for (feed_dict0, seq_idxs0), (feed_dict1, seq_idxs1) in zip(*results):
+    assert_equal(seq_idxs0, seq_idxs1)
+    assert_equal(sorted(feed_dict0.keys()), sorted(feed_dict1.keys()))
+    for key in feed_dict0.keys():
+      numpy.testing.assert_array_equal(feed_dict0[key], feed_dict1[key])
+
+
 def test_DatasetDataProvider():
   from returnn.datasets.generating import DummyDataset
   seq_len = 5
@@ -226,6 +263,46 @@ def test_engine_train():
   engine.finalize()
 
 
+def test_engine_train_save_model_async():
+  from returnn.datasets.generating import DummyDataset
+  from glob import glob
+  seq_len = 5
+  n_data_dim = 2
+  n_classes_dim = 3
+  train_data = DummyDataset(input_dim=n_data_dim, output_dim=n_classes_dim, num_seqs=4, seq_len=seq_len)
+  train_data.init_seq_order(epoch=1)
+  cv_data = DummyDataset(input_dim=n_data_dim, output_dim=n_classes_dim, num_seqs=2, seq_len=seq_len)
+  cv_data.init_seq_order(epoch=1)
+
+  config = Config()
+  config.update({
+    "model": "%s/model" % _get_tmp_dir(),
+    "num_outputs": n_classes_dim,
+    "num_inputs": n_data_dim,
+    "network": {"output": {"class": "softmax", "loss": "ce"}},
+    "start_epoch": 1,
+    "num_epochs": 2,
+    "save_model_async": True,
+  })
+  _cleanup_old_models(config)
+  engine = Engine(config=config)
+  engine.init_train_from_config(config=config, train_data=train_data, dev_data=cv_data, eval_data=None)
+  engine.train()
+  async_filename = engine.get_epoch_model_filename(epoch=2)
+  sync_filename = "%s/model.sync" % _get_tmp_dir()
+  config.set("save_model_async", False)
+  engine.save_model(sync_filename)
+  engine.finalize()
+
+  assert os.path.exists(async_filename + ".index")
+  assert not glob("%s/*.tmp-async-save*" % _get_tmp_dir())
+  async_reader = tf_compat.v1.train.NewCheckpointReader(async_filename)
+  sync_reader = tf_compat.v1.train.NewCheckpointReader(sync_filename)
+  assert_equal(async_reader.get_variable_to_shape_map(), sync_reader.get_variable_to_shape_map())
+  for name in sync_reader.get_variable_to_shape_map():
+    numpy.testing.assert_array_equal(async_reader.get_tensor(name), sync_reader.get_tensor(name))
+
+
 def test_engine_train_newbob():
   from returnn.datasets.generating import DummyDataset
   seq_len = 5
@@ -254,6 +331,56 @@ def test_engine_train_newbob():
   engine.finalize()
 
 
+def test_DatasetDataProvider_batches():
+  from returnn.datasets.generating import DummyDataset
+  seq_len = 5
+  n_data_dim = 2
+  n_classes_dim = 3
+  num_seqs = 5
+  dataset = DummyDataset(input_dim=n_data_dim, output_dim=n_classes_dim, num_seqs=num_seqs, seq_len=seq_len)
+  dataset.init_seq_order(epoch=1)
+
+  n_batch = 2
+  config = Config({"dataset_pipeline": "batches"})
+
+  with make_scope() as session:
+    extern_data = ExternData()
+    extern_data.init_from_dataset(dataset, auto_create_placeholders=False)
+
+    from returnn.tf.data_pipeline import DatasetDataProvider
+    data_provider = DatasetDataProvider(
+      extern_data=extern_data, config=config, datasets={"train": dataset})
+    batches = dataset.generate_batches(recurrent_net=True, batch_size=seq_len * n_batch, max_seqs=n_batch)
+    data_provider.set_current_dataset(dataset_name="train", batches=batches)
+    data_provider.start_threads(session=session)
+
+    num_steps = 0
+    while True:
+      try:
+        data, data_size, classes, classes_size = session.run([
+          extern_data.data["data"].placeholder,
+          extern_data.data["data"].get_sequence_lengths(),
+          extern_data.data["classes"].placeholder,
+          extern_data.data["classes"].get_sequence_lengths()])
+      except tf.errors.OutOfRangeError as exc:
+        print("Got out-of-range (as expected):", exc.message)
+        break
+      cur_n_batch = min(n_batch, num_seqs - num_steps * n_batch)
+      assert_equal(data.shape, (cur_n_batch, seq_len, n_data_dim))
+      assert_equal(classes.shape, (cur_n_batch, seq_len))
+      assert_equal(list(data_size), [seq_len] * cur_n_batch)
+      assert_equal(list(classes_size), [seq_len] * cur_n_batch)
+      if num_steps == 0:
+        numpy.testing.assert_almost_equal(list(data[0, 0]), [-0.5, -0.4])
+        numpy.testing.assert_almost_equal(list(data[0, -1]), [0.3, 0.4])
+        assert_equal(classes[0].tolist(), [1, 2, 0, 1, 2])
+      num_steps += 1
+      assert num_steps <= num_seqs
+
+    assert_equal(num_steps, (num_seqs - 1) // n_batch + 1)
+    data_provider.stop_threads()
+
+
 def test_engine_train_new_dataset_pipeline():
   from returnn.datasets.generating import DummyDataset
   seq_len = 5
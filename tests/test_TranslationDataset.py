@@ -114,6 +114,39 @@ def test_translation_dataset():
   shutil.rmtree(dummy_dataset)
 
 
+def test_translation_dataset_data_cache():
+  """
+  The second instance should load the packed data from the data cache, without reading the text files.
+  """
+  dummy_dataset = tempfile.mkdtemp()
+  with open(os.path.join(dummy_dataset, "source.test"), "wb") as source_file:
+    source_file.write(dummy_source_text.encode("utf-8"))
+  with open(os.path.join(dummy_dataset, "target.test"), "wb") as target_file:
+    target_file.write(dummy_target_text.encode("utf-8"))
+  for prefix, text in [("source", dummy_source_text), ("target", dummy_target_text)]:
+    with open(os.path.join(dummy_dataset, "%s.vocab.pkl" % prefix), "wb") as vocabulary_file:
+      pickle.dump(create_vocabulary(text)[0], vocabulary_file)
+  cache_dir = os.path.join(dummy_dataset, "cache")
+
+  def _get_all_data(dataset):
+    dataset.init_seq_order(epoch=1)
+    dataset.load_seqs(0, dataset.num_seqs)
+    return [
+      (dataset.get_tag(i), dataset.get_data(i, "data").tolist(), dataset.get_data(i, "classes").tolist())
+      for i in range(dataset.num_seqs)]
+
+  orig_data = _get_all_data(TranslationDataset(path=dummy_dataset, file_postfix="test"))
+  assert_equal(len(orig_data), len(dummy_source_text.splitlines()))
+  dataset = TranslationDataset(path=dummy_dataset, file_postfix="test", data_cache=cache_dir)
+  assert_equal(_get_all_data(dataset), orig_data)  # this fills the cache
+  assert os.listdir(cache_dir)
+  dataset = TranslationDataset(path=dummy_dataset, file_postfix="test", data_cache=cache_dir)
+  assert dataset._thread is None  # loaded from the cache
+  assert_equal(_get_all_data(dataset), orig_data)
+
+  shutil.rmtree(dummy_dataset)
+
+
 num_source_factors = 2
 dummy_source_text_factor_0 = ("This is some example text.\n"
                               "The factors here have no meaning\n")
@@ -192,6 +225,12 @@ def test_translation_factors_dataset():
   shutil.rmtree(dummy_dataset)
 
 
+
+def test_translation_dataset_count_lines():
+  import io
+  for text in [b"", b"\n", b"a\n", b"a", b"a\nb c\n", b"a\n\nb c", dummy_source_text.encode("utf8")]:
+    assert_equal(TranslationDataset._count_lines(io.BytesIO(text)), len(io.BytesIO(text).readlines()))
+
 if __name__ == "__main__":
   better_exchook.install()
   if len(sys.argv) <= 1:
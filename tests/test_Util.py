@@ -283,6 +283,115 @@ def test_CollectionReadCheckCovered():
   assert x and x.truth_value
 
 
+def test_PersistentArraysCache():
+  import tempfile
+  import shutil
+  tmp_dir = tempfile.mkdtemp()
+  try:
+    src_fn = "%s/source.txt" % tmp_dir
+    with open(src_fn, "w") as f:
+      f.write("a b c\n")
+    create_count = [0]
+
+    def _create():
+      create_count[0] += 1
+      return {"a": numpy.arange(5), "b/c": numpy.array([1.5, 2.5], dtype="float32")}
+
+    cache = PersistentArraysCache(name="test", source_files=[src_fn], opts={"x": 1}, cache_dir=tmp_dir)
+    assert_is(cache.load(), None)
+    arrays = cache.get(_create)
+    assert_equal(create_count[0], 1)
+    assert_equal(sorted(arrays.keys()), ["a", "b/c"])
+    assert_equal(arrays["a"].tolist(), [0, 1, 2, 3, 4])
+    assert isinstance(arrays["a"], numpy.memmap)
+    cache = PersistentArraysCache(name="test", source_files=[src_fn], opts={"x": 1}, cache_dir=tmp_dir)
+    arrays = cache.get(_create)
+    assert_equal(create_count[0], 1)  # reused
+    assert_equal(arrays["b/c"].tolist(), [1.5, 2.5])
+    cache = PersistentArraysCache(name="test", source_files=[src_fn], opts={"x": 2}, cache_dir=tmp_dir)
+    cache.get(_create)
+    assert_equal(create_count[0], 2)  # other opts
+    with open(src_fn, "a") as f:
+      f.write("d e\n")
+    cache = PersistentArraysCache(name="test", source_files=[src_fn], opts={"x": 1}, cache_dir=tmp_dir)
+    cache.get(_create)
+    assert_equal(create_count[0], 3)  # source file changed
+  finally:
+    shutil.rmtree(tmp_dir)
+
+
+def test_PersistentSeqArraysCache():
+  import tempfile
+  import shutil
+  tmp_dir = tempfile.mkdtemp()
+  try:
+    src_fn = "%s/source.zip" % tmp_dir
+    with open(src_fn, "w") as f:
+      f.write("dummy\n")
+    rnd = numpy.random.RandomState(42)
+    arrays = {"seq-%i" % i: rnd.normal(size=(i + 1, 3)).astype("float32") for i in range(5)}
+    arrays["seq-int"] = numpy.array([1, 2, 3], dtype="int16")
+    # Like two processes which fill the same cache concurrently.
+    cache1 = PersistentSeqArraysCache(name="test", source_files=[src_fn], opts={"x": 1}, cache_dir=tmp_dir)
+    cache2 = PersistentSeqArraysCache(name="test", source_files=[src_fn], opts={"x": 1}, cache_dir=tmp_dir)
+    for i, (key, array) in enumerate(sorted(arrays.items())):
+      assert_is((cache1, cache2)[i % 2].load(key), None)
+      numpy.testing.assert_array_equal((cache1, cache2)[i % 2].get(key, lambda: array), array)
+    for cache in [cache1, cache2]:
+      for key, array in arrays.items():
+        cached = cache.get(key, lambda: None)
+        assert_equal(cached.dtype, array.dtype)
+        assert not cached.flags.writeable
+        numpy.testing.assert_array_equal(cached, array)
+    assert_equal((cache1.num_hits, cache1.num_misses, cache2.num_misses), (len(arrays), 3, 3))
+    assert_equal(len([fn for fn in os.listdir(cache1.entry_dir) if fn.endswith(".data")]), 2)
+    cache3 = PersistentSeqArraysCache(name="test", source_files=[src_fn], opts={"x": 2}, cache_dir=tmp_dir)
+    assert_is(cache3.load("seq-0"), None)  # other opts
+  finally:
+    shutil.rmtree(tmp_dir)
+
+
+
+def test_StepTrace():
+  import tempfile
+  import shutil
+  import json
+  tmp_dir = tempfile.mkdtemp()
+  try:
+    for file_format in ["chrome", "jsonl"]:
+      fn = "%s/trace.%s" % (tmp_dir, file_format)
+      trace = StepTrace(phases=["data_wait", "session_run"], capacity=3, filename=fn, file_format=file_format)
+      for step in range(5):
+        t = 100. + step
+        trace.start_step(step, start_time=t)
+        t = trace.record("data_wait", t, end_time=t + 0.1)
+        t = trace.record("session_run", t, end_time=t + 0.5)
+        trace.record("data_wait", t, end_time=t + 0.1)  # accumulated
+        trace.end_step(end_time=t + 0.2)
+      trace.close()
+      assert_equal(trace.num_steps, 5)
+      totals = trace.get_total_durations()
+      assert_almost_equal([totals["data_wait"], totals["session_run"], totals["step"]], [1., 2.5, 4.])
+      out = StringIO()
+      trace.print_summary(prefix="train", file=out)
+      print(out.getvalue())
+      assert "percentiles of last 3 steps" in out.getvalue()
+      assert "session_run: 62.5%" in out.getvalue()
+      with open(fn) as f:
+        if file_format == "chrome":
+          events = json.load(f)
+          assert_equal(len(events), 5 * 4)  # step + 3 phase events
+          assert_equal(events[0]["name"], "step 0")
+          assert_almost_equal(events[0]["dur"], 0.8 * 1e6)
+        else:
+          lines = [json.loads(line) for line in f.read().splitlines()]
+          assert_equal([line["step"] for line in lines], list(range(5)))
+          assert_almost_equal(lines[0]["data_wait"], 0.2)
+          assert_almost_equal(lines[0]["step_duration"], 0.8)
+  finally:
+    shutil.rmtree(tmp_dir)
+
+
 if __name__ == "__main__":
   better_exchook.install()
   if len(sys.argv) <= 1:
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+"""
+Benchmarks the feature extraction of :class:`ExtractAudioFeatures`,
+i.e. the librosa backend vs. the NumPy backend (:class:`returnn.util.sig_proc.AudioFeatureExtractor`),
+the latter also with multiple seqs per batch.
+Reports the throughput in seconds of audio per CPU-second,
+and the max abs difference of the NumPy features to the librosa features.
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+import numpy
+
+import _setup_returnn_env  # noqa
+from returnn.datasets.generating import ExtractAudioFeatures
+from returnn.util.sig_proc import AudioFeatureExtractor
+import argparse
+
+
+def _load_audios(args):
+  """
+  :param args: from argparse
+  :return: list of audios, sample rate
+  :rtype: (list[numpy.ndarray], int)
+  """
+  if args.files:
+    # noinspection PyPackageRequirements
+    import soundfile
+    audios = []
+    sample_rate = None
+    for filename in args.files:
+      audio, sample_rate_ = soundfile.read(filename)
+      assert sample_rate in (None, sample_rate_), "all files should have the same sample rate"
+      sample_rate = sample_rate_
+      audios.append(audio)
+    return audios, sample_rate
+  rnd = numpy.random.RandomState(42)
+  lens = rnd.uniform(0.5, 1.5, (args.num_seqs,)) * args.seq_len * args.sample_rate
+  return [rnd.uniform(-1., 1., (int(n),)) for n in lens], args.sample_rate
+
+
+def _benchmark(name, func, audios, total_secs, repetitions):
+  """
+  :param str name:
+  :param (list[numpy.ndarray])->list[numpy.ndarray] func:
+  :param list[numpy.ndarray] audios:
+  :param float total_secs: audio length in seconds
+  :param int repetitions:
+  :return: features
+  :rtype: list[numpy.ndarray]
+  """
+  res = func(audios)  # warm-up, e.g. to init the filterbanks
+  start_time = time.process_time()
+  for _ in range(repetitions):
+    res = func(audios)
+  cpu_time = (time.process_time() - start_time) / repetitions
+  print("%s: %.3f CPU-secs for %.1f secs of audio, %.1f secs of audio per CPU-sec" % (
+    name, cpu_time, total_secs, total_secs / max(cpu_time, 1e-10)))
+  return res
+
+
+def main():
+  """
+  Main entry.
+  """
+  arg_parser = argparse.ArgumentParser(description=__doc__)
+  arg_parser.add_argument("--features", default="log_mel_filterbank", help="see ExtractAudioFeatures")
+  arg_parser.add_argument("--num_feature_filters", type=int, default=80)
+  arg_parser.add_argument("--window_len", type=float, default=0.025)
+  arg_parser.add_argument("--step_len", type=float, default=0.010)
+  arg_parser.add_argument("--sample_rate", type=int, default=16000, help="for the generated audio")
+  arg_parser.add_argument("--seq_len", type=float, default=10., help="avg seq len in secs for the generated audio")
+  arg_parser.add_argument("--num_seqs", type=int, default=20, help="for the generated audio")
+  arg_parser.add_argument("--files", nargs="*", help="audio files to use instead of generated audio")
+  arg_parser.add_argument("--batch_size", type=int, default=8, help="num seqs per batch for the NumPy backend")
+  arg_parser.add_argument("--repetitions", type=int, default=3)
+  args = arg_parser.parse_args()
+
+  audios, sample_rate = _load_audios(args)
+  total_secs = sum(len(audio) for audio in audios) / float(sample_rate)
+  opts = dict(
+    features=args.features, num_feature_filters=args.num_feature_filters,
+    window_len=args.window_len, step_len=args.step_len)
+  extractor = AudioFeatureExtractor.get_instance(sample_rate=sample_rate, **opts)
+  print("Extractor:", extractor)
+
+  def _numpy_batched(audios_):
+    res_ = []
+    for i in range(0, len(audios_), args.batch_size):
+      res_.extend(extractor.get_features_batch(audios_[i:i + args.batch_size]))
+    return res_
+
+  numpy_res = _benchmark(
+    "numpy", lambda audios_: [extractor.get_features(audio) for audio in audios_],
+    audios=audios, total_secs=total_secs, repetitions=args.repetitions)
+  _benchmark(
+    "numpy, batch size %i" % args.batch_size, _numpy_batched,
+    audios=audios, total_secs=total_secs, repetitions=args.repetitions)
+
+  try:
+    # noinspection PyPackageRequirements
+    import librosa  # noqa
+  except ImportError:
+    print("librosa not available, skip librosa backend.")
+    return
+  librosa_extractor = ExtractAudioFeatures(peak_normalization=False, feature_backend="librosa", **opts)
+  librosa_res = _benchmark(
+    "librosa", lambda audios_: [librosa_extractor.get_audio_features(audio, sample_rate) for audio in audios_],
+    audios=audios, total_secs=total_secs, repetitions=args.repetitions)
+  max_diff = max(numpy.max(numpy.abs(a - b)) for (a, b) in zip(numpy_res, librosa_res))
+  print("Max abs diff numpy vs librosa: %f" % max_diff)
+
+
+if __name__ == "__main__":
+  from returnn.util import better_exchook
+  better_exchook.install()
+  try:
+    main()
+  except KeyboardInterrupt:
+    print("KeyboardInterrupt")
+    sys.exit(1)
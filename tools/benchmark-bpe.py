@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+"""
+Benchmarks the BPE segmentation of :class:`returnn.util.bpe.StandardBytePairEncoder`,
+i.e. the original greedy merge loop (from subword-nmt) vs. the priority-queue merge,
+and the batched segmentation with the word cache.
+Reports the throughput in words per CPU-second, and checks that both merge implementations agree.
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+import numpy
+
+import _setup_returnn_env  # noqa
+from returnn.util.bpe import StandardBytePairEncoder
+import argparse
+
+
+def _load_sentences(args, bpe):
+  """
+  :param args: from argparse
+  :param StandardBytePairEncoder bpe:
+  :return: sentences
+  :rtype: list[str]
+  """
+  if args.text_file:
+    with open(args.text_file, "rb") as f:
+      return [line.decode("utf8").strip() for line in f.read().splitlines()[:args.num_sentences]]
+  # Generate random words over the chars of the BPE codes, with a Zipf distribution, like in natural text.
+  # noinspection PyProtectedMember
+  chars = sorted(set("".join(a + b for (a, b) in bpe._bpe_codes.keys()).replace("</w>", "")))
+  rnd = numpy.random.RandomState(42)
+  words = ["".join(rnd.choice(chars, size=rnd.randint(2, 13))) for _ in range(args.num_distinct_words)]
+  word_idxs = numpy.minimum(rnd.zipf(1.2, size=(args.num_sentences, args.sentence_len)), len(words)) - 1
+  return [" ".join(words[i] for i in idxs) for idxs in word_idxs]
+
+
+def _benchmark(name, func, num_words, repetitions):
+  """
+  :param str name:
+  :param ()->T func:
+  :param int num_words:
+  :param int repetitions:
+  :return: result of func
+  :rtype: T
+  """
+  res = None
+  start_time = time.process_time()
+  for _ in range(repetitions):
+    res = func()
+  cpu_time = (time.process_time() - start_time) / repetitions
+  print("%s: %.3f CPU-secs for %i words, %.1f words per CPU-sec" % (
+    name, cpu_time, num_words, num_words / max(cpu_time, 1e-10)))
+  return res
+
+
+def main():
+  """
+  Main entry.
+  """
+  arg_parser = argparse.ArgumentParser(description=__doc__)
+  arg_parser.add_argument("--bpe_file", required=True, help="BPE codes file")
+  arg_parser.add_argument("--vocab_file", help="BPE vocab, see Vocabulary. if given, OOV segments are split")
+  arg_parser.add_argument("--text_file", help="one sentence per line. if not given, will generate random words")
+  arg_parser.add_argument("--num_sentences", type=int, default=1000)
+  arg_parser.add_argument("--sentence_len", type=int, default=20, help="for the generated text")
+  arg_parser.add_argument("--num_distinct_words", type=int, default=10000, help="for the generated text")
+  arg_parser.add_argument("--batch_size", type=int, default=100, help="num sentences per batch")
+  arg_parser.add_argument("--repetitions", type=int, default=3)
+  args = arg_parser.parse_args()
+
+  labels = None
+  if args.vocab_file:
+    from returnn.datasets.generating import Vocabulary
+    labels = Vocabulary(vocab_file=args.vocab_file, unknown_label=None).labels
+  bpe_uncached = StandardBytePairEncoder(bpe_codes_file=args.bpe_file, labels=labels, word_cache_size=0)
+  sentences = _load_sentences(args, bpe=bpe_uncached)
+  words = [word for sentence in sentences for word in sentence.split()]
+  print("%i sentences, %i words, %i distinct words" % (len(sentences), len(words), len(set(words))))
+
+  # noinspection PyProtectedMember
+  reference_res = _benchmark(
+    "reference merge, no cache",
+    lambda: [bpe_uncached._encode_word_uncached(word, merge_func=bpe_uncached._merge_reference) for word in words],
+    num_words=len(words), repetitions=args.repetitions)
+  # noinspection PyProtectedMember
+  res = _benchmark(
+    "priority-queue merge, no cache", lambda: [bpe_uncached._encode_word_uncached(word) for word in words],
+    num_words=len(words), repetitions=args.repetitions)
+  num_diffs = sum([a != b for (a, b) in zip(reference_res, res)])
+  print("Words which differ from the reference: %i" % num_diffs)
+
+  bpe = StandardBytePairEncoder(bpe_codes_file=args.bpe_file, labels=labels)
+  sentence_res = _benchmark(
+    "segment_sentence, word cache", lambda: [bpe.segment_sentence(sentence) for sentence in sentences],
+    num_words=len(words), repetitions=args.repetitions)
+
+  def _batched():
+    res_ = []
+    for i in range(0, len(sentences), args.batch_size):
+      res_.extend(bpe.segment_sentences(sentences[i:i + args.batch_size]))
+    return res_
+
+  batched_res = _benchmark(
+    "segment_sentences, batch size %i, word cache" % args.batch_size, _batched,
+    num_words=len(words), repetitions=args.repetitions)
+  assert batched_res == sentence_res
+  # noinspection PyProtectedMember
+  print("Word cache:", bpe._word_cache)
+  if num_diffs:
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+  from returnn.util import better_exchook
+  better_exchook.install()
+  try:
+    main()
+  except KeyboardInterrupt:
+    print("KeyboardInterrupt")
+    sys.exit(1)
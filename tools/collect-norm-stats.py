@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+"""
+Collects the mean and std-dev of some data of a dataset, for feature normalization,
+via :class:`returnn.datasets.normalization_data.MeanVarianceAccumulator`.
+The dataset is split into shards (contiguous seq ranges), which are processed in parallel processes.
+The partial statistics of each shard are saved regularly, and a restarted run resumes from there.
+
+The result is written to ``<output_prefix>.mean.txt`` and ``<output_prefix>.std_dev.txt``,
+which can be used as ``norm_mean`` and ``norm_std_dev`` of :class:`ExtractAudioFeatures`.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import multiprocessing
+
+import _setup_returnn_env  # noqa
+from returnn.log import log
+from returnn.config import Config
+from returnn.datasets.basic import init_dataset
+from returnn.datasets.normalization_data import MeanVarianceAccumulator
+from returnn.util.basic import hms
+import argparse
+
+
+def _get_dataset_opts(args):
+  """
+  :param args: from argparse
+  :rtype: dict[str]
+  """
+  if args.returnn_config.strip().startswith("{"):
+    dataset_opts = eval(args.returnn_config.strip())
+  else:
+    assert os.path.exists(args.returnn_config), "config file not found: %r" % args.returnn_config
+    config = Config()
+    config.load_file(args.returnn_config)
+    dataset_opts = config.typed_value(args.dataset)
+  assert isinstance(dataset_opts, dict), "expected dataset dict, got %r" % (dataset_opts,)
+  return dataset_opts
+
+
+def _get_partial_stats_filename(args, shard_idx):
+  """
+  :param args: from argparse
+  :param int shard_idx:
+  :rtype: str
+  """
+  return "%s.shard-%i-of-%i.npz" % (args.partial_stats_prefix or args.output_prefix, shard_idx, args.num_shards)
+
+
+def _collect_shard(args, shard_idx):
+  """
+  Runs in a worker process.
+
+  :param args: from argparse
+  :param int shard_idx:
+  :return: partial stats of this shard
+  :rtype: MeanVarianceAccumulator
+  """
+  filename = _get_partial_stats_filename(args, shard_idx)
+  if os.path.exists(filename):
+    acc = MeanVarianceAccumulator.load(filename)
+    if acc.info.get("finished"):
+      return acc
+  else:
+    acc = MeanVarianceAccumulator()
+  dataset = init_dataset(_get_dataset_opts(args))
+  dataset.init_seq_order(epoch=args.epoch)
+  num_seqs = dataset.num_seqs
+  start, end = num_seqs * shard_idx // args.num_shards, num_seqs * (shard_idx + 1) // args.num_shards
+  seq_idx = acc.info.get("seq_idx_end", start)
+  print("Shard %i: seqs %i to %i, start at %i." % (shard_idx, start, end, seq_idx), file=log.v3)
+  last_save_time = time.time()
+  while seq_idx < end:
+    dataset.load_seqs(seq_idx, seq_idx + 1)
+    acc.add(dataset.get_data(seq_idx, args.key))
+    seq_idx += 1
+    if time.time() - last_save_time > args.save_interval:
+      acc.info["seq_idx_end"] = seq_idx
+      acc.save(filename)
+      last_save_time = time.time()
+  acc.info.update({"seq_idx_end": seq_idx, "finished": 1})
+  acc.save(filename)
+  return acc
+
+
+def main():
+  """
+  Main entry.
+  """
+  arg_parser = argparse.ArgumentParser(description=__doc__)
+  arg_parser.add_argument("returnn_config", help="either filename to config-file, or dict for dataset")
+  arg_parser.add_argument("--dataset", default="train", help="if given the config, specifies the dataset")
+  arg_parser.add_argument("--epoch", type=int, default=1)
+  arg_parser.add_argument("--key", default="data", help="data-key, e.g. 'data'")
+  arg_parser.add_argument("--output_prefix", required=True)
+  arg_parser.add_argument(
+    "--partial_stats_prefix", help="for the partial stats of each shard. output_prefix by default")
+  arg_parser.add_argument("--num_shards", type=int, default=1)
+  arg_parser.add_argument("--num_workers", type=int, default=1, help="num of processes for the shards")
+  arg_parser.add_argument("--save_interval", type=float, default=60., help="secs, to save the partial stats")
+  arg_parser.add_argument("--verbosity", type=int, default=4)
+  args = arg_parser.parse_args()
+  log.initialize(verbosity=[args.verbosity])
+  args.num_shards = max(args.num_shards, args.num_workers)
+
+  start_time = time.time()
+  if args.num_workers > 1:
+    pool = multiprocessing.Pool(args.num_workers)
+    shard_accs = pool.starmap(_collect_shard, [(args, shard_idx) for shard_idx in range(args.num_shards)])
+    pool.close()
+    pool.join()
+  else:
+    shard_accs = [_collect_shard(args, shard_idx) for shard_idx in range(args.num_shards)]
+  acc = MeanVarianceAccumulator()
+  for shard_acc in shard_accs:
+    acc.merge(shard_acc)
+  print("Done. %i frames in %s." % (acc.count, hms(time.time() - start_time)), file=log.v2)
+  print("Mean:", acc.get_mean(), file=log.v2)
+  print("Std dev:", acc.get_std_dev(), file=log.v2)
+  acc.save("%s.stats.npz" % args.output_prefix)
+  acc.write_feature_vec_files(args.output_prefix)
+  print("Wrote %s.(mean|std_dev).txt." % args.output_prefix, file=log.v2)
+
+
+if __name__ == "__main__":
+  from returnn.util import better_exchook
+  better_exchook.install()
+  try:
+    main()
+  except KeyboardInterrupt:
+    print("KeyboardInterrupt")
+    sys.exit(1)
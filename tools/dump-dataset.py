@@ -32,6 +32,18 @@ def plot(m):
   show()
 
 
+def dump_numpy(filename, data, **kwargs):
+  """
+  :param str filename: if it ends with ".npy", the NumPy binary format is used, otherwise text
+  :param numpy.ndarray data:
+  :param kwargs: passed to :func:`numpy.savetxt`
+  """
+  if filename.endswith(".npy"):
+    numpy.save(filename, data)
+  else:
+    numpy.savetxt(filename, data, **kwargs)
+
+
 def dump_dataset(dataset, options):
   """
   :type dataset: Dataset.Dataset
@@ -141,7 +153,7 @@ def dump_dataset(dataset, options):
     else:
       data = dataset.get_data(seq_idx, options.key)
       if options.type == "numpy":
-        numpy.savetxt("%s%i.data%s" % (options.dump_prefix, seq_idx, options.dump_postfix), data)
+        dump_numpy("%s%i.data%s" % (options.dump_prefix, seq_idx, options.dump_postfix), data)
       elif options.type == "stdout":
         print("seq %s tag:" % progress, dataset.get_tag(seq_idx))
         print("seq %s data:" % progress, pretty_print(data))
@@ -152,7 +164,7 @@ def dump_dataset(dataset, options):
       for target in dataset.get_target_list():
         targets = dataset.get_targets(target, seq_idx)
         if options.type == "numpy":
-          numpy.savetxt(
+          dump_numpy(
             "%s%i.targets.%s%s" % (options.dump_prefix, seq_idx, target, options.dump_postfix), targets, fmt='%i')
         elif options.type == "stdout":
           extra = ""
@@ -256,7 +268,7 @@ def main():
   argparser.add_argument("--stdout_as_bytes", action="store_true")
   argparser.add_argument("--verbosity", type=int, default=4, help="overwrites log_verbosity (default: 4)")
   argparser.add_argument('--dump_prefix', default='/tmp/returnn.dump-dataset.')
-  argparser.add_argument('--dump_postfix', default='.txt.gz')
+  argparser.add_argument('--dump_postfix', default='.txt.gz', help="for --type=numpy. '.npy' for binary format")
   argparser.add_argument("--key", default="data", help="data-key, e.g. 'data' or 'classes'. (default: 'data')")
   argparser.add_argument('--stats', action="store_true", help="calculate mean/stddev stats")
   argparser.add_argument('--dump_stats', help="file-prefix to dump stats to")
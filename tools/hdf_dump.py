@@ -3,12 +3,17 @@
 """
 Creates a HDF file, which can be read by :class:`HDFDataset`.
 The input is any other dataset (:class:`Dataset`).
+
+With ``--num_shards``, disjoint seq ranges are dumped in parallel worker processes to part files,
+which are then merged, or listed in a manifest which can directly be used in ``HDFDataset(files=[...])``.
 """
 
 from __future__ import print_function
 
+import os
 import sys
 import argparse
+import multiprocessing
 
 import _setup_returnn_env  # noqa
 from returnn.log import log
@@ -72,6 +77,93 @@ def init(config_filename, cmd_line_opts, dataset_config_str):
   return dataset
 
 
+def _get_part_filename(hdf_filename, shard_idx, num_shards):
+  """
+  :param str hdf_filename:
+  :param int shard_idx:
+  :param int num_shards:
+  :rtype: str
+  """
+  return "%s.part-%i-of-%i" % (hdf_filename, shard_idx, num_shards)
+
+
+def _dump_shard(args, returnn_config, dataset_config_str, shard_idx, start_seq, end_seq):
+  """
+  Runs in a worker process.
+  Dumps the seqs [start_seq, end_seq) into a part file.
+  Existing part files are complete and are skipped, so a restarted dump resumes.
+
+  :param args: argparse object from main()
+  :param str|None returnn_config:
+  :param str|None dataset_config_str:
+  :param int shard_idx:
+  :param int start_seq:
+  :param int end_seq:
+  :return: part filename
+  :rtype: str
+  """
+  part_filename = _get_part_filename(args.hdf_filename, shard_idx, args.num_shards)
+  if os.path.exists(part_filename):
+    print("Shard %i: %s exists, skip." % (shard_idx, part_filename), file=log.v3)
+    return part_filename
+  dataset = init(config_filename=returnn_config, cmd_line_opts=[], dataset_config_str=dataset_config_str)
+  print("Shard %i: seqs %i to %i." % (shard_idx, start_seq, end_seq), file=log.v3)
+  tmp_filename = "%s/.%s.tmp" % (os.path.dirname(part_filename) or ".", os.path.basename(part_filename))
+  hdf_dataset = hdf_dataset_init(tmp_filename)
+  hdf_dataset.dump_from_dataset(
+    dataset=dataset, epoch=args.epoch, start_seq=start_seq, end_seq=end_seq - 1, use_progress_bar=False)
+  hdf_close(hdf_dataset)
+  os.rename(tmp_filename, part_filename)
+  return part_filename
+
+
+def hdf_dump_sharded(dataset, parser_args, returnn_config, dataset_config_str):
+  """
+  :param Dataset dataset: only used to get the number of seqs
+  :param parser_args: argparse object from main()
+  :param str|None returnn_config:
+  :param str|None dataset_config_str:
+  """
+  dataset.init_seq_order(parser_args.epoch)
+  start_seq = parser_args.start_seq
+  end_seq = min(dataset.num_seqs, parser_args.end_seq + 1)
+  assert end_seq > start_seq
+  num_shards = parser_args.num_shards
+  if not dataset.have_corpus_seq_idx():
+    print(
+      "Warning: %s has no corpus seq indices, thus every shard goes through all seqs before its range." % dataset,
+      "The later shards will be almost as slow as a single dump.", file=log.v2)
+  shard_args = [
+    (parser_args, returnn_config, dataset_config_str, shard_idx,
+     start_seq + (end_seq - start_seq) * shard_idx // num_shards,
+     start_seq + (end_seq - start_seq) * (shard_idx + 1) // num_shards)
+    for shard_idx in range(num_shards)]
+  print("Dump seqs %i to %i in %i shards with %i workers." % (
+    start_seq, end_seq, num_shards, parser_args.num_workers), file=log.v3)
+  # Spawn, not fork, because the dataset in this process might have threads.
+  pool = multiprocessing.get_context("spawn").Pool(parser_args.num_workers)
+  result = pool.starmap_async(_dump_shard, shard_args)
+  while not result.ready():
+    # With init_thread_join_hack(), a wait without timeout returns early, thus we wait with timeout.
+    result.wait(timeout=1.)
+  part_filenames = result.get()
+  pool.close()
+  pool.join()
+
+  if parser_args.shard_output == "manifest":
+    manifest_filename = parser_args.hdf_filename
+    if not manifest_filename.endswith(".manifest"):
+      manifest_filename += ".manifest"
+    hdf_dataset_mod.write_hdf_manifest(manifest_filename, part_filenames)
+    print("Wrote manifest %s." % manifest_filename, file=log.v3)
+  else:
+    hdf_dataset = hdf_dataset_init(parser_args.hdf_filename)
+    hdf_dataset.merge_from_files(part_filenames)
+    hdf_close(hdf_dataset)
+    for part_filename in part_filenames:
+      os.remove(part_filename)
+
+
 def _is_crnn_config(filename):
   """
   :param str filename:
@@ -102,8 +194,14 @@ def main(argv):
   parser.add_argument('--start_seq', type=int, default=0, help="Start sequence index of the dataset to dump")
   parser.add_argument('--end_seq', type=int, default=float("inf"), help="End sequence index of the dataset to dump")
   parser.add_argument('--epoch', type=int, default=1, help="Optional start epoch for initialization")
+  parser.add_argument('--num_workers', type=int, default=1, help="Number of worker processes for the shards")
+  parser.add_argument('--num_shards', type=int, default=None, help="Number of part files. num_workers by default")
+  parser.add_argument('--shard_output', choices=["merge", "manifest"], default="merge",
+                      help="Merge the part files into hdf_filename, or write a manifest (hdf_filename.manifest)")
 
   args = parser.parse_args(argv[1:])
+  if args.num_shards is None:
+    args.num_shards = args.num_workers
   returnn_config = None
   dataset_config_str = None
   if _is_crnn_config(args.config_file_or_dataset):
@@ -111,9 +209,12 @@ def main(argv):
   else:
     dataset_config_str = args.config_file_or_dataset
   dataset = init(config_filename=returnn_config, cmd_line_opts=[], dataset_config_str=dataset_config_str)
-  hdf_dataset = hdf_dataset_init(args.hdf_filename)
-  hdf_dump_from_dataset(dataset, hdf_dataset, args)
-  hdf_close(hdf_dataset)
+  if args.num_shards > 1:
+    hdf_dump_sharded(dataset, args, returnn_config=returnn_config, dataset_config_str=dataset_config_str)
+  else:
+    hdf_dataset = hdf_dataset_init(args.hdf_filename)
+    hdf_dump_from_dataset(dataset, hdf_dataset, args)
+    hdf_close(hdf_dataset)
 
   rnn.finalize()
 
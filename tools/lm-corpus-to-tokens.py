@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+"""
+Converts the corpus of a :class:`LmDataset` once to token ids (see :class:`returnn.datasets.lm.TokenCorpus`).
+The resulting directory can then be used as ``corpus_file`` of the :class:`LmDataset`,
+with the same vocabulary options, and it will be memory-mapped.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+import _setup_returnn_env  # noqa
+from returnn.log import log
+from returnn.config import Config
+from returnn.datasets.lm import LmDataset
+from returnn.util.basic import hms
+import argparse
+
+
+def main():
+  """
+  Main entry.
+  """
+  arg_parser = argparse.ArgumentParser(description=__doc__)
+  arg_parser.add_argument("returnn_config", help="either filename to config-file, or dict for LmDataset")
+  arg_parser.add_argument("--dataset", default="train", help="if given the config, specifies the dataset")
+  arg_parser.add_argument("--corpus_file", nargs="*", help="overwrites the corpus_file of the dataset")
+  arg_parser.add_argument("--output_dir", required=True)
+  arg_parser.add_argument("--verbosity", type=int, default=4)
+  args = arg_parser.parse_args()
+  log.initialize(verbosity=[args.verbosity])
+
+  if args.returnn_config.strip().startswith("{"):
+    dataset_opts = eval(args.returnn_config.strip())
+  else:
+    assert os.path.exists(args.returnn_config), "config file not found: %r" % args.returnn_config
+    config = Config()
+    config.load_file(args.returnn_config)
+    dataset_opts = config.typed_value(args.dataset)
+  assert isinstance(dataset_opts, dict), "expected dataset dict, got %r" % (dataset_opts,)
+  dataset_opts = dataset_opts.copy()
+  assert dataset_opts.pop("class", "LmDataset") == "LmDataset"
+  corpus_file = args.corpus_file or dataset_opts["corpus_file"]
+  if callable(corpus_file):
+    corpus_file = corpus_file()
+  # Do not load the corpus in the dataset itself, it is streamed in the conversion.
+  dataset_opts["corpus_file"] = []
+  dataset = LmDataset(**dataset_opts)
+  print("Dataset:", dataset, file=log.v2)
+  print("Corpus:", corpus_file, file=log.v2)
+
+  start_time = time.time()
+  num_seqs = dataset.convert_corpus_to_token_corpus(corpus_file=corpus_file, output_dir=args.output_dir)
+  print("Done. %i seqs in %s." % (num_seqs, hms(time.time() - start_time)), file=log.v2)
+
+
+if __name__ == "__main__":
+  from returnn.util import better_exchook
+  better_exchook.install()
+  try:
+    main()
+  except KeyboardInterrupt:
+    print("KeyboardInterrupt")
+    sys.exit(1)
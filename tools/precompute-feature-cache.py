@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+"""
+Fills the persistent feature cache of a dataset, e.g. :class:`OggZipDataset` with ``feature_cache=True``,
+by iterating once over all seqs.
+Training jobs with the same dataset options then read the cached features.
+With ``--num_workers``, the dataset runs in multiple processes (via :class:`MultiProcDataset`),
+which fill the cache in parallel.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+import _setup_returnn_env  # noqa
+from returnn.log import log
+from returnn.config import Config
+from returnn.datasets.basic import init_dataset
+from returnn.util.basic import hms, progress_bar_with_time
+import argparse
+
+
+def main():
+  """
+  Main entry.
+  """
+  arg_parser = argparse.ArgumentParser(description=__doc__)
+  arg_parser.add_argument("returnn_config", help="either filename to config-file, or dict for dataset")
+  arg_parser.add_argument("--dataset", default="train", help="if given the config, specifies the dataset")
+  arg_parser.add_argument("--epoch", type=int, default=1)
+  arg_parser.add_argument("--num_workers", type=int, default=1)
+  arg_parser.add_argument("--verbosity", type=int, default=4)
+  args = arg_parser.parse_args()
+  log.initialize(verbosity=[args.verbosity])
+
+  if args.returnn_config.strip().startswith("{"):
+    dataset_opts = eval(args.returnn_config.strip())
+  else:
+    assert os.path.exists(args.returnn_config), "config file not found: %r" % args.returnn_config
+    config = Config()
+    config.load_file(args.returnn_config)
+    dataset_opts = config.typed_value(args.dataset)
+  assert isinstance(dataset_opts, dict), "expected dataset dict, got %r" % (dataset_opts,)
+  # The seq ordering does not matter, and we do not want to load the seq lengths for sorting.
+  dataset_opts = dict(dataset_opts, seq_ordering="default", partition_epoch=1)
+  if args.num_workers > 1:
+    dataset_opts = {"class": "MultiProcDataset", "num_workers": args.num_workers, "dataset": dataset_opts}
+  dataset = init_dataset(dataset_opts)
+  print("Dataset:", dataset, file=log.v2)
+  dataset.init_seq_order(epoch=args.epoch)
+
+  start_time = time.time()
+  seq_idx = 0
+  while dataset.is_less_than_num_seqs(seq_idx):
+    dataset.load_seqs(seq_idx, seq_idx + 1)
+    if log.verbose[3]:
+      progress_bar_with_time(dataset.get_complete_frac(seq_idx))
+    seq_idx += 1
+  dataset.finish_epoch()
+  print("Done. %i seqs in %s." % (seq_idx, hms(time.time() - start_time)), file=log.v2)
+
+
+if __name__ == "__main__":
+  from returnn.util import better_exchook
+  better_exchook.install()
+  try:
+    main()
+  except KeyboardInterrupt:
+    print("KeyboardInterrupt")
+    sys.exit(1)
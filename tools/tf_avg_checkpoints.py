@@ -19,6 +19,15 @@ Script to average values of variables in a list of checkpoint files.
 
 This script is generic for any TF checkpoint. It is not specific to RETURNN.
 
+The averaging is streaming, i.e. one variable at a time over all checkpoints,
+and the averaged checkpoint is written incrementally in shards, which are merged at the end.
+Thus the peak memory is bounded by the largest single variable (times the number of workers)
+plus the output shard size, independent of the model size and the number of checkpoints.
+The variables of the checkpoints are read in parallel in multiple processes (``--num_workers``).
+
+Besides the plain average, weighted averaging (``--weights``) and an exponential moving average
+over the checkpoints (``--ema_decay``) are supported.
+
 Original code:
 https://github.com/tensorflow/tensor2tensor/blob/master/tensor2tensor/utils/avg_checkpoints.py
 """
@@ -29,7 +38,9 @@ from __future__ import print_function
 
 import os
 import numpy
+import typing
 import logging
+import multiprocessing
 import tensorflow as tf
 
 import _setup_returnn_env  # noqa
@@ -53,6 +64,18 @@ flags.DEFINE_string(
 flags.DEFINE_string(
   "output_path", "/tmp/averaged.ckpt",
   "Path to output the averaged checkpoint to.")
+flags.DEFINE_string(
+  "weights", "",
+  "Comma-separated list of weights, one per checkpoint (same order). Will be normalized. Uniform by default.")
+flags.DEFINE_float(
+  "ema_decay", 0.,
+  "If set, exponential moving average over the checkpoints (ordered from oldest to newest) with this decay.")
+flags.DEFINE_integer(
+  "num_workers", 1,
+  "Number of processes to read the checkpoints in parallel.")
+flags.DEFINE_integer(
+  "output_shard_size", 256,
+  "Max size in MB of the averaged variables which are kept in memory before they are written as a shard.")
 
 
 def checkpoint_exists(path):
@@ -65,6 +88,173 @@ def checkpoint_exists(path):
     tf_compat.v1.gfile.Exists(path + ".index"))
 
 
+def get_checkpoint_weights(num_checkpoints, weights=None, ema_decay=None):
+  """
+  :param int num_checkpoints:
+  :param list[float]|None weights: one per checkpoint. uniform if not given
+  :param float|None ema_decay: exponential moving average, over the checkpoints from oldest to newest
+  :return: normalized weights, one per checkpoint
+  :rtype: list[float]
+  """
+  assert num_checkpoints >= 1
+  if ema_decay:
+    assert not weights, "specify either weights or ema_decay"
+    assert 0. < ema_decay < 1.
+    # ema_0 = x_0, ema_i = ema_decay * ema_{i-1} + (1 - ema_decay) * x_i.
+    weights = [ema_decay ** (num_checkpoints - 1)] + [
+      (1. - ema_decay) * ema_decay ** (num_checkpoints - 1 - i) for i in range(1, num_checkpoints)]
+  elif weights:
+    assert len(weights) == num_checkpoints, "expected one weight per checkpoint"
+  else:
+    weights = [1.] * num_checkpoints
+  total = float(sum(weights))
+  assert total > 0.
+  return [w / total for w in weights]
+
+
+_readers = {}  # type: typing.Dict[str,tf.compat.v1.train.NewCheckpointReader]  # per process, checkpoint -> reader
+
+
+def _get_reader(checkpoint):
+  """
+  :param str checkpoint:
+  :rtype: tf.compat.v1.train.NewCheckpointReader
+  """
+  if checkpoint not in _readers:
+    _readers[checkpoint] = tf_compat.v1.train.NewCheckpointReader(checkpoint)
+  return _readers[checkpoint]
+
+
+def _read_weighted_sum(name, checkpoints_and_weights):
+  """
+  Can run in a worker process.
+  Only reads this one variable from the checkpoints, and keeps only one copy at a time in memory.
+
+  :param str name: variable name
+  :param list[(str,float)] checkpoints_and_weights:
+  :return: weighted sum of the variable over the checkpoints, as float64
+  :rtype: numpy.ndarray
+  """
+  res = None
+  for checkpoint, weight in checkpoints_and_weights:
+    tensor = numpy.asarray(_get_reader(checkpoint).get_tensor(name))
+    if res is None:
+      res = tensor.astype(numpy.float64) * weight
+    else:
+      res += tensor * weight
+  return res
+
+
+class _ShardedCheckpointWriter:
+  """
+  Writes a checkpoint incrementally.
+  Variables are collected until ``max_shard_bytes``, and then written as a separate checkpoint shard.
+  At the end, the shards are merged into the final checkpoint (only the index is rewritten, the data files are moved).
+  """
+
+  def __init__(self, output_path, max_shard_bytes):
+    """
+    :param str output_path: checkpoint prefix
+    :param int max_shard_bytes:
+    """
+    self.output_path = os.path.abspath(output_path)  # TF needs absolute path
+    self.max_shard_bytes = max_shard_bytes
+    self.tmp_dir = self.output_path + ".tmp-shards"
+    if not os.path.isdir(self.tmp_dir):
+      os.makedirs(self.tmp_dir)
+    self.shard_prefixes = []  # type: typing.List[str]
+    self._names = []  # type: typing.List[str]
+    self._dtypes = []  # type: typing.List[tf.DType]
+    self._values = []  # type: typing.List[numpy.ndarray]
+    self._num_bytes = 0
+
+  def add(self, name, dtype, value):
+    """
+    :param str name:
+    :param tf.DType dtype:
+    :param numpy.ndarray value:
+    """
+    self._names.append(name)
+    self._dtypes.append(dtype)
+    self._values.append(value)
+    self._num_bytes += value.nbytes
+    if self._num_bytes >= self.max_shard_bytes:
+      self._write_shard()
+
+  def _write_shard(self):
+    if not self._names:
+      return
+    from tensorflow.python.ops import gen_io_ops
+    prefix = os.path.join(self.tmp_dir, "shard-%05i" % len(self.shard_prefixes))
+    with tf.Graph().as_default() as graph:
+      placeholders = [
+        tf_compat.v1.placeholder(dtype=dtype, name="value_%i" % i) for (i, dtype) in enumerate(self._dtypes)]
+      save_op = gen_io_ops.save_v2(
+        prefix=prefix, tensor_names=self._names, shape_and_slices=[""] * len(self._names), tensors=placeholders)
+      with tf_compat.v1.Session(graph=graph) as session:
+        session.run(save_op, feed_dict=dict(zip(placeholders, self._values)))
+    tf_compat.v1.logging.info("Wrote shard %s with %i variables", prefix, len(self._names))
+    self.shard_prefixes.append(prefix)
+    self._names, self._dtypes, self._values, self._num_bytes = [], [], [], 0
+
+  def close(self):
+    """
+    Writes the remaining variables, and merges all shards into the final checkpoint.
+    """
+    from tensorflow.python.ops import gen_io_ops
+    self._write_shard()
+    assert self.shard_prefixes, "no variables"
+    with tf.Graph().as_default() as graph:
+      merge_op = gen_io_ops.merge_v2_checkpoints(
+        checkpoint_prefixes=self.shard_prefixes, destination_prefix=self.output_path, delete_old_dirs=True)
+      with tf_compat.v1.Session(graph=graph) as session:
+        session.run(merge_op)
+    if os.path.isdir(self.tmp_dir):
+      os.rmdir(self.tmp_dir)
+
+
+def avg_checkpoints(checkpoints, weights, output_path, num_workers=1, max_shard_bytes=256 * 1024 * 1024):
+  """
+  :param list[str] checkpoints:
+  :param list[float] weights: normalized, one per checkpoint
+  :param str output_path: checkpoint prefix
+  :param int num_workers: processes to read the checkpoints in parallel
+  :param int max_shard_bytes: see :class:`_ShardedCheckpointWriter`
+  """
+  assert len(checkpoints) == len(weights)
+  checkpoints_and_weights = list(zip(checkpoints, weights))
+  num_workers = max(min(num_workers, len(checkpoints)), 1)
+  # Each worker reads a subset of the checkpoints and sums them up,
+  # thus there is at most one partial sum per worker in memory.
+  chunks = [checkpoints_and_weights[i::num_workers] for i in range(num_workers)]
+  reader = _get_reader(checkpoints[0])
+  var_to_dtype = reader.get_variable_to_dtype_map()
+  var_to_shape = reader.get_variable_to_shape_map()
+  for checkpoint in checkpoints[1:]:
+    assert _get_reader(checkpoint).get_variable_to_shape_map() == var_to_shape, (
+      "checkpoint %s has different variables than %s" % (checkpoint, checkpoints[0]))
+  pool = multiprocessing.get_context("spawn").Pool(num_workers) if num_workers > 1 else None
+  writer = _ShardedCheckpointWriter(output_path=output_path, max_shard_bytes=max_shard_bytes)
+  for name in sorted(var_to_shape):
+    dtype = var_to_dtype[name]
+    if dtype.is_floating:
+      if pool:
+        partial_sums = pool.starmap(_read_weighted_sum, [(name, chunk) for chunk in chunks])
+      else:
+        partial_sums = [_read_weighted_sum(name, checkpoints_and_weights)]
+      value = partial_sums[0]
+      for partial_sum in partial_sums[1:]:
+        value += partial_sum
+      value = value.astype(dtype.as_numpy_dtype)
+    else:  # e.g. global_step. just take the last
+      value = numpy.asarray(_get_reader(checkpoints[-1]).get_tensor(name))
+    writer.add(name, dtype, value)
+  writer.close()
+  if pool:
+    pool.close()
+    pool.join()
+
+
 def main(_):
   """
   Main entry.
@@ -88,53 +278,25 @@ def main(_):
     # Checkpoints are ordered from oldest to newest.
     checkpoints = checkpoint_state.all_model_checkpoint_paths[-FLAGS.num_last_checkpoints:]
 
+  weights = [float(w) for w in FLAGS.weights.split(",") if w.strip()] if FLAGS.weights else None
+  if weights:
+    assert len(weights) == len(checkpoints), "expected one weight per checkpoint"
+    weights = [w for (c, w) in zip(checkpoints, weights) if checkpoint_exists(c)]
   checkpoints = [c for c in checkpoints if checkpoint_exists(c)]
   if not checkpoints:
     if FLAGS.checkpoints:
       raise ValueError("None of the provided checkpoints exist. %s" % FLAGS.checkpoints)
     else:
       raise ValueError("Could not find checkpoints at %s" % os.path.dirname(FLAGS.prefix))
+  weights = get_checkpoint_weights(len(checkpoints), weights=weights, ema_decay=FLAGS.ema_decay or None)
 
   # Read variables from all checkpoints and average them.
   tf_compat.v1.logging.info("Reading variables and averaging checkpoints:")
-  for c in checkpoints:
-    tf_compat.v1.logging.info("%s ", c)
-  var_list = tf.train.list_variables(checkpoints[0])
-  var_values, var_dtypes = {}, {}
-  for (name, shape) in var_list:
-    var_values[name] = numpy.zeros(shape)
-  for checkpoint in checkpoints:
-    reader = tf.train.load_checkpoint(checkpoint)
-    for name in var_values:
-      tensor = reader.get_tensor(name)
-      if not isinstance(tensor, numpy.ndarray):  # e.g. int (scalar)
-        tensor = numpy.array(tensor)
-      assert isinstance(tensor, numpy.ndarray)
-      var_dtypes[name] = tensor.dtype
-      if isinstance(tensor.dtype, numpy.integer):
-        var_values[name] = tensor  # just take last
-      else:
-        var_values[name] += tensor
-    tf_compat.v1.logging.info("Read from checkpoint %s", checkpoint)
-  for name in var_values:  # Average.
-    if not isinstance(var_dtypes[name], numpy.integer):
-      var_values[name] /= len(checkpoints)
-
-  with tf_compat.v1.variable_scope(tf_compat.v1.get_variable_scope(), reuse=tf_compat.v1.AUTO_REUSE):
-    tf_vars = [
-      tf_compat.v1.get_variable(v, shape=var_values[v].shape, dtype=var_dtypes[v])
-      for v in var_values]
-  placeholders = [tf_compat.v1.placeholder(v.dtype, shape=v.shape) for v in tf_vars]
-  assign_ops = [tf_compat.v1.assign(v, p) for (v, p) in zip(tf_vars, placeholders)]
-  saver = tf_compat.v1.train.Saver(tf_compat.v1.all_variables())
-
-  # Build a model consisting only of variables, set them to the average values.
-  with tf_compat.v1.Session() as sess:
-    sess.run(tf_compat.v1.global_variables_initializer())
-    for p, assign_op, (name, value) in zip(placeholders, assign_ops, var_values.items()):
-      sess.run(assign_op, {p: value})
-    # Use the built saver to save the averaged checkpoint.
-    saver.save(sess, FLAGS.output_path)
+  for c, w in zip(checkpoints, weights):
+    tf_compat.v1.logging.info("%s (weight %f)", c, w)
+  avg_checkpoints(
+    checkpoints=checkpoints, weights=weights, output_path=FLAGS.output_path,
+    num_workers=FLAGS.num_workers, max_shard_bytes=FLAGS.output_shard_size * 1024 * 1024)
 
   tf_compat.v1.logging.info("Averaged checkpoints saved in %s", FLAGS.output_path)
 